@@ -9,13 +9,15 @@ const BACKEND_URL = "http://localhost:8080";
 
 
 // TypeScript interfaces for better type safety
+// Version history entry - listed without content (metadata_only=true)
 interface DocumentVersion {
   id: number;
   version_number: number;
-  content: string;
   is_active: boolean;
   created_at: string;
   document_id: number;
+  size: number;
+  content_hash: string | null;
 }
 
 
@@ -173,7 +175,7 @@ function App() {
       const documentData: DocumentWithCurrentVersion = documentResponse.data;
 
       // Get all version history
-      const versionsResponse = await axios.get(`${BACKEND_URL}/api/documents/${documentNumber}/versions`);
+      const versionsResponse = await axios.get(`${BACKEND_URL}/api/documents/${documentNumber}/versions?metadata_only=true`);
       const versions: DocumentVersion[] = versionsResponse.data;
 
       setAppState(prev => ({
@@ -267,7 +269,7 @@ function App() {
       setCurrentDocumentContent(updatedDocument.content);
 
       // Reload version list to update active status
-      const versionsResponse = await axios.get(`${BACKEND_URL}/api/documents/${appState.currentDocument.id}/versions`);
+      const versionsResponse = await axios.get(`${BACKEND_URL}/api/documents/${appState.currentDocument.id}/versions?metadata_only=true`);
       setAppState(prev => ({
         ...prev,
         documentVersions: versionsResponse.data
@@ -93,6 +93,7 @@ interface ChatMessage {
   type?: "text" | "suggestion_cards" | "suggestion_summary";
   suggestions?: Suggestion[];
   summary?: SuggestionSummary;
+  streaming?: boolean; // Reply still arriving as assistant_delta frames
 }
 
 interface SuggestionSummary {
@@ -110,6 +111,7 @@ interface ProcessingStage {
   progress: number;
   status: 'pending' | 'active' | 'completed' | 'error';
   agent: string;
+  durationMs?: number;  // Measured by the backend once the stage completes
 }
 
 interface Suggestion {
@@ -164,6 +166,8 @@ export default function ChatPanel({
   const [detectedIntent, setDetectedIntent] = useState<string | null>(null); // Track detected intent
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const highlightTimeoutRef = useRef<number | null>(null);
+  // IDs of suggestion cards streamed during the current turn, before its final cards arrive
+  const streamedCardIdsRef = useRef<string[]>([]);
 
   // Predefined processing stages configuration based on intent
   // Note: These IDs must match what the backend actually sends
@@ -366,6 +370,15 @@ export default function ChatPanel({
     };
   }, []);
 
+  // Forget the cards streamed during this turn, except those kept in the final card set
+  const dropStreamedSuggestions = (keepIds: string[] = []) => {
+    const stale = streamedCardIdsRef.current.filter(id => !keepIds.includes(id));
+    streamedCardIdsRef.current = [];
+    if (suggestionManager && stale.length > 0) {
+      suggestionManager.removeSuggestions(stale);
+    }
+  };
+
   // Handle WebSocket messages
   useEffect(() => {
     if (!lastJsonMessage) return;
@@ -414,9 +427,10 @@ export default function ChatPanel({
               ...stage,
               name: stageData.name || stage.name,
               message: stageData.message || stage.message,
-              progress: stageData.progress || stage.progress,
-              status: 'active' as const,
-              agent: stageData.agent || stage.agent
+              progress: stageData.progress ?? stage.progress,
+              status: stageData.status === 'completed' ? 'completed' as const : 'active' as const,
+              agent: stageData.agent || stage.agent,
+              durationMs: stageData.duration_ms ?? stage.durationMs
             };
           } else {
             // For document_analysis, agents run in parallel, so don't auto-complete earlier stages
@@ -464,12 +478,68 @@ export default function ChatPanel({
         }
         break;
         
+      case 'assistant_delta':
+        // Streamed piece of the reply, appended to the message being written
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          if (last?.streaming) {
+            return [...prev.slice(0, -1), { ...last, content: last.content + message.delta }];
+          }
+          return [...prev, {
+            role: "assistant",
+            content: message.delta,
+            timestamp: new Date(),
+            type: "text",
+            streaming: true
+          }];
+        });
+        break;
+
+      case 'suggestion_cards_batch':
+        // Cards of one mapped paragraph, shown while the analysis is still running
+        if (message.cards && message.cards.length > 0) {
+          let batchSuggestions: Suggestion[] = message.cards;
+          if (suggestionManager) {
+            suggestionManager.updateCurrentText(getCurrentDocumentContent?.() || '');
+            suggestionManager.addSuggestions(message.cards);
+            streamedCardIdsRef.current.push(...message.cards.map((card: Suggestion) => card.id));
+            batchSuggestions = message.cards.map((card: Suggestion) => suggestionManager.getSuggestion(card.id) || card);
+          }
+          setMessages(prev => {
+            const last = prev[prev.length - 1];
+            if (last?.streaming && last.type === 'suggestion_cards') {
+              return [...prev.slice(0, -1), { ...last, suggestions: [...(last.suggestions || []), ...batchSuggestions] }];
+            }
+            return [...prev, {
+              role: "assistant",
+              content: "Detailed Suggestions:",
+              timestamp: new Date(),
+              type: "suggestion_cards",
+              suggestions: batchSuggestions,
+              streaming: true
+            }];
+          });
+        }
+        break;
+
+      case 'suggestion_cards_summary':
+        console.log(`📊 ${message.total_count} suggestions, ${message.streamed_count} streamed in ${message.batches} batches`);
+        break;
+
       case 'assistant_response':
         setIsLoading(false);
         onAIStatusChange?.(true, false, 'AI Ready');
         // Clear processing stages when response is complete
         setCurrentProcessingStage(null);
         setAllProcessingStages([]);
+        // The final messages replace any streamed text, and cards that were regenerated
+        // (new IDs) replace the streamed ones
+        setMessages(prev => prev.filter(msg => !msg.streaming));
+        dropStreamedSuggestions(
+          (message.messages || [])
+            .filter((aiMessage: any) => aiMessage.type === 'suggestion_cards' && aiMessage.cards)
+            .flatMap((aiMessage: any) => aiMessage.cards.map((card: Suggestion) => card.id))
+        );
         
         // Check if intent was detected in the response
         if (message.intent_detected) {
@@ -548,6 +618,21 @@ export default function ChatPanel({
         }
         break;
         
+      case 'cancelled':
+        // The turn was stopped (or superseded by a newer message for this document);
+        // whatever it streamed is dropped
+        setMessages(prev => prev.filter(msg => !msg.streaming));
+        dropStreamedSuggestions();
+        if (message.reason === 'superseded') break;
+        setIsLoading(false);
+        onAIStatusChange?.(true, false, 'AI Ready');
+        setCurrentProcessingStage(null);
+        setAllProcessingStages([]);
+        break;
+
+      case 'pong':
+        break;
+
       case 'workflow_error':
       case 'processing_error':
       case 'validation_error':
@@ -587,8 +672,15 @@ export default function ChatPanel({
   }, []);
 
   // Send message via WebSocket with retry logic
+  // Stop the in-flight turn for this document; the backend answers with a 'cancelled' frame
+  const cancelMessage = () => {
+    if (readyState !== ReadyState.OPEN) return;
+    sendJsonMessage({ type: 'cancel', document_id: documentId });
+  };
+
+  // Also allowed while a turn is running: the backend supersedes that turn with this message
   const sendMessage = async () => {
-    if (!inputMessage.trim() || isLoading) return;
+    if (!inputMessage.trim()) return;
 
     // Check connection state and handle accordingly
     if (readyState === ReadyState.CONNECTING) {
@@ -643,7 +735,8 @@ export default function ChatPanel({
             message: messageToSend,
             document_content: currentDocumentContent,
             document_id: documentId,
-            document_version: documentVersion
+            document_version: documentVersion,
+            stream: true
           });
         } catch (error) {
           console.error(`Send attempt failed (${4 - retries} of 3):`, error);
@@ -1083,6 +1176,8 @@ export default function ChatPanel({
 
 
   // Handle Enter key for sending
+  const canStop = isLoading && !inputMessage.trim();
+
   const handleKeyDown = (e: React.KeyboardEvent) => {
     if (e.key === "Enter" && !e.shiftKey) {
       e.preventDefault();
@@ -1370,20 +1465,22 @@ export default function ChatPanel({
               lineHeight: '1.5'
             }}
             rows={1}
-            disabled={isLoading || (readyState !== ReadyState.OPEN && readyState !== ReadyState.CONNECTING)}
+            disabled={readyState !== ReadyState.OPEN && readyState !== ReadyState.CONNECTING}
           />
+          {/* Stop while a turn runs and nothing new is typed; otherwise send (superseding the turn) */}
           <button
-            onClick={sendMessage}
-            disabled={!inputMessage.trim() || isLoading || readyState !== ReadyState.OPEN}
+            onClick={canStop ? cancelMessage : sendMessage}
+            disabled={canStop ? readyState !== ReadyState.OPEN : (!inputMessage.trim() || readyState !== ReadyState.OPEN)}
+            title={canStop ? "Stop" : undefined}
             className={`w-10 h-10 rounded-full flex items-center justify-center transition-colors flex-shrink-0 ${
-              !inputMessage.trim() || isLoading || readyState !== ReadyState.OPEN
+              !canStop && (!inputMessage.trim() || readyState !== ReadyState.OPEN)
                 ? 'bg-gray-200 text-gray-400 cursor-not-allowed'
                 : 'bg-red-500 text-white hover:bg-red-600'
             }`}
             style={{ borderRadius: '50%' }}
           >
-            {isLoading ? (
-              <div className="w-5 h-5 border-2 border-white border-t-transparent rounded-full animate-spin"></div>
+            {canStop ? (
+              <div className="w-3.5 h-3.5 bg-white rounded-sm"></div>
             ) : (
               <svg className="w-5 h-5 transform rotate-90" fill="none" stroke="currentColor" viewBox="0 0 24 24">
                 <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M12 19l9 2-9-18-9 18 9-2zm0 0v-8" />
@@ -280,6 +280,18 @@ export class SuggestionManager {
     return this.suggestions.get(id);
   }
   
+  /**
+   * Remove suggestions that are no longer offered (e.g. streamed cards of a stopped turn).
+   * Applied suggestions are kept.
+   */
+  removeSuggestions(suggestionIds: string[]): void {
+    suggestionIds.forEach(id => {
+      if (!this.appliedSuggestions.has(id)) {
+        this.suggestions.delete(id);
+      }
+    });
+  }
+  
   /**
    * Reject a suggestion
    */
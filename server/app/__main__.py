@@ -3,51 +3,41 @@ from datetime import datetime
 import json
 import logging
 import asyncio
+import time
 from pathlib import Path
+from typing import Optional, Union
 
-from fastapi import Depends, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
+from fastapi import (
+    Depends, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks, Header, Query,
+    Request, Response
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
-from sqlalchemy import insert, select, update, func
+from sqlalchemy import LargeBinary, cast, select, func
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-import app.internal.data as data_module
-from bs4 import BeautifulSoup
-from app.internal.db import Base, SessionLocal, engine, get_db
+from app.internal.db import (
+    Base, SessionLocal, async_engine, count_queries, engine, get_db, startup_lock
+)
+from app.internal.chat_retention import chat_compactor
+from app.internal.chat_writer import chat_writer
+from app.internal.migrations import run_migrations
 from app.internal.text_utils import html_to_plain_text, validate_text_for_ai, StreamingJSONParser
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_title_from_html(html_content: str) -> str:
-    """
-    Extract title from HTML content
-    Priority order: <title> tag > <h1> tag > default title
-    """
-    try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Prefer <title> tag
-        title_tag = soup.find('title')
-        if title_tag and title_tag.string:
-            return title_tag.string.strip()
-        
-        # If no <title>, use first <h1> tag
-        h1_tag = soup.find('h1')
-        if h1_tag and h1_tag.string:
-            return h1_tag.string.strip()
-        
-        # If none found, return default title
-        return "Untitled Document"
-        
-    except Exception as e:
-        logger.warning(f"Failed to extract title: {e}")
-        return "Untitled Document"
-
 import app.models as models
 import app.schemas as schemas
+from app.internal import (
+    document_repository, search_index, seed_snapshot, version_diff, version_store
+)
+from app.internal.autosave import save_coalescer
+from app.internal.document_cache import document_cache
+from app.internal.document_import import DocumentImporter, NdjsonDecoder, import_pool
 
 
 @asynccontextmanager
@@ -59,56 +49,117 @@ async def lifespan(_: FastAPI):
     - Now need to create data for both Document and DocumentVersion tables
     - Need to properly set up relationships between documents and versions
     """
-    # Create the database tables
-    Base.metadata.create_all(bind=engine)
-    
-    # Insert seed data with versioning support
-    with SessionLocal() as db:
-        # Check if data has already been initialised (avoid duplicate initialisation)
-        existing_doc = db.scalar(select(models.Document).where(models.Document.id == 1))
-        if not existing_doc:
-            # Dynamically discover all DOCUMENT_* variables with proper ordering
-            document_pairs = []
-            for attr_name in dir(data_module):
-                if attr_name.startswith('DOCUMENT_') and not attr_name.endswith('__'):
-                    document_content = getattr(data_module, attr_name)
-                    if isinstance(document_content, str):
-                        document_pairs.append((attr_name, document_content))
-            
-            # Sort documents by numeric suffix to maintain correct order (DOCUMENT_1, DOCUMENT_2, DOCUMENT_3)
-            document_pairs.sort(key=lambda x: int(x[0].split('_')[1]) if x[0].split('_')[1].isdigit() else 999)
-            documents = [pair[1] for pair in document_pairs]
-            
-            # Create documents and versions for each discovered document
-            for i, document_content in enumerate(documents, 1):
-                # Create document (automatically extract title from HTML)
-                doc_title = extract_title_from_html(document_content)
-                doc = models.Document(
-                    id=i,
-                    title=doc_title,
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                db.add(doc)
-                db.flush()  # Ensure doc has ID
-                
-                # Create initial version for document
-                version = models.DocumentVersion(
-                    document_id=doc.id,
-                    version_number=1,
-                    content=document_content,
-                    is_active=True,
-                    created_at=datetime.utcnow()
-                )
-                db.add(version)
-                db.flush()  # Ensure version has ID
-                
-                # Set document's current version
-                doc.current_version_id = version.id
-            
-            db.commit()
-            logger.info(f"✅ Seeded {len(documents)} documents dynamically")
+    # Workers start at the same time - only one creates, migrates and seeds at once
+    with startup_lock():
+        # Create the database tables and upgrade existing ones
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+    
+        # Insert seed data from the precomputed snapshot (app/internal/seed_snapshot.py)
+        with SessionLocal() as db:
+            # Check if data has already been initialised (avoid duplicate initialisation)
+            existing_doc = db.scalar(select(models.Document).where(models.Document.id == 1))
+            if not existing_doc:
+                try:
+                    started = time.perf_counter()
+                    seeded = seed_snapshot.seed_database(db)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    logger.info(f"✅ Seeded {seeded} documents in {elapsed_ms:.0f} ms")
+                except IntegrityError:
+                    # Another process seeded the same documents first
+                    db.rollback()
+                    logger.info("Seed documents already present, skipping seeding")
+    
+    # Enforce chat history retention in the background
+    chat_compactor.start()
     yield
+    
+    # Write chat messages still queued, then release pooled async connections
+    await chat_compactor.stop()
+    await chat_writer.close()
+    await async_engine.dispose()
+    # Joins the import workers, so not on the event loop
+    await run_in_threadpool(import_pool.shutdown)
+
+
+def serialize_version(
+    db: Session, version: models.DocumentVersion, current_version_id: Optional[int]
+) -> schemas.DocumentVersionRead:
+    """DocumentVersionRead with the version's full content (delta versions are rebuilt)"""
+    # Built field by field - validating the ORM object would load the deferred content column
+    return schemas.DocumentVersionRead(
+        id=version.id,
+        document_id=version.document_id,
+        version_number=version.version_number,
+        content=version_store.get_version_content(db, version),
+        # Derived from the document's pointer - the per-row is_active column is not maintained
+        is_active=version.id == current_version_id,
+        created_at=version.created_at,
+    )
+
+
+def list_version_metadata(
+    db: Session,
+    document: models.Document,
+    limit: Optional[int] = None,
+    before: Optional[int] = None,
+) -> list[schemas.DocumentVersionMetadata]:
+    """
+    Version metadata of a document, newest first, without reading any content
+    
+    Keyset pagination: pass the smallest version_number of the previous page as before.
+    Served by the unique (document_id, version_number) index.
+    """
+    query = (
+        select(
+            models.DocumentVersion.id,
+            models.DocumentVersion.document_id,
+            models.DocumentVersion.version_number,
+            models.DocumentVersion.created_at,
+            models.DocumentVersion.content_hash,
+            # Legacy rows without a blob keep their content inline
+            func.coalesce(
+                models.ContentBlob.size,
+                func.length(cast(models.DocumentVersion.content, LargeBinary))
+            ).label("size"),
+        )
+        .outerjoin(
+            models.ContentBlob, models.ContentBlob.hash == models.DocumentVersion.content_hash
+        )
+        .where(models.DocumentVersion.document_id == document.id)
+        .order_by(models.DocumentVersion.version_number.desc())
+    )
+    if before is not None:
+        query = query.where(models.DocumentVersion.version_number < before)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    return [
+        schemas.DocumentVersionMetadata(
+            **row._mapping, is_active=row.id == document.current_version_id
+        )
+        for row in db.execute(query)
+    ]
+
+
+def not_modified_response(
+    response: Response, etag: Optional[str], last_modified: Optional[datetime],
+    if_none_match: Optional[str], if_modified_since: Optional[str]
+) -> Optional[Response]:
+    """
+    Set the validators of a GET response, and return a 304 if the client's copy is current
+    
+    no-cache makes browsers revalidate every time, which costs a 304 rather than a body.
+    """
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = document_repository.http_date(last_modified)
+    response.headers.update(headers)
+    if document_repository.is_not_modified(if_none_match, if_modified_since, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return None
 
 
 app = FastAPI(lifespan=lifespan)
@@ -118,16 +169,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Readable by the editor: ETag for If-Match on autosave, X-Query-Count for debugging
+    expose_headers=["ETag", "Last-Modified", "X-Query-Count"],
 )
 
 
+@app.middleware("http")
+async def count_request_queries(request, call_next):
+    """
+    Report the number of SQL statements a request ran in the X-Query-Count header
+    
+    Makes N+1 query patterns visible in tests and in the browser's network panel.
+    Streamed response bodies are still running when the header is sent, so their
+    queries are not included.
+    """
+    with count_queries() as queries:
+        response = await call_next(request)
+    response.headers["X-Query-Count"] = str(queries.count)
+    return response
+
+
 # ===================================================================
 # Maintain backward compatible legacy API endpoints
 # ===================================================================
 
 @app.get("/document/{document_id}")
 def get_document(
-    document_id: int, db: Session = Depends(get_db)
+    document_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
 ) -> schemas.DocumentWithCurrentVersion:
     """
     Get document and its current version content (backward compatible)
@@ -136,47 +208,85 @@ def get_document(
     - Frontend currently uses this endpoint to get documents
     - Maintain backward compatibility, avoid breaking existing functionality
     - Now returns current version content rather than direct content field
+    - Served from the read-through document cache while the document is unchanged
+    - The ETag header can be sent back as If-Match on /save
+    - If-None-Match / If-Modified-Since are answered with 304 after one metadata query
     """
-    # Query document and its current version
-    document = db.scalar(
-        select(models.Document)
-        .where(models.Document.id == document_id)
-    )
+    # Pointer and last write time decide whether the cached response is still current
+    pointer = document_repository.get_document_state(db, document_id)
     
-    if not document:
+    if not pointer:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Get current version
-    current_version = None
-    if document.current_version_id:
-        current_version = db.scalar(
-            select(models.DocumentVersion)
-            .where(models.DocumentVersion.id == document.current_version_id)
-        )
+    etag = document_repository.content_etag(pointer.version_id, pointer.content_hash)
+    not_modified = not_modified_response(
+        response, etag, pointer.updated_at, if_none_match, if_modified_since
+    )
+    if not_modified:
+        return not_modified
     
-    # If no current version, get latest version
-    if not current_version:
-        current_version = db.scalar(
-            select(models.DocumentVersion)
-            .where(models.DocumentVersion.document_id == document_id)
-            .order_by(models.DocumentVersion.version_number.desc())
-        )
+    cached = document_cache.get(document_id, pointer.current_version_id, pointer.updated_at)
+    if cached is not None:
+        return cached
     
+    # Current version (latest version if the document has no pointer)
+    document, current_version = document_repository.get_document_with_current_version(
+        db, document_id
+    )
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
     if not current_version:
         raise HTTPException(status_code=404, detail="No version found for document")
     
-    return schemas.DocumentWithCurrentVersion(
+    result = schemas.DocumentWithCurrentVersion(
         id=document.id,
         title=document.title,
-        content=current_version.content,
+        content=version_store.get_version_content(db, current_version),
         version_number=current_version.version_number,
-        last_modified=current_version.created_at
+        last_modified=current_version.created_at,
+        content_hash=current_version.content_hash
     )
+    document_cache.put(document_id, pointer.current_version_id, pointer.updated_at, result)
+    return result
+
+
+def write_save(db: Session, document_id: int, content: str) -> tuple[dict, bool]:
+    """
+    Write an autosave of the document's current version, returns (response body, changed)
+    
+    Content identical to the stored content is not written and not committed.
+    """
+    # Update the current version's content (latest version if the document has no
+    # pointer) and the document's updated_at timestamp
+    document, current_version, changed = document_repository.save_current_version(
+        db, document_id, content
+    )
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not current_version:
+        raise HTTPException(status_code=404, detail="No version found for document")
+    
+    result = {
+        "document_id": document_id,
+        "version_number": current_version.version_number,
+        "content": content,
+        "etag": document_repository.content_etag(current_version.id, current_version.content_hash),
+    }
+    if changed:
+        db.commit()
+        document_cache.invalidate(document_id)
+    return result, changed
 
 
 @app.post("/save/{document_id}")
 def save(
-    document_id: int, request: schemas.CreateVersionRequest, db: Session = Depends(get_db)
+    document_id: int,
+    request: schemas.CreateVersionRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
 ):
     """
     Save document content (backward compatible)
@@ -186,67 +296,123 @@ def save(
     - Save by updating current active version content
     - Don't create new version, only update existing version
     
+    Autosave handling:
+    - Content identical to the stored content (same hash) is not written
+    - Bursts of saves of one document are merged into one write of the newest content
+      (see app.internal.autosave); the response describes what was written
+    - With If-Match set to the ETag of GET /document or of the previous save, a save based
+      on content that has changed since is rejected with 412 before anything is written
+    
     Fix variable name conflict:
     - Parameter name changed from document to request, avoid conflict with database object
     """
     try:
-        # Find the document
-        document = db.scalar(
-            select(models.Document)
-            .where(models.Document.id == document_id)
+        if if_match is not None:
+            state = document_repository.get_document_state(db, document_id)
+            if not state:
+                raise HTTPException(status_code=404, detail="Document not found")
+            etag = document_repository.content_etag(state.version_id, state.content_hash)
+            if not document_repository.etag_matches(if_match, etag):
+                raise HTTPException(
+                    status_code=412,
+                    detail="The document has changed since it was loaded"
+                )
+        
+        result = save_coalescer.save(
+            document_id, request.content, lambda content: write_save(db, document_id, content)
+        )
+        if result["etag"]:
+            response.headers["ETag"] = result["etag"]
+        return result
+        
+    except HTTPException:
+        raise
+    except version_store.ContentConflictError as e:
+        db.rollback()
+        logger.warning(f"Save conflict in save endpoint: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="The document was changed by another save. Reload it and retry."
+        )
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database operation failed in save endpoint: {e}")
+        raise HTTPException(
+            status_code=500, 
+            detail="Database operation failed. Changes have been rolled back."
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Unexpected error in save endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="An unexpected error occurred"
+        )
+
+
+@app.patch("/api/documents/{document_id}/content")
+def patch_document_content(
+    document_id: int,
+    request: schemas.PatchContentRequest,
+    response: Response,
+    db: Session = Depends(get_db)
+) -> schemas.PatchContentResponse:
+    """
+    Apply text splices to the current version's content
+    
+    The incremental counterpart of /save: the client sends what changed since
+    base_hash (the content_hash of a previous patch response, or the hash in the ETag of
+    GET /document) and the server rebuilds the content from the stored version.
+    - 409 if the document no longer is at base_hash - reload and send a full save
+    - 422 if a splice reaches past the end of the content
+    
+    Patches are not coalesced like /save: each one is based on the previous one's hash.
+    """
+    try:
+        document, current_version, changed = document_repository.patch_current_version(
+            db, document_id, request.base_hash,
+            [(splice.start, splice.delete, splice.insert) for splice in request.splices]
         )
         
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
-        
-        # Find current active version
-        current_version = None
-        if document.current_version_id:
-            current_version = db.scalar(
-                select(models.DocumentVersion)
-                .where(models.DocumentVersion.id == document.current_version_id)
-            )
-        
-        # If no current version, get latest version
-        if not current_version:
-            current_version = db.scalar(
-                select(models.DocumentVersion)
-                .where(models.DocumentVersion.document_id == document_id)
-                .order_by(models.DocumentVersion.version_number.desc())
-            )
-        
         if not current_version:
             raise HTTPException(status_code=404, detail="No version found for document")
         
-        # Update version content
-        db.execute(
-            update(models.DocumentVersion)
-            .where(models.DocumentVersion.id == current_version.id)
-            .values(content=request.content)
+        result = schemas.PatchContentResponse(
+            document_id=document_id,
+            version_number=current_version.version_number,
+            content_hash=current_version.content_hash,
         )
-        
-        # Update document's updated_at timestamp
-        db.execute(
-            update(models.Document)
-            .where(models.Document.id == document_id)
-            .values(updated_at=datetime.utcnow())
+        response.headers["ETag"] = document_repository.content_etag(
+            current_version.id, current_version.content_hash
         )
-        
-        db.commit()
-        return {"document_id": document_id, "version_number": current_version.version_number, "content": request.content}
+        if changed:
+            db.commit()
+            document_cache.invalidate(document_id)
+        return result
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except version_store.ContentConflictError as e:
+        db.rollback()
+        logger.info(f"Patch conflict in patch_document_content endpoint: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="The document has changed since base_hash. Reload it and retry."
+        )
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Database operation failed in save endpoint: {e}")
+        logger.error(f"Database operation failed in patch_document_content endpoint: {e}")
         raise HTTPException(
             status_code=500, 
             detail="Database operation failed. Changes have been rolled back."
         )
     except Exception as e:
         db.rollback()
-        logger.error(f"Unexpected error in save endpoint: {e}")
+        logger.error(f"Unexpected error in patch_document_content endpoint: {e}")
         raise HTTPException(
             status_code=500,
             detail="An unexpected error occurred"
@@ -277,40 +443,210 @@ def get_all_documents(db: Session = Depends(get_db)):
         for doc in documents
     ]
 
+
+# Registered before the /api/documents/{document_id} routes, which would take "batch" or
+# "import" for an id
+@app.get("/api/documents/batch")
+def get_documents_batch(
+    ids: list[int] = Query([], max_length=schemas.MAX_BATCH_DOCUMENTS),
+    db: Session = Depends(get_db)
+) -> schemas.BatchDocumentsResponse:
+    """
+    Several documents with their current version content in one request
+    
+    Replaces one /document/{id} round trip per document: all documents and their
+    current versions are read in one query, and contents not already cached are read
+    in batches. Pass ids repeatedly (?ids=1&ids=2); documents come back in that order.
+    """
+    if not ids:
+        raise HTTPException(status_code=422, detail="At least one document id is required")
+    
+    requested = list(dict.fromkeys(ids))
+    found = document_repository.get_documents_with_current_versions(db, requested)
+    contents = version_store.get_versions_content(
+        db, [version for _, version in found.values() if version is not None]
+    )
+    
+    documents, missing = [], []
+    for document_id in requested:
+        document, version = found.get(document_id, (None, None))
+        if document is None or version is None:
+            missing.append(document_id)
+            continue
+        documents.append(schemas.DocumentWithCurrentVersion(
+            id=document.id,
+            title=document.title,
+            content=contents[version.id],
+            version_number=version.version_number,
+            last_modified=version.created_at,
+            content_hash=version.content_hash
+        ))
+    
+    return schemas.BatchDocumentsResponse(documents=documents, missing=missing)
+
+
+@app.post("/api/documents/batch/versions")
+def create_versions_batch(
+    request: schemas.BatchCreateVersionsRequest, db: Session = Depends(get_db)
+) -> schemas.BatchCreateVersionsResponse:
+    """
+    Create a new version of many documents in one transaction
+    
+    Same rules as POST /api/documents/{id}/versions for each item, but the documents are
+    looked up in one query and everything is committed once: either every document gets
+    its new version or none does.
+    """
+    try:
+        document_ids = [item.document_id for item in request.versions]
+        if len(set(document_ids)) != len(document_ids):
+            raise HTTPException(
+                status_code=422, detail="Each document can only appear once in a batch"
+            )
+        
+        found = document_repository.get_documents_for_new_versions(db, document_ids)
+        missing = [document_id for document_id in document_ids if document_id not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Documents not found: {missing}")
+        
+        # Current contents of the documents whose new version is a copy
+        copied = version_store.get_versions_content(db, [
+            found[item.document_id][1] for item in request.versions
+            if not item.content and found[item.document_id][1] is not None
+        ])
+        
+        created = []
+        for item in request.versions:
+            document, current_version, max_version = found[item.document_id]
+            content = item.content or (copied[current_version.id] if current_version else "")
+            new_version = models.DocumentVersion(
+                document_id=document.id,
+                version_number=max_version + 1,
+                created_at=datetime.utcnow()
+            )
+            version_store.add_version(db, new_version, content)
+            document_repository.point_document_at(document, new_version)
+            created.append(schemas.BatchCreatedVersion(
+                document_id=document.id,
+                version_id=new_version.id,
+                version_number=new_version.version_number,
+                content_hash=new_version.content_hash
+            ))
+        
+        db.commit()
+        for document_id in document_ids:
+            document_cache.invalidate(document_id)
+        
+        return schemas.BatchCreateVersionsResponse(versions=created)
+        
+    except HTTPException:
+        raise
+    except IntegrityError as e:
+        db.rollback()
+        logger.warning(f"Version number conflict in create_versions_batch endpoint: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="Another version was created at the same time. Please retry."
+        )
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Database operation failed in create_versions_batch endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Database operation failed. Changes have been rolled back."
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Unexpected error in create_versions_batch endpoint: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="An unexpected error occurred"
+        )
+
+
+@app.post("/api/documents/import")
+async def import_documents(
+    request: Request, db: Session = Depends(get_db)
+) -> schemas.DocumentImportReport:
+    """
+    Bulk import documents from an NDJSON body, one {"content": "<html>", "title": ...} per line
+    
+    The body is parsed as it streams in and written in batches of IMPORT_BATCH_SIZE
+    documents, one transaction each, with titles and content prepared in the shared
+    process pool (import_pool, app/internal/document_import.py). title is optional and
+    scanned from the HTML when missing. Invalid lines are skipped and reported; batches
+    already written stay imported.
+    """
+    decoder = NdjsonDecoder()
+    with DocumentImporter(db, pool=import_pool) as importer:
+        pending = []
+        async for chunk in request.stream():
+            pending.extend(decoder.feed(chunk))
+            while len(pending) >= importer.batch_size:
+                batch, pending = pending[:importer.batch_size], pending[importer.batch_size:]
+                await run_in_threadpool(importer.import_batch, batch)
+        pending.extend(decoder.close())
+        await run_in_threadpool(importer.import_batch, pending)
+    
+    report = importer.report
+    if not report.documents and not report.skipped:
+        raise HTTPException(status_code=422, detail="The request body holds no documents")
+    return schemas.DocumentImportReport(
+        documents=report.documents,
+        skipped=report.skipped,
+        batches=report.batches,
+        seconds=report.seconds,
+        docs_per_second=report.docs_per_second,
+        document_ids=report.document_ids,
+        errors=report.errors
+    )
+
+
 @app.get("/api/documents/{document_id}")
 def get_document_with_versions(
-    document_id: int, db: Session = Depends(get_db)
+    document_id: int,
+    response: Response,
+    metadata_only: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
 ) -> schemas.DocumentRead:
     """
     Get document and all its version history
     
     This endpoint is specifically for version management functionality:
     - Returns complete document information
-    - Contains list of all versions
+    - Contains list of all versions (without content when metadata_only is set)
     - Indicates currently active version
+    - If-None-Match / If-Modified-Since are answered with 304 without reading content
     """
-    document = db.scalar(
-        select(models.Document)
-        .where(models.Document.id == document_id)
+    document, current_version, etag = document_repository.get_document_with_history_etag(
+        db, document_id
     )
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Get all versions (sorted by version number)
-    versions = db.scalars(
-        select(models.DocumentVersion)
-        .where(models.DocumentVersion.document_id == document_id)
-        .order_by(models.DocumentVersion.version_number.desc())
-    ).all()
+    not_modified = not_modified_response(
+        response, etag, document.updated_at, if_none_match, if_modified_since
+    )
+    if not_modified:
+        return not_modified
+    # Only the version the document actually points at is reported as current
+    if current_version and current_version.id != document.current_version_id:
+        current_version = None
     
-    # Get current version
-    current_version = None
-    if document.current_version_id:
-        current_version = db.scalar(
-            select(models.DocumentVersion)
-            .where(models.DocumentVersion.id == document.current_version_id)
-        )
+    # Get all versions (sorted by version number)
+    if metadata_only:
+        versions = list_version_metadata(db, document)
+    else:
+        versions = [
+            serialize_version(db, v, document.current_version_id)
+            for v in db.scalars(
+                select(models.DocumentVersion)
+                .where(models.DocumentVersion.document_id == document_id)
+                .order_by(models.DocumentVersion.version_number.desc())
+            )
+        ]
     
     return schemas.DocumentRead(
         id=document.id,
@@ -318,8 +654,11 @@ def get_document_with_versions(
         current_version_id=document.current_version_id,
         created_at=document.created_at,
         updated_at=document.updated_at,
-        versions=[schemas.DocumentVersionRead.model_validate(v) for v in versions],
-        current_version=schemas.DocumentVersionRead.model_validate(current_version) if current_version else None
+        versions=versions,
+        current_version=(
+            serialize_version(db, current_version, document.current_version_id)
+            if current_version else None
+        )
     )
 
 
@@ -335,77 +674,58 @@ def create_version(
     Logic for creating new version:
     1. Find document
     2. Calculate new version number (max version number + 1)  
-    3. If no content provided, copy content from current active version
-    4. Set all existing versions to inactive
-    5. Create new version and set as active
-    6. Update document's current version pointer
+    3. If no content provided, copy content from current version
+    4. Create new version
+    5. Point the document at the new version
     """
     try:
-        # Find the document
-        document = db.scalar(
-            select(models.Document)
-            .where(models.Document.id == document_id)
+        # Find the document, its current version and maximum version number
+        document, current_version, max_version = (
+            document_repository.get_document_for_new_version(db, document_id)
         )
         
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        # Get maximum version number
-        max_version = db.scalar(
-            select(models.DocumentVersion.version_number)
-            .where(models.DocumentVersion.document_id == document_id)
-            .order_by(models.DocumentVersion.version_number.desc())
-        ) or 0
-        
         new_version_number = max_version + 1
         
-        # Get current active version content for copying
+        # Get current version content for copying
         current_version_content = ""
-        if not request.content:  # If no content provided, copy from current active version
-            current_active_version = db.scalar(
-                select(models.DocumentVersion)
-                .where(models.DocumentVersion.document_id == document_id)
-                .where(models.DocumentVersion.is_active == True)
-            )
-            if current_active_version:
-                current_version_content = current_active_version.content
+        if not request.content:  # If no content provided, copy from current version
+            if current_version:
+                current_version_content = version_store.get_version_content(db, current_version)
         
-        # Set all existing versions to inactive
-        db.execute(
-            update(models.DocumentVersion)
-            .where(models.DocumentVersion.document_id == document_id)
-            .values(is_active=False)
-        )
-        
-        # Create new version (copy from current active version if no content provided)
+        # Create new version (copy from current version if no content provided)
         new_version = models.DocumentVersion(
             document_id=document_id,
             version_number=new_version_number,
-            content=request.content if request.content else current_version_content,
-            is_active=True,
             created_at=datetime.utcnow()
         )
         
-        db.add(new_version)
-        db.flush()  # Get new version's ID
+        # Stored in full; the previous newest version becomes a reverse delta against it
+        version_store.add_version(
+            db, new_version, request.content if request.content else current_version_content
+        )
         
         # Update document's current version pointer
-        db.execute(
-            update(models.Document)
-            .where(models.Document.id == document_id)
-            .values(
-                current_version_id=new_version.id,
-                updated_at=datetime.utcnow()
-            )
-        )
+        document_repository.point_document_at(document, new_version)
+        response = serialize_version(db, new_version, new_version.id)
         
         db.commit()
-        db.refresh(new_version)
+        document_cache.invalidate(document_id)
         
-        return schemas.DocumentVersionRead.model_validate(new_version)
+        return response
         
     except HTTPException:
         raise
+    except IntegrityError as e:
+        # Unique (document_id, version_number) - another request created this number first
+        db.rollback()
+        logger.warning(f"Version number conflict in create_version endpoint: {e}")
+        raise HTTPException(
+            status_code=409,
+            detail="Another version was created at the same time. Please retry."
+        )
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Database operation failed in create_version endpoint: {e}")
@@ -433,67 +753,36 @@ def switch_version(
     
     Logic for switching version:
     1. Verify document and version exist
-    2. Set all versions to inactive
-    3. Activate specified version
-    4. Update document's current version pointer
-    5. Return document information after switch
+    2. Update document's current version pointer - the only row written
+    3. Return document information after switch
     """
     try:
-        # Find the document
-        document = db.scalar(
-            select(models.Document)
-            .where(models.Document.id == document_id)
+        # Find the document and the specified version
+        document, target_version = document_repository.get_document_with_version(
+            db, document_id, request.version_number
         )
         
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
-        
-        # Find specified version
-        target_version = db.scalar(
-            select(models.DocumentVersion)
-            .where(
-                models.DocumentVersion.document_id == document_id,
-                models.DocumentVersion.version_number == request.version_number
-            )
-        )
-        
         if not target_version:
             raise HTTPException(status_code=404, detail=f"Version {request.version_number} not found")
         
-        # Set all versions to inactive
-        db.execute(
-            update(models.DocumentVersion)
-            .where(models.DocumentVersion.document_id == document_id)
-            .values(is_active=False)
-        )
-        
-        # Activate target version
-        db.execute(
-            update(models.DocumentVersion)
-            .where(models.DocumentVersion.id == target_version.id)
-            .values(is_active=True)
-        )
-        
         # Update document's current version pointer
-        db.execute(
-            update(models.Document)
-            .where(models.Document.id == document_id)
-            .values(
-                current_version_id=target_version.id,
-                updated_at=datetime.utcnow()
-            )
-        )
-        
-        db.commit()
-        
-        return schemas.DocumentWithCurrentVersion(
+        document_repository.point_document_at(document, target_version)
+        response = schemas.DocumentWithCurrentVersion(
             id=document.id,
             title=document.title,
-            content=target_version.content,
+            content=version_store.get_version_content(db, target_version),
             version_number=target_version.version_number,
-            last_modified=target_version.created_at
+            last_modified=target_version.created_at,
+            content_hash=target_version.content_hash
         )
         
+        db.commit()
+        document_cache.invalidate(document_id)
+        
+        return response
+        
     except HTTPException:
         raise
     except SQLAlchemyError as e:
@@ -514,32 +803,111 @@ def switch_version(
 
 @app.get("/api/documents/{document_id}/versions")
 def get_versions(
-    document_id: int, db: Session = Depends(get_db)
-) -> list[schemas.DocumentVersionRead]:
+    document_id: int,
+    response: Response,
+    metadata_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+) -> list[Union[schemas.DocumentVersionRead, schemas.DocumentVersionMetadata]]:
     """
     Get a list of all versions for a document.
 
     This endpoint is specifically for displaying version history:
     - Only returns version information, does not include document information.
     - Sorted by version number in descending order (newest version first).
+    - metadata_only=true returns id, number, date, size and hash without content;
+      fetch a version's content from /api/documents/{id}/versions/{number}
+    - limit and before page through the list: pass the last version_number of a page
+      as before to get the next one
+    - If-None-Match / If-Modified-Since are answered with 304 without reading content
     """
-    # Verify the document exists
-    document = db.scalar(
-        select(models.Document)
-        .where(models.Document.id == document_id)
-    )
+    # Verify the document exists, and whether the client's copy is still current
+    document, _, etag = document_repository.get_document_with_history_etag(db, document_id)
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
+    not_modified = not_modified_response(
+        response, etag, document.updated_at, if_none_match, if_modified_since
+    )
+    if not_modified:
+        return not_modified
+    
+    if metadata_only:
+        return list_version_metadata(db, document, limit=limit, before=before)
+    
     # Get all versions
-    versions = db.scalars(
+    query = (
         select(models.DocumentVersion)
         .where(models.DocumentVersion.document_id == document_id)
         .order_by(models.DocumentVersion.version_number.desc())
-    ).all()
+    )
+    if before is not None:
+        query = query.where(models.DocumentVersion.version_number < before)
+    if limit is not None:
+        query = query.limit(limit)
+    
+    return [serialize_version(db, v, document.current_version_id) for v in db.scalars(query)]
+
+
+@app.get("/api/documents/{document_id}/versions/{version_number}")
+def get_version(
+    document_id: int, version_number: int, db: Session = Depends(get_db)
+) -> schemas.DocumentVersionRead:
+    """
+    Get one version with its content
+    
+    Pairs with the metadata-only listing: the history panel lists versions without
+    content and fetches a version's content only when it is opened.
+    """
+    document, version = document_repository.get_document_with_version(
+        db, document_id, version_number
+    )
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not version:
+        raise HTTPException(status_code=404, detail=f"Version {version_number} not found")
+    
+    return serialize_version(db, version, document.current_version_id)
+
+
+@app.get("/api/documents/{document_id}/diff")
+def get_version_diff(
+    document_id: int,
+    from_version: int = Query(..., alias="from"),
+    to_version: int = Query(..., alias="to"),
+    db: Session = Depends(get_db)
+) -> schemas.VersionDiff:
+    """
+    Word-level diff between two versions of a document
     
-    return [schemas.DocumentVersionRead.model_validate(v) for v in versions]
+    Compares the plain text of both versions and returns only the changed regions, so
+    the response grows with the change rather than with the document. Diffs are cached
+    by the pair of content hashes: comparing the same contents again reads no content.
+    """
+    document, old, new = document_repository.get_document_with_version_pair(
+        db, document_id, from_version, to_version
+    )
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    for number, version in ((from_version, old), (to_version, new)):
+        if not version:
+            raise HTTPException(status_code=404, detail=f"Version {number} not found")
+    
+    return schemas.VersionDiff(
+        document_id=document_id,
+        from_version=from_version,
+        to_version=to_version,
+        from_hash=old.content_hash,
+        to_hash=new.content_hash,
+        hunks=[
+            schemas.VersionDiffHunk(**hunk._asdict())
+            for hunk in version_diff.diff_versions(db, old, new)
+        ],
+    )
 
 
 @app.delete("/api/documents/{document_id}/versions/{version_number}")
@@ -555,69 +923,42 @@ def delete_version(
     1. Verify document exists
     2. Check if there are at least 2 versions (can't delete last version)
     3. Verify the version to delete exists
-    4. Check if the version to delete is the current active version
-    5. If it's the active version, switch to latest other version first
+    4. Check if the version to delete is the document's current version
+    5. If it's the current version, switch to latest other version first
     6. Delete specified version
     """
     try:
-        # Find the document
-        document = db.scalar(
-            select(models.Document)
-            .where(models.Document.id == document_id)
-        )
+        # Find the document, version count, version to delete and latest other version
+        deletion = document_repository.get_version_for_deletion(db, document_id, version_number)
         
-        if not document:
+        if not deletion:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        # Check total version count
-        version_count = db.scalar(
-            select(func.count(models.DocumentVersion.id))
-            .where(models.DocumentVersion.document_id == document_id)
-        )
+        document, target_version = deletion.document, deletion.target
         
-        if version_count <= 1:
+        if deletion.version_count <= 1:
             raise HTTPException(
                 status_code=400, 
                 detail="Cannot delete the last remaining version"
             )
         
-        # Find version to delete
-        target_version = db.scalar(
-            select(models.DocumentVersion)
-            .where(
-                models.DocumentVersion.document_id == document_id,
-                models.DocumentVersion.version_number == version_number
-            )
-        )
-        
         if not target_version:
             raise HTTPException(
                 status_code=404, 
                 detail=f"Version {version_number} not found"
             )
         
-        # If deleting current active version, need to switch to other version first
-        if target_version.is_active:
-            # Find latest other version
-            alternative_version = db.scalar(
-                select(models.DocumentVersion)
-                .where(
-                    models.DocumentVersion.document_id == document_id,
-                    models.DocumentVersion.id != target_version.id
-                )
-                .order_by(models.DocumentVersion.version_number.desc())
-            )
-            
-            if alternative_version:
-                # Activate alternative version
-                alternative_version.is_active = True
-                # Update document's current version pointer
-                document.current_version_id = alternative_version.id
-                document.updated_at = datetime.utcnow()
-        
-        # Delete target version
-        db.delete(target_version)
+        # If deleting the current version, need to switch to other version first
+        if document.current_version_id == target_version.id and deletion.alternative_id:
+            # Update document's current version pointer
+            document.current_version_id = deletion.alternative_id
+        # The version history changed, so does the document's Last-Modified
+        document.updated_at = datetime.utcnow()
+        
+        # Delete it and release its content blob unless another version shares it
+        version_store.delete_version(db, target_version)
         db.commit()
+        document_cache.invalidate(document_id)
         
         return {"message": f"Version {version_number} deleted successfully"}
         
@@ -639,6 +980,43 @@ def delete_version(
         )
 
 
+@app.get("/api/search")
+def search_documents(
+    q: str = Query(..., min_length=1, max_length=500),
+    kind: str = Query("all", pattern="^(all|versions|chat)$"),
+    document_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+) -> schemas.SearchResponse:
+    """
+    Full-text search over version content and chat history
+    
+    - Results are ranked best match first (bm25); versions and chat messages share one list
+      unless kind narrows it down
+    - Snippets are HTML-escaped with the matched terms wrapped in <mark>
+    - Words are ANDed, "quoted phrases" match as phrases and a trailing * searches by prefix
+    - limit and offset page through the results, has_more tells whether there is a next page
+    """
+    try:
+        results, has_more = search_index.search(
+            db, q, kind=kind, document_id=document_id, limit=limit, offset=offset
+        )
+    except search_index.SearchUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except SQLAlchemyError as e:
+        logger.error(f"Database operation failed in search endpoint: {e}")
+        raise HTTPException(status_code=500, detail="Search failed")
+    
+    return schemas.SearchResponse(
+        query=q,
+        results=[schemas.SearchResult(**result) for result in results],
+        limit=limit,
+        offset=offset,
+        has_more=has_more,
+    )
+
+
 
 # Try to import enhanced endpoints (if available)
 try:
@@ -648,6 +1026,7 @@ try:
         ChatRequest,
         unified_chat_websocket_endpoint,
         load_chat_history_for_version,
+        stream_chat_history_for_version,
         handle_suggestion_card_action,
         clear_chat_history_for_version
     )
@@ -669,8 +1048,17 @@ try:
     
     # Register chat history endpoints
     @app.get("/api/chat/history/{document_id}/{version_number}")
-    async def get_chat_history(document_id: int, version_number: str):
-        return await load_chat_history_for_version(document_id, version_number)
+    async def get_chat_history(
+        document_id: int,
+        version_number: str,
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: Optional[str] = None
+    ):
+        return await load_chat_history_for_version(document_id, version_number, limit, cursor)
+    
+    @app.get("/api/chat/history/{document_id}/{version_number}/stream")
+    async def stream_chat_history(document_id: int, version_number: str):
+        return stream_chat_history_for_version(document_id, version_number)
     
     @app.post("/api/chat/suggestion-action/{document_id}/{version_number}/{message_id}")
     async def suggestion_card_action(document_id: int, version_number: str, 
@@ -712,20 +1100,13 @@ async def export_document_to_pdf(
     try:
         logger.info(f"Starting PDF export for document {document_id}...")
         
-        # 1. Get document
-        document = db.scalar(select(models.Document).where(models.Document.id == document_id))
+        # 1. Get document and its current version
+        document, current_version = document_repository.get_document_with_current_version(
+            db, document_id
+        )
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        # 2. Get current active version
-        current_version = db.scalar(
-            select(models.DocumentVersion)
-            .where(
-                models.DocumentVersion.document_id == document_id,
-                models.DocumentVersion.is_active == True
-            )
-        )
-        
         if not current_version:
             raise HTTPException(status_code=404, detail="No active version found")
         
@@ -741,7 +1122,8 @@ async def export_document_to_pdf(
         
         # 4. Generate PDF
         exporter = PDFExporter()
-        filename = await exporter.export_document(document, current_version)
+        content = version_store.get_version_content(db, current_version)
+        filename = await exporter.export_document(document, current_version, content=content)
         
         # 5. Schedule file cleanup (after 24 hours)
         background_tasks.add_task(cleanup_pdf_file, filename, delay_hours=24)
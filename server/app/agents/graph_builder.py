@@ -7,7 +7,7 @@ all agents and handles the complete chat and analysis pipeline.
 
 import logging
 import operator
-from typing import Dict, Any, Optional, Annotated
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Annotated
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage, SystemMessage
@@ -19,13 +19,23 @@ from .technical_agent import technical_analysis_node
 from .legal_agent import legal_analysis_node
 from .novelty_agent import novelty_analysis_node
 from .lead_agent import lead_evaluation_node
-from .mapping_agent import mapping_analysis_node
+from .mapping_agent import SUGGESTION_CARDS_EVENT, mapping_analysis_node
+from ..internal.llm_stream import ASSISTANT_DELTA_EVENT, complete_text
 from ..internal.mermaid_render import generate_mermaid_node
 from ..internal.text_utils import html_to_plain_text, create_chunks_from_text, convert_chunks_to_full_text
 from ..internal.suggestion_generator import generate_suggestions_from_chunk_mapping
 
 logger = logging.getLogger(__name__)
 
+# node_callback(node, "start" | "end", state update) - see execute_chat_workflow
+NodeCallback = Callable[[str, str, Dict[str, Any]], Awaitable[None]]
+
+# delta_callback(node, text) - see execute_chat_workflow
+DeltaCallback = Callable[[str, str], Awaitable[None]]
+
+# cards_callback(node, cards) - see execute_chat_workflow
+CardsCallback = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
 
 class ChatWorkflowState(TypedDict):
     """
@@ -41,7 +51,8 @@ class ChatWorkflowState(TypedDict):
     version_number: Optional[str]
     openai_client: Any
     intent: Optional[str]
-    progress_callback: Optional[Any]  # Callback for progress updates
+    stream_deltas: Optional[bool]  # Answering nodes stream their text, see llm_stream
+    stream_cards: Optional[bool]  # The mapping agent streams suggestion cards as it maps chunks
     
     # Fields that may be updated by parallel nodes (need reducers)
     technical_suggestions: Annotated[list, operator.add]
@@ -59,6 +70,7 @@ class ChatWorkflowState(TypedDict):
     final_improved_document: Optional[str]
     chunk_mapping: Optional[Dict[str, Any]]
     suggested_chunks: Optional[list]  # Store chunks to maintain ID consistency
+    suggestion_cards: Optional[list]  # Cards already streamed for the whole chunk_mapping
     
     # Optional workflow fields
     intent_confidence: Optional[str]
@@ -271,10 +283,6 @@ async def handle_casual_chat_node(state: ChatWorkflowState) -> ChatWorkflowState
         Updated state with casual chat response
     """
     try:
-        # Send progress update for agent selection
-        if state.get("progress_callback"):
-            await state["progress_callback"]("agent_selection", "system", "casual_chat")
-            
         logger.info("Handling casual chat")
         
         user_input = state.get("user_input", "")
@@ -290,8 +298,10 @@ async def handle_casual_chat_node(state: ChatWorkflowState) -> ChatWorkflowState
                 }]
             }
         
-        # Generate casual chat response
-        response = await openai_client.chat.completions.create(
+        # Generate casual chat response, streamed out as it is written when asked to
+        chat_response = await complete_text(
+            openai_client,
+            stream=bool(state.get("stream_deltas")),
             model=os.getenv("OPENAI_MODEL", "gpt-4.1"),
             temperature=0.7,  # Higher temperature for more conversational responses
             max_tokens=300,
@@ -308,12 +318,6 @@ async def handle_casual_chat_node(state: ChatWorkflowState) -> ChatWorkflowState
             ]
         )
         
-        chat_response = response.choices[0].message.content
-        
-        # Send progress update for finalizing results
-        if state.get("progress_callback"):
-            await state["progress_callback"]("finalizing_results", "system", "casual_chat")
-        
         return {
             **state,
             "messages": [{
@@ -347,10 +351,6 @@ async def recruit_agents_node(state: ChatWorkflowState) -> ChatWorkflowState:
         Updated state with agent recruitment information
     """
     try:
-        # Send progress update
-        if state.get("progress_callback"):
-            await state["progress_callback"]("agent_selection", "lead", state.get("intent", "document_analysis"))
-            
         logger.info("Recruiting specialized agents for analysis")
         
         # Check if document is ready for analysis
@@ -448,10 +448,6 @@ async def format_final_response_node(state: ChatWorkflowState) -> ChatWorkflowSt
         Final state with formatted response messages
     """
     try:
-        # Send progress update for finalizing results
-        if state.get("progress_callback"):
-            await state["progress_callback"]("finalizing_results", "system", state.get("intent", "document_analysis"))
-            
         logger.info("Formatting final response")
         
         # Get chunk mapping and generate suggestions
@@ -464,12 +460,12 @@ async def format_final_response_node(state: ChatWorkflowState) -> ChatWorkflowSt
         suggestions = []
         suggested_chunks = state.get("suggested_chunks", [])
         
-        if chunk_mapping and original_chunks and suggested_chunks:
+        if state.get("suggestion_cards") is not None:
+            # Built and streamed by the mapping agent entry by entry, keep them (and their IDs)
+            suggestions = state["suggestion_cards"]
+            logger.info(f"Using {len(suggestions)} suggestion cards streamed during mapping")
+        elif chunk_mapping and original_chunks and suggested_chunks:
             try:
-                # Send progress update for generating suggestions
-                if state.get("progress_callback"):
-                    await state["progress_callback"]("generating_suggestions", "lead", state.get("intent", "document_analysis"))
-                
                 # Use stored suggested chunks to maintain ID consistency
                 logger.info(f"Using stored suggested chunks: {len(suggested_chunks)} chunks")
                 
@@ -552,11 +548,67 @@ async def format_final_response_node(state: ChatWorkflowState) -> ChatWorkflowSt
         }
 
 
+async def run_with_node_events(workflow, initial_state: ChatWorkflowState,
+                               node_callback: Optional[NodeCallback] = None,
+                               delta_callback: Optional[DeltaCallback] = None,
+                               cards_callback: Optional[CardsCallback] = None) -> Dict[str, Any]:
+    """
+    Run a compiled workflow through astream_events, calling node_callback as nodes start and end.
+    
+    Only the workflow's own nodes are reported - not routing functions or anything a
+    node runs inside. Text deltas a node streams (llm_stream.complete_text) go to
+    delta_callback, suggestion cards the mapping agent streams go to cards_callback, as
+    they arrive. Errors raised by a callback are logged, they never stop the workflow.
+    
+    Returns:
+        Final workflow state, as ainvoke() returns it
+    """
+    result = None
+    async for event in workflow.astream_events(initial_state, version="v2"):
+        kind = event["event"]
+        if kind == "on_custom_event":
+            node = event.get("metadata", {}).get("langgraph_node")
+            try:
+                if delta_callback is not None and event["name"] == ASSISTANT_DELTA_EVENT:
+                    await delta_callback(node, event["data"]["delta"])
+                elif cards_callback is not None and event["name"] == SUGGESTION_CARDS_EVENT:
+                    await cards_callback(node, event["data"]["cards"])
+            except Exception as e:
+                logger.error(f"Callback for {event['name']} from {node} failed: {e}")
+            continue
+        if kind not in ("on_chain_start", "on_chain_end"):
+            continue
+        
+        parent_ids = event.get("parent_ids") or []
+        if not parent_ids:
+            # The graph run itself - its output is the final state
+            if kind == "on_chain_end":
+                result = event["data"].get("output")
+            continue
+        
+        node = event.get("metadata", {}).get("langgraph_node")
+        if node_callback is None or len(parent_ids) != 1 or event["name"] != node:
+            continue
+        
+        if kind == "on_chain_start":
+            phase, update = "start", {}
+        else:
+            output = event["data"].get("output")
+            phase, update = "end", output if isinstance(output, dict) else {}
+        try:
+            await node_callback(node, phase, update)
+        except Exception as e:
+            logger.error(f"Node callback failed for {node} {phase}: {e}")
+    
+    return result
+
+
 def create_initial_state(user_input: str, document_content: str = "",
                         document_id: Optional[int] = None,
                         version_number: Optional[str] = None,
                         chat_history: Optional[list] = None,
-                        progress_callback: Optional[callable] = None) -> ChatWorkflowState:
+                        stream_deltas: bool = False,
+                        stream_cards: bool = False) -> ChatWorkflowState:
     """
     Create initial state for the workflow that matches ChatWorkflowState structure.
     
@@ -566,6 +618,8 @@ def create_initial_state(user_input: str, document_content: str = "",
         document_id: Document ID (if any)
         version_number: Document version (if any)
         chat_history: Previous chat history (if any)
+        stream_deltas: Whether answering nodes stream their text as they write it
+        stream_cards: Whether suggestion cards are streamed as chunk mappings arrive
         
     Returns:
         Initial workflow state
@@ -582,7 +636,8 @@ def create_initial_state(user_input: str, document_content: str = "",
         "version_number": version_number,
         "openai_client": openai_client,
         "intent": None,
-        "progress_callback": progress_callback,
+        "stream_deltas": stream_deltas,
+        "stream_cards": stream_cards,
         
         # Fields with reducers (start as empty lists)
         "technical_suggestions": [],
@@ -602,6 +657,7 @@ def create_initial_state(user_input: str, document_content: str = "",
         "agents_recruited": None,
         "recruitment_complete": None,
         "final_analysis": None,
+        "suggestion_cards": None,
         "error": None
     }
     
@@ -612,7 +668,9 @@ async def execute_chat_workflow(user_input: str, document_content: str = "",
                                document_id: Optional[int] = None,
                                version_number: Optional[str] = None,
                                chat_history: Optional[list] = None,
-                               progress_callback: Optional[callable] = None) -> Dict[str, Any]:
+                               node_callback: Optional[NodeCallback] = None,
+                               delta_callback: Optional[DeltaCallback] = None,
+                               cards_callback: Optional[CardsCallback] = None) -> Dict[str, Any]:
     """
     Execute the complete chat workflow.
     
@@ -622,7 +680,15 @@ async def execute_chat_workflow(user_input: str, document_content: str = "",
         document_id: Document ID
         version_number: Document version
         chat_history: Previous chat history
-        progress_callback: Optional callback for progress updates
+        node_callback: Optional coroutine function told about every workflow node as it
+            runs: node_callback(node, "start", {}) when the node starts and
+            node_callback(node, "end", update) when it finishes with its state update
+        delta_callback: Optional coroutine function called as delta_callback(node, text)
+            with each piece of the reply while casual chat or diagram generation writes it;
+            the final result still carries the complete messages
+        cards_callback: Optional coroutine function called as cards_callback(node, cards)
+            with the suggestion cards of each original chunk as soon as the mapping agent
+            has mapped it; the final suggestion_cards message still carries all of them
         
     Returns:
         Workflow execution result
@@ -640,7 +706,8 @@ async def execute_chat_workflow(user_input: str, document_content: str = "",
             document_id=document_id,
             version_number=version_number,
             chat_history=chat_history,
-            progress_callback=progress_callback
+            stream_deltas=delta_callback is not None,
+            stream_cards=cards_callback is not None
         )
         
         # Add debug logging
@@ -648,8 +715,13 @@ async def execute_chat_workflow(user_input: str, document_content: str = "",
         logger.info(f"Initial document_content length: {len(initial_state.get('document_content', ''))}")
         logger.info(f"User input: {initial_state.get('user_input', 'None')[:100]}...")
         
-        # Execute workflow
-        result = await workflow.ainvoke(initial_state)
+        # Execute workflow, reporting node events and deltas as they happen if anyone listens
+        if node_callback is None and delta_callback is None and cards_callback is None:
+            result = await workflow.ainvoke(initial_state)
+        else:
+            result = await run_with_node_events(
+                workflow, initial_state, node_callback, delta_callback, cards_callback
+            )
         
         # Debug the result
         logger.info(f"Workflow result keys: {result.keys() if result else 'None'}")
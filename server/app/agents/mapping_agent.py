@@ -8,15 +8,23 @@ unique suggestion card generation.
 
 import logging
 import json
-from typing import Dict, Any, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from langchain_core.callbacks import adispatch_custom_event
 from openai import AsyncOpenAI
 
 from .base_agent import BaseAgent, AnalysisContext
 from ..internal.chunk_manager import DocumentChunk
-from ..internal.text_utils import create_chunks_from_text
+from ..internal.suggestion_generator import generate_suggestions_from_chunk_mapping
+from ..internal.text_utils import StreamingObjectMembers, create_chunks_from_text
 
 logger = logging.getLogger(__name__)
 
+# Custom event carrying {"cards": [...]} for one resolved original chunk
+SUGGESTION_CARDS_EVENT = "suggestion_cards"
+
+# on_entry(original_chunk_id, mapping_data) - see MappingAgent.create_chunk_mapping
+MappingEntryCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
 
 class MappingAgent(BaseAgent):
     """
@@ -95,11 +103,14 @@ Return ONLY a valid JSON object in this exact format (NO markdown formatting):
   }
 }
 """
-    
-    
-    async def create_chunk_mapping(self, original_chunks: List[Dict[str, Any]], 
-                                  suggested_chunks: List[Dict[str, Any]],
-                                  context: AnalysisContext) -> Dict[str, Any]:
+
+    async def create_chunk_mapping(
+        self,
+        original_chunks: List[Dict[str, Any]],
+        suggested_chunks: List[Dict[str, Any]],
+        context: AnalysisContext,
+        on_entry: Optional[MappingEntryCallback] = None,
+    ) -> Dict[str, Any]:
         """
         Create mapping between original and suggested chunks.
         
@@ -107,6 +118,10 @@ Return ONLY a valid JSON object in this exact format (NO markdown formatting):
             original_chunks: List of original document chunks (as dicts)
             suggested_chunks: List of suggested document chunks (as dicts)  
             context: Analysis context
+            on_entry: Optional coroutine function; when given, the mapping is streamed and
+                on_entry(original_chunk_id, mapping_data) is awaited for each valid entry
+                as soon as it arrives. The returned mapping is authoritative - it may be
+                a fallback mapping if the complete response turns out to be invalid.
             
         Returns:
             Chunk mapping dictionary with severity and confidence scores
@@ -128,14 +143,18 @@ Return ONLY a valid JSON object in this exact format (NO markdown formatting):
             ]
             
             # Call OpenAI API for chunk mapping
-            response = await self.openai_client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.1,  # Low temperature for consistent mapping
-                max_tokens=3000
-            )
-            
-            mapping_response = response.choices[0].message.content.strip()
+            if on_entry is None:
+                response = await self.openai_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.1,  # Low temperature for consistent mapping
+                    max_tokens=3000
+                )
+                mapping_response = response.choices[0].message.content.strip()
+            else:
+                mapping_response = (await self._stream_mapping(
+                    messages, original_chunks, suggested_chunks, on_entry
+                )).strip()
             
             # Parse JSON response
             try:
@@ -170,6 +189,38 @@ Return ONLY a valid JSON object in this exact format (NO markdown formatting):
             logger.error(f"Chunk mapping creation failed: {e}")
             return self._create_fallback_mapping(original_chunks, suggested_chunks)
     
+    async def _stream_mapping(self, messages: List[Dict[str, str]],
+                              original_chunks: List[Dict[str, Any]],
+                              suggested_chunks: List[Dict[str, Any]],
+                              on_entry: MappingEntryCallback) -> str:
+        """
+        Request the mapping as a stream, handing each valid entry to on_entry as it completes.
+        
+        Returns:
+            The complete response text
+        """
+        stream = await self.openai_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.1,
+            max_tokens=3000,
+            stream=True
+        )
+        
+        parts = []
+        members = StreamingObjectMembers()
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            text = chunk.choices[0].delta.content
+            parts.append(text)
+            for original_id, mapping_data in members.add_chunk(text):
+                entry = {original_id: mapping_data}
+                if self._validate_mapping(entry, original_chunks, suggested_chunks):
+                    await on_entry(original_id, mapping_data)
+        
+        return "".join(parts)
+    
     def _create_mapping_prompt(self, original_chunks: List[Dict[str, Any]], 
                              suggested_chunks: List[Dict[str, Any]]) -> str:
         """
@@ -371,10 +422,6 @@ async def mapping_analysis_node(state: Dict[str, Any]) -> Dict[str, Any]:
         Updated state with chunk mapping results
     """
     try:
-        # Send progress update for suggestion mapping
-        if state.get("progress_callback"):
-            await state["progress_callback"]("suggestion_mapping", "mapping", "document_analysis")
-            
         # Extract required information from state
         openai_client = state.get("openai_client")
         original_chunks = state.get("original_chunks", [])
@@ -409,15 +456,38 @@ async def mapping_analysis_node(state: Dict[str, Any]) -> Dict[str, Any]:
         
         # Create and run mapping agent
         agent = await create_mapping_agent(openai_client)
-        chunk_mapping = await agent.create_chunk_mapping(original_chunks, suggested_chunks, context)
+        
+        # When asked to, cards are built and sent out per original chunk as its mapping arrives
+        streamed_entries = {}
+        streamed_cards = []
+        
+        async def send_cards(original_id: str, mapping_data: Dict[str, Any]):
+            if original_id in streamed_entries:
+                return
+            cards = generate_suggestions_from_chunk_mapping(
+                {original_id: mapping_data}, original_chunks, suggested_chunks
+            )
+            streamed_entries[original_id] = mapping_data
+            streamed_cards.extend(cards)
+            if cards:
+                await adispatch_custom_event(SUGGESTION_CARDS_EVENT, {"cards": cards})
+        
+        chunk_mapping = await agent.create_chunk_mapping(
+            original_chunks, suggested_chunks, context,
+            on_entry=send_cards if state.get("stream_cards") else None
+        )
         
         logger.info(f"Chunk mapping completed: {len(chunk_mapping)} mappings created")
         
         # Return chunk mapping AND suggested chunks to maintain ID consistency
-        return {
+        update = {
             "chunk_mapping": chunk_mapping,
             "suggested_chunks": suggested_chunks  # Store chunks to avoid recreating with new IDs
         }
+        if streamed_entries and streamed_entries == chunk_mapping:
+            # Every entry was streamed as it stands, the response reuses those cards (and IDs)
+            update["suggestion_cards"] = streamed_cards
+        return update
         
     except Exception as e:
         logger.error(f"Mapping analysis node failed: {e}")
@@ -4,71 +4,181 @@ from datetime import datetime
 import json
 import logging
 import asyncio
-from typing import List, Dict, Optional
+import os
+import time
+from typing import Any, List, Dict, Optional
 
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
 
 from app.internal.ai_enhanced import get_ai_enhanced
+from app.internal.cancellation import cancellation_stats
 from app.internal.text_utils import html_to_plain_text, validate_text_for_ai
-from app.internal.db import get_db, SessionLocal
-from app.internal.chat_manager import get_chat_manager
+from app.internal.db import AsyncSessionLocal
+from app.internal.chat_manager import decode_history_cursor, encode_history_cursor, get_chat_manager
+from app.internal.chat_writer import chat_writer
+from app.models import ChatHistory
 from app.agents.graph_builder import execute_chat_workflow
 
 logger = logging.getLogger(__name__)
 
-# Intent-specific processing stage configurations
+# What a new /ws/chat message does to an in-flight turn for the same document:
+# "supersede" cancels it, "queue" waits for it - see ChatTurnScheduler
+CHAT_TURN_POLICY = os.getenv("CHAT_TURN_POLICY", "supersede")
+
+# Intent-specific processing stages, in order, with the workflow nodes each one covers.
+# A stage starts when its first node starts and completes when its last node finishes.
 INTENT_STAGE_MAPPINGS = {
     "casual_chat": [
-        {"id": "intent_detection", "name": "Understanding Request", "message": "Processing your message...", "progress": 25, "agent": "system"},
-        {"id": "agent_selection", "name": "Preparing Response", "message": "Setting up AI assistant...", "progress": 50, "agent": "system"},
-        {"id": "finalizing_results", "name": "Generating Response", "message": "Creating response...", "progress": 90, "agent": "system"}
+        {
+            "id": "intent_detection",
+            "name": "Understanding Request",
+            "message": "Processing your message...",
+            "agent": "system",
+            "nodes": ["intent_detector"],
+        },
+        {
+            "id": "finalizing_results",
+            "name": "Generating Response",
+            "message": "Creating response...",
+            "agent": "system",
+            "nodes": ["casual_responder"],
+        },
     ],
     "document_analysis": [
-        {"id": "intent_detection", "name": "Intent Detection", "message": "Analyzing your request...", "progress": 10, "agent": "system"},
-        {"id": "agent_selection", "name": "Agent Selection", "message": "Selecting appropriate AI agents...", "progress": 20, "agent": "lead"},
-        {"id": "technical_analysis", "name": "Technical Analysis", "message": "Technical agent reviewing structure...", "progress": 40, "agent": "technical"},
-        {"id": "legal_analysis", "name": "Legal Analysis", "message": "Legal agent investigating compliance...", "progress": 40, "agent": "legal"},
-        {"id": "novelty_analysis", "name": "Novelty Analysis", "message": "Novelty agent checking innovation...", "progress": 40, "agent": "novelty"},
-        {"id": "lead_synthesis", "name": "Lead Synthesis", "message": "Lead agent synthesizing findings...", "progress": 60, "agent": "lead"},
-        {"id": "suggestion_mapping", "name": "Suggestion Mapping", "message": "Mapping suggestions to document...", "progress": 80, "agent": "mapping"},
-        {"id": "finalizing_results", "name": "Finalizing Results", "message": "Finalizing analysis results...", "progress": 100, "agent": "system"}
+        {
+            "id": "intent_detection",
+            "name": "Intent Detection",
+            "message": "Analyzing your request...",
+            "agent": "system",
+            "nodes": ["intent_detector"],
+        },
+        {
+            "id": "agent_selection",
+            "name": "Agent Selection",
+            "message": "Selecting appropriate AI agents...",
+            "agent": "lead",
+            "nodes": ["document_loader", "agent_recruiter"],
+        },
+        {
+            "id": "technical_analysis",
+            "name": "Technical Analysis",
+            "message": "Technical agent reviewing structure...",
+            "agent": "technical",
+            "nodes": ["technical_agent"],
+        },
+        {
+            "id": "legal_analysis",
+            "name": "Legal Analysis",
+            "message": "Legal agent investigating compliance...",
+            "agent": "legal",
+            "nodes": ["legal_agent"],
+        },
+        {
+            "id": "novelty_analysis",
+            "name": "Novelty Analysis",
+            "message": "Novelty agent checking innovation...",
+            "agent": "novelty",
+            "nodes": ["novelty_agent"],
+        },
+        {
+            "id": "lead_synthesis",
+            "name": "Lead Synthesis",
+            "message": "Lead agent synthesizing findings...",
+            "agent": "lead",
+            "nodes": ["suggestions_aggregator", "lead_agent"],
+        },
+        {
+            "id": "suggestion_mapping",
+            "name": "Suggestion Mapping",
+            "message": "Mapping suggestions to document...",
+            "agent": "mapping",
+            "nodes": ["mapping_agent"],
+        },
+        {
+            "id": "finalizing_results",
+            "name": "Finalizing Results",
+            "message": "Finalizing analysis results...",
+            "agent": "system",
+            "nodes": ["response_formatter"],
+        },
     ],
     "mermaid_diagram": [
-        {"id": "intent_detection", "name": "Request Analysis", "message": "Understanding diagram requirements...", "progress": 25, "agent": "system"},
-        {"id": "agent_selection", "name": "Diagram Setup", "message": "Preparing diagram generator...", "progress": 75, "agent": "system"},
-        {"id": "diagram_generation", "name": "Creating Diagram", "message": "Generating Mermaid diagram...", "progress": 90, "agent": "system"}
-    ]
+        {
+            "id": "intent_detection",
+            "name": "Request Analysis",
+            "message": "Understanding diagram requirements...",
+            "agent": "system",
+            "nodes": ["intent_detector"],
+        },
+        {
+            "id": "diagram_generation",
+            "name": "Creating Diagram",
+            "message": "Generating Mermaid diagram...",
+            "agent": "system",
+            "nodes": ["mermaid_generator"],
+        },
+    ],
 }
 
 # Legacy processing stages (for backward compatibility)
 PROCESSING_STAGES = INTENT_STAGE_MAPPINGS["document_analysis"]
 
-async def send_processing_stage(websocket: WebSocket, stage_id: str, agent: str = "system", 
-                               delay: float = 0.8, intent_type: str = "document_analysis"):
-    """Send a processing stage message to the client with optional delay"""
-    # Get stages for the specific intent type
+# Workflow intent names as the client knows them
+INTENT_ALIASES = {
+    "chat": "casual_chat",
+    "casual": "casual_chat",
+    "analysis": "document_analysis",
+    "document": "document_analysis",
+    "diagram": "mermaid_diagram",
+    "mermaid": "mermaid_diagram"
+}
+
+
+def get_intent_stages(intent_type: Optional[str]) -> List[Dict]:
+    """
+    Stages of an intent, with progress = percentage of the intent's stages done once each
+    completes
+    """
     stages = INTENT_STAGE_MAPPINGS.get(intent_type, INTENT_STAGE_MAPPINGS["document_analysis"])
+    return [
+        {**stage, "progress": round(100 * (position + 1) / len(stages))}
+        for position, stage in enumerate(stages)
+    ]
+
+
+async def send_processing_stage(websocket: WebSocket, stage_id: str, agent: str = "system",
+                                intent_type: Optional[str] = "document_analysis",
+                                status: str = "started", progress: Optional[int] = None,
+                                duration_ms: Optional[float] = None):
+    """
+    Send a processing stage message to the client
+    
+    status is "started" or "completed"; completed stages carry their measured duration_ms.
+    progress is the percentage of the intent's stages completed, by default the stage's
+    own share. intent_type is None while the intent is still being detected. The chat
+    endpoint sends stages as the workflow reaches them.
+    """
+    stages = get_intent_stages(intent_type)
     stage = next((s for s in stages if s["id"] == stage_id), None)
     if not stage:
         logger.warning(f"Stage {stage_id} not found for intent {intent_type}")
         return
     
-    # Add delay for realistic processing timing
-    if delay > 0:
-        await asyncio.sleep(delay)
-    
     stage_msg = {
         "type": "processing_stage",
         "stage": stage["id"],
         "name": stage["name"],
         "message": stage["message"],
-        "progress": stage["progress"],
+        "status": status,
+        "progress": stage["progress"] if progress is None else progress,
         "agent": stage.get("agent", agent),  # Use stage's agent or fallback
         "intent_type": intent_type,  # Include intent for frontend
         "timestamp": datetime.utcnow().isoformat()
     }
+    if duration_ms is not None:
+        stage_msg["duration_ms"] = round(duration_ms, 1)
     
     try:
         # Check if WebSocket is still connected before sending
@@ -76,14 +186,19 @@ async def send_processing_stage(websocket: WebSocket, stage_id: str, agent: str
             logger.warning(f"WebSocket not connected, skipping stage: {stage['name']}")
             return
         await websocket.send_text(json.dumps(stage_msg))
-        logger.info(f"📊 Sent {intent_type} stage: {stage['name']} ({stage['progress']}%)")
+        logger.info(
+            f"📊 Sent {intent_type} stage: {stage['name']} {status} ({stage_msg['progress']}%)"
+        )
     except Exception as e:
         logger.error(f"Failed to send processing stage {stage_id}: {e}")
 
 
 async def send_intent_stage_list(websocket: WebSocket, intent_type: str):
     """Send the complete stage list for an intent to the frontend"""
-    stages = INTENT_STAGE_MAPPINGS.get(intent_type, INTENT_STAGE_MAPPINGS["document_analysis"])
+    stages = [
+        {key: value for key, value in stage.items() if key != "nodes"}
+        for stage in get_intent_stages(intent_type)
+    ]
     
     stage_list_msg = {
         "type": "stage_list",
@@ -99,28 +214,150 @@ async def send_intent_stage_list(websocket: WebSocket, intent_type: str):
         logger.error(f"Failed to send stage list for {intent_type}: {e}")
 
 
-async def simulate_progress_for_intent(websocket: WebSocket, intent_type: str):
-    """Simulate realistic progress updates for a specific intent"""
-    stages = INTENT_STAGE_MAPPINGS.get(intent_type, INTENT_STAGE_MAPPINGS["document_analysis"])
+class StageProgress:
+    """
+    Turns the workflow's node events into processing stage messages for one chat turn
     
-    # Different delays based on intent complexity
-    delays = {
-        "casual_chat": [0.3, 0.5, 0.2],  # Fast for simple chat
-        "document_analysis": [0.5, 0.3, 0.8, 1.2, 1.0, 0.8, 1.0, 0.5],  # Varied for complex analysis
-        "mermaid_diagram": [0.4, 0.6, 1.2, 0.8, 0.3]  # Creative process timing
-    }
+    Passed to execute_chat_workflow as node_callback. Nothing is paced or simulated: a
+    stage is reported when its first node starts and again, with its measured duration,
+    when its last node finishes. progress is the share of the intent's stages completed.
+    The stage list is sent as soon as intent detection finishes.
+    """
     
-    stage_delays = delays.get(intent_type, [0.8] * len(stages))
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.intent: Optional[str] = None
+        self.started: Dict[str, float] = {}
+        self.durations: Dict[str, float] = {}
+        self.running_nodes: set = set()
+        self.finished_nodes: set = set()
     
-    for i, stage in enumerate(stages):
-        delay = stage_delays[i] if i < len(stage_delays) else 0.8
-        await send_processing_stage(
-            websocket, 
-            stage["id"], 
-            stage.get("agent", "system"), 
-            delay, 
-            intent_type
-        )
+    async def __call__(self, node: str, phase: str, update: Dict):
+        if phase == "start":
+            self.running_nodes.add(node)
+        else:
+            self.running_nodes.discard(node)
+            self.finished_nodes.add(node)
+        
+        if node == "intent_detector" and phase == "end":
+            intent = update.get("intent") or "casual_chat"
+            self.intent = INTENT_ALIASES.get(intent, intent)
+            await send_intent_stage_list(self.websocket, self.intent)
+        
+        stages = get_intent_stages(self.intent)
+        stage = next((s for s in stages if node in s["nodes"]), None)
+        if stage is None:
+            return
+        
+        stage_id = stage["id"]
+        if phase == "start" and stage_id not in self.started:
+            self.started[stage_id] = time.perf_counter()
+            await send_processing_stage(
+                self.websocket, stage_id, intent_type=self.intent,
+                progress=self._progress(stages)
+            )
+        elif phase == "end" and node == stage["nodes"][-1] and stage_id in self.started:
+            self.durations[stage_id] = (time.perf_counter() - self.started[stage_id]) * 1000
+            await send_processing_stage(
+                self.websocket, stage_id, intent_type=self.intent, status="completed",
+                progress=self._progress(stages), duration_ms=self.durations[stage_id]
+            )
+    
+    def _progress(self, stages: List[Dict]) -> int:
+        done = sum(1 for stage in stages if stage["id"] in self.durations)
+        return round(100 * done / len(stages))
+    
+    def unfinished_nodes(self) -> tuple:
+        """
+        (nodes still running, nodes of the detected intent never started) - the work a cancel
+        saves
+        """
+        if self.intent is None:
+            return len(self.running_nodes), 0
+        nodes = {node for stage in get_intent_stages(self.intent) for node in stage["nodes"]}
+        return len(self.running_nodes), len(nodes - self.running_nodes - self.finished_nodes)
+
+
+class AssistantDeltas:
+    """
+    Forwards the reply of a chat turn to the client as it is written
+    
+    Passed to execute_chat_workflow as delta_callback when the client asks for streaming
+    ("stream": true). Each piece of text the answering node (casual chat or diagram
+    generation) receives from the model is sent as an assistant_delta frame. The
+    assistant_response that ends the turn still carries, and persists, the full messages,
+    which replace the streamed text.
+    """
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.count = 0
+        self.started = time.perf_counter()
+        self.first_delta_ms: Optional[float] = None
+    
+    async def __call__(self, node: str, delta: str):
+        if self.first_delta_ms is None:
+            self.first_delta_ms = (time.perf_counter() - self.started) * 1000
+            logger.info(f"⚡ First assistant delta from {node} after {self.first_delta_ms:.0f} ms")
+        await self.websocket.send_text(json.dumps({
+            "type": "assistant_delta",
+            "node": node,
+            "delta": delta,
+            "index": self.count,
+            "timestamp": datetime.utcnow().isoformat()
+        }))
+        self.count += 1
+
+
+class SuggestionCardStream:
+    """
+    Forwards the suggestion cards of a document analysis to the client as they are mapped
+    
+    Passed to execute_chat_workflow as cards_callback when the client asks for streaming
+    ("stream": true). The mapping agent resolves the mapping original chunk by original
+    chunk; the cards of each one are sent right away as a suggestion_cards_batch frame.
+    finish() sends the suggestion_cards_summary frame once the workflow is done. The
+    suggestion_cards message of the assistant_response remains the complete set.
+    """
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.batches = 0
+        self.count = 0
+        self.started = time.perf_counter()
+        self.first_card_ms: Optional[float] = None
+    
+    async def __call__(self, node: str, cards: List[Dict]):
+        if self.first_card_ms is None:
+            self.first_card_ms = (time.perf_counter() - self.started) * 1000
+            logger.info(f"⚡ First suggestion card after {self.first_card_ms:.0f} ms")
+        await self.websocket.send_text(json.dumps({
+            "type": "suggestion_cards_batch",
+            "cards": cards,
+            "batch": self.batches,
+            "timestamp": datetime.utcnow().isoformat()
+        }))
+        self.batches += 1
+        self.count += len(cards)
+    
+    async def finish(self, messages: List[Dict]):
+        """Send the summary of the final cards in the workflow's messages"""
+        cards = [card for message in messages if message.get("type") == "suggestion_cards"
+                 for card in message.get("cards", [])]
+        severity_counts = {"high": 0, "medium": 0, "low": 0}
+        for card in cards:
+            severity = card.get("severity")
+            if severity in severity_counts:
+                severity_counts[severity] += 1
+        await self.websocket.send_text(json.dumps({
+            "type": "suggestion_cards_summary",
+            "total_count": len(cards),
+            "severity_counts": severity_counts,
+            "streamed_count": self.count,
+            "batches": self.batches,
+            "first_card_ms": None if self.first_card_ms is None else round(self.first_card_ms, 1),
+            "timestamp": datetime.utcnow().isoformat()
+        }))
 
 
 class ChatMessage(BaseModel):
@@ -133,6 +370,77 @@ class ChatRequest(BaseModel):
     current_document_content: str = ""  # New: current document content
 
 
+class ClientFrames:
+    """
+    Reads a WebSocket in the background, so a disconnect is noticed while work runs
+    
+    An endpoint that awaits long AI work between receives otherwise only learns that the
+    client is gone when sending the result fails, after paying for all of it. Frames that
+    arrive while work runs are queued for receive_text().
+    """
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.frames: asyncio.Queue = asyncio.Queue()
+        self.disconnected = asyncio.Event()
+        self._reader = asyncio.create_task(self._read())
+    
+    async def _read(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                await self.frames.put(message.get("text") or "")
+        except Exception as e:
+            logger.info(f"Stopped reading WebSocket: {e}")
+        finally:
+            self.disconnected.set()
+    
+    async def receive_text(self) -> Optional[str]:
+        """The next text frame, None once the client has disconnected"""
+        if not self.frames.empty():
+            return self.frames.get_nowait()
+        frame = asyncio.ensure_future(self.frames.get())
+        gone = asyncio.ensure_future(self.disconnected.wait())
+        try:
+            await asyncio.wait({frame, gone}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            gone.cancel()
+            if not frame.done():
+                frame.cancel()
+        return frame.result() if frame.done() and not frame.cancelled() else None
+    
+    async def run(self, work) -> bool:
+        """
+        Await work (a coroutine), cancelling it if the client disconnects first
+        
+        Returns:
+            True when the work completed (its exception, if any, is raised), False when
+            it was cancelled because the client went away
+        """
+        task = asyncio.ensure_future(work)
+        gone = asyncio.ensure_future(self.disconnected.wait())
+        try:
+            await asyncio.wait({task, gone}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            gone.cancel()
+        
+        if task.done():
+            task.result()
+            return True
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return False
+    
+    async def close(self):
+        self._reader.cancel()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
 async def websocket_enhanced_endpoint(websocket: WebSocket):
     """
     Enhanced WebSocket endpoint: AI suggestion system with Function Calling support
@@ -162,10 +470,16 @@ async def websocket_enhanced_endpoint(websocket: WebSocket):
         await websocket.close()
         return
     
+    # Read in the background: a client leaving mid-analysis cancels the review
+    frames = ClientFrames(websocket)
+    
     try:
         while True:
             # Receive HTML content
-            html_content = await websocket.receive_text()
+            html_content = await frames.receive_text()
+            if html_content is None:
+                logger.info("Enhanced WebSocket connection disconnected")
+                break
             logger.info(f"Received HTML content, length: {len(html_content)}")
             
             # Notify frontend processing started
@@ -197,9 +511,19 @@ async def websocket_enhanced_endpoint(websocket: WebSocket):
                 logger.info("Starting enhanced AI document analysis...")
                 response_chunks = []
                 
-                async for chunk in ai.review_document_with_functions(plain_text):
-                    if chunk:
-                        response_chunks.append(chunk)
+                async def review():
+                    async for chunk in ai.review_document_with_functions(plain_text):
+                        if chunk:
+                            response_chunks.append(chunk)
+                
+                if not await frames.run(review()):
+                    # Nobody is left to read the result - the stream was aborted instead
+                    cancellation_stats.review(len(response_chunks))
+                    logger.info(
+                        f"🛑 Client disconnected mid-analysis, review cancelled after "
+                        f"{len(response_chunks)} chunks"
+                    )
+                    break
                 
                 # Merge all responses
                 full_response = "".join(response_chunks)
@@ -247,6 +571,8 @@ async def websocket_enhanced_endpoint(websocket: WebSocket):
             await websocket.send_text(json.dumps(error_response))
         except:
             pass
+    finally:
+        await frames.close()
 
 
 async def chat_with_ai(request: ChatRequest):
@@ -292,17 +618,224 @@ async def chat_with_ai(request: ChatRequest):
 
 
 # New unified chat WebSocket endpoint for integrated AI assistant
+class ChatTurnScheduler:
+    """
+    Runs the chat turns of one /ws/chat connection as tasks
+    
+    Why tasks?
+    - The receive loop used to await each workflow before reading the next frame, so a
+      user who edited and re-asked waited for the stale analysis, and nothing else (a
+      ping, a cancel) was read meanwhile
+    - Now the loop only submits turns and keeps reading
+    
+    Turns are keyed by document_id. With CHAT_TURN_POLICY "supersede" (the default) a new
+    message for a document cancels that document's in-flight turn, which then answers
+    with a "cancelled" frame (reason "superseded"), and the new turn starts once the old
+    one has unwound. With "queue" the new turn waits for the old one to finish instead.
+    Turns of different documents run concurrently.
+    """
+    
+    ALL = object()  # cancel() key for every turn of the connection
+    
+    def __init__(self, websocket: WebSocket, policy: Optional[str] = None):
+        self.websocket = websocket
+        self.policy = policy or CHAT_TURN_POLICY
+        self.tasks: Dict[Any, asyncio.Task] = {}
+        self.reasons: Dict[asyncio.Task, str] = {}  # Why a task was cancelled
+    
+    def submit(self, key: Any, data: Dict) -> asyncio.Task:
+        """
+        Start the turn for a chat message, superseding or queueing behind the key's current
+        turn
+        """
+        previous = self.tasks.get(key)
+        if previous is not None and not previous.done() and self.policy == "supersede":
+            self.reasons[previous] = "superseded"
+            previous.cancel()
+        task = asyncio.create_task(self._run(key, previous, data))
+        self.tasks[key] = task
+        return task
+    
+    def cancel(self, key: Any = ALL, reason: str = "cancelled") -> List[Any]:
+        """Cancel the in-flight turn of a key (of every key with ALL), returns the keys cancelled"""
+        keys = list(self.tasks) if key is self.ALL else [key]
+        cancelled = []
+        for task_key in keys:
+            task = self.tasks.get(task_key)
+            if task is not None and not task.done():
+                self.reasons[task] = reason
+                task.cancel()
+                cancelled.append(task_key)
+        return cancelled
+    
+    async def close(self):
+        """Cancel every turn and wait for them to unwind"""
+        self.cancel(reason="disconnected")
+        tasks = list(self.tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _run(self, key: Any, previous: Optional[asyncio.Task], data: Dict):
+        # Created here so that a cancelled turn can tell which nodes it cut short
+        stage_progress = StageProgress(self.websocket)
+        try:
+            if previous is not None and not previous.done():
+                # Cancelled or queued, it must be out of the way before this turn starts
+                await asyncio.wait([previous])
+            await run_chat_turn(self.websocket, data, stage_progress)
+        except asyncio.CancelledError:
+            reason = self.reasons.pop(asyncio.current_task(), "cancelled")
+            aborted, skipped = stage_progress.unfinished_nodes()
+            cancellation_stats.chat_turn(reason, nodes_aborted=aborted, nodes_skipped=skipped)
+            logger.info(
+                f"🛑 Chat turn for document {key} {reason}: {aborted} nodes aborted, "
+                f"{skipped} never started"
+            )
+            if reason != "disconnected":
+                try:
+                    await self.websocket.send_text(json.dumps({
+                        "type": "cancelled",
+                        "document_id": key,
+                        "reason": reason,
+                        "timestamp": datetime.utcnow().isoformat()
+                    }))
+                except Exception as send_e:
+                    logger.info(f"Could not report cancelled turn: {send_e}")
+        except Exception as e:
+            logger.error(f"❌ Chat turn for document {key} failed: {e}")
+        finally:
+            self.reasons.pop(asyncio.current_task(), None)
+            if self.tasks.get(key) is asyncio.current_task():
+                del self.tasks[key]
+
+
+async def run_chat_turn(websocket: WebSocket, data: Dict,
+                        stage_progress: Optional[StageProgress] = None):
+    """
+    One chat turn of /ws/chat: run the workflow for a user message and send the response
+    
+    Runs as a task of the connection's ChatTurnScheduler. When the scheduler cancels it,
+    the cancellation propagates through the workflow into the awaited LLM requests, which
+    are aborted, and nothing of the turn is sent or saved after that.
+    """
+    # Extract message data
+    user_message = data.get("message", "")
+    document_content = data.get("document_content", "")
+    document_id = data.get("document_id")
+    document_version = data.get("document_version", "v1.0")
+    
+    # Save user message to chat history (written behind, nothing waits for it)
+    if document_id:
+        chat_writer.enqueue(
+            ChatHistory.create_user_message(document_id, document_version, user_message)
+        )
+    
+    # Stages (and the stage list) are sent as the workflow's nodes start and finish
+    stage_progress = stage_progress or StageProgress(websocket)
+    # and, in streaming mode, the reply as the model writes it and the cards as they are mapped
+    streaming = bool(data.get("stream"))
+    assistant_deltas = AssistantDeltas(websocket) if streaming else None
+    card_stream = SuggestionCardStream(websocket) if streaming else None
+    
+    # Use LangGraph workflow for proper intent detection and routing
+    try:
+        logger.info("🤖 Using LangGraph workflow for message processing")
+    
+        result = await execute_chat_workflow(
+            user_input=user_message,
+            document_content=document_content,
+            document_id=document_id,
+            version_number=document_version,
+            chat_history=[],  # You can add actual chat history if needed
+            node_callback=stage_progress,
+            delta_callback=assistant_deltas,
+            cards_callback=card_stream
+        )
+    
+        # Extract results from workflow
+        messages = result.get("messages", [])
+        intent_detected = result.get("intent_detected", "unknown")
+        agents_used = result.get("agents_used", [])
+    
+        logger.info(f"✅ Workflow completed - Intent: {intent_detected}")
+    
+        # Handle empty response
+        if not messages:
+            messages = [{
+                "type": "text",
+                "content": (
+                    "I'm here to help! You can ask me questions about your document "
+                    "or request an analysis."
+                ),
+            }]
+            intent_detected = "casual_chat"  # Changed from "chat" to match intent types
+            agents_used = ["system"]
+    
+        # Map intent names for consistency
+        intent_detected = INTENT_ALIASES.get(intent_detected, intent_detected)
+    
+        if card_stream is not None and intent_detected == "document_analysis":
+            await card_stream.finish(messages)
+    
+        # Save messages to chat history (if needed) - one batched write, IDs go to the client
+        if document_id:
+            text_messages = [message for message in messages if message.get("type") == "text"]
+            # Add other message type handling as needed
+            message_ids = await chat_writer.save_all([
+                ChatHistory.create_assistant_message(
+                    document_id, document_version, message["content"], agents_used
+                )
+                for message in text_messages
+            ])
+            for message, message_id in zip(text_messages, message_ids):
+                message["message_id"] = message_id
+    
+    except Exception as e:
+        logger.error(f"❌ AI processing error: {e}")
+        content = (
+            "I apologize, but I'm experiencing technical difficulties. "
+            "Please try again in a moment."
+        )
+        messages = [{
+            "type": "text",
+            "content": content
+        }]
+        intent_detected = "error"
+        agents_used = ["system"]
+    
+    # Send response to client
+    response = {
+        "type": "assistant_response",
+        "messages": messages,
+        "intent_detected": intent_detected,
+        "agents_used": agents_used,
+        # Measured milliseconds per stage of this turn
+        "stage_durations": {
+            stage_id: round(duration, 1) for stage_id, duration in stage_progress.durations.items()
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    try:
+        await websocket.send_text(json.dumps(response))
+        logger.info(f"📤 Response sent: {len(messages)} messages")
+    except Exception as e:
+        logger.error(f"Failed to send response: {e}")
+
+
 async def unified_chat_websocket_endpoint(websocket: WebSocket):
     """
     Unified WebSocket endpoint for integrated AI assistant.
     
-    This endpoint handles chat with persistent history management.
-    TODO: Implement full LangGraph multi-agent workflow.
+    This endpoint handles chat with persistent history management. Chat messages run
+    as tasks of a ChatTurnScheduler while the loop keeps reading frames:
+    - {"message": ...}: a chat turn, superseding the document's in-flight one
+    - {"type": "cancel", "document_id": ...}: cancel a document's turn (all without document_id)
+    - {"type": "ping"}: answered with a pong
     """
     await websocket.accept()
     logger.info("🔌 Unified chat WebSocket connection established")
     
-    db_session = None
+    scheduler = ChatTurnScheduler(websocket)
     
     try:
         # Send connection success message
@@ -334,13 +867,29 @@ async def unified_chat_websocket_endpoint(websocket: WebSocket):
                     else:
                         raise e
                 
-                # Extract message data
-                user_message = data.get("message", "")
-                document_content = data.get("document_content", "")
-                document_id = data.get("document_id")
-                document_version = data.get("document_version", "v1.0")
+                message_type = data.get("type", "message")
+                
+                if message_type == "ping":
+                    await websocket.send_text(json.dumps({
+                        "type": "pong",
+                        "timestamp": datetime.utcnow().isoformat()
+                    }))
+                    continue
                 
-                if not user_message.strip():
+                if message_type == "cancel":
+                    # Cancel the in-flight turn of one document, or every turn without document_id
+                    cancelled = scheduler.cancel(data.get("document_id", ChatTurnScheduler.ALL))
+                    logger.info(f"🛑 Cancel requested: {len(cancelled)} turns cancelled")
+                    if not cancelled:
+                        await websocket.send_text(json.dumps({
+                            "type": "cancelled",
+                            "document_id": data.get("document_id"),
+                            "reason": "idle",
+                            "timestamp": datetime.utcnow().isoformat()
+                        }))
+                    continue
+                
+                if not data.get("message", "").strip():
                     error_msg = {
                         "type": "validation_error",
                         "message": "Please provide a message",
@@ -353,114 +902,8 @@ async def unified_chat_websocket_endpoint(websocket: WebSocket):
                         break
                     continue
                 
-                # Save user message to chat history
-                if document_id:
-                    with SessionLocal() as temp_db:
-                        temp_chat_manager = get_chat_manager(temp_db)
-                        await temp_chat_manager.save_user_message(
-                            document_id, document_version, user_message
-                        )
-                
-                # Stage 1: Intent Detection (quick check)
-                await send_processing_stage(websocket, "intent_detection", "system", 0.3)
-                
-                # Use LangGraph workflow for proper intent detection and routing
-                try:
-                    logger.info("🤖 Using LangGraph workflow for message processing")
-                    
-                    # Track if we've sent stage list for this intent
-                    sent_stage_lists = set()
-                    
-                    # Create progress callback for real-time updates
-                    async def progress_callback(stage_id: str, agent: str = "system", intent_type: str = "document_analysis"):
-                        """Send real-time progress updates during workflow execution"""
-                        try:
-                            # Send stage list once per intent when we first know the intent
-                            if intent_type and intent_type not in sent_stage_lists:
-                                logger.info(f"🎯 Early stage list send for intent: {intent_type}")
-                                await send_intent_stage_list(websocket, intent_type)
-                                sent_stage_lists.add(intent_type)
-                            
-                            await send_processing_stage(websocket, stage_id, agent, 0.1, intent_type)
-                        except Exception as e:
-                            logger.error(f"Failed to send progress update for {stage_id}: {e}")
-                    
-                    # Execute the full LangGraph workflow with progress callback
-                    result = await execute_chat_workflow(
-                        user_input=user_message,
-                        document_content=document_content,
-                        document_id=document_id,
-                        version_number=document_version,
-                        chat_history=[],  # You can add actual chat history if needed
-                        progress_callback=progress_callback
-                    )
-                    
-                    # Extract results from workflow
-                    messages = result.get("messages", [])
-                    intent_detected = result.get("intent_detected", "unknown")
-                    agents_used = result.get("agents_used", [])
-                    
-                    logger.info(f"✅ Workflow completed - Intent: {intent_detected}")
-                    
-                    # Handle empty response
-                    if not messages:
-                        messages = [{
-                            "type": "text",
-                            "content": "I'm here to help! You can ask me questions about your document or request an analysis."
-                        }]
-                        intent_detected = "casual_chat"  # Changed from "chat" to match intent types
-                        agents_used = ["system"]
-                    
-                    # Map intent names for consistency
-                    intent_mapping = {
-                        "chat": "casual_chat",
-                        "casual": "casual_chat",
-                        "analysis": "document_analysis",
-                        "document": "document_analysis",
-                        "diagram": "mermaid_diagram",
-                        "mermaid": "mermaid_diagram"
-                    }
-                    intent_detected = intent_mapping.get(intent_detected, intent_detected)
-                    
-                    # Stage list already sent during workflow execution via progress_callback
-                    logger.info(f"📋 Stage list already sent for intent: {intent_detected}")
-                    
-                    # Save messages to chat history (if needed)
-                    if document_id:
-                        with SessionLocal() as temp_db:
-                            temp_chat_manager = get_chat_manager(temp_db)
-                            for i, message in enumerate(messages):
-                                if message.get("type") == "text":
-                                    saved_message = await temp_chat_manager.save_assistant_message(
-                                        document_id, document_version, message["content"], agents_used
-                                    )
-                                    messages[i]["message_id"] = saved_message.id
-                                # Add other message type handling as needed
-                    
-                except Exception as e:
-                    logger.error(f"❌ AI processing error: {e}")
-                    content = "I apologize, but I'm experiencing technical difficulties. Please try again in a moment."
-                    messages = [{
-                        "type": "text",
-                        "content": content
-                    }]
-                    intent_detected = "error"
-                    agents_used = ["system"]
-                
-                # Send response to client
-                response = {
-                    "type": "assistant_response",
-                    "messages": messages,
-                    "intent_detected": intent_detected,
-                    "agents_used": agents_used,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-                try:
-                    await websocket.send_text(json.dumps(response))
-                    logger.info(f"📤 Response sent: {len(messages)} messages")
-                except Exception as e:
-                    logger.error(f"Failed to send response: {e}")
-                    break
+                # A chat message: runs as a task, the loop goes on reading frames meanwhile
+                scheduler.submit(data.get("document_id"), data)
                 
             except json.JSONDecodeError as e:
                 logger.error(f"❌ JSON decode error: {e}")
@@ -502,24 +945,43 @@ async def unified_chat_websocket_endpoint(websocket: WebSocket):
         else:
             logger.error(f"❌ Unified chat WebSocket error: {e}")
     finally:
-        # WebSocket cleanup - database sessions are handled per operation
-        pass
+        # Turns still running can no longer answer anyone - database sessions are handled per
+        # operation
+        await scheduler.close()
 
 
 # Chat history management implementations
-async def load_chat_history_for_version(document_id: int, version_number: str) -> Dict:
+def _parse_history_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return decode_history_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def load_chat_history_for_version(document_id: int, version_number: str,
+                                        limit: int = 100, cursor: Optional[str] = None) -> Dict:
     """
-    Load chat history for a specific document version.
+    Load one page of chat history for a specific document version.
+    
+    Pages are keyset-paginated by (created_at, id): pass the returned next_cursor
+    to get the following page, next_cursor is None on the last page.
     """
     logger.info(f"📚 Loading chat history for document {document_id}, version {version_number}")
+    after = _parse_history_cursor(cursor)
     
     try:
         # Use session context manager for proper cleanup
-        with SessionLocal() as db_session:
+        async with AsyncSessionLocal() as db_session:
             chat_manager = get_chat_manager(db_session)
             
-            # Load chat history
-            chat_messages = await chat_manager.load_chat_history(document_id, version_number)
+            # One extra row tells whether there is a next page
+            chat_messages = await chat_manager.load_chat_history(
+                document_id, version_number, limit=limit + 1, after=after
+            )
+            has_more = len(chat_messages) > limit
+            chat_messages = chat_messages[:limit]
             
             # Convert to API format
             api_messages = []
@@ -532,7 +994,8 @@ async def load_chat_history_for_version(document_id: int, version_number: str) -
             "messages": api_messages,
             "document_id": document_id,
             "version_number": version_number,
-            "message_count": len(api_messages)
+            "message_count": len(api_messages),
+            "next_cursor": encode_history_cursor(chat_messages[-1]) if has_more else None
         }
         
     except Exception as e:
@@ -543,10 +1006,34 @@ async def load_chat_history_for_version(document_id: int, version_number: str) -
             "messages": [],
             "document_id": document_id,
             "version_number": version_number,
-            "message_count": 0
+            "message_count": 0,
+            "next_cursor": None
         }
 
 
+def stream_chat_history_for_version(document_id: int, version_number: str) -> StreamingResponse:
+    """
+    Stream a version's whole chat history as NDJSON, one message per line.
+    
+    Rows are read in keyset batches while the response is being sent, so long
+    histories never sit in memory at once. The status code is sent before the first
+    row is read, so a failure mid-stream ends the body with an {"error": ...} line.
+    """
+    logger.info(f"📚 Streaming chat history for document {document_id}, version {version_number}")
+    
+    async def generate():
+        try:
+            async with AsyncSessionLocal() as db_session:
+                chat_manager = get_chat_manager(db_session)
+                async for chat_msg in chat_manager.iter_chat_history(document_id, version_number):
+                    yield json.dumps(chat_msg.to_dict()) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming chat history: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 async def handle_suggestion_card_action(message_id: int, card_id: str, action: str) -> Dict:
     """
     Handle suggestion card actions (accept/dismiss).
@@ -555,7 +1042,7 @@ async def handle_suggestion_card_action(message_id: int, card_id: str, action: s
     
     try:
         # Use session context manager for proper cleanup
-        with SessionLocal() as db_session:
+        async with AsyncSessionLocal() as db_session:
             chat_manager = get_chat_manager(db_session)
             
             # Mark the card action
@@ -592,7 +1079,7 @@ async def clear_chat_history_for_version(document_id: int, version_number: str)
     
     try:
         # Use session context manager for proper cleanup
-        with SessionLocal() as db_session:
+        async with AsyncSessionLocal() as db_session:
             chat_manager = get_chat_manager(db_session)
             
             # Clear chat history
@@ -2,9 +2,27 @@
 Abstract base class for AI providers (OpenAI, Gemini, etc.)
 """
 
+import inspect
 from abc import ABC, abstractmethod
 from typing import AsyncGenerator, List, Dict, Any
 
+
+async def close_stream(stream: Any):
+    """
+    Close a provider's response stream, aborting the request if it is still running
+    
+    Called in a finally around the stream's iteration: when the task consuming it is
+    cancelled (the client disconnected), the HTTP response is closed right away instead
+    of being left for garbage collection. Streams without close()/aclose() are left alone.
+    """
+    close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if close is None:
+        return
+    result = close()
+    if inspect.isawaitable(result):
+        await result
+
+
 class AIProvider(ABC):
     """Abstract base class for AI providers"""
     
@@ -9,7 +9,7 @@ from openai import AsyncOpenAI
 
 import logging
 
-from app.internal.ai_base import AIProvider
+from app.internal.ai_base import AIProvider, close_stream
 from app.internal.prompt_enhanced import ENHANCED_PROMPT, FUNCTION_TOOLS
 from app.internal.patent_chat_prompt import format_patent_chat_prompt
 from app.internal.text_utils import html_to_plain_text
@@ -107,34 +107,42 @@ class OpenAIProvider(AIProvider):
         
         logger.info("Starting AI streaming response processing...")
         
-        async for chunk in stream:
-            delta = chunk.choices[0].delta
-            
-            # Log regular text content (for debugging)
-            if delta.content:
-                logger.debug(f"AI text response: {delta.content}")
-            
-            # Process tool calls
-            if delta.tool_calls:
-                logger.info(f"Received tool call: {delta.tool_calls}")
-                for tool_call in delta.tool_calls:
-                    call_index = tool_call.index
-                    
-                    if tool_call.function.name:
-                        # New function call starts
-                        if call_index in current_function_calls:
-                            # If this index already has function call, save previous one first
-                            function_calls.append(current_function_calls[call_index])
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta
+                
+                # Log regular text content (for debugging)
+                if delta.content:
+                    logger.debug(f"AI text response: {delta.content}")
+                
+                # Process tool calls
+                if delta.tool_calls:
+                    logger.info(f"Received tool call: {delta.tool_calls}")
+                    for tool_call in delta.tool_calls:
+                        call_index = tool_call.index
                         
-                        current_function_calls[call_index] = {
-                            "name": tool_call.function.name,
-                            "arguments": tool_call.function.arguments or ""
-                        }
-                        logger.info(f"New function call {call_index}: {tool_call.function.name}")
-                        
-                    elif call_index in current_function_calls:
-                        # Continue accumulating arguments for this index
-                        current_function_calls[call_index]["arguments"] += tool_call.function.arguments or ""
+                        if tool_call.function.name:
+                            # New function call starts
+                            if call_index in current_function_calls:
+                                # If this index already has function call, save previous one first
+                                function_calls.append(current_function_calls[call_index])
+                            
+                            current_function_calls[call_index] = {
+                                "name": tool_call.function.name,
+                                "arguments": tool_call.function.arguments or ""
+                            }
+                            logger.info(
+                                f"New function call {call_index}: {tool_call.function.name}"
+                            )
+                            
+                        elif call_index in current_function_calls:
+                            # Continue accumulating arguments for this index
+                            current_function_calls[call_index]["arguments"] += (
+                                tool_call.function.arguments or ""
+                            )
+        finally:
+            # Aborts the request when the consumer is cancelled mid-stream
+            await close_stream(stream)
         
         # Add all remaining function calls
         for call_index, func_call in current_function_calls.items():
@@ -308,27 +316,31 @@ class OpenAIProvider(AIProvider):
             stream=True,
         )
 
-        async for chunk in stream:
-            delta = chunk.choices[0].delta
-            
-            # Handle regular text response
-            if delta.content:
-                yield delta.content
-            
-            # Handle tool calls
-            if delta.tool_calls:
-                for tool_call in delta.tool_calls:
-                    if tool_call.function.name == "create_diagram":
-                        # Handle diagram generation
-                        try:
-                            args = json.loads(tool_call.function.arguments)
-                            diagram_response = {
-                                "type": "diagram",
-                                "data": args
-                            }
-                            yield f"\n```mermaid\n{args.get('mermaid_syntax', '')}\n```\n"
-                        except json.JSONDecodeError:
-                            continue
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta
+                
+                # Handle regular text response
+                if delta.content:
+                    yield delta.content
+                
+                # Handle tool calls
+                if delta.tool_calls:
+                    for tool_call in delta.tool_calls:
+                        if tool_call.function.name == "create_diagram":
+                            # Handle diagram generation
+                            try:
+                                args = json.loads(tool_call.function.arguments)
+                                diagram_response = {
+                                    "type": "diagram",
+                                    "data": args
+                                }
+                                yield f"\n```mermaid\n{args.get('mermaid_syntax', '')}\n```\n"
+                            except json.JSONDecodeError:
+                                continue
+        finally:
+            # Aborts the request when the consumer is cancelled mid-stream
+            await close_stream(stream)
 
     async def chat_with_document_context(self, messages: List[Dict[str, str]], document_content: str = "") -> AsyncGenerator[str | None, None]:
         """
@@ -387,31 +399,37 @@ class OpenAIProvider(AIProvider):
         function_calls = []
         current_function_calls = {}
         
-        async for chunk in stream:
-            delta = chunk.choices[0].delta
-            
-            # Handle regular text response
-            if delta.content:
-                yield delta.content
-            
-            # Process function calls
-            if delta.tool_calls:
-                for tool_call in delta.tool_calls:
-                    call_index = tool_call.index
-                    
-                    if tool_call.function.name:
-                        # New function call starts
-                        if call_index in current_function_calls:
-                            function_calls.append(current_function_calls[call_index])
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta
+                
+                # Handle regular text response
+                if delta.content:
+                    yield delta.content
+                
+                # Process function calls
+                if delta.tool_calls:
+                    for tool_call in delta.tool_calls:
+                        call_index = tool_call.index
                         
-                        current_function_calls[call_index] = {
-                            "name": tool_call.function.name,
-                            "arguments": tool_call.function.arguments or ""
-                        }
-                        
-                    elif call_index in current_function_calls:
-                        # Continue accumulating arguments
-                        current_function_calls[call_index]["arguments"] += tool_call.function.arguments or ""
+                        if tool_call.function.name:
+                            # New function call starts
+                            if call_index in current_function_calls:
+                                function_calls.append(current_function_calls[call_index])
+                            
+                            current_function_calls[call_index] = {
+                                "name": tool_call.function.name,
+                                "arguments": tool_call.function.arguments or ""
+                            }
+                            
+                        elif call_index in current_function_calls:
+                            # Continue accumulating arguments
+                            current_function_calls[call_index]["arguments"] += (
+                                tool_call.function.arguments or ""
+                            )
+        finally:
+            # Aborts the request when the consumer is cancelled mid-stream
+            await close_stream(stream)
         
         # Process all collected function calls
         for call_index, func_call in current_function_calls.items():
@@ -0,0 +1,145 @@
+"""
+Write coalescing for editor autosaves
+
+Why coalesce?
+- The editor posts the full document to /save/{id} on every autosave, and while the
+  user types, saves of the same document arrive faster than they are worth writing
+- Each write stores a new blob, re-indexes the version and releases the old blob
+
+How it works:
+- A save of a document that hasn't been written within the last SAVE_COALESCE_MS is
+  written right away, so an isolated save has no added latency
+- Saves arriving while a write is in flight, or within the window after it, wait
+  together: the first of them writes once the window has passed, with the content of
+  the newest save, and every waiting request gets the result of that one write
+- Whether the content actually changed is decided by the write itself (see
+  document_repository.save_current_version), so unchanged saves cost no write at all
+
+Works on threads rather than the event loop because /save is a sync endpoint served
+from the threadpool. State is per process; with several workers each one coalesces the
+saves it receives.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Saves of one document within this window after a write are merged into one write
+SAVE_COALESCE_MS = float(os.getenv("SAVE_COALESCE_MS", "250"))
+
+
+class _Batch:
+    """Saves of one document waiting to be written together"""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.done = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _DocumentSaves:
+    def __init__(self):
+        self.last_write_at = float("-inf")
+        self.writing = False
+        self.pending: Optional[_Batch] = None
+
+
+class SaveCoalescer:
+    """
+    Merges bursts of saves of the same document into one write
+
+    saves counts calls, coalesced the saves merged into another save's write, writes
+    and unchanged the writes that did and didn't change anything.
+    """
+
+    def __init__(self, window_ms: float = SAVE_COALESCE_MS):
+        self.window = window_ms / 1000
+        self._documents: Dict[int, _DocumentSaves] = {}
+        self._condition = threading.Condition()
+        self.saves = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.unchanged = 0
+
+    def save(self, document_id: int, content: str, write: Callable[[str], Tuple[Any, bool]]) -> Any:
+        """
+        Save content through write(content) -> (result, changed), coalescing bursts
+
+        Returns the result of the write that stored this save's content or newer content.
+        If that write raises, every save merged into it raises the same exception.
+        """
+        with self._condition:
+            self.saves += 1
+            state = self._documents.setdefault(document_id, _DocumentSaves())
+
+            if state.pending is not None:
+                # Another request is already waiting to write - hand it the newer content
+                batch = state.pending
+                batch.content = content
+                self.coalesced += 1
+                while not batch.done:
+                    self._condition.wait()
+                if batch.error is not None:
+                    raise batch.error
+                return batch.result
+
+            batch = _Batch(content)
+            state.pending = batch
+            while True:
+                wait = state.last_write_at + self.window - time.monotonic()
+                if not state.writing and wait <= 0:
+                    break
+                self._condition.wait(None if state.writing else wait)
+            state.pending = None
+            state.writing = True
+
+        changed = False
+        try:
+            batch.result, changed = write(batch.content)
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            with self._condition:
+                state.writing = False
+                state.last_write_at = time.monotonic()
+                batch.done = True
+                if batch.error is None:
+                    if changed:
+                        self.writes += 1
+                    else:
+                        self.unchanged += 1
+                self._prune()
+                self._condition.notify_all()
+        return batch.result
+
+    def _prune(self):
+        """Forget documents whose window has passed (called with the lock held)"""
+        if len(self._documents) < 256:
+            return
+        expired = time.monotonic() - self.window
+        for document_id, state in list(self._documents.items()):
+            if not state.writing and state.pending is None and state.last_write_at < expired:
+                del self._documents[document_id]
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "saves": self.saves,
+                "coalesced": self.coalesced,
+                "writes": self.writes,
+                "unchanged": self.unchanged,
+            }
+
+    def reset(self):
+        with self._condition:
+            self._documents.clear()
+            self.saves = 0
+            self.coalesced = 0
+            self.writes = 0
+            self.unchanged = 0
+
+
+save_coalescer = SaveCoalescer()
@@ -0,0 +1,474 @@
+"""
+Content-addressed, compressed storage for version content
+
+Why a blob store?
+- Many versions are byte-identical: create_version copies the active version verbatim
+  and users often save without edits
+- Keying content by its SHA-256 means identical content is stored exactly once, no
+  matter how many versions (or documents) reference it
+
+How it works:
+- Each content_blob row is identified by the hash of the full content it represents
+- data holds either the full content or a delta against base_hash (see compute_delta),
+  compressed with zstd when the zstandard package is installed, zlib otherwise
+- Reads decompress on demand and rebuild delta chains; results are kept in an LRU cache
+  keyed by hash, which can never go stale because a hash always maps to the same content
+- Blobs no longer referenced by any version are released, after re-basing the blobs
+  that were stored as deltas against them
+
+Version-level policy (which blob is kept in full, which becomes a delta) lives in
+app.internal.version_store. Callers commit.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, exists, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models import ContentBlob, DocumentVersion
+
+try:
+    import zstandard
+except ImportError:  # Optional - zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Codec used for new blobs; existing blobs keep the codec they were written with
+BLOB_CODEC = os.getenv("BLOB_CODEC", "zstd" if zstandard is not None else "zlib")
+BLOB_COMPRESSION_LEVEL = int(os.getenv("BLOB_COMPRESSION_LEVEL", "6"))
+
+# Number of decompressed contents kept in memory
+CONTENT_CACHE_SIZE = int(os.getenv("CONTENT_CACHE_SIZE", "256"))
+
+# Longest changed region (in tokens) that is diffed rather than stored as a literal insert
+DELTA_MAX_TOKENS = int(os.getenv("DELTA_MAX_TOKENS", "2000"))
+
+# Tags and words with their trailing whitespace - diffing tokens instead of characters
+# keeps SequenceMatcher fast on large documents while still producing small deltas
+_TOKEN_PATTERN = re.compile(r"<[^>]*>|[^<\s]+\s*|\s+")
+
+
+def hash_content(content: str) -> str:
+    """SHA-256 hex digest identifying a piece of content"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# ===================================================================
+# Compression codecs
+# ===================================================================
+
+def compress(payload: bytes, codec: str = None) -> Tuple[str, bytes]:
+    """Compress payload, returns (codec, data)"""
+    codec = codec or BLOB_CODEC
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("BLOB_CODEC is zstd but the zstandard package is not installed")
+        return codec, zstandard.ZstdCompressor(level=BLOB_COMPRESSION_LEVEL).compress(payload)
+    if codec == "zlib":
+        return codec, zlib.compress(payload, BLOB_COMPRESSION_LEVEL)
+    raise ValueError(f"Unknown blob codec '{codec}'")
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown blob codec '{codec}'")
+
+
+# ===================================================================
+# Delta encoding
+# ===================================================================
+
+def compute_delta(base: str, target: str) -> bytes:
+    """
+    Encode target as a list of operations against base
+
+    The delta is a JSON list where [start, length] copies a range of base and a string
+    inserts literal text. It is compressed together with the rest of the blob.
+
+    Edits are usually local, so the unchanged head and tail are matched in linear time
+    and only the tokens between them are diffed. If that middle part is longer than
+    DELTA_MAX_TOKENS it is stored as one literal insert instead, which bounds the cost
+    of the (quadratic in the worst case) SequenceMatcher.
+    """
+    base_tokens = _TOKEN_PATTERN.findall(base)
+    target_tokens = _TOKEN_PATTERN.findall(target)
+
+    # Character offset of every base token, so copies can reference base directly
+    base_offsets = [0]
+    for token in base_tokens:
+        base_offsets.append(base_offsets[-1] + len(token))
+
+    operations: List = []
+
+    def copy(i1: int, i2: int):
+        start, length = base_offsets[i1], base_offsets[i2] - base_offsets[i1]
+        if length == 0:
+            return
+        # Merge with the previous copy when ranges are contiguous
+        if operations and isinstance(operations[-1], list) and sum(operations[-1]) == start:
+            operations[-1][1] += length
+        else:
+            operations.append([start, length])
+
+    def insert(j1: int, j2: int):
+        text = "".join(target_tokens[j1:j2])
+        if not text:
+            return
+        if operations and isinstance(operations[-1], str):
+            operations[-1] += text
+        else:
+            operations.append(text)
+
+    shortest = min(len(base_tokens), len(target_tokens))
+    prefix = 0
+    while prefix < shortest and base_tokens[prefix] == target_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and base_tokens[-1 - suffix] == target_tokens[-1 - suffix]:
+        suffix += 1
+    base_end, target_end = len(base_tokens) - suffix, len(target_tokens) - suffix
+
+    copy(0, prefix)
+    if max(base_end, target_end) - prefix > DELTA_MAX_TOKENS:
+        insert(prefix, target_end)
+    else:
+        # autojunk would treat frequent tokens (tags, common words) as junk, which breaks
+        # matches in boilerplate-heavy patent text and inflates the delta
+        matcher = SequenceMatcher(
+            None, base_tokens[prefix:base_end], target_tokens[prefix:target_end], autojunk=False
+        )
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                copy(prefix + i1, prefix + i2)
+            elif tag in ("replace", "insert"):
+                insert(prefix + j1, prefix + j2)
+            # "delete": nothing to emit
+    copy(base_end, len(base_tokens))
+
+    return json.dumps(operations, separators=(",", ":")).encode("utf-8")
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    """Rebuild the target content from base and a delta produced by compute_delta"""
+    parts = []
+    for operation in json.loads(delta.decode("utf-8")):
+        if isinstance(operation, str):
+            parts.append(operation)
+        else:
+            start, length = operation
+            parts.append(base[start:start + length])
+    return "".join(parts)
+
+
+# ===================================================================
+# Decompressed content cache
+# ===================================================================
+
+class ContentCache:
+    """
+    Thread-safe LRU cache of full contents keyed by content hash
+
+    Keying by hash rather than version id means entries can never go stale: an edited
+    version gets a new hash, and other workers sharing the database agree on hashes.
+    """
+
+    def __init__(self, max_entries: int = CONTENT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content_hash: Optional[str]) -> Optional[str]:
+        if not content_hash:
+            return None
+        with self._lock:
+            content = self._entries.get(content_hash)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(content_hash)
+            self.hits += 1
+            return content
+
+    def put(self, content_hash: Optional[str], content: str):
+        if not content_hash or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[content_hash] = content
+            self._entries.move_to_end(content_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+content_cache = ContentCache()
+
+
+# ===================================================================
+# Reading and writing blobs
+# ===================================================================
+
+def _encode_full(blob: ContentBlob, content: str):
+    blob.codec, blob.data = compress(content.encode("utf-8"))
+    blob.base_hash = None
+
+
+def _encode_delta(blob: ContentBlob, content: str, base_hash: str, base_content: str):
+    """Store content as a delta against base_hash, or in full if the delta doesn't pay off"""
+    codec, data = compress(compute_delta(base_content, content))
+    full_codec, full_data = compress(content.encode("utf-8"))
+    if len(data) >= len(full_data):
+        blob.codec, blob.data, blob.base_hash = full_codec, full_data, None
+        return
+    blob.codec, blob.data, blob.base_hash = codec, data, base_hash
+
+
+def get_content(db: Session, content_hash: str) -> str:
+    """
+    Return the full content of a blob, decompressing and applying deltas as needed
+    """
+    cached = content_cache.get(content_hash)
+    if cached is not None:
+        return cached
+
+    # Walk towards a full blob (or a cached ancestor), then apply deltas back down
+    chain: List[ContentBlob] = []
+    current_hash = content_hash
+    while True:
+        blob = db.get(ContentBlob, current_hash)
+        if blob is None:
+            raise ValueError(f"Content blob {current_hash} is missing")
+        if blob.base_hash is None:
+            content = decompress(blob.codec, blob.data).decode("utf-8")
+            content_cache.put(blob.hash, content)
+            break
+        if blob in chain:
+            raise ValueError(f"Delta chain of content blob {content_hash} contains a cycle")
+        chain.append(blob)
+        content = content_cache.get(blob.base_hash)
+        if content is not None:
+            break
+        current_hash = blob.base_hash
+
+    for blob in reversed(chain):
+        content = apply_delta(content, decompress(blob.codec, blob.data))
+        content_cache.put(blob.hash, content)
+
+    return content
+
+
+def get_contents(db: Session, content_hashes: Iterable[str]) -> Dict[str, str]:
+    """
+    Full contents of many blobs, keyed by hash
+
+    Blobs missing from the content cache are loaded with one IN query per level of
+    their delta chains, rather than one query per blob, then rebuilt by get_content()
+    from the session's identity map.
+    """
+    hashes = list(dict.fromkeys(content_hashes))
+    wanted = [content_hash for content_hash in hashes if content_cache.get(content_hash) is None]
+    while wanted:
+        blobs = db.scalars(select(ContentBlob).where(ContentBlob.hash.in_(wanted))).all()
+        # Next level: bases that are neither cached nor already in the session
+        wanted = list({
+            blob.base_hash for blob in blobs
+            if blob.base_hash is not None
+            and content_cache.get(blob.base_hash) is None
+            and db.identity_map.get(db.identity_key(ContentBlob, blob.base_hash)) is None
+        })
+    return {content_hash: get_content(db, content_hash) for content_hash in hashes}
+
+
+def _insert_ignoring_existing(db: Session, blobs: List[ContentBlob]):
+    """
+    INSERT blob rows in one statement, doing nothing for hashes already stored
+
+    Hashes are global, so two workers saving the same content can both miss the blob
+    in put_content's check. The second insert must not fail: the content is stored.
+    """
+    values = [
+        {
+            "hash": blob.hash,
+            "codec": blob.codec,
+            "data": blob.data,
+            "base_hash": blob.base_hash,
+            "size": blob.size,
+        }
+        for blob in blobs
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = sqlite_insert(ContentBlob).on_conflict_do_nothing(index_elements=["hash"])
+    elif dialect == "postgresql":
+        statement = postgresql_insert(ContentBlob).on_conflict_do_nothing(index_elements=["hash"])
+    else:
+        statement = insert(ContentBlob).prefix_with("IGNORE", dialect="mysql")
+    db.execute(statement, values)
+
+
+def put_blobs(db: Session, blobs: Iterable[ContentBlob]) -> List[str]:
+    """
+    Store many already encoded full blobs in one statement, returns their hashes
+
+    For bulk writers that hash and compress content elsewhere (see document_import):
+    hashes already stored are left alone, and any of them stored as a delta is
+    materialized, as add_version does for a single version. Duplicates are stored once.
+    """
+    unique = list({blob.hash: blob for blob in blobs}.values())
+    if not unique:
+        return []
+    hashes = [blob.hash for blob in unique]
+    stored_as_delta = db.scalars(
+        select(ContentBlob.hash).where(
+            ContentBlob.hash.in_(hashes), ContentBlob.base_hash.is_not(None)
+        )
+    ).all()
+    _insert_ignoring_existing(db, unique)
+    for content_hash in stored_as_delta:
+        materialize(db, content_hash)
+    return hashes
+
+
+def put_content(db: Session, content: str, delta_base: Optional[str] = None) -> str:
+    """
+    Store content unless a blob with the same hash already exists, returns the hash
+
+    Args:
+        delta_base: Hash of an existing blob to encode the new blob against, if any
+    """
+    content_hash = hash_content(content)
+    if db.get(ContentBlob, content_hash) is None:
+        blob = ContentBlob(hash=content_hash, size=len(content.encode("utf-8")))
+        if delta_base and delta_base != content_hash:
+            _encode_delta(blob, content, delta_base, get_content(db, delta_base))
+        else:
+            _encode_full(blob, content)
+        _insert_ignoring_existing(db, [blob])
+    content_cache.put(content_hash, content)
+    return content_hash
+
+
+def materialize(db: Session, content_hash: str) -> ContentBlob:
+    """Make sure a blob stores its full content rather than a delta"""
+    blob = db.get(ContentBlob, content_hash)
+    if blob is not None and blob.base_hash is not None:
+        _encode_full(blob, get_content(db, content_hash))
+        db.flush()
+    return blob
+
+
+def _depends_on(db: Session, content_hash: str, ancestor_hash: str) -> bool:
+    """Whether rebuilding content_hash goes through ancestor_hash"""
+    current = db.get(ContentBlob, content_hash)
+    while current is not None and current.base_hash is not None:
+        if current.base_hash == ancestor_hash:
+            return True
+        current = db.get(ContentBlob, current.base_hash)
+    return False
+
+
+def rebase(db: Session, content_hash: str, base_hash: str):
+    """
+    Re-encode a blob as a delta against base_hash
+
+    If the base is itself rebuilt through this blob, the base is materialized first so
+    delta chains can never form a cycle.
+    """
+    if content_hash == base_hash:
+        return
+    content = get_content(db, content_hash)
+    base_content = get_content(db, base_hash)
+    if _depends_on(db, base_hash, content_hash):
+        materialize(db, base_hash)
+    _encode_delta(db.get(ContentBlob, content_hash), content, base_hash, base_content)
+    db.flush()
+
+
+def is_referenced(db: Session, content_hash: str) -> bool:
+    return db.scalar(select(exists().where(DocumentVersion.content_hash == content_hash)))
+
+
+def release(db: Session, content_hash: str, successor: Optional[str] = None,
+            rebase_dependents: bool = True) -> bool:
+    """
+    Delete a blob if no version references it any more
+
+    Blobs stored as deltas against it are re-encoded against successor (defaults to the
+    released blob's own base), or stored in full if there is none. With
+    rebase_dependents=False a blob that others depend on is kept instead, so releasing
+    never diffs anything.
+
+    Returns:
+        Whether the blob was deleted
+    """
+    blob = db.get(ContentBlob, content_hash)
+    if blob is None or is_referenced(db, content_hash):
+        return False
+
+    successor = successor or blob.base_hash
+    dependents = db.scalars(
+        select(ContentBlob.hash).where(ContentBlob.base_hash == content_hash)
+    ).all()
+    if dependents and not rebase_dependents:
+        return False
+    for dependent_hash in dependents:
+        if successor and successor != dependent_hash:
+            rebase(db, dependent_hash, successor)
+        else:
+            materialize(db, dependent_hash)
+
+    db.delete(blob)
+    db.flush()
+    return True
+
+
+def blob_stats(db: Session, hashes: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    Blob counts and stored (compressed) bytes, optionally limited to some hashes
+
+    Returns:
+        Dict with blob, full and delta counts, stored bytes and uncompressed content bytes
+    """
+    query = select(
+        func.count(ContentBlob.hash),
+        func.sum(case((ContentBlob.base_hash.is_(None), 1), else_=0)),
+        func.coalesce(func.sum(func.length(ContentBlob.data)), 0),
+        func.coalesce(func.sum(ContentBlob.size), 0),
+    )
+    if hashes is not None:
+        query = query.where(ContentBlob.hash.in_(list(hashes)))
+
+    blobs, full, stored_bytes, content_bytes = db.execute(query).one()
+    return {
+        "blobs": blobs or 0,
+        "full": full or 0,
+        "deltas": (blobs or 0) - (full or 0),
+        "stored_bytes": stored_bytes,
+        "content_bytes": content_bytes,
+    }
@@ -0,0 +1,58 @@
+"""
+Counters for AI work cut short by cancellation
+
+Why count it?
+- When a client disconnects, cancels or supersedes a request, the chat workflow, the
+  document review stream and any diagram render are cancelled instead of running to
+  completion for nobody
+- These counters show how much work that saved: workflow nodes aborted mid-call (each
+  one an in-flight LLM request) or never started, review streams and renders aborted
+
+The places that cancel or get cancelled record here; stats() totals them.
+"""
+
+from typing import Dict
+
+# Why a chat turn or review was cancelled
+REASONS = ("disconnected", "superseded", "cancelled")
+
+
+class CancellationStats:
+    """Process-wide counters of cancelled AI work"""
+
+    def __init__(self):
+        self._stats = {
+            "chat_turns_cancelled": 0,
+            **{f"chat_turns_{reason}": 0 for reason in REASONS},
+            "workflow_nodes_aborted": 0,
+            "workflow_nodes_skipped": 0,
+            "reviews_cancelled": 0,
+            "review_chunks_received": 0,
+            "renders_aborted": 0,
+        }
+
+    def chat_turn(self, reason: str, nodes_aborted: int = 0, nodes_skipped: int = 0):
+        """
+        A chat turn was cancelled with nodes_aborted still running and nodes_skipped never
+        started
+        """
+        self._stats["chat_turns_cancelled"] += 1
+        if reason in REASONS:
+            self._stats[f"chat_turns_{reason}"] += 1
+        self._stats["workflow_nodes_aborted"] += nodes_aborted
+        self._stats["workflow_nodes_skipped"] += nodes_skipped
+
+    def review(self, chunks_received: int):
+        """A document review stream was aborted after chunks_received chunks"""
+        self._stats["reviews_cancelled"] += 1
+        self._stats["review_chunks_received"] += chunks_received
+
+    def render(self):
+        """A Mermaid render was aborted and its browser closed"""
+        self._stats["renders_aborted"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+
+cancellation_stats = CancellationStats()
@@ -5,22 +5,46 @@ Manages chat history storage and retrieval for document version-specific convers
 Handles saving messages, loading chat history, and managing suggestion card states.
 """
 
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
-from typing import List, Optional, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, delete, desc, exists, select, tuple_, update
+from sqlalchemy.orm import selectinload
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
+import base64
 import logging
 from datetime import datetime
 
-from ..models import ChatHistory, ChatMessage
-from ..internal.db import get_db
+from ..models import ChatHistory, ChatMessage, SuggestionCard
+from ..internal.db import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
 
+# Position in a version's history, (created_at, id) of the last message seen
+HistoryCursor = Tuple[datetime, int]
+
+
+def encode_history_cursor(message: ChatMessage) -> str:
+    """Opaque cursor pointing just after the given message"""
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_history_cursor(cursor: str) -> HistoryCursor:
+    """Parse a cursor from encode_history_cursor, raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid chat history cursor: {cursor!r}") from e
+
 
 class ChatHistoryManager:
     """
     Manages chat history operations for document version-specific conversations.
     
+    All database work goes through an AsyncSession, so saving or loading chat
+    history never blocks the event loop shared by every WebSocket on the worker.
+    
     This class provides methods for:
     - Saving chat messages to database
     - Loading chat history for specific document versions
@@ -28,7 +52,7 @@ class ChatHistoryManager:
     - Cleaning up old messages
     """
     
-    def __init__(self, db_session: Session):
+    def __init__(self, db_session: AsyncSession):
         self.db = db_session
     
     async def save_user_message(self, document_id: int, version_number: str, 
@@ -37,15 +61,14 @@ class ChatHistoryManager:
         try:
             message = ChatHistory.create_user_message(document_id, version_number, content)
             self.db.add(message)
-            self.db.commit()
-            self.db.refresh(message)
+            await self.db.commit()
             
             logger.info(f"Saved user message for doc {document_id} v{version_number}")
             return message
             
         except Exception as e:
             logger.error(f"Error saving user message: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
     async def save_assistant_message(self, document_id: int, version_number: str, 
@@ -56,15 +79,14 @@ class ChatHistoryManager:
                 document_id, version_number, content, agents_used
             )
             self.db.add(message)
-            self.db.commit()
-            self.db.refresh(message)
+            await self.db.commit()
             
             logger.info(f"Saved assistant message for doc {document_id} v{version_number}")
             return message
             
         except Exception as e:
             logger.error(f"Error saving assistant message: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
     async def save_suggestion_cards(self, document_id: int, version_number: str, 
@@ -76,19 +98,39 @@ class ChatHistoryManager:
                 document_id, version_number, suggestion_cards, agents_used
             )
             self.db.add(message)
-            self.db.commit()
-            self.db.refresh(message)
+            await self.db.commit()
             
             logger.info(f"Saved {len(suggestion_cards)} suggestion cards for doc {document_id} v{version_number}")
             return message
             
         except Exception as e:
             logger.error(f"Error saving suggestion cards: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             raise
     
-    async def load_chat_history(self, document_id: int, version_number: str, 
-                               limit: int = 100) -> List[ChatMessage]:
+    def _history_query(self, document_id: int, version_number: str,
+                       after: Optional[HistoryCursor], limit: int):
+        """One keyset page of a version's history (ix_chat_history_document_version_created)"""
+        query = (
+            select(ChatHistory)
+            .where(
+                and_(
+                    ChatHistory.document_id == document_id,
+                    ChatHistory.version_number == version_number
+                )
+            )
+            .order_by(ChatHistory.created_at, ChatHistory.id)
+            .limit(limit)
+            # Cards of all suggestion messages in one extra query
+            .options(selectinload(ChatHistory.cards))
+        )
+        if after is not None:
+            query = query.where(tuple_(ChatHistory.created_at, ChatHistory.id) > tuple_(*after))
+        return query
+    
+    async def load_chat_history(self, document_id: int, version_number: str,
+                                limit: int = 100,
+                                after: Optional[HistoryCursor] = None) -> List[ChatMessage]:
         """
         Load chat history for a specific document version.
         
@@ -96,18 +138,16 @@ class ChatHistoryManager:
             document_id: The document ID
             version_number: The version number (e.g., "v1.0")
             limit: Maximum number of messages to retrieve (default: 100)
+            after: Only return messages after this (created_at, id) position,
+                   see decode_history_cursor
         
         Returns:
             List of ChatMessage objects ordered by creation time
         """
         try:
-            # Query chat history for this document version
-            chat_records = self.db.query(ChatHistory).filter(
-                and_(
-                    ChatHistory.document_id == document_id,
-                    ChatHistory.version_number == version_number
-                )
-            ).order_by(ChatHistory.created_at).limit(limit).all()
+            chat_records = (await self.db.scalars(
+                self._history_query(document_id, version_number, after, limit)
+            )).all()
             
             # Convert to ChatMessage objects
             messages = [ChatMessage.from_db_record(record) for record in chat_records]
@@ -119,6 +159,27 @@ class ChatHistoryManager:
             logger.error(f"Error loading chat history: {e}")
             return []
     
+    async def iter_chat_history(self, document_id: int, version_number: str,
+                                batch_size: int = 500) -> AsyncIterator[ChatMessage]:
+        """
+        Yield a version's whole history in order, one keyset page at a time.
+        
+        Only batch_size rows are materialised at once, so long histories can be
+        streamed without loading them into memory.
+        """
+        after = None
+        while True:
+            chat_records = (await self.db.scalars(
+                self._history_query(document_id, version_number, after, batch_size)
+            )).all()
+            for record in chat_records:
+                yield ChatMessage.from_db_record(record)
+            if len(chat_records) < batch_size:
+                return
+            after = (chat_records[-1].created_at, chat_records[-1].id)
+            # Drop the page from the identity map before loading the next one
+            self.db.expunge_all()
+    
     async def mark_suggestion_card_action(self, message_id: int, card_id: str, 
                                         action: str) -> bool:
         """
@@ -133,26 +194,30 @@ class ChatHistoryManager:
             True if successful, False otherwise
         """
         try:
-            message = self.db.query(ChatHistory).filter(ChatHistory.id == message_id).first()
-            
-            if not message:
-                logger.error(f"Chat message {message_id} not found")
-                return False
+            # Single-row update on the suggestion_card table
+            result = await self.db.execute(
+                update(SuggestionCard)
+                .where(
+                    SuggestionCard.message_id == message_id,
+                    SuggestionCard.card_id == card_id
+                )
+                .values(status=action, acted_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
             
-            if message.message_type != "suggestion_cards":
-                logger.error(f"Message {message_id} is not a suggestion cards message")
+            if result.rowcount == 0:
+                logger.error(f"Suggestion card {card_id} not found in message {message_id}")
+                await self.db.rollback()
                 return False
             
-            # Mark the card action
-            message.mark_card_action(card_id, action)
-            self.db.commit()
+            await self.db.commit()
             
             logger.info(f"Marked card {card_id} as {action} in message {message_id}")
             return True
             
         except Exception as e:
             logger.error(f"Error marking card action: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return False
     
     async def remove_suggestion_card_message(self, message_id: int) -> bool:
@@ -166,7 +231,7 @@ class ChatHistoryManager:
             True if successful, False otherwise
         """
         try:
-            message = self.db.query(ChatHistory).filter(ChatHistory.id == message_id).first()
+            message = await self.db.get(ChatHistory, message_id)
             
             if not message:
                 logger.error(f"Chat message {message_id} not found")
@@ -177,21 +242,29 @@ class ChatHistoryManager:
                 return False
             
             # Check if all cards have been acted upon
-            active_cards = message.get_active_suggestion_cards()
-            if active_cards:
-                logger.info(f"Message {message_id} still has {len(active_cards)} active cards")
+            has_active_cards = await self.db.scalar(
+                select(
+                    exists().where(
+                        SuggestionCard.message_id == message_id,
+                        SuggestionCard.status == SuggestionCard.ACTIVE,
+                        SuggestionCard.card_id != ""
+                    )
+                )
+            )
+            if has_active_cards:
+                logger.info(f"Message {message_id} still has active cards")
                 return False
             
-            # Remove the message
-            self.db.delete(message)
-            self.db.commit()
+            # Remove the message, its cards go with it (delete-orphan cascade)
+            await self.db.delete(message)
+            await self.db.commit()
             
             logger.info(f"Removed suggestion cards message {message_id}")
             return True
             
         except Exception as e:
             logger.error(f"Error removing suggestion cards message: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return False
     
     async def get_active_suggestion_cards(self, document_id: int, 
@@ -207,19 +280,18 @@ class ChatHistoryManager:
             List of active suggestion card dictionaries
         """
         try:
-            # Get all suggestion cards messages for this document version
-            messages = self.db.query(ChatHistory).filter(
-                and_(
-                    ChatHistory.document_id == document_id,
-                    ChatHistory.version_number == version_number,
-                    ChatHistory.message_type == "suggestion_cards"
+            # One query on the (document_id, version_number, status) index, newest message first
+            all_active_cards = list((await self.db.scalars(
+                select(SuggestionCard.payload)
+                .where(
+                    SuggestionCard.document_id == document_id,
+                    SuggestionCard.version_number == version_number,
+                    SuggestionCard.status == SuggestionCard.ACTIVE,
+                    # Cards without an id can't be acted on
+                    SuggestionCard.card_id != ""
                 )
-            ).order_by(desc(ChatHistory.created_at)).all()
-            
-            all_active_cards = []
-            for message in messages:
-                active_cards = message.get_active_suggestion_cards()
-                all_active_cards.extend(active_cards)
+                .order_by(desc(SuggestionCard.message_id), SuggestionCard.position)
+            )).all())
             
             logger.info(f"Found {len(all_active_cards)} active suggestion cards for doc {document_id} v{version_number}")
             return all_active_cards
@@ -240,22 +312,37 @@ class ChatHistoryManager:
             bool: True if successful, False otherwise
         """
         try:
+            # Delete cards first - bulk deletes don't run ORM cascades
+            await self.db.execute(
+                delete(SuggestionCard)
+                .where(
+                    SuggestionCard.document_id == document_id,
+                    SuggestionCard.version_number == version_number
+                )
+                .execution_options(synchronize_session=False)
+            )
+            
             # Delete all chat history records for this document version
-            deleted_count = self.db.query(ChatHistory).filter(
-                and_(
-                    ChatHistory.document_id == document_id,
-                    ChatHistory.version_number == version_number
+            result = await self.db.execute(
+                delete(ChatHistory)
+                .where(
+                    and_(
+                        ChatHistory.document_id == document_id,
+                        ChatHistory.version_number == version_number
+                    )
                 )
-            ).delete(synchronize_session=False)
+                .execution_options(synchronize_session=False)
+            )
+            deleted_count = result.rowcount
             
-            self.db.commit()
+            await self.db.commit()
             
             logger.info(f"Cleared {deleted_count} chat messages for document {document_id} version {version_number}")
             return True
             
         except Exception as e:
             logger.error(f"Error clearing chat history: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return False
     
     async def cleanup_old_messages(self, document_id: int, version_number: str, 
@@ -272,33 +359,54 @@ class ChatHistoryManager:
             Number of messages deleted
         """
         try:
-            # Get all messages for this document version, ordered by creation time (newest first)
-            all_messages = self.db.query(ChatHistory).filter(
-                and_(
-                    ChatHistory.document_id == document_id,
-                    ChatHistory.version_number == version_number
+            in_version = and_(
+                ChatHistory.document_id == document_id,
+                ChatHistory.version_number == version_number
+            )
+            old_messages = select(ChatHistory.id).where(in_version)
+            
+            if keep_count > 0:
+                # Oldest message that is kept, everything before it is deleted
+                boundary = (await self.db.execute(
+                    select(ChatHistory.created_at, ChatHistory.id)
+                    .where(in_version)
+                    .order_by(desc(ChatHistory.created_at), desc(ChatHistory.id))
+                    .offset(keep_count - 1)
+                    .limit(1)
+                )).first()
+                
+                if boundary is None:
+                    return 0
+                
+                old_messages = old_messages.where(
+                    tuple_(ChatHistory.created_at, ChatHistory.id) < tuple_(*boundary)
                 )
-            ).order_by(desc(ChatHistory.created_at)).all()
-            
-            if len(all_messages) <= keep_count:
-                return 0
-            
-            # Delete old messages (keep the newest ones)
-            messages_to_delete = all_messages[keep_count:]
-            deleted_count = 0
             
-            for message in messages_to_delete:
-                self.db.delete(message)
-                deleted_count += 1
+            # Set-based deletes, cards first - bulk deletes don't run ORM cascades
+            await self.db.execute(
+                delete(SuggestionCard)
+                .where(SuggestionCard.message_id.in_(old_messages))
+                .execution_options(synchronize_session=False)
+            )
+            result = await self.db.execute(
+                delete(ChatHistory)
+                .where(ChatHistory.id.in_(old_messages))
+                .execution_options(synchronize_session=False)
+            )
+            deleted_count = result.rowcount
             
-            self.db.commit()
+            await self.db.commit()
             
-            logger.info(f"Cleaned up {deleted_count} old messages for doc {document_id} v{version_number}")
+            if deleted_count:
+                logger.info(
+                    f"Cleaned up {deleted_count} old messages for doc {document_id} "
+                    f"v{version_number}"
+                )
             return deleted_count
             
         except Exception as e:
             logger.error(f"Error cleaning up old messages: {e}")
-            self.db.rollback()
+            await self.db.rollback()
             return 0
     
     async def initialize_document_chat(self, document_id: int, version_number: str) -> ChatHistory:
@@ -330,17 +438,18 @@ class ChatHistoryManager:
             raise
 
 
-def get_chat_manager(db: Session = None) -> ChatHistoryManager:
+def get_chat_manager(db: AsyncSession = None) -> ChatHistoryManager:
     """
     Get a ChatHistoryManager instance.
     
     Args:
-        db: Optional database session. If not provided, will get a new one.
+        db: Optional async database session. If not provided, a new one is opened
+            and the caller is responsible for closing it.
     
     Returns:
         ChatHistoryManager instance
     """
     if db is None:
-        db = next(get_db())
+        db = AsyncSessionLocal()
     
     return ChatHistoryManager(db)
\ No newline at end of file
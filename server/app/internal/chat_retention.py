@@ -0,0 +1,279 @@
+"""
+Scheduled retention and compaction of chat history
+
+Why a background job?
+- Chat history only ever grows: nothing called cleanup_old_messages, and an unbounded
+  chat_history table slows every history load, search index update and backup
+- Deleting a large backlog in one transaction would hold SQLite's write lock for as
+  long as it takes, stalling every save and chat message meanwhile
+
+How it works:
+- Two retention rules: messages older than CHAT_RETENTION_DAYS are deleted everywhere,
+  and each document version keeps only its newest CHAT_RETENTION_PER_VERSION messages
+  (0 disables either rule)
+- Every slice is one short transaction of two set-based statements,
+  DELETE FROM suggestion_card WHERE message_id IN (subquery) and
+  DELETE FROM chat_history WHERE id IN (subquery), where the subquery selects at most
+  CHAT_COMPACTION_BATCH message ids - no rows are loaded into Python
+- A run executes slices until its CHAT_COMPACTION_BUDGET_MS time budget is spent; work
+  left over is picked up by the next run, every CHAT_COMPACTION_INTERVAL_S seconds
+- Once a run has caught up, file-backed SQLite databases give the freed pages back to
+  the file system: with PRAGMA incremental_vacuum when the database uses
+  auto_vacuum=INCREMENTAL (new databases do, see SQLITE_PRAGMAS), otherwise with a full
+  VACUUM when at least VACUUM_MIN_FREE_RATIO of the file is free - which also switches
+  the database to incremental vacuum for the next time
+
+Each worker runs its own job; the deletes are idempotent, so overlapping runs only
+repeat work.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, desc, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.internal.db import async_engine, is_sqlite_memory_url
+from app.models import ChatHistory, SuggestionCard
+
+logger = logging.getLogger(__name__)
+
+# Retention rules - 0 disables a rule
+RETENTION_PER_VERSION = int(os.getenv("CHAT_RETENTION_PER_VERSION", "1000"))
+RETENTION_DAYS = float(os.getenv("CHAT_RETENTION_DAYS", "365"))
+
+# Scheduling - 0 disables the background job
+COMPACTION_INTERVAL = float(os.getenv("CHAT_COMPACTION_INTERVAL_S", "3600"))
+COMPACTION_BUDGET_MS = float(os.getenv("CHAT_COMPACTION_BUDGET_MS", "250"))
+COMPACTION_BATCH = int(os.getenv("CHAT_COMPACTION_BATCH", "500"))
+
+# Share of free pages above which a database without incremental vacuum is VACUUMed
+VACUUM_MIN_FREE_RATIO = 0.1
+
+
+@dataclass
+class CompactionReport:
+    """What one compaction run reclaimed"""
+    expired_messages: int = 0
+    overflow_messages: int = 0
+    cards: int = 0
+    slices: int = 0
+    # False when the time budget ran out with messages still to delete
+    complete: bool = True
+    # "incremental", "full" or None
+    vacuum: Optional[str] = None
+    pages_freed: int = 0
+
+    @property
+    def messages(self) -> int:
+        return self.expired_messages + self.overflow_messages
+
+
+class ChatCompactor:
+    """
+    Enforces chat history retention in time-budgeted slices
+
+    compact() runs once, start() schedules it every interval seconds on the running
+    event loop until stop().
+    """
+
+    def __init__(self, engine: AsyncEngine = async_engine,
+                 keep_per_version: int = RETENTION_PER_VERSION,
+                 max_age_days: float = RETENTION_DAYS,
+                 budget_ms: float = COMPACTION_BUDGET_MS, batch_size: int = COMPACTION_BATCH,
+                 interval: float = COMPACTION_INTERVAL):
+        self.engine = engine
+        self.keep_per_version = keep_per_version
+        self.max_age_days = max_age_days
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.messages_deleted = 0
+        self.cards_deleted = 0
+        self.pages_freed = 0
+
+    async def compact(self) -> CompactionReport:
+        """Delete what the retention rules no longer keep, for at most budget_ms"""
+        report = CompactionReport()
+        deadline = time.monotonic() + self.budget
+
+        if self.max_age_days > 0:
+            cutoff = datetime.utcnow() - timedelta(days=self.max_age_days)
+            # No index on created_at alone: scanning in id order finds old messages
+            # first, so the scan stops after batch_size matches
+            expired = (
+                select(ChatHistory.id)
+                .where(ChatHistory.created_at < cutoff)
+                .order_by(ChatHistory.id)
+                .limit(self.batch_size)
+            )
+            report.expired_messages = await self._delete_until(expired, deadline, report)
+
+        if self.keep_per_version > 0 and (report.complete or not report.slices):
+            async with self.engine.connect() as conn:
+                versions = (await conn.execute(
+                    select(ChatHistory.document_id, ChatHistory.version_number)
+                    .group_by(ChatHistory.document_id, ChatHistory.version_number)
+                    .having(func.count(ChatHistory.id) > self.keep_per_version)
+                )).all()
+            for document_id, version_number in versions:
+                # Every run makes progress, even when an earlier rule spent the budget
+                if report.slices and time.monotonic() >= deadline:
+                    report.complete = False
+                    break
+                overflow = await self._overflow_query(document_id, version_number)
+                if overflow is not None:
+                    report.overflow_messages += await self._delete_until(overflow, deadline, report)
+
+        if report.complete:
+            report.vacuum, report.pages_freed = await self._vacuum()
+
+        self.runs += 1
+        self.messages_deleted += report.messages
+        self.cards_deleted += report.cards
+        self.pages_freed += report.pages_freed
+        if report.messages or report.pages_freed:
+            logger.info(
+                f"Chat compaction deleted {report.messages} messages and {report.cards} cards "
+                f"in {report.slices} slices, freed {report.pages_freed} pages"
+                + ("" if report.complete else " (budget spent, continuing next run)")
+            )
+        return report
+
+    async def _overflow_query(self, document_id: int, version_number: str):
+        """
+        Subquery of the oldest messages of a version beyond keep_per_version, None if there
+        are none
+        """
+        in_version = (
+            (ChatHistory.document_id == document_id)
+            & (ChatHistory.version_number == version_number)
+        )
+        async with self.engine.connect() as conn:
+            # Oldest message that is kept, everything before it goes
+            boundary = (await conn.execute(
+                select(ChatHistory.created_at, ChatHistory.id)
+                .where(in_version)
+                .order_by(desc(ChatHistory.created_at), desc(ChatHistory.id))
+                .offset(self.keep_per_version - 1)
+                .limit(1)
+            )).first()
+        if boundary is None:
+            return None
+        return (
+            select(ChatHistory.id)
+            .where(in_version, tuple_(ChatHistory.created_at, ChatHistory.id) < tuple_(*boundary))
+            .order_by(ChatHistory.created_at, ChatHistory.id)
+            .limit(self.batch_size)
+        )
+
+    async def _delete_until(self, message_ids, deadline: float, report: CompactionReport) -> int:
+        """
+        Delete the messages message_ids selects, one slice per transaction, until none are
+        left or the deadline
+        """
+        deleted = 0
+        while True:
+            messages, cards = await self._delete_slice(message_ids)
+            report.slices += 1
+            report.cards += cards
+            deleted += messages
+            if messages < self.batch_size:
+                return deleted
+            if time.monotonic() >= deadline:
+                report.complete = False
+                return deleted
+
+    async def _delete_slice(self, message_ids) -> tuple:
+        async with self.engine.begin() as conn:
+            # Cards first - bulk deletes don't run ORM cascades. Deleting cards doesn't
+            # change what message_ids selects, so both statements see the same messages
+            cards = await conn.execute(
+                delete(SuggestionCard).where(SuggestionCard.message_id.in_(message_ids))
+            )
+            messages = await conn.execute(
+                delete(ChatHistory).where(ChatHistory.id.in_(message_ids))
+            )
+            return messages.rowcount, cards.rowcount
+
+    def _is_file_backed_sqlite(self) -> bool:
+        url = self.engine.url
+        return (
+            url.get_backend_name() == "sqlite"
+            and not is_sqlite_memory_url(url.render_as_string())
+        )
+
+    async def _vacuum(self) -> tuple:
+        """Return free pages to the file system, (mode, pages freed)"""
+        if not self._is_file_backed_sqlite():
+            return None, 0
+        try:
+            async with self.engine.connect() as conn:
+                # VACUUM can't run inside a transaction
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                free_pages = await self._pragma(conn, "freelist_count")
+                if not free_pages:
+                    return None, 0
+                if await self._pragma(conn, "auto_vacuum") == 2:
+                    # Frees one page per step, and only a script is stepped to the end
+                    raw = await conn.get_raw_connection()
+                    await raw.driver_connection.executescript("PRAGMA incremental_vacuum")
+                    mode = "incremental"
+                elif free_pages >= VACUUM_MIN_FREE_RATIO * await self._pragma(conn, "page_count"):
+                    # Rebuilds the file, and switches it to incremental vacuum on the way
+                    await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                    await conn.exec_driver_sql("VACUUM")
+                    mode = "full"
+                else:
+                    return None, 0
+                return mode, free_pages - await self._pragma(conn, "freelist_count")
+        except Exception as e:
+            # Busy database or no space for VACUUM's copy - the pages stay reusable
+            logger.warning(f"Chat compaction vacuum skipped: {e}")
+            return None, 0
+
+    @staticmethod
+    async def _pragma(conn: AsyncConnection, name: str) -> int:
+        return (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+
+    def start(self):
+        """Run compact() every interval seconds on the running event loop"""
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Chat compaction failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "messages_deleted": self.messages_deleted,
+            "cards_deleted": self.cards_deleted,
+            "pages_freed": self.pages_freed,
+        }
+
+
+chat_compactor = ChatCompactor()
@@ -0,0 +1,227 @@
+"""
+Write-behind persistence for chat messages
+
+Why not save each message with its own session and commit?
+- Every commit is a separate write transaction (and fsync) on the WebSocket's
+  response path, and concurrent connections queue up on SQLite's single write lock
+- The user message doesn't need to be durable before the workflow starts, and the
+  assistant message only needs its ID before the response is sent
+
+How it works:
+- Messages are put on an in-process queue and written by one background task
+- The task collects everything queued within CHAT_WRITE_FLUSH_MS (at most
+  CHAT_WRITE_MAX_BATCH messages) and writes it in one transaction
+- Callers that need a message ID (save/save_all) wake the task immediately, and get
+  the IDs once the batch is committed, so an ID always refers to a durable row
+- If a batch fails, its messages are retried one per transaction (as fresh copies, the
+  failed flush already assigned IDs to the originals), so one bad row doesn't drop
+  the others
+- close() writes everything still queued, and is called on graceful shutdown. Messages
+  queued on an event loop that has since closed are carried over to the new one
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.internal.db import AsyncSessionLocal
+from app.models import ChatHistory
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = int(os.getenv("CHAT_WRITE_FLUSH_MS", "20")) / 1000
+MAX_BATCH = int(os.getenv("CHAT_WRITE_MAX_BATCH", "100"))
+
+
+def _fresh_copy(message: ChatHistory) -> ChatHistory:
+    """Unsaved copy of a message (and its suggestion cards) without the ID of a failed flush"""
+    def columns(instance, skip):
+        return {
+            column.key: getattr(instance, column.key)
+            for column in instance.__table__.columns
+            if column.key not in skip
+        }
+
+    copy = ChatHistory(**columns(message, {"id"}))
+    # Only cards set on the message itself - never lazy-load outside a session
+    cards = inspect(message).dict.get("cards") or []
+    copy.cards = [type(card)(**columns(card, {"id", "message_id"})) for card in cards]
+    return copy
+
+
+@dataclass
+class _PendingWrite:
+    message: ChatHistory
+    # Resolved with the message ID, None for fire-and-forget writes
+    future: Optional[asyncio.Future] = None
+    urgent: bool = False
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class ChatWriteQueue:
+    """
+    Batches chat message INSERTs into one transaction per flush window
+
+    The background task is started on first use in the running event loop.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal,
+                 flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stats = {"queued": 0, "written": 0, "failed": 0, "batches": 0}
+        # Queued or being written, in submission order - survives a closed event loop
+        self._unwritten: Dict[int, _PendingWrite] = {}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        leftover = self._take_leftover(loop)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        for item in leftover:
+            self._queue.put_nowait(item)
+            self._unwritten[id(item)] = item
+        self._task = loop.create_task(self._run())
+
+    def _take_leftover(self, loop: asyncio.AbstractEventLoop) -> List[_PendingWrite]:
+        """Writes not done on a previous event loop, to be written on this one"""
+        if self._loop is None or self._loop is loop:
+            return []
+        if not self._loop.is_closed() and self._task is not None and not self._task.done():
+            # The old loop is still alive - let its own task write what it has
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+            return []
+        leftover = list(self._unwritten.values())
+        self._unwritten.clear()
+        for item in leftover:
+            # Nobody can await a future of a closed loop any more, the message is still written
+            if item.future is not None and item.future.get_loop().is_closed():
+                item.future = None
+        if leftover:
+            logger.warning(f"Carrying {len(leftover)} chat writes over from a closed event loop")
+        return leftover
+
+    def _submit(self, message: ChatHistory, want_id: bool) -> Optional[asyncio.Future]:
+        self._ensure_started()
+        # Message time is when it was submitted, not when the batch is written
+        if message.created_at is None:
+            message.created_at = datetime.utcnow()
+        future = self._loop.create_future() if want_id else None
+        item = _PendingWrite(message, future, urgent=want_id)
+        self._queue.put_nowait(item)
+        self._unwritten[id(item)] = item
+        self._stats["queued"] += 1
+        if want_id:
+            self._wakeup.set()
+        return future
+
+    def enqueue(self, message: ChatHistory):
+        """Queue a message without waiting for it to be written, errors are logged"""
+        self._submit(message, want_id=False)
+
+    async def save(self, message: ChatHistory) -> int:
+        """Queue a message and return its ID once it has been committed"""
+        return await self._submit(message, want_id=True)
+
+    async def save_all(self, messages: List[ChatHistory]) -> List[int]:
+        """Queue several messages, written in the same batch, and return their IDs in order"""
+        futures = [self._submit(message, want_id=True) for message in messages]
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> Optional[List[_PendingWrite]]:
+        """Wait for the next batch, None once the queue is closed and empty"""
+        first = await self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+
+        if not first.urgent:
+            # Wait out the window unless someone needs an ID
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        while len(batch) < self.max_batch and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is None:
+                # Closing - write this batch, then stop
+                self._queue.put_nowait(None)
+                break
+            batch.append(item)
+        self._wakeup.clear()
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if batch is None:
+                return
+            try:
+                await self._write(batch)
+            except Exception as e:
+                logger.error(f"Chat write batch of {len(batch)} failed, retrying one by one: {e}")
+                for item in batch:
+                    item.message = _fresh_copy(item.message)
+                    try:
+                        await self._write([item])
+                    except Exception as item_error:
+                        self._fail(item, item_error)
+
+    async def _write(self, batch: List[_PendingWrite]):
+        async with self.session_factory() as session:
+            session.add_all([item.message for item in batch])
+            await session.commit()
+        # Only committed rows get their IDs handed out
+        for item in batch:
+            self._unwritten.pop(id(item), None)
+            if item.future is not None and not item.future.done():
+                item.future.set_result(item.message.id)
+        self._stats["written"] += len(batch)
+        self._stats["batches"] += 1
+        waited = (time.perf_counter() - batch[0].queued_at) * 1000
+        logger.debug(
+            f"Wrote {len(batch)} chat messages in one transaction "
+            f"({waited:.1f} ms after queueing)"
+        )
+
+    def _fail(self, item: _PendingWrite, error: Exception):
+        self._unwritten.pop(id(item), None)
+        self._stats["failed"] += 1
+        logger.error(f"Failed to save chat message for doc {item.message.document_id}: {error}")
+        if item.future is not None and not item.future.done():
+            item.future.set_exception(error)
+
+    async def close(self):
+        """Write everything queued so far and stop the background task"""
+        if self._task is None or self._task.done():
+            return
+        if self._loop is not asyncio.get_running_loop():
+            logger.error("Chat write queue belongs to another event loop, cannot flush it")
+            return
+        self._queue.put_nowait(None)
+        self._wakeup.set()
+        await self._task
+        logger.info(f"Chat write queue closed: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        pending = self._queue.qsize() if self._queue is not None else 0
+        return {**self._stats, "pending": pending}
+
+
+chat_writer = ChatWriteQueue()
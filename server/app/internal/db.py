@@ -1,17 +1,281 @@
-from sqlalchemy import StaticPool, create_engine
+import atexit
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import AsyncAdaptedQueuePool, QueuePool, StaticPool, create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///:memory:"
+try:
+    import fcntl
+except ImportError:  # Windows - startup_lock is a no-op there
+    fcntl = None
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False,  # You can set this to True to see the SQL queries made by SQLAlchemy
-    poolclass=StaticPool,
-)
+load_dotenv()
+
+# Set DATABASE_URL to a file path (e.g. sqlite:///./document_intelligence.db) to keep
+# data across restarts and to run more than one uvicorn worker against the same database.
+# The in-memory default is only suitable for a single process.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///:memory:")
+
+
+# Connection pool sizing for file-backed databases
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLite tuning - applied to every new connection of a file-backed database
+SQLITE_PRAGMAS = {
+    # Only takes effect for new databases (or at the next VACUUM), so it goes first
+    "auto_vacuum": "INCREMENTAL",  # Chat compaction hands freed pages back without a full VACUUM
+    "journal_mode": "WAL",  # Readers don't block the writer and vice versa
+    # Safe with WAL, far fewer fsyncs than FULL
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative = KiB, so 64 MiB page cache
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Wait for the write lock instead of failing
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+
+
+def is_sqlite_memory_url(database_url: str) -> bool:
+    """Whether the URL points at an in-memory SQLite database (private or shared-cache)"""
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        return False
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def temporary_database_url() -> str:
+    """
+    File-backed stand-in for the in-memory default, deleted when the process exits
+
+    The async engine (used by WebSocket and other async handlers) needs its own
+    connections, and a private ":memory:" database is invisible to them. A shared-cache
+    memory database is visible, but its table locks fail with "database table is locked"
+    at once instead of waiting, so a sync write in the threadpool would break concurrent
+    chat reads and writes. A temporary file gets WAL and busy_timeout like any other.
+    """
+    directory = tempfile.mkdtemp(prefix="document_intelligence-")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return f"sqlite:///{Path(directory) / 'document_intelligence.db'}"
+
+
+def to_async_url(database_url: str) -> str:
+    """
+    Derive the async driver URL for a database URL
+
+    sqlite:///./app.db -> sqlite+aiosqlite:///./app.db
+    postgresql://...   -> postgresql+asyncpg://...
+    """
+    url = make_url(database_url)
+    async_drivers = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "mysql": "aiomysql"}
+    backend = url.get_backend_name()
+    if backend not in async_drivers:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    async_url = url.set(drivername=f"{backend}+{async_drivers[backend]}")
+    return async_url.render_as_string(hide_password=False)
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict = None):
+    """Apply tuning pragmas to a raw sqlite3 connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in (pragmas or SQLITE_PRAGMAS).items():
+            # Setting auto_vacuum waits for the write lock, and on an existing database it
+            # does nothing until the next VACUUM - new connections would queue behind writers
+            if name == "auto_vacuum":
+                cursor.execute("PRAGMA page_count")
+                if cursor.fetchone()[0]:
+                    continue
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(database_url: str = DATABASE_URL, echo: bool = False) -> Engine:
+    """
+    Create the SQLAlchemy engine for a database URL
+
+    - In-memory SQLite keeps a single shared connection (StaticPool), otherwise every
+      connection would see its own empty database
+    - File-backed SQLite gets a real connection pool, one connection per worker thread,
+      with WAL mode and the tuned pragmas above
+    - Any other backend uses SQLAlchemy's defaults plus the pool sizing settings
+    """
+    url = make_url(database_url)
+
+    if url.get_backend_name() != "sqlite":
+        return create_engine(
+            database_url,
+            echo=echo,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+
+    if is_sqlite_memory_url(database_url):
+        return create_engine(
+            database_url,
+            connect_args={"check_same_thread": False},
+            echo=echo,  # You can set this to True to see the SQL queries made by SQLAlchemy
+            poolclass=StaticPool,
+        )
+
+    db_engine = create_engine(
+        database_url,
+        connect_args={
+            "check_same_thread": False,
+            # Python-level lock wait; busy_timeout below covers the same for the C library
+            "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+        },
+        echo=echo,
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+    @event.listens_for(db_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+
+    return db_engine
+
+
+def create_async_db_engine(database_url: str = DATABASE_URL, echo: bool = False) -> AsyncEngine:
+    """
+    Create the async engine for the same database as create_db_engine
+
+    Uses aiosqlite for SQLite, so queries run on the driver's own thread and never
+    block the event loop. Pooling and pragmas mirror the sync engine.
+    """
+    async_url = os.getenv("ASYNC_DATABASE_URL") or to_async_url(database_url)
+    url = make_url(database_url)
+
+    if url.get_backend_name() != "sqlite":
+        return create_async_engine(
+            async_url,
+            echo=echo,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+
+    if is_sqlite_memory_url(database_url):
+        # One connection, checked out by one session at a time. Sharing it (StaticPool)
+        # would let one session's check-in roll back another session's transaction, and
+        # several connections would fail on shared-cache table locks instead of waiting.
+        return create_async_engine(
+            async_url,
+            echo=echo,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+    async_db_engine = create_async_engine(
+        async_url,
+        connect_args={"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000},
+        echo=echo,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+    @event.listens_for(async_db_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+
+    return async_db_engine
+
+
+@contextmanager
+def startup_lock(database_url: str = DATABASE_URL):
+    """
+    Hold an exclusive lock while one worker creates tables, migrates and seeds
+
+    Every uvicorn worker runs the same startup; without the lock they race on
+    CREATE TABLE and on inserting the seed documents. File-backed SQLite is locked
+    through a <database>.startup.lock file next to it. In-memory databases are private
+    to one process, and other backends are left to the database's own locking.
+    """
+    url = make_url(database_url)
+    if fcntl is None or url.get_backend_name() != "sqlite" or is_sqlite_memory_url(database_url):
+        yield
+        return
+
+    lock_path = Path(url.database).with_name(Path(url.database).name + ".startup.lock")
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class QueryCount:
+    """Number of SQL statements executed while a count_queries() block is active"""
+
+    def __init__(self):
+        self.count = 0
+
+
+_query_count: ContextVar[Optional[QueryCount]] = ContextVar("query_count", default=None)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the statements every engine executes in the current context
+
+    The counter follows the context into worker threads and tasks started inside the
+    block, so a request's count includes sync endpoints run in the threadpool. Used per
+    request by the app, and by tests to catch N+1 query patterns.
+    """
+    counter = QueryCount()
+    token = _query_count.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_count.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_count.get()
+    if counter is not None:
+        counter.count += 1
+
+
+if is_sqlite_memory_url(DATABASE_URL):
+    DATABASE_URL = temporary_database_url()
+
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine(DATABASE_URL)
+# expire_on_commit=False: attribute access after commit would otherwise trigger lazy IO,
+# which is not allowed on an AsyncSession
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -21,3 +285,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
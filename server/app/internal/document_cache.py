@@ -0,0 +1,132 @@
+"""
+Read-through cache of the editor's view of a document
+
+Why cache it?
+- Every editor load (GET /document/{id}) looked up the document, the version it points
+  at and, for documents without a pointer, the latest version, then rebuilt the content
+- The answer only changes when the document is saved or its versions change
+
+How it works:
+- Entries are DocumentWithCurrentVersion responses keyed by (document_id, current_version_id)
+- A lookup first reads the document's current_version_id and updated_at - one primary
+  key read - and only uses an entry stored for the same pointer and the same updated_at.
+  Every write path bumps updated_at, so writes made by other workers sharing the database
+  are never served stale
+- save, create_version, switch_version and delete_version also invalidate the document
+  right away, so this worker drops entries it can no longer use
+- Memory is bounded per document (only the entry for the newest key is kept), by entry
+  count and by total content size; content larger than the byte budget is not cached
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.schemas import DocumentWithCurrentVersion
+
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "128"))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+CacheKey = Tuple[int, Optional[int]]
+# (updated_at the entry was read at, response, content size)
+CacheEntry = Tuple[Optional[datetime], DocumentWithCurrentVersion, int]
+
+
+class DocumentCache:
+    """
+    Thread-safe LRU cache of DocumentWithCurrentVersion keyed by (document_id, current_version_id)
+
+    hits and misses count lookups, invalidations counts documents dropped by writes.
+    """
+
+    def __init__(
+        self, max_entries: int = DOCUMENT_CACHE_SIZE, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._keys_by_document: Dict[int, CacheKey] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(
+        self, document_id: int, current_version_id: Optional[int], updated_at: Optional[datetime]
+    ) -> Optional[DocumentWithCurrentVersion]:
+        key = (document_id, current_version_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != updated_at:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(
+        self,
+        document_id: int,
+        current_version_id: Optional[int],
+        updated_at: Optional[datetime],
+        response: DocumentWithCurrentVersion,
+    ):
+        size = len(response.content.encode("utf-8"))
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        key = (document_id, current_version_id)
+        with self._lock:
+            # One entry per document - an older pointer's response can't be requested again
+            # until the pointer moves back, and then it is re-read anyway
+            self._remove(self._keys_by_document.get(document_id))
+            self._entries[key] = (updated_at, response, size)
+            self._keys_by_document[document_id] = key
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, document_id: int):
+        """Drop the cached response of a document"""
+        with self._lock:
+            key = self._keys_by_document.get(document_id)
+            if key is not None:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key: Optional[CacheKey]):
+        entry = self._entries.pop(key, None) if key is not None else None
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        if self._keys_by_document.get(key[0]) == key:
+            del self._keys_by_document[key[0]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_document.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+document_cache = DocumentCache()
@@ -0,0 +1,498 @@
+"""
+Bulk import of documents from HTML files or an NDJSON archive
+
+Why a separate import path?
+- Creating documents one by one, with a BeautifulSoup parse for the title and an
+  add_version() of several statements each, is fine for three seed documents and takes
+  minutes for ten thousand
+- Here titles come from a regex scan, the CPU-heavy part of storing a document (title,
+  SHA-256, compression, search text) runs in a process pool, and documents are written
+  IMPORT_BATCH_SIZE at a time with bulk statements (write_documents)
+
+How it works:
+- Sources yield ImportItems lazily: HTML files are read by the workers themselves, NDJSON
+  lines ({"content": "<html>", "title": optional}) are parsed as they arrive, so memory
+  holds about two batches no matter how large the import is
+- While a batch is written, the pool is already preparing the next one
+- Each batch is one transaction: documents, content blobs, first versions and search
+  index rows. A failed batch is rolled back and reported; batches before it stay imported
+- Imported versions are stored in full, like every document's newest version
+
+Command line:
+    python -m app.internal.document_import docs/ more.html
+    python -m app.internal.document_import --ndjson archive.ndjson
+"""
+
+import argparse
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.internal import blob_store, search_index
+from app.internal.db import Base, SessionLocal, engine, startup_lock
+from app.internal.migrations import run_migrations
+from app.models import ContentBlob, Document, DocumentVersion
+
+logger = logging.getLogger(__name__)
+
+# Documents written per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+# Worker processes preparing documents; 0 or 1 prepares them in this process
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+
+# Batches smaller than this are prepared in this process - starting a pool costs more
+IMPORT_MIN_PARALLEL = int(os.getenv("IMPORT_MIN_PARALLEL", "64"))
+
+# Longest NDJSON line (one document) accepted
+IMPORT_MAX_DOCUMENT_BYTES = int(os.getenv("IMPORT_MAX_DOCUMENT_BYTES", str(16 * 1024 * 1024)))
+
+# Errors kept in a report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+DEFAULT_TITLE = "Untitled Document"
+
+_TITLE_PATTERN = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+_H1_PATTERN = re.compile(r"<h1\b[^>]*>(.*?)</h1\s*>", re.IGNORECASE | re.DOTALL)
+_COMMENT_PATTERN = re.compile(r"<!--.*?-->", re.DOTALL)
+_TAG_PATTERN = re.compile(r"<[^>]*>")
+_SPACE_PATTERN = re.compile(r"\s+")
+
+_HTML_SUFFIXES = {".html", ".htm"}
+
+
+def scan_title(content: str) -> str:
+    """
+    Title of an HTML document: <title>, else the first <h1>, else DEFAULT_TITLE
+
+    Same priority the seeder's BeautifulSoup lookup used, but a regex scan that stops at
+    the first match instead of building a parse tree of the whole document. Tags
+    inside the element are dropped and entities decoded.
+    """
+    for pattern in (_TITLE_PATTERN, _H1_PATTERN):
+        match = pattern.search(content)
+        if match:
+            inner = _TAG_PATTERN.sub("", _COMMENT_PATTERN.sub("", match.group(1)))
+            title = _SPACE_PATTERN.sub(" ", html.unescape(inner)).strip()
+            if title:
+                return title
+    return DEFAULT_TITLE
+
+
+class ImportItem(NamedTuple):
+    """
+    One document to import
+
+    content is None when a worker should read it from source (a file path). Items with
+    an error are skipped and reported.
+    """
+    source: str
+    content: Optional[str] = None
+    title: Optional[str] = None
+    error: Optional[str] = None
+
+
+class PreparedDocument(NamedTuple):
+    """Everything needed to write a document, computed in a worker process"""
+    source: str
+    title: str
+    content_hash: str
+    codec: str
+    data: bytes
+    size: int
+    search_text: str
+    error: Optional[str] = None
+
+
+def prepare(item: ImportItem, codec: Optional[str] = None) -> PreparedDocument:
+    """
+    Read, title, hash, compress and extract search text of one document. Runs in the pool.
+
+    codec overrides the blob codec, BLOB_CODEC by default.
+    """
+    if item.error is not None:
+        return PreparedDocument(item.source, "", "", "", b"", 0, "", item.error)
+    try:
+        content = item.content
+        if content is None:
+            content = Path(item.source).read_text(encoding="utf-8", errors="replace")
+        payload = content.encode("utf-8")
+        codec, data = blob_store.compress(payload, codec)
+        return PreparedDocument(
+            source=item.source,
+            title=item.title or scan_title(content),
+            content_hash=blob_store.hash_content(content),
+            codec=codec,
+            data=data,
+            size=len(payload),
+            search_text=search_index.index_text(content),
+        )
+    except Exception as e:
+        return PreparedDocument(item.source, "", "", "", b"", 0, "", str(e))
+
+
+# ===================================================================
+# Sources
+# ===================================================================
+
+def iter_html_files(paths: Iterable[Union[str, Path]]) -> Iterator[ImportItem]:
+    """Items for HTML files, and for the .html/.htm files under directories, in name order"""
+    for path in map(Path, paths):
+        if path.is_dir():
+            for file in sorted(path.rglob("*")):
+                if file.suffix.lower() in _HTML_SUFFIXES and file.is_file():
+                    yield ImportItem(str(file))
+        elif path.is_file():
+            yield ImportItem(str(path))
+        else:
+            yield ImportItem(str(path), error="No such file or directory")
+
+
+def parse_ndjson_line(line: Union[str, bytes], source: str) -> Optional[ImportItem]:
+    """Item for one NDJSON line, None for a blank line"""
+    if not line.strip():
+        return None
+    if len(line) > IMPORT_MAX_DOCUMENT_BYTES:
+        return ImportItem(source, error=f"Document larger than {IMPORT_MAX_DOCUMENT_BYTES} bytes")
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return ImportItem(source, error=f"Invalid JSON: {e}")
+    if not isinstance(record, dict) or not isinstance(record.get("content"), str):
+        return ImportItem(source, error='Expected an object with a "content" string')
+    title = record.get("title")
+    title = (title.strip() or None) if isinstance(title, str) else None
+    return ImportItem(source, record["content"], title)
+
+
+def iter_ndjson(lines: Iterable[Union[str, bytes]], name: str = "ndjson") -> Iterator[ImportItem]:
+    """Items for the lines of an NDJSON archive, e.g. an open file"""
+    for number, line in enumerate(lines, 1):
+        item = parse_ndjson_line(line, f"{name}:{number}")
+        if item is not None:
+            yield item
+
+
+class NdjsonDecoder:
+    """
+    Incremental NDJSON parser for a body arriving in chunks of arbitrary size
+
+    feed() returns the items of the lines completed by a chunk; close() the last line.
+    A line longer than IMPORT_MAX_DOCUMENT_BYTES is dropped as it streams in and
+    reported as one error item, so a runaway line can't fill memory.
+    """
+
+    def __init__(self, name: str = "request"):
+        self.name = name
+        self._buffer = bytearray()
+        self._line = 0
+        self._oversized = False
+
+    def feed(self, chunk: bytes) -> List[ImportItem]:
+        items = []
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            self._append(chunk[start:end])
+            items.extend(self._finish_line())
+            start = end + 1
+        self._append(chunk[start:])
+        return items
+
+    def close(self) -> List[ImportItem]:
+        if not self._buffer and not self._oversized:
+            return []
+        return self._finish_line()
+
+    def _append(self, data: bytes):
+        if self._oversized:
+            return
+        self._buffer += data
+        if len(self._buffer) > IMPORT_MAX_DOCUMENT_BYTES:
+            self._buffer.clear()
+            self._oversized = True
+
+    def _finish_line(self) -> List[ImportItem]:
+        self._line += 1
+        source = f"{self.name}:{self._line}"
+        if self._oversized:
+            self._oversized = False
+            error = f"Document larger than {IMPORT_MAX_DOCUMENT_BYTES} bytes"
+            return [ImportItem(source, error=error)]
+        item = parse_ndjson_line(bytes(self._buffer), source)
+        self._buffer.clear()
+        return [item] if item is not None else []
+
+
+# ===================================================================
+# Importer
+# ===================================================================
+
+def write_documents(
+    db: Session, prepared: List[PreparedDocument], document_ids: Optional[List[int]] = None
+) -> List[int]:
+    """
+    Add documents with their first versions, returns the document ids. The caller commits.
+
+    Bulk INSERT/UPDATE statements rather than ORM objects: documents, blobs, versions,
+    search rows and the current version pointers, a handful of executions whatever the
+    number of documents (SQLite runs the RETURNING inserts row by row within them).
+    document_ids gives the documents fixed ids (the seed documents), otherwise the
+    database assigns them.
+    """
+    if not prepared:
+        return []
+    rows = [{"title": p.title} for p in prepared]
+    if document_ids is not None:
+        for row, document_id in zip(rows, document_ids):
+            row["id"] = document_id
+    ids = db.scalars(
+        insert(Document).returning(Document.id, sort_by_parameter_order=True), rows
+    ).all()
+
+    blob_store.put_blobs(db, [
+        ContentBlob(hash=p.content_hash, codec=p.codec, data=p.data, base_hash=None, size=p.size)
+        for p in prepared
+    ])
+    version_ids = db.scalars(
+        insert(DocumentVersion).returning(DocumentVersion.id, sort_by_parameter_order=True),
+        [
+            {
+                "document_id": document_id,
+                "version_number": 1,
+                "content": "",
+                "content_hash": p.content_hash,
+            }
+            for document_id, p in zip(ids, prepared)
+        ]
+    ).all()
+    search_index.index_versions(
+        db, {version_id: p.search_text for version_id, p in zip(version_ids, prepared)}
+    )
+
+    db.execute(update(Document), [
+        {"id": document_id, "current_version_id": version_id}
+        for document_id, version_id in zip(ids, version_ids)
+    ])
+    return list(ids)
+
+
+@dataclass
+class ImportReport:
+    """Outcome of an import; document_ids in import order"""
+    documents: int = 0
+    skipped: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    document_ids: List[int] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds > 0 else 0.0
+
+    def add_error(self, source: str, message: str):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"{source}: {message}")
+
+
+class ImportPool:
+    """
+    One worker pool for every import of a server process
+
+    A pool per request would fork the multi-threaded server for each import, and joining
+    its workers on exit would block the event loop. This pool starts its workers with
+    spawn, creates them on demand, and is shut down once by the app's lifespan.
+    """
+
+    def __init__(self, workers: int = IMPORT_WORKERS):
+        self.workers = workers
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def shutdown(self):
+        """Wait for running work and stop the workers; blocks, so run it off the event loop"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+import_pool = ImportPool()
+
+
+class DocumentImporter:
+    """
+    Writes documents and their first versions in batched transactions of a session
+
+    Each batch is committed on db, or rolled back if it fails. Use as a context manager:
+    without a pool, one is started on the first batch large enough to need it and shut
+    down on exit. A pool passed in (import_pool) is shared and left running. run()
+    imports a whole source; import_batch() imports one batch, for callers feeding
+    documents as they arrive. Both add to self.report.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        batch_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        pool: Optional[ImportPool] = None,
+    ):
+        self.db = db
+        self.batch_size = max(1, batch_size or IMPORT_BATCH_SIZE)
+        if workers is None:
+            workers = IMPORT_WORKERS if pool is None else pool.workers
+        self.workers = workers
+        self.report = ImportReport()
+        self._shared_pool = pool
+        self._pool: Optional[Executor] = None
+
+    def __enter__(self) -> "DocumentImporter":
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None and self._shared_pool is None:
+            self._pool.shutdown()
+        self._pool = None
+
+    def run(self, items: Iterable[ImportItem]) -> ImportReport:
+        """Import every item, preparing the next batch while the current one is written"""
+        started = time.perf_counter()
+        items = iter(items)
+        pending = None
+        while True:
+            batch = list(islice(items, self.batch_size))
+            upcoming = self._prepare(batch) if batch else None
+            if pending is not None:
+                self._write(list(pending))
+            if upcoming is None:
+                break
+            pending = upcoming
+        self.report.seconds += time.perf_counter() - started
+        return self.report
+
+    def import_batch(self, items: List[ImportItem]) -> ImportReport:
+        """Import one batch of at most batch_size items"""
+        started = time.perf_counter()
+        if items:
+            self._write(list(self._prepare(items)))
+        self.report.seconds += time.perf_counter() - started
+        return self.report
+
+    def _prepare(self, batch: List[ImportItem]) -> Iterator[PreparedDocument]:
+        """Start preparing a batch; results come back in order as they are consumed"""
+        if self.workers <= 1 or len(batch) < IMPORT_MIN_PARALLEL:
+            return map(prepare, batch)
+        if self._pool is None:
+            if self._shared_pool is not None:
+                self._pool = self._shared_pool.get()
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool.map(prepare, batch, chunksize=max(1, len(batch) // (self.workers * 4)))
+
+    def _write(self, prepared: List[PreparedDocument]):
+        """Write one batch in one transaction"""
+        self.report.batches += 1
+        ready = []
+        for document in prepared:
+            if document.error is not None:
+                self.report.add_error(document.source, document.error)
+            else:
+                ready.append(document)
+        if not ready:
+            return
+
+        try:
+            document_ids = write_documents(self.db, ready)
+            self.db.commit()
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            logger.error(f"Import batch of {len(ready)} documents failed: {e}")
+            for p in ready:
+                self.report.add_error(p.source, "Database write failed, batch rolled back")
+            return
+
+        self.report.documents += len(document_ids)
+        self.report.document_ids.extend(document_ids)
+
+
+def import_documents(db: Session, items: Iterable[ImportItem], **options) -> ImportReport:
+    """Import every item with a DocumentImporter built from options"""
+    with DocumentImporter(db, **options) as importer:
+        return importer.run(items)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "paths", nargs="*", help="HTML files, or directories searched for .html/.htm files"
+    )
+    parser.add_argument(
+        "--ndjson", action="append", default=[], help="NDJSON archive to import, - for stdin"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Documents per transaction"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=IMPORT_WORKERS, help="Worker processes, 0 for none"
+    )
+    args = parser.parse_args(argv)
+    if not args.paths and not args.ndjson:
+        parser.error("nothing to import: pass HTML paths and/or --ndjson archives")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with startup_lock():
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+
+    def sources() -> Iterator[ImportItem]:
+        yield from iter_html_files(args.paths)
+        for name in args.ndjson:
+            if name == "-":
+                yield from iter_ndjson(sys.stdin.buffer, "stdin")
+            else:
+                with open(name, "rb") as archive:
+                    yield from iter_ndjson(archive, name)
+
+    with SessionLocal() as db:
+        report = import_documents(db, sources(), batch_size=args.batch_size, workers=args.workers)
+    for error in report.errors:
+        logger.warning(f"Skipped {error}")
+    logger.info(
+        f"Imported {report.documents} documents ({report.skipped} skipped) "
+        f"in {report.batches} batches, {report.seconds:.2f} s, {report.docs_per_second:.0f} docs/s"
+    )
+    return 0 if report.documents or not report.skipped else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Document and version lookups for the document endpoints, one query each
+
+Why a repository?
+- Every endpoint re-implemented "load the document, then the version it points at, else
+  the latest version" as two or three separate queries, and save issued two more UPDATEs
+- Here each lookup is one joined SELECT, and writes change the ORM objects so the
+  session sends them in a single flush when the endpoint commits
+
+Document.current_version_id is the single source of truth for the current version;
+documents without a pointer (or pointing at a deleted version) fall back to their latest
+version. Functions return None where the endpoint answers 404 and never commit.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Row, String, cast, func, select
+from sqlalchemy.orm import Session, aliased
+
+from app.internal import version_store
+from app.internal.blob_store import hash_content
+from app.models import Document, DocumentVersion
+
+
+class VersionDeletion(NamedTuple):
+    """What delete_version needs to know, loaded in one query"""
+    document: Document
+    target: Optional[DocumentVersion]
+    version_count: int
+    # Newest version other than target, used when the current version is deleted
+    alternative_id: Optional[int]
+
+
+def _current_version_id():
+    """current_version_id if it points at an existing version, else the latest version's id"""
+    # Aliased, so the subqueries correlate to the outer document only, never to the
+    # outer query's own DocumentVersion
+    pointed = aliased(DocumentVersion)
+    return func.coalesce(
+        select(pointed.id).where(pointed.id == Document.current_version_id).scalar_subquery(),
+        _latest_version_id(),
+    )
+
+
+def _latest_version_id(excluding=None):
+    version = aliased(DocumentVersion)
+    query = select(version.id).where(version.document_id == Document.id)
+    if excluding is not None:
+        query = query.where(version.id != excluding)
+    return query.order_by(version.version_number.desc()).limit(1).scalar_subquery()
+
+
+# Stands in for a missing content hash in the history fingerprint - never part of a hex hash
+_NO_HASH = "?"
+
+
+def _history_fingerprint():
+    """id:number:content_hash of every version of the document, comma-separated"""
+    version = aliased(DocumentVersion)
+    entry = (
+        cast(version.id, String) + ":" + cast(version.version_number, String) + ":"
+        + func.coalesce(version.content_hash, _NO_HASH)
+    )
+    return (
+        select(func.aggregate_strings(entry, ","))
+        .where(version.document_id == Document.id)
+        .scalar_subquery()
+    )
+
+
+def _version_stat(aggregate):
+    version = aliased(DocumentVersion)
+    return select(aggregate(version)).where(version.document_id == Document.id).scalar_subquery()
+
+
+def get_document_with_current_version(
+    db: Session, document_id: int
+) -> Tuple[Optional[Document], Optional[DocumentVersion]]:
+    """(document, current version) - either is None when it doesn't exist"""
+    row = db.execute(
+        select(Document, DocumentVersion)
+        .outerjoin(DocumentVersion, DocumentVersion.id == _current_version_id())
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        return None, None
+    return row[0], row[1]
+
+
+def get_documents_with_current_versions(
+    db: Session, document_ids: Iterable[int]
+) -> Dict[int, Tuple[Document, Optional[DocumentVersion]]]:
+    """{document_id: (document, current version)} of the documents that exist, in one query"""
+    rows = db.execute(
+        select(Document, DocumentVersion)
+        .outerjoin(DocumentVersion, DocumentVersion.id == _current_version_id())
+        .where(Document.id.in_(list(document_ids)))
+    ).all()
+    return {row[0].id: (row[0], row[1]) for row in rows}
+
+
+def get_document_with_version(
+    db: Session, document_id: int, version_number: int
+) -> Tuple[Optional[Document], Optional[DocumentVersion]]:
+    """(document, its version with this number) - either is None when it doesn't exist"""
+    row = db.execute(
+        select(Document, DocumentVersion)
+        .outerjoin(
+            DocumentVersion,
+            (DocumentVersion.document_id == Document.id)
+            & (DocumentVersion.version_number == version_number)
+        )
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        return None, None
+    return row[0], row[1]
+
+
+def get_document_with_version_pair(
+    db: Session, document_id: int, from_number: int, to_number: int
+) -> Tuple[Optional[Document], Optional[DocumentVersion], Optional[DocumentVersion]]:
+    """(document, version from_number, version to_number) - any is None when it doesn't exist"""
+    from_version, to_version = aliased(DocumentVersion), aliased(DocumentVersion)
+    row = db.execute(
+        select(Document, from_version, to_version)
+        .outerjoin(
+            from_version,
+            (from_version.document_id == Document.id) & (from_version.version_number == from_number)
+        )
+        .outerjoin(
+            to_version,
+            (to_version.document_id == Document.id) & (to_version.version_number == to_number)
+        )
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        return None, None, None
+    return row[0], row[1], row[2]
+
+
+def get_document_for_new_version(
+    db: Session, document_id: int
+) -> Tuple[Optional[Document], Optional[DocumentVersion], int]:
+    """(document, current version, highest version number or 0)"""
+    max_version_number = _version_stat(lambda version: func.max(version.version_number))
+    row = db.execute(
+        select(Document, DocumentVersion, max_version_number)
+        .outerjoin(DocumentVersion, DocumentVersion.id == _current_version_id())
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        return None, None, 0
+    return row[0], row[1], row[2] or 0
+
+
+def get_documents_for_new_versions(
+    db: Session, document_ids: Iterable[int]
+) -> Dict[int, Tuple[Document, Optional[DocumentVersion], int]]:
+    """{document_id: (document, current version, highest version number or 0)}, in one query"""
+    max_version_number = _version_stat(lambda version: func.max(version.version_number))
+    rows = db.execute(
+        select(Document, DocumentVersion, max_version_number)
+        .outerjoin(DocumentVersion, DocumentVersion.id == _current_version_id())
+        .where(Document.id.in_(list(document_ids)))
+    ).all()
+    return {row[0].id: (row[0], row[1], row[2] or 0) for row in rows}
+
+
+def get_version_for_deletion(
+    db: Session, document_id: int, version_number: int
+) -> Optional[VersionDeletion]:
+    """The document, the version to delete, how many versions it has and the fallback version"""
+    target = aliased(DocumentVersion)
+    version_count = _version_stat(lambda version: func.count(version.id))
+    row = db.execute(
+        select(Document, target, version_count, _latest_version_id(excluding=target.id))
+        .outerjoin(
+            target,
+            (target.document_id == Document.id) & (target.version_number == version_number),
+        )
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        return None
+    return VersionDeletion(row[0], row[1], row[2], row[3])
+
+
+def get_document_state(db: Session, document_id: int) -> Optional[Row]:
+    """
+    current_version_id, updated_at, version_id and content_hash of a document, without
+    loading either row - enough to check a cache entry or a precondition
+    """
+    return db.execute(
+        select(
+            Document.current_version_id,
+            Document.updated_at,
+            DocumentVersion.id.label("version_id"),
+            DocumentVersion.content_hash,
+        )
+        .outerjoin(DocumentVersion, DocumentVersion.id == _current_version_id())
+        .where(Document.id == document_id)
+    ).one_or_none()
+
+
+def content_etag(version_id: Optional[int], content_hash: Optional[str]) -> Optional[str]:
+    """Strong ETag of a document's current content, None for rows without a content hash"""
+    if version_id is None or content_hash is None:
+        return None
+    return f'"{version_id}-{content_hash}"'
+
+
+def etag_matches(if_match: str, etag: Optional[str]) -> bool:
+    """Strong If-Match comparison against a content_etag() value"""
+    tags = [tag.strip() for tag in if_match.split(",")]
+    if "*" in tags:
+        return etag is not None
+    return etag is not None and etag in tags
+
+
+def get_document_with_history_etag(
+    db: Session, document_id: int
+) -> Tuple[Optional[Document], Optional[DocumentVersion], Optional[str]]:
+    """
+    (document, current version, ETag of its version history views), in one query
+
+    The ETag covers the document's title, pointer and updated_at and every version's id,
+    number and content hash - everything those responses are built from - and is read
+    without loading any content. It is None when a legacy version has no content hash.
+    """
+    row = db.execute(
+        select(Document, DocumentVersion, _history_fingerprint())
+        .outerjoin(DocumentVersion, DocumentVersion.id == _current_version_id())
+        .where(Document.id == document_id)
+    ).one_or_none()
+    if row is None:
+        return None, None, None
+    document, version, fingerprint = row
+    if fingerprint is not None and _NO_HASH in fingerprint:
+        return document, version, None
+    state = repr((document.title, document.current_version_id, document.updated_at, fingerprint))
+    return document, version, f'"{document.id}-{hashlib.sha256(state.encode("utf-8")).hexdigest()}"'
+
+
+def http_date(value: datetime) -> str:
+    """Last-Modified value of a naive UTC timestamp"""
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def is_not_modified(
+    if_none_match: Optional[str], if_modified_since: Optional[str],
+    etag: Optional[str], last_modified: Optional[datetime]
+) -> bool:
+    """
+    Whether a GET can be answered with 304 Not Modified
+
+    If-None-Match decides when present (weak comparison, as RFC 9110 asks for GET),
+    otherwise If-Modified-Since against last_modified. HTTP dates have second
+    resolution, so If-None-Match is the exact check of the two.
+    """
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False  # Invalid dates are ignored
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
+
+def save_current_version(
+    db: Session, document_id: int, content: str
+) -> Tuple[Optional[Document], Optional[DocumentVersion], bool]:
+    """
+    Store new content for the document's current version (autosave)
+
+    Content identical to what is stored (same hash) writes nothing, not even updated_at.
+    Otherwise the version's new blob reference and the document's updated_at go out in
+    one flush. Returns (document, version, changed) - document or version is None when
+    missing, and nothing is written. The caller commits.
+    """
+    document, version = get_document_with_current_version(db, document_id)
+    if document is None or version is None:
+        return document, version, False
+    if version.content_hash is not None and version.content_hash == hash_content(content):
+        return document, version, False
+    document.updated_at = datetime.utcnow()
+    version_store.update_version_content(db, version, content)
+    return document, version, True
+
+
+def patch_current_version(
+    db: Session, document_id: int, base_hash: str, splices: Iterable[Tuple[int, int, str]]
+) -> Tuple[Optional[Document], Optional[DocumentVersion], bool]:
+    """
+    Apply (start, delete, insert) splices to the current version's content
+
+    The splices must have been made against base_hash, the current content's hash,
+    otherwise ContentConflictError is raised; out-of-range splices raise ValueError.
+    Stored like save_current_version(), returns (document, version, changed). The
+    caller commits.
+    """
+    document, version = get_document_with_current_version(db, document_id)
+    if document is None or version is None:
+        return document, version, False
+    if version.content_hash != base_hash:
+        raise version_store.ContentConflictError(
+            f"Splices were made against {base_hash}, the document is at {version.content_hash}"
+        )
+    content = version_store.apply_splices(version_store.get_version_content(db, version), splices)
+    if hash_content(content) == base_hash:
+        return document, version, False
+    document.updated_at = datetime.utcnow()
+    version_store.update_version_content(db, version, content)
+    return document, version, True
+
+
+def point_document_at(document: Document, version: DocumentVersion):
+    """Make version the document's current version. The caller commits."""
+    document.current_version_id = version.id
+    document.updated_at = datetime.utcnow()
@@ -0,0 +1,51 @@
+"""
+Chat completions whose text can be streamed out of a running workflow
+
+A workflow node that answers the user directly calls complete_text() instead of
+openai_client.chat.completions.create(). With stream=True the completion is requested
+as a stream and every text delta is dispatched as an ASSISTANT_DELTA_EVENT custom
+event of the node's run, which graph_builder.run_with_node_events() hands to its
+delta_callback while the workflow keeps running. The full text is still returned, so
+the node's state update (and the persisted message) is the same either way.
+"""
+
+from typing import Any
+
+from langchain_core.callbacks import adispatch_custom_event
+
+from .ai_base import close_stream
+
+# Name of the custom event carrying {"delta": text}
+ASSISTANT_DELTA_EVENT = "assistant_delta"
+
+
+async def complete_text(openai_client: Any, stream: bool = False, **request) -> str:
+    """
+    Text of a chat completion
+
+    Args:
+        openai_client: AsyncOpenAI client
+        stream: Dispatch text deltas as they arrive; must be called from a workflow node
+        **request: Arguments for chat.completions.create()
+
+    Returns:
+        Complete message content
+    """
+    if not stream:
+        response = await openai_client.chat.completions.create(**request)
+        return response.choices[0].message.content
+
+    parts = []
+    completion = await openai_client.chat.completions.create(stream=True, **request)
+    try:
+        async for chunk in completion:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                await adispatch_custom_event(ASSISTANT_DELTA_EVENT, {"delta": delta})
+    finally:
+        # Aborts the request when the turn is cancelled mid-stream
+        await close_stream(completion)
+    return "".join(parts)
@@ -11,6 +11,8 @@ import re
 from typing import Dict, List, Tuple
 from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
+from .cancellation import cancellation_stats
+from .llm_stream import complete_text
 from .text_utils import html_to_plain_text
 
 logger = logging.getLogger(__name__)
@@ -378,6 +380,11 @@ class MermaidRenderer:
                     await browser.close()
                     return ""
                     
+        except asyncio.CancelledError:
+            # Leaving async_playwright() has already shut the browser down
+            cancellation_stats.render()
+            logger.info("Mermaid rendering cancelled")
+            raise
         except Exception as e:
             logger.error(f"Mermaid rendering failed: {str(e)}")
             return ""
@@ -695,10 +702,6 @@ async def generate_mermaid_node(state: dict) -> dict:
         Updated state with mermaid diagram response
     """
     try:
-        # Send progress update for agent selection
-        if state.get("progress_callback"):
-            await state["progress_callback"]("agent_selection", "system", "mermaid_diagram")
-            
         logger.info("Generating Mermaid diagram")
         
         user_input = state.get("user_input", "")
@@ -721,8 +724,10 @@ async def generate_mermaid_node(state: dict) -> dict:
                 }]
             }
         
-        # Generate Mermaid code using AI
-        response = await openai_client.chat.completions.create(
+        # Generate Mermaid code using AI, streamed out as it is written when asked to
+        mermaid_code = await complete_text(
+            openai_client,
+            stream=bool(state.get("stream_deltas")),
             model=os.getenv("OPENAI_MODEL", "gpt-4.1"),
             temperature=0.3,
             max_tokens=1000,  # Prevent truncation of diagram syntax
@@ -783,7 +788,7 @@ Document Content:
             ]
         )
         
-        mermaid_code = response.choices[0].message.content.strip()
+        mermaid_code = mermaid_code.strip()
         
         # Clean up the response (remove markdown formatting if present)
         import re
@@ -808,10 +813,6 @@ Document Content:
                 mermaid_code = create_fallback_diagram(user_input)
                 logger.info("Using fallback diagram due to persistent syntax errors")
         
-        # Send progress update for diagram generation
-        if state.get("progress_callback"):
-            await state["progress_callback"]("diagram_generation", "system", "mermaid_diagram")
-        
         # Return response with mermaid diagram
         return {
             **state,
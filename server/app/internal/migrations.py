@@ -0,0 +1,235 @@
+"""
+Lightweight schema migrations run on startup
+
+Why do we need this?
+- Base.metadata.create_all only creates missing tables, it never changes existing ones
+- Since DATABASE_URL can point at a file, databases created by older versions of the
+  app must be upgraded in place when new columns or indexes are added
+
+Each migration is idempotent: it inspects the live schema and only applies what is
+missing, so running all of them on every startup is safe.
+"""
+
+import json
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, literal_column, select, table, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+
+def _existing_columns(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _add_columns(conn: Connection, table: str, columns: List[Tuple[str, str]]) -> int:
+    """Add (name, DDL type) columns that don't exist yet, returns how many were added"""
+    existing = _existing_columns(conn, table)
+    added = 0
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            added += 1
+    return added
+
+
+def add_version_content_hash_column(conn: Connection):
+    """content_hash on document_version, referencing the content_blob table"""
+    _add_columns(conn, "document_version", [
+        ("content_hash", "VARCHAR(64) REFERENCES content_blob(hash)"),
+    ])
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_version_content_hash "
+        "ON document_version (content_hash)"
+    ))
+
+
+def move_version_content_to_blobs(conn: Connection):
+    """
+    Move inline version content into the content-addressed blob store
+
+    Versions written before the blob store existed keep their full content in
+    document_version.content. Migrated documents get the same keyframe/reverse-delta
+    layout as new ones.
+    """
+    from sqlalchemy.orm import Session
+
+    from app.internal import blob_store
+    from app.internal.version_store import KEYFRAME_INTERVAL
+
+    pending_rows = conn.execute(text(
+        "SELECT document_version.id, document_version.document_id, "
+        "document_version.version_number, document_version.content FROM document_version "
+        "LEFT JOIN content_blob ON content_blob.hash = document_version.content_hash "
+        "WHERE content_blob.hash IS NULL "
+        "ORDER BY document_version.document_id, document_version.version_number"
+    )).all()
+    if not pending_rows:
+        return
+
+    hashes = {}
+    with Session(bind=conn) as db:
+        for row in pending_rows:
+            hashes[row.id] = blob_store.put_content(db, row.content or "")
+
+        # Reverse deltas: each version's blob against the next version's, except keyframes
+        for older, newer in zip(pending_rows, pending_rows[1:]):
+            if older.document_id != newer.document_id:
+                continue
+            if KEYFRAME_INTERVAL > 1 and older.version_number % KEYFRAME_INTERVAL != 0:
+                blob_store.rebase(db, hashes[older.id], hashes[newer.id])
+        db.flush()
+
+    for row in pending_rows:
+        conn.execute(
+            text("UPDATE document_version SET content = '', content_hash = :hash WHERE id = :id"),
+            {"hash": hashes[row.id], "id": row.id}
+        )
+    logger.info(f"Moved content of {len(pending_rows)} versions into the blob store")
+
+
+def add_version_number_unique_index(conn: Connection):
+    """
+    Unique (document_id, version_number) index on document_version
+
+    Concurrent create_version requests could previously insert the same version number
+    twice. Duplicates are renumbered after the document's highest version first, oldest
+    row keeping its number.
+    """
+    duplicates = conn.execute(text(
+        "SELECT id, document_id FROM document_version AS v "
+        "WHERE EXISTS (SELECT 1 FROM document_version AS o WHERE o.document_id = v.document_id "
+        "AND o.version_number = v.version_number AND o.id < v.id) "
+        "ORDER BY document_id, id"
+    )).all()
+    for row_id, document_id in duplicates:
+        conn.execute(
+            text(
+                "UPDATE document_version SET version_number = "
+                "(SELECT MAX(version_number) + 1 FROM document_version "
+                "WHERE document_id = :document_id) "
+                "WHERE id = :id"
+            ),
+            {"document_id": document_id, "id": row_id}
+        )
+    if duplicates:
+        logger.warning(f"Renumbered {len(duplicates)} versions with duplicate version numbers")
+
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_document_version_document_number "
+        "ON document_version (document_id, version_number)"
+    ))
+
+
+def move_suggestion_cards_to_table(conn: Connection):
+    """
+    Move suggestion cards out of chat_history.chat_metadata into the suggestion_card table
+
+    Cards and their card_actions used to be stored as one JSON string per message.
+    Migrated messages keep only agents_used in chat_metadata, so rows without a
+    "suggestion_cards" key have already been moved.
+    """
+    tables = set(inspect(conn).get_table_names())
+    if "chat_history" not in tables or "suggestion_card" not in tables:
+        return
+
+    rows = conn.execute(text(
+        "SELECT id, document_id, version_number, chat_metadata FROM chat_history "
+        "WHERE message_type = 'suggestion_cards' AND chat_metadata LIKE '%\"suggestion_cards\"%'"
+    )).all()
+    moved = 0
+    for row in rows:
+        try:
+            metadata = json.loads(row.chat_metadata)
+        except (TypeError, json.JSONDecodeError):
+            continue
+        card_actions = metadata.get("card_actions") or {}
+        for position, card in enumerate(metadata.get("suggestion_cards") or []):
+            card_id = str(card["id"]) if card.get("id") else ""
+            status = card_actions.get(card_id, "active")
+            conn.execute(
+                text(
+                    "INSERT INTO suggestion_card (message_id, document_id, version_number, "
+                    "card_id, position, status, payload) VALUES (:message_id, :document_id, "
+                    ":version_number, :card_id, :position, :status, :payload)"
+                ),
+                {
+                    "message_id": row.id,
+                    "document_id": row.document_id,
+                    "version_number": row.version_number,
+                    "card_id": card_id,
+                    "position": position,
+                    "status": status,
+                    "payload": json.dumps(card),
+                }
+            )
+            moved += 1
+        conn.execute(
+            text("UPDATE chat_history SET chat_metadata = :metadata WHERE id = :id"),
+            {"metadata": json.dumps({"agents_used": metadata.get("agents_used", [])}), "id": row.id}
+        )
+    if rows:
+        logger.info(
+            f"Moved {moved} suggestion cards of {len(rows)} chat messages into suggestion_card"
+        )
+
+
+def add_chat_history_index(conn: Connection):
+    """Composite (document_id, version_number, created_at, id) index on chat_history"""
+    if "chat_history" not in inspect(conn).get_table_names():
+        return
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_history_document_version_created "
+        "ON chat_history (document_id, version_number, created_at, id)"
+    ))
+
+
+def add_search_index(conn: Connection):
+    """
+    FTS5 search tables (see app.internal.search_index) and versions missing from them
+
+    Chat messages are indexed by triggers; versions written before the index existed
+    are read through the blob store and indexed here.
+    """
+    from sqlalchemy.orm import Session
+
+    from app.internal import search_index, version_store
+    from app.models import DocumentVersion
+
+    if conn.dialect.name != "sqlite":
+        return
+    search_index.ensure_search_tables(conn)
+    if "version_search" not in inspect(conn).get_table_names():
+        return
+
+    with Session(bind=conn) as db:
+        indexed = select(literal_column("rowid")).select_from(table("version_search"))
+        missing = db.scalars(
+            select(DocumentVersion).where(DocumentVersion.id.not_in(indexed))
+        ).all()
+        for version in missing:
+            content = version_store.get_version_content(db, version)
+            search_index.index_version(db, version.id, content)
+        db.flush()
+    if missing:
+        logger.info(f"Indexed {len(missing)} versions for full-text search")
+
+
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("add_version_content_hash_column", add_version_content_hash_column),
+    ("move_version_content_to_blobs", move_version_content_to_blobs),
+    ("add_version_number_unique_index", add_version_number_unique_index),
+    ("move_suggestion_cards_to_table", move_suggestion_cards_to_table),
+    ("add_chat_history_index", add_chat_history_index),
+    ("add_search_index", add_search_index),
+]
+
+
+def run_migrations(engine: Engine):
+    """Apply all migrations in order, each in its own transaction"""
+    for name, migration in MIGRATIONS:
+        with engine.begin() as conn:
+            migration(conn)
+        logger.debug(f"Migration checked: {name}")
@@ -160,13 +160,16 @@ class SimplePDFExporter:
         }
         """
     
-    async def export_document(self, document: Document, version: DocumentVersion) -> str:
+    async def export_document(self, document: Document, version: DocumentVersion,
+                              content: Optional[str] = None) -> str:
         """
         Export document version to PDF
         
         Args:
             document: Document object
             version: Document version object
+            content: Full version content; defaults to version.content (only complete
+                for versions not stored as deltas)
             
         Returns:
             Generated PDF filename
@@ -178,7 +181,9 @@ class SimplePDFExporter:
             logger.info("Processing Mermaid diagrams...")
             from app.internal.mermaid_render import MermaidRenderer
             mermaid_renderer = MermaidRenderer()
-            processed_html = await mermaid_renderer.process_html(version.content)
+            processed_html = await mermaid_renderer.process_html(
+                content if content is not None else version.content
+            )
             
             # 2. Clean HTML content
             logger.info("Preprocessing HTML content...")
@@ -0,0 +1,254 @@
+"""
+SQLite FTS5 full-text search over document versions and chat history
+
+Why an FTS index?
+- Finding which document or version mentions a claim term used to mean loading and
+  decompressing every version and scanning every chat row
+- FTS5 answers the same question from an inverted index in milliseconds, ranks matches
+  with bm25 and cuts highlighted snippets around them
+
+How it works:
+- version_search holds the plain text of every version, with rowid = document_version.id.
+  Version content lives compressed in the blob store, so it can't be indexed by a
+  trigger - version_store updates the index when a version is created or saved
+- chat_search is an external-content index over chat_history.content, kept in sync by
+  triggers, so every writer (sync sessions, the async chat writer, bulk deletes) is covered
+- A trigger on document_version removes index rows of deleted versions, whichever way
+  they are deleted
+- Search results are joined back to document_version / chat_history, so a stale index
+  row can never surface a row that no longer exists
+
+Only SQLite builds with FTS5 are supported; on other databases indexing is a no-op and
+search() raises SearchUnavailableError.
+"""
+
+import html
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.internal.db import Base
+
+logger = logging.getLogger(__name__)
+
+# Porter stemming so "claims" finds "claim"; diacritics folded for names and citations
+TOKENIZER = "porter unicode61 remove_diacritics 2"
+
+SEARCH_KINDS = ("all", "versions", "chat")
+
+# Tokens around a match in a snippet
+SNIPPET_TOKENS = 16
+
+# Control characters used as highlight markers, so snippets can be HTML-escaped before
+# the markers are turned into <mark> tags
+_MARK_OPEN = "\x02"
+_MARK_CLOSE = "\x03"
+
+_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS version_search USING fts5(body, tokenize='{TOKENIZER}')",
+    "CREATE TRIGGER IF NOT EXISTS version_search_ad AFTER DELETE ON document_version BEGIN "
+    "DELETE FROM version_search WHERE rowid = old.id; END",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS chat_search USING fts5(content, content='chat_history', "
+    f"content_rowid='id', tokenize='{TOKENIZER}')",
+    "CREATE TRIGGER IF NOT EXISTS chat_search_ai AFTER INSERT ON chat_history BEGIN "
+    "INSERT INTO chat_search(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_search_ad AFTER DELETE ON chat_history BEGIN "
+    "INSERT INTO chat_search(chat_search, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_search_au AFTER UPDATE OF content ON chat_history BEGIN "
+    "INSERT INTO chat_search(chat_search, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO chat_search(rowid, content) VALUES (new.id, new.content); END",
+]
+
+_TAG_PATTERN = re.compile(r"<[^>]*>")
+_SPACE_PATTERN = re.compile(r"\s+")
+# A quoted phrase, or a bare word with an optional trailing * for prefix search
+_QUERY_TERM_PATTERN = re.compile(r'"([^"]*)"|([^\s"]+)')
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class SearchUnavailableError(Exception):
+    """The database has no FTS5 index (not SQLite, or SQLite built without FTS5)"""
+
+
+def _is_sqlite(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_search_tables(conn: Connection):
+    """
+    Create the FTS tables and triggers if they don't exist yet
+
+    A chat index created next to existing chat_history rows is rebuilt from them.
+    Versions are backfilled by the add_search_index migration, because their
+    content has to be read through the blob store.
+    """
+    if not _is_sqlite(conn):
+        return
+    existing = set(conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'table'")))
+    if "document_version" not in existing or "chat_history" not in existing:
+        return
+    for statement in _SCHEMA:
+        conn.execute(text(statement))
+    if "chat_search" not in existing:
+        conn.execute(text("INSERT INTO chat_search(chat_search) VALUES ('rebuild')"))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_search_tables(_target, connection, **_kw):
+    ensure_search_tables(connection)
+
+
+def index_text(content: str) -> str:
+    """
+    Plain text of version HTML for indexing
+
+    A regex strip rather than html_to_plain_text(): this runs on every autosave, and
+    BeautifulSoup takes tens of milliseconds on a large document while the tokenizer
+    only needs the words.
+    """
+    return _SPACE_PATTERN.sub(" ", html.unescape(_TAG_PATTERN.sub(" ", content or ""))).strip()
+
+
+def index_version(db: Session, version_id: int, content: str):
+    """Index (or re-index) a version's content. The caller commits."""
+    if not _is_sqlite(db.get_bind()):
+        return
+    db.execute(text("DELETE FROM version_search WHERE rowid = :id"), {"id": version_id})
+    db.execute(
+        text("INSERT INTO version_search(rowid, body) VALUES (:id, :body)"),
+        {"id": version_id, "body": index_text(content)}
+    )
+
+
+def index_versions(db: Session, bodies: Dict[int, str]):
+    """
+    Index many versions at once from text already run through index_text(), keyed by
+    version id
+
+    For bulk writers; one DELETE and one INSERT executemany instead of two statements
+    per version. The caller commits.
+    """
+    if not bodies or not _is_sqlite(db.get_bind()):
+        return
+    db.execute(text("DELETE FROM version_search WHERE rowid = :id"), [{"id": i} for i in bodies])
+    db.execute(
+        text("INSERT INTO version_search(rowid, body) VALUES (:id, :body)"),
+        [{"id": i, "body": body} for i, body in bodies.items()]
+    )
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turn user input into a safe FTS5 MATCH expression
+
+    Every term is quoted, so FTS5 operators and column filters in the input are matched
+    as plain words instead of raising syntax errors. "quoted phrases" stay phrases and a
+    trailing * keeps prefix search. Terms are ANDed.
+
+    Returns an empty string when the input has no searchable words.
+    """
+    terms = []
+    for phrase, word in _QUERY_TERM_PATTERN.findall(query or ""):
+        words = _WORD_PATTERN.findall(phrase or word)
+        if not words:
+            continue
+        term = '"' + " ".join(words) + '"'
+        if word and word.endswith("*") and len(words) == 1:
+            term += "*"
+        terms.append(term)
+    return " ".join(terms)
+
+
+def _highlight(snippet: Optional[str]) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def _snippet(table: str, column: int) -> str:
+    return (
+        f"snippet({table}, {column}, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', {SNIPPET_TOKENS})"
+    )
+
+
+_VERSION_SELECT = (
+    "SELECT 'version' AS kind, v.document_id AS document_id, d.title AS document_title, "
+    "CAST(v.version_number AS TEXT) AS version_number, v.id AS version_id, NULL AS message_id, "
+    "NULL AS message_type, v.created_at AS created_at, "
+    f"{_snippet('version_search', 0)} AS snippet, bm25(version_search) AS rank "
+    "FROM version_search "
+    "JOIN document_version AS v ON v.id = version_search.rowid "
+    "JOIN document AS d ON d.id = v.document_id "
+    "WHERE version_search MATCH :match"
+)
+
+_CHAT_SELECT = (
+    "SELECT 'chat' AS kind, c.document_id AS document_id, d.title AS document_title, "
+    "c.version_number AS version_number, NULL AS version_id, c.id AS message_id, "
+    "c.message_type AS message_type, c.created_at AS created_at, "
+    f"{_snippet('chat_search', 0)} AS snippet, bm25(chat_search) AS rank "
+    "FROM chat_search "
+    "JOIN chat_history AS c ON c.id = chat_search.rowid "
+    "JOIN document AS d ON d.id = c.document_id "
+    "WHERE chat_search MATCH :match"
+)
+
+
+def search(
+    db: Session,
+    query: str,
+    kind: str = "all",
+    document_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Tuple[List[Dict], bool]:
+    """
+    Ranked full-text search over version content and/or chat messages
+
+    Args:
+        query: User input, see build_match_query()
+        kind: "all", "versions" or "chat"
+        document_id: Only search this document
+        limit, offset: Page of results, best match first
+
+    Returns:
+        (results, has_more) - results are dicts with kind, document_id, document_title,
+        version_number, version_id (versions), message_id and message_type (chat),
+        created_at, snippet (HTML-escaped, matches wrapped in <mark>) and rank
+        (bm25, lower is better)
+    """
+    if kind not in SEARCH_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(SEARCH_KINDS)}")
+    if not _is_sqlite(db.get_bind()):
+        raise SearchUnavailableError("Full-text search requires SQLite with FTS5")
+
+    match = build_match_query(query)
+    if not match:
+        return [], False
+
+    selects = []
+    if kind in ("all", "versions"):
+        version_filter = " AND v.document_id = :document_id" if document_id is not None else ""
+        selects.append(_VERSION_SELECT + version_filter)
+    if kind in ("all", "chat"):
+        chat_filter = " AND c.document_id = :document_id" if document_id is not None else ""
+        selects.append(_CHAT_SELECT + chat_filter)
+    statement = (
+        " UNION ALL ".join(selects) + " ORDER BY rank, created_at DESC LIMIT :limit OFFSET :offset"
+    )
+
+    rows = db.execute(
+        text(statement),
+        {"match": match, "document_id": document_id, "limit": limit + 1, "offset": offset}
+    ).mappings().all()
+
+    results = []
+    for row in rows[:limit]:
+        result = dict(row)
+        result["snippet"] = _highlight(result["snippet"])
+        results.append(result)
+    return results, len(rows) > limit
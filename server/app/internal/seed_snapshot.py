@@ -0,0 +1,176 @@
+"""
+Precomputed snapshot of the seed documents, loaded on first startup
+
+Why a snapshot?
+- Seeding used to import the seed corpus (app.internal.data), parse every document with
+  BeautifulSoup for its title, then hash, compress and index it with add_version(), one
+  document at a time, before the app could serve requests
+- All of that is the same on every boot, so it is done once, at build time: the snapshot
+  holds the rows ready to insert (titles, content hashes, compressed blobs, search text)
+  and startup only bulk-inserts them through document_import.write_documents()
+
+The snapshot is rebuilt whenever app/internal/data.py changes:
+    python -m app.internal.seed_snapshot          # rewrite seed_snapshot.json
+    python -m app.internal.seed_snapshot --check  # exit 1 if it is out of date
+
+It records a digest of the seed contents, checked before seeding (three SHA-256 hashes,
+no parsing). If the file is stale, missing or unreadable, seeding falls back to
+computing the rows from the seed corpus and logs a warning; tests also fail while it is
+stale.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.internal.document_import import ImportItem, PreparedDocument, prepare, write_documents
+
+logger = logging.getLogger(__name__)
+
+SEED_SNAPSHOT_PATH = Path(
+    os.getenv("SEED_SNAPSHOT_PATH", Path(__file__).with_name("seed_snapshot.json"))
+)
+
+# Bumped when the snapshot layout changes; other versions are ignored and rebuilt
+SNAPSHOT_FORMAT = 1
+
+# zlib is always available, so the snapshot loads whether or not zstandard is installed
+SNAPSHOT_CODEC = "zlib"
+
+
+def seed_contents() -> List[str]:
+    """The DOCUMENT_<n> strings of app.internal.data, in order of n"""
+    import app.internal.data as data_module
+
+    names = [
+        name for name in dir(data_module)
+        if name.startswith("DOCUMENT_") and not name.endswith("__")
+        and isinstance(getattr(data_module, name), str)
+    ]
+    names.sort(key=lambda name: int(name.split("_")[1]) if name.split("_")[1].isdigit() else 999)
+    return [getattr(data_module, name) for name in names]
+
+
+def source_digest(contents: List[str]) -> str:
+    """Digest of the seed contents a snapshot was built from"""
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(hashlib.sha256(content.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+def build_snapshot(contents: List[str]) -> dict:
+    """Snapshot of the seed documents, as written to SEED_SNAPSHOT_PATH"""
+    documents = []
+    for number, content in enumerate(contents, 1):
+        prepared = prepare(ImportItem(f"DOCUMENT_{number}", content), codec=SNAPSHOT_CODEC)
+        if prepared.error is not None:
+            raise ValueError(f"Seed document {number} cannot be prepared: {prepared.error}")
+        documents.append({
+            "id": number,
+            "title": prepared.title,
+            "content_hash": prepared.content_hash,
+            "codec": prepared.codec,
+            "data": base64.b64encode(prepared.data).decode("ascii"),
+            "size": prepared.size,
+            "search_text": prepared.search_text,
+        })
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "source_digest": source_digest(contents),
+        "documents": documents,
+    }
+
+
+def write_snapshot(path: Path = SEED_SNAPSHOT_PATH) -> dict:
+    """Rebuild the snapshot file from app.internal.data"""
+    snapshot = build_snapshot(seed_contents())
+    path.write_text(json.dumps(snapshot, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+    return snapshot
+
+
+def load_snapshot(path: Path = SEED_SNAPSHOT_PATH) -> Optional[dict]:
+    """The snapshot file, None when it is missing, unreadable or of another format"""
+    try:
+        snapshot = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Seed snapshot {path} not loaded: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+        logger.warning(f"Seed snapshot {path} has an unsupported format, ignoring it")
+        return None
+    return snapshot
+
+
+def _prepared_documents(snapshot: dict) -> List[PreparedDocument]:
+    return [
+        PreparedDocument(
+            source=f"DOCUMENT_{row['id']}",
+            title=row["title"],
+            content_hash=row["content_hash"],
+            codec=row["codec"],
+            data=base64.b64decode(row["data"]),
+            size=row["size"],
+            search_text=row["search_text"],
+        )
+        for row in snapshot["documents"]
+    ]
+
+
+def seed_database(db: Session, path: Path = SEED_SNAPSHOT_PATH) -> int:
+    """
+    Insert the seed documents (ids 1..n) with their first versions, returns how many
+
+    Commits. Raises IntegrityError if another process seeded them first.
+    """
+    contents = seed_contents()
+    snapshot = load_snapshot(path)
+    if snapshot is not None and snapshot.get("source_digest") != source_digest(contents):
+        logger.warning(
+            f"Seed snapshot {path} is out of date, run: python -m app.internal.seed_snapshot"
+        )
+        snapshot = None
+    if snapshot is None:
+        logger.warning("Building the seed rows from app.internal.data instead")
+        snapshot = build_snapshot(contents)
+    documents = snapshot["documents"]
+    write_documents(
+        db, _prepared_documents(snapshot), document_ids=[row["id"] for row in documents]
+    )
+    db.commit()
+    return len(documents)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="Only check that the snapshot is up to date"
+    )
+    parser.add_argument("--path", type=Path, default=SEED_SNAPSHOT_PATH, help="Snapshot file")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        snapshot = load_snapshot(args.path)
+        if snapshot is None or snapshot["source_digest"] != source_digest(seed_contents()):
+            print(f"{args.path} is out of date, run: python -m app.internal.seed_snapshot")
+            return 1
+        print(f"{args.path} is up to date")
+        return 0
+
+    snapshot = write_snapshot(args.path)
+    print(f"Wrote {len(snapshot['documents'])} seed documents to {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -350,6 +350,90 @@ class StreamingJSONParser:
         return f"Buffer length: {len(self.buffer)}, reset count: {self.reset_count}"
 
 
+class StreamingObjectMembers:
+    """
+    Incremental parser for the members of one streamed JSON object
+
+    Why do we need this class?
+    - StreamingJSONParser only returns the object once all of it has arrived
+    - A response like {"chunk_1": {...}, "chunk_2": {...}} is useful member by member:
+      each "key": value pair can be acted on as soon as its value is complete
+
+    Text before the opening brace (prose, a ```json fence) is skipped. Parsing stops at
+    the closing brace or at the first member that is not valid JSON; the caller still
+    parses the whole response as before. An incomplete member is only decoded again once
+    a closing } or ] has arrived, so a long member costs linear, not quadratic, time.
+
+    Usage example:
+        members = StreamingObjectMembers()
+        for chunk in ai_stream:
+            for key, value in members.add_chunk(chunk):
+                handle_member(key, value)
+    """
+
+    _decoder = json.JSONDecoder()
+    _separator = re.compile(r'[\s,]*')
+    _whitespace = re.compile(r'\s*')
+    _closers = re.compile(r'[}\]]')
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None  # Index after the opening brace, None until it arrives
+        self.waiting_from = None  # Set while a member is incomplete: where new text begins
+        self.done = False
+
+    def add_chunk(self, chunk: str) -> List[tuple]:
+        """
+        Add streamed text, returns the (key, value) members it completed, in order
+        """
+        if self.done or not chunk:
+            return []
+        self.buffer += chunk
+        if self.waiting_from is not None:
+            # No value can have completed without a closing } or ]
+            if not self._closers.search(self.buffer, self.waiting_from):
+                self.waiting_from = len(self.buffer)
+                return []
+            self.waiting_from = None
+
+        if self.position is None:
+            start = self.buffer.find('{')
+            if start == -1:
+                return []
+            self.position = start + 1
+
+        members = []
+        while True:
+            position = self._separator.match(self.buffer, self.position).end()
+            if position == len(self.buffer):
+                break
+            if self.buffer[position] == '}':
+                self.done = True
+                break
+            try:
+                key, end = self._decoder.raw_decode(self.buffer, position)
+                colon = self._whitespace.match(self.buffer, end).end()
+                if colon == len(self.buffer):
+                    self.waiting_from = len(self.buffer)
+                    break
+                if self.buffer[colon] != ':' or not isinstance(key, str):
+                    self.done = True
+                    break
+                value_start = self._whitespace.match(self.buffer, colon + 1).end()
+                value, end = self._decoder.raw_decode(self.buffer, value_start)
+            except json.JSONDecodeError:
+                # Incomplete until more text arrives (a broken member just never completes)
+                self.waiting_from = len(self.buffer)
+                break
+            if end == len(self.buffer) and not isinstance(value, (dict, list, str)):
+                # A number or literal may continue in the next chunk
+                self.waiting_from = len(self.buffer)
+                break
+            members.append((key, value))
+            self.position = end
+        return members
+
+
 def create_chunks_from_text(text: str) -> List[DocumentChunk]:
     """
     Create document chunks from plain text.
@@ -0,0 +1,202 @@
+"""
+Word-level diffs between document versions
+
+Why diff on the server?
+- Comparing two versions used to ship both full HTML versions to the client, which
+  diffed them itself (client wordLevelDiff.ts) - payload and work grew with the
+  document, not with the change
+- Here the diff runs over the plain text of both versions (html_to_plain_text) and only
+  the changed regions are returned, so a one-word edit to a long patent is a one-hunk
+  response
+
+How it works:
+- Text is split into the same tokens as the client uses: words, single punctuation
+  characters and runs of whitespace
+- The unchanged head and tail are matched in linear time and only the tokens between
+  them go through SequenceMatcher; a middle part longer than DIFF_MAX_TOKENS is
+  reported as one replaced region, which bounds the (quadratic in the worst case) cost
+- Hunks separated only by whitespace are merged, so a rewritten phrase is one hunk
+  rather than one per word
+- Results are cached by the (from, to) pair of content hashes. A hash identifies the
+  content, so entries never go stale and workers sharing a database agree on keys
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.internal import version_store
+from app.internal.text_utils import html_to_plain_text
+from app.models import DocumentVersion
+
+# Number of diffs kept in memory, and the total changed text they may hold
+VERSION_DIFF_CACHE_SIZE = int(os.getenv("VERSION_DIFF_CACHE_SIZE", "256"))
+VERSION_DIFF_CACHE_MAX_BYTES = int(os.getenv("VERSION_DIFF_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Longest changed region (in tokens) that is diffed rather than reported as one replacement
+DIFF_MAX_TOKENS = int(os.getenv("DIFF_MAX_TOKENS", "5000"))
+
+# Words, single punctuation characters and whitespace runs, as in the client's wordLevelDiff.ts.
+# Every character belongs to a token, so joining the tokens gives back the text
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+class DiffHunk(NamedTuple):
+    """
+    from_text at from_start in the old text was replaced by to_text at to_start in the new
+    text
+    """
+    from_start: int
+    from_text: str
+    to_start: int
+    to_text: str
+
+
+def word_diff(old: str, new: str) -> List[DiffHunk]:
+    """Changed regions between two texts, offsets in characters"""
+    old_tokens = _WORD_PATTERN.findall(old)
+    new_tokens = _WORD_PATTERN.findall(new)
+
+    shortest = min(len(old_tokens), len(new_tokens))
+    prefix = 0
+    while prefix < shortest and old_tokens[prefix] == new_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and old_tokens[-1 - suffix] == new_tokens[-1 - suffix]:
+        suffix += 1
+    old_end, new_end = len(old_tokens) - suffix, len(new_tokens) - suffix
+
+    # Changed token ranges (i1, i2, j1, j2)
+    ranges: List[List[int]] = []
+    if prefix == old_end and prefix == new_end:
+        pass
+    elif max(old_end, new_end) - prefix > DIFF_MAX_TOKENS:
+        ranges.append([prefix, old_end, prefix, new_end])
+    else:
+        # autojunk would treat frequent tokens (spaces, common words) as junk
+        matcher = SequenceMatcher(
+            None, old_tokens[prefix:old_end], new_tokens[prefix:new_end], autojunk=False
+        )
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            i1, i2, j1, j2 = i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix
+            previous = ranges[-1] if ranges else None
+            if previous is not None and all(
+                token.isspace() for token in old_tokens[previous[1]:i1]
+            ):
+                previous[1], previous[3] = i2, j2
+            else:
+                ranges.append([i1, i2, j1, j2])
+
+    old_offsets = _offsets(old_tokens)
+    new_offsets = _offsets(new_tokens)
+    return [
+        DiffHunk(
+            old_offsets[i1], "".join(old_tokens[i1:i2]),
+            new_offsets[j1], "".join(new_tokens[j1:j2]),
+        )
+        for i1, i2, j1, j2 in ranges
+    ]
+
+
+def _offsets(tokens: List[str]) -> List[int]:
+    """Character offset of every token, plus the text length"""
+    offsets = [0]
+    for token in tokens:
+        offsets.append(offsets[-1] + len(token))
+    return offsets
+
+
+class DiffCache:
+    """
+    Thread-safe LRU cache of diffs keyed by (from content hash, to content hash)
+
+    Bounded by entry count and by the total length of the hunks' text; diffs larger than
+    the byte budget are not cached.
+    """
+
+    def __init__(self, max_entries: int = VERSION_DIFF_CACHE_SIZE,
+                 max_bytes: int = VERSION_DIFF_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[DiffHunk], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[DiffHunk]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[str, str], hunks: List[DiffHunk]):
+        size = sum(len(hunk.from_text) + len(hunk.to_text) for hunk in hunks)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (hunks, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+diff_cache = DiffCache()
+
+
+def diff_versions(
+    db: Session, from_version: DocumentVersion, to_version: DocumentVersion
+) -> List[DiffHunk]:
+    """
+    Word-level diff of two versions' plain text, cached by their content hashes
+
+    Versions with the same hash are identical and cost no content read. Legacy rows
+    without a hash are diffed but not cached.
+    """
+    key = None
+    if from_version.content_hash and to_version.content_hash:
+        if from_version.content_hash == to_version.content_hash:
+            return []
+        key = (from_version.content_hash, to_version.content_hash)
+        cached = diff_cache.get(key)
+        if cached is not None:
+            return cached
+
+    hunks = word_diff(
+        html_to_plain_text(version_store.get_version_content(db, from_version)),
+        html_to_plain_text(version_store.get_version_content(db, to_version)),
+    )
+    if key is not None:
+        diff_cache.put(key, hunks)
+    return hunks
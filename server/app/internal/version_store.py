@@ -0,0 +1,254 @@
+"""
+Version content storage on top of the content-addressed blob store
+
+Why not store the full HTML for every version?
+- A long-lived patent accumulates hundreds of versions that differ by a few words
+- Full copies make the document_version table grow with document size x version count
+- Many versions are byte-identical (copied on create, saved without edits)
+
+How it works:
+- Every version references a blob by content_hash (see app.internal.blob_store), so
+  identical versions share one compressed blob
+- The newest version's blob is always stored in full (a "keyframe")
+- When a newer version is created, the previous newest version's blob is re-encoded as
+  a reverse delta against it, so reading recent versions is cheap
+- Every KEYFRAME_INTERVAL-th version number stays a keyframe, which bounds the chain of
+  deltas that has to be applied to rebuild an old version
+- Rebuilt contents are kept in an LRU cache keyed by content hash, so repeated reads
+  (version history, switching back and forth) don't re-apply deltas
+- Autosaves store the new content in full and never diff, so saving stays cheap; the
+  chain is re-encoded (compact_versions) when the next version is created
+- Every write also updates the full-text index (see app.internal.search_index)
+
+All API responses keep returning full content - callers read it through
+get_version_content() instead of DocumentVersion.content, which is empty for blob rows.
+"""
+
+import logging
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.internal import blob_store, search_index
+from app.internal.blob_store import blob_stats, hash_content
+from app.models import ContentBlob, DocumentVersion
+
+logger = logging.getLogger(__name__)
+
+# Every Nth version number is kept as a full copy
+KEYFRAME_INTERVAL = int(os.getenv("VERSION_KEYFRAME_INTERVAL", "10"))
+
+
+def is_keyframe(db: Session, version: DocumentVersion) -> bool:
+    """Whether the version's content is stored in full rather than as a delta"""
+    if version.content_hash is None:
+        return True
+    blob = db.get(ContentBlob, version.content_hash)
+    return blob is None or blob.base_hash is None
+
+
+def get_version_content(db: Session, version: DocumentVersion) -> str:
+    """Return the full content of a version"""
+    if version.content_hash is None:
+        # Legacy row written before the blob store existed
+        return version.content
+    return blob_store.get_content(db, version.content_hash)
+
+
+def get_versions_content(db: Session, versions: Iterable[DocumentVersion]) -> Dict[int, str]:
+    """Full contents of many versions keyed by version id, blobs loaded in batches"""
+    versions = list(versions)
+    contents = blob_store.get_contents(
+        db, [version.content_hash for version in versions if version.content_hash is not None]
+    )
+    return {
+        version.id: (
+            contents[version.content_hash] if version.content_hash is not None else version.content
+        )
+        for version in versions
+    }
+
+
+def _should_stay_keyframe(version_number: int) -> bool:
+    return KEYFRAME_INTERVAL <= 1 or version_number % KEYFRAME_INTERVAL == 0
+
+
+def add_version(db: Session, version: DocumentVersion, content: str) -> DocumentVersion:
+    """
+    Persist a new (newest) version and re-encode the previous newest version as a delta
+
+    The caller commits.
+    """
+    version.content = ""
+    version.content_hash = blob_store.put_content(db, content)
+    # The blob may already exist as a delta, e.g. when reverting to older content
+    blob_store.materialize(db, version.content_hash)
+    db.add(version)
+    db.flush()
+    search_index.index_version(db, version.id, content)
+
+    previous = db.scalar(
+        select(DocumentVersion)
+        .where(
+            DocumentVersion.document_id == version.document_id,
+            DocumentVersion.id != version.id,
+            DocumentVersion.version_number < version.version_number
+        )
+        .order_by(DocumentVersion.version_number.desc())
+        .limit(1)
+    )
+    if (
+        previous is not None
+        and previous.content_hash is not None
+        and previous.content_hash != version.content_hash
+        and is_keyframe(db, previous)
+        and not _should_stay_keyframe(previous.version_number)
+    ):
+        blob_store.rebase(db, previous.content_hash, version.content_hash)
+
+    compact_versions(db, version.document_id)
+    return version
+
+
+class ContentConflictError(Exception):
+    """The version's content changed since it was read (another save got there first)"""
+
+
+def update_version_content(db: Session, version: DocumentVersion, content: str) -> DocumentVersion:
+    """
+    Point a version at new content (autosave)
+
+    This runs on every autosave, so it never diffs: the new content is stored in full,
+    and the old blob is released unless older versions are deltas against it. Both are
+    re-encoded by compact_versions() when the next version is created. The caller commits.
+
+    The row is only updated if it still references the content it was read with, so of
+    two requests saving over the same content one raises ContentConflictError instead
+    of silently overwriting the other. The caller rolls back.
+    """
+    new_hash = hash_content(content)
+    if version.content_hash == new_hash:
+        return version
+
+    old_hash = version.content_hash
+    blob_store.put_content(db, content)
+    db.flush()
+    updated = db.execute(
+        update(DocumentVersion)
+        .where(DocumentVersion.id == version.id, DocumentVersion.content_hash == old_hash)
+        .values(content="", content_hash=new_hash)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        raise ContentConflictError(f"Version {version.id} was changed by another save")
+    set_committed_value(version, "content", "")
+    set_committed_value(version, "content_hash", new_hash)
+    search_index.index_version(db, version.id, content)
+
+    if old_hash:
+        blob_store.release(db, old_hash, rebase_dependents=False)
+
+    return version
+
+
+def apply_splices(content: str, splices: Iterable[Tuple[int, int, str]]) -> str:
+    """
+    Apply (start, delete, insert) splices to content, each one to the result of the last
+
+    Offsets count characters (code points). Raises ValueError when a splice reaches
+    past the end of the content.
+    """
+    for start, delete, insert in splices:
+        if start < 0 or delete < 0 or start + delete > len(content):
+            raise ValueError(
+                f"Splice at {start} deleting {delete} is outside the content "
+                f"({len(content)} characters)"
+            )
+        content = content[:start] + insert + content[start + delete:]
+    return content
+
+
+def compact_versions(db: Session, document_id: int):
+    """
+    Re-encode what autosaves left behind in a document's version chain
+
+    - Versions saved since the last compaction are stored in full; those that are
+      neither the newest nor a keyframe become deltas against the next newer version
+    - Versions that are deltas against a blob no version references any more (the
+      content before an autosave) are re-based the same way, and the old blob is released
+
+    Called by add_version. The caller commits.
+    """
+    versions = db.execute(
+        select(DocumentVersion.version_number, DocumentVersion.content_hash)
+        .where(
+            DocumentVersion.document_id == document_id,
+            DocumentVersion.content_hash.is_not(None),
+        )
+        .order_by(DocumentVersion.version_number)
+    ).all()
+
+    retired = set()
+    for older, newer in zip(versions, versions[1:]):
+        if older.content_hash == newer.content_hash or _should_stay_keyframe(older.version_number):
+            continue
+        blob = db.get(ContentBlob, older.content_hash)
+        if blob is None:
+            continue
+        if blob.base_hash is not None and blob_store.is_referenced(db, blob.base_hash):
+            continue
+        if blob.base_hash is not None:
+            retired.add(blob.base_hash)
+        blob_store.rebase(db, older.content_hash, newer.content_hash)
+
+    for content_hash in retired:
+        blob_store.release(db, content_hash)
+
+
+def delete_version(db: Session, version: DocumentVersion):
+    """
+    Delete a version and release its blob if no other version shares it
+
+    Blobs stored as deltas against the released one are re-based onto its own base, or
+    stored in full. The search index row is removed by a trigger. The caller commits.
+    """
+    content_hash = version.content_hash
+    db.delete(version)
+    db.flush()
+    if content_hash:
+        blob_store.release(db, content_hash)
+
+
+def storage_stats(db: Session, document_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Stored bytes for version content versus full uncompressed copies
+
+    Returns:
+        Dict with version and blob counts, stored (compressed) bytes and the bytes
+        full copies of every version would take
+    """
+    query = select(
+        func.count(DocumentVersion.id),
+        func.coalesce(func.sum(ContentBlob.size), 0),
+    ).join(ContentBlob, ContentBlob.hash == DocumentVersion.content_hash)
+    hashes_query = select(DocumentVersion.content_hash).where(
+        DocumentVersion.content_hash.is_not(None)
+    )
+    if document_id is not None:
+        query = query.where(DocumentVersion.document_id == document_id)
+        hashes_query = hashes_query.where(DocumentVersion.document_id == document_id)
+
+    versions, logical_bytes = db.execute(query).one()
+    blobs = blob_stats(db, set(db.scalars(hashes_query)))
+    return {
+        "versions": versions or 0,
+        "blobs": blobs["blobs"],
+        "keyframes": blobs["full"],
+        "deltas": blobs["deltas"],
+        "stored_bytes": blobs["stored_bytes"],
+        "logical_bytes": logical_bytes,
+    }
+
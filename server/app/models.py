@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column, Integer, String, DateTime, Boolean, ForeignKey, Index, JSON, LargeBinary
+)
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
 
 from app.internal.db import Base
@@ -62,11 +64,23 @@ class DocumentVersion(Base):
     - Version number shown to users (v1.0, v2.0, etc.)
     - More friendly and meaningful than database ID
     
-    Why need is_active?
-    - Mark which version is the currently active version
-    - Allow users to switch between different versions
+    Why no longer use is_active?
+    - Document.current_version_id is the single source of truth for the active version,
+      so switching versions writes one row instead of every version of the document
+    - The column is kept for existing databases but is not maintained; API responses
+      derive is_active from the document's pointer
+    
+    Why content_hash instead of content?
+    - Content lives in the content-addressed blob store (see app.internal.blob_store),
+      so byte-identical versions share one compressed blob
+    - content is only filled for legacy rows written before the blob store existed
+    - Always read content through version_store.get_version_content()
     """
     __tablename__ = "document_version"
+    __table_args__ = (
+        # One row per version number - also serves lookups by (document, version number)
+        Index("ux_document_version_document_number", "document_id", "version_number", unique=True),
+    )
     
     # Primary key ID
     id = Column(Integer, primary_key=True, index=True)
@@ -77,10 +91,14 @@ class DocumentVersion(Base):
     # Version number - increment from 1 (v1.0, v2.0...)
     version_number = Column(Integer, nullable=False)
     
-    # Version content - actual document content for this version
-    content = Column(String, nullable=False, default="")
+    # Legacy inline content - empty for versions stored in the blob store
+    # Deferred, so loading version rows for listings never reads it
+    content = deferred(Column(String, nullable=False, default=""))
+    
+    # SHA-256 of the full content - key of the content_blob row holding it
+    content_hash = Column(String(64), ForeignKey("content_blob.hash"), nullable=True, index=True)
     
-    # Whether this is the current active version
+    # Legacy active flag - not maintained, see Document.current_version_id
     is_active = Column(Boolean, default=False, nullable=False)
     
     # Creation time - record when this version was created
@@ -90,6 +108,37 @@ class DocumentVersion(Base):
     document = relationship("Document", back_populates="versions", foreign_keys=[document_id])
 
 
+class ContentBlob(Base):
+    """
+    Content-addressed blob - one row per distinct piece of content
+    
+    Why key by hash?
+    - Identical content (copied versions, saves without edits) is stored once
+    - The key is derived from the content, so it can be shared across documents
+    
+    data is compressed (codec: zlib or zstd) and holds either the full content or,
+    when base_hash is set, a delta against that blob. See app.internal.blob_store.
+    """
+    __tablename__ = "content_blob"
+    
+    # SHA-256 hex digest of the full (uncompressed) content
+    hash = Column(String(64), primary_key=True)
+    
+    # Compression codec of data
+    codec = Column(String(16), nullable=False)
+    
+    # Compressed full content, or compressed delta against base_hash
+    data = Column(LargeBinary, nullable=False)
+    
+    # Blob this one is a delta against, NULL when data holds the full content
+    base_hash = Column(String(64), ForeignKey("content_blob.hash"), nullable=True, index=True)
+    
+    # Size in bytes of the full uncompressed content
+    size = Column(Integer, nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 # ChatHistory model for document version-specific conversations
 class ChatHistory(Base):
     """
@@ -97,8 +146,18 @@ class ChatHistory(Base):
     
     Each message is associated with a specific document and version, allowing
     for separate conversation histories per document version.
+    
+    Suggestion cards of a 'suggestion_cards' message live in the suggestion_card
+    table, chat_metadata only keeps small per-message data such as agents_used.
     """
     __tablename__ = "chat_history"
+    __table_args__ = (
+        # Loading a version's history in (created_at, id) order, and keyset paging through it
+        Index(
+            "ix_chat_history_document_version_created",
+            "document_id", "version_number", "created_at", "id"
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("document.id"), nullable=False)
@@ -111,6 +170,14 @@ class ChatHistory(Base):
     # Relationship to document
     document = relationship("Document", back_populates="chat_messages")
     
+    # Suggestion cards of a 'suggestion_cards' message, in display order
+    cards = relationship(
+        "SuggestionCard",
+        back_populates="message",
+        cascade="all, delete-orphan",
+        order_by="SuggestionCard.position"
+    )
+    
     def __repr__(self):
         return f"<ChatHistory(id={self.id}, doc_id={self.document_id}, version={self.version_number}, type={self.message_type})>"
     
@@ -123,6 +190,13 @@ class ChatHistory(Base):
                 metadata_dict = json.loads(self.chat_metadata)
             except json.JSONDecodeError:
                 metadata_dict = {}
+        
+        if self.message_type == "suggestion_cards":
+            metadata_dict["suggestion_cards"] = [card.payload for card in self.cards]
+            metadata_dict["card_actions"] = {
+                card.card_id: card.status
+                for card in self.cards if card.status != SuggestionCard.ACTIVE
+            }
                 
         return {
             "id": self.id,
@@ -165,12 +239,10 @@ class ChatHistory(Base):
     @classmethod
     def create_suggestion_cards_message(cls, document_id: int, version_number: str, 
                                       suggestion_cards, agents_used):
-        """Create a suggestion cards message entry"""
+        """Create a suggestion cards message entry, with one SuggestionCard row per card"""
         import json
         metadata = {
-            "suggestion_cards": suggestion_cards,
             "agents_used": agents_used,
-            "card_actions": {}  # Track accept/dismiss actions
         }
         
         return cls(
@@ -178,47 +250,91 @@ class ChatHistory(Base):
             version_number=version_number,
             message_type="suggestion_cards",
             content=f"AI Analysis Results ({len(suggestion_cards)} suggestions from {len(agents_used)} agents)",
-            chat_metadata=json.dumps(metadata)
+            chat_metadata=json.dumps(metadata),
+            cards=[
+                SuggestionCard.from_card(document_id, version_number, position, card)
+                for position, card in enumerate(suggestion_cards)
+            ]
         )
     
     def mark_card_action(self, card_id: str, action: str):
         """Mark a suggestion card as accepted or dismissed"""
-        import json
-        metadata_dict = {}
-        if self.chat_metadata:
-            try:
-                metadata_dict = json.loads(self.chat_metadata)
-            except json.JSONDecodeError:
-                metadata_dict = {}
-        
-        if "card_actions" not in metadata_dict:
-            metadata_dict["card_actions"] = {}
-        
-        metadata_dict["card_actions"][card_id] = action
-        self.chat_metadata = json.dumps(metadata_dict)
+        for card in self.cards:
+            if card.card_id == card_id:
+                card.status = action
+                card.acted_at = datetime.utcnow()
     
     def get_active_suggestion_cards(self):
         """Get suggestion cards that haven't been accepted or dismissed"""
-        import json
-        if self.message_type != "suggestion_cards" or not self.chat_metadata:
-            return []
-        
-        try:
-            metadata_dict = json.loads(self.chat_metadata)
-        except json.JSONDecodeError:
+        if self.message_type != "suggestion_cards":
             return []
-        
-        suggestion_cards = metadata_dict.get("suggestion_cards", [])
-        card_actions = metadata_dict.get("card_actions", {})
-        
-        # Filter out cards that have been acted upon
-        active_cards = []
-        for card in suggestion_cards:
-            card_id = card.get("id")
-            if card_id and card_id not in card_actions:
-                active_cards.append(card)
-        
-        return active_cards
+        return [
+            card.payload for card in self.cards
+            if card.status == SuggestionCard.ACTIVE and card.card_id
+        ]
+
+
+class SuggestionCard(Base):
+    """
+    Suggestion card table - one row per card of a 'suggestion_cards' chat message
+    
+    Why a separate table instead of JSON in chat_metadata?
+    - Accepting or dismissing a card is a single-row UPDATE of status
+    - Active cards of a document version are one indexed query, without decoding and
+      re-encoding every message's metadata
+    
+    payload holds the card as produced by the suggestion generator (type, description,
+    original_text, replace_to, ...) and is returned to the client unchanged.
+    """
+    __tablename__ = "suggestion_card"
+    __table_args__ = (
+        # Active cards of a document version
+        Index("ix_suggestion_card_document_status", "document_id", "version_number", "status"),
+    )
+    
+    ACTIVE = "active"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    message_id = Column(
+        Integer, ForeignKey("chat_history.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    
+    # Denormalized from the message, so listing by document version needs no join
+    document_id = Column(Integer, ForeignKey("document.id"), nullable=False)
+    version_number = Column(String, nullable=False)
+    
+    # Card id assigned by the suggestion generator, unique within a message. Empty for
+    # cards without an id - they can't be acted on and are not listed as active
+    card_id = Column(String, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    
+    # 'active', 'accepted' or 'dismissed'
+    status = Column(String, nullable=False, default=ACTIVE, index=True)
+    acted_at = Column(DateTime, nullable=True)
+    
+    payload = Column(JSON, nullable=False)
+    
+    message = relationship("ChatHistory", back_populates="cards")
+    
+    @staticmethod
+    def card_id_of(card: dict) -> str:
+        """Card id as stored, empty for cards without an id (never listed as active)"""
+        return str(card["id"]) if card.get("id") else ""
+    
+    @classmethod
+    def from_card(
+        cls, document_id: int, version_number: str, position: int, card: dict,
+        status: str = ACTIVE
+    ):
+        """Build a row from a suggestion card dictionary"""
+        return cls(
+            document_id=document_id,
+            version_number=version_number,
+            card_id=SuggestionCard.card_id_of(card),
+            position=position,
+            status=status,
+            payload=card,
+        )
 
 
 # ChatMessage data transfer object
@@ -239,7 +355,7 @@ class ChatMessage:
     
     @property
     def suggestion_cards(self):
-        """Get active suggestion cards from metadata"""
+        """Get all suggestion cards from metadata, card_actions says which were acted on"""
         if self.type == "suggestion_cards" and self.metadata:
             return self.metadata.get("suggestion_cards", [])
         return []
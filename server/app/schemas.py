@@ -1,6 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Union
 
 
 # ===================================================================
@@ -35,6 +35,26 @@ class DocumentVersionRead(DocumentVersionBase):
     created_at: datetime
 
 
+class DocumentVersionMetadata(BaseModel):
+    """
+    Version listing entry without content
+    
+    Why a separate schema?
+    - The version history panel only needs numbers and dates, and full content for
+      every version of a large document adds up to megabytes per request
+    - Content of a single version is fetched on demand
+    """
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    document_id: int
+    version_number: int
+    is_active: bool
+    created_at: datetime
+    size: int  # Content size in bytes
+    content_hash: Optional[str]
+
+
 # ===================================================================
 # Document related Pydantic schemas
 # ===================================================================
@@ -64,8 +84,8 @@ class DocumentRead(DocumentBase):
     created_at: datetime
     updated_at: datetime
     
-    # List containing all versions - for version history display
-    versions: Optional[List[DocumentVersionRead]] = []
+    # List containing all versions - for version history display (metadata only on request)
+    versions: Optional[List[Union[DocumentVersionRead, DocumentVersionMetadata]]] = []
     
     # Detailed information of current active version
     current_version: Optional[DocumentVersionRead] = None
@@ -85,6 +105,60 @@ class DocumentWithCurrentVersion(BaseModel):
     content: str  # Current version content
     version_number: int  # Current version number
     last_modified: datetime
+    content_hash: Optional[str] = None  # base_hash for PATCH /api/documents/{id}/content
+
+
+# Most documents a batch request may name
+MAX_BATCH_DOCUMENTS = 200
+
+
+class BatchDocumentsResponse(BaseModel):
+    """
+    Documents of a batch read, in the order requested
+    
+    Ids without a document (or without any version) are listed in missing instead.
+    """
+    documents: List[DocumentWithCurrentVersion]
+    missing: List[int]
+
+
+class BatchVersionItem(BaseModel):
+    """One new version of a batch - empty content copies the document's current version"""
+    document_id: int
+    content: Optional[str] = ""
+
+
+class BatchCreateVersionsRequest(BaseModel):
+    """New versions for many documents, created in one transaction (each document at most once)"""
+    versions: List[BatchVersionItem] = Field(min_length=1, max_length=MAX_BATCH_DOCUMENTS)
+
+
+class BatchCreatedVersion(BaseModel):
+    """A version created by a batch, now its document's current version"""
+    document_id: int
+    version_id: int
+    version_number: int
+    content_hash: Optional[str] = None
+
+
+class BatchCreateVersionsResponse(BaseModel):
+    versions: List[BatchCreatedVersion]
+
+
+class DocumentImportReport(BaseModel):
+    """
+    Outcome of a bulk import
+    
+    document_ids lists the new documents in import order. Skipped documents (invalid
+    lines, failed batches) are counted in skipped; errors describes the first of them.
+    """
+    documents: int
+    skipped: int
+    batches: int
+    seconds: float
+    docs_per_second: float
+    document_ids: List[int]
+    errors: List[str]
 
 
 class CreateVersionRequest(BaseModel):
@@ -95,3 +169,90 @@ class CreateVersionRequest(BaseModel):
 class SwitchVersionRequest(BaseModel):
     """Request schema for switching version"""
     version_number: int
+
+
+class ContentSplice(BaseModel):
+    """Replace delete characters at start with insert (offsets in code points)"""
+    start: int = Field(ge=0)
+    delete: int = Field(0, ge=0)
+    insert: str = ""
+
+
+class PatchContentRequest(BaseModel):
+    """
+    Request schema for patching the current version's content
+    
+    Why patches?
+    - /save uploads the whole document for a one-character edit; a patch carries only
+      the edit, so request size and parsing scale with the edit, not the document
+    - base_hash is the content_hash the splices were made against; splices apply in
+      order, each to the result of the previous one
+    """
+    base_hash: str = Field(min_length=64, max_length=64)
+    splices: List[ContentSplice] = Field(min_length=1, max_length=1000)
+
+
+class PatchContentResponse(BaseModel):
+    """Result of a patch - content_hash is the base_hash for the next patch"""
+    document_id: int
+    version_number: int
+    content_hash: str
+
+
+class VersionDiffHunk(BaseModel):
+    """
+    from_text at from_start in the old version's plain text became to_text at to_start in the
+    new one
+    """
+    from_start: int
+    from_text: str
+    to_start: int
+    to_text: str
+
+
+class VersionDiff(BaseModel):
+    """
+    Word-level diff between two versions' plain text
+    
+    Only the changed regions are returned; offsets are in characters of each version's
+    plain text (html_to_plain_text). No hunks means the versions read the same.
+    """
+    document_id: int
+    from_version: int
+    to_version: int
+    from_hash: Optional[str] = None
+    to_hash: Optional[str] = None
+    hunks: List[VersionDiffHunk]
+
+
+# ===================================================================
+# Full-text search
+# ===================================================================
+
+class SearchResult(BaseModel):
+    """
+    One full-text search hit - a document version or a chat message
+    
+    - version_id is set for version hits, message_id and message_type for chat hits
+    - snippet is HTML-escaped text around the match with the matched terms in <mark>
+    - rank is the bm25 score, lower is a better match
+    """
+    kind: str  # 'version' or 'chat'
+    document_id: int
+    document_title: str
+    version_number: str  # Chat history keys versions by their label, e.g. "v1.0"
+    version_id: Optional[int] = None
+    message_id: Optional[int] = None
+    message_type: Optional[str] = None
+    created_at: datetime
+    snippet: str
+    rank: float
+
+
+class SearchResponse(BaseModel):
+    """A page of search results, best match first"""
+    query: str
+    results: List[SearchResult]
+    limit: int
+    offset: int
+    has_more: bool
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Autosave write benchmark under a simulated typing workload.
+
+Runs the app in-process against a throwaway file-backed database. Each editor types
+into its own seed document and posts the full document after every keystroke without
+waiting for the previous save (the worst case, no client-side debounce), re-sending
+unchanged content every few saves like an idle autosave timer would.
+
+Reports how many saves turned into writes at window 0 (only saves arriving while a
+write is in flight are merged) and at the given coalescing windows.
+
+Usage:
+    python benchmarks/bench_autosave.py --editors 3 --keystrokes 100 --keystroke-ms 30 --windows 100 250
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+server_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(server_dir))
+
+tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmpdir) / 'autosave.db'}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+import app.__main__ as main_module  # noqa: E402
+from app.internal.autosave import SaveCoalescer  # noqa: E402
+from app.internal.db import engine  # noqa: E402
+
+
+def run(client: TestClient, window_ms: float, args) -> dict:
+    main_module.save_coalescer = coalescer = SaveCoalescer(window_ms)
+    version_writes = 0
+
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        nonlocal version_writes
+        if statement.startswith("UPDATE document_version"):
+            version_writes += 1
+
+    event.listen(engine, "before_cursor_execute", count_writes)
+    latencies = []
+    lock = threading.Lock()
+
+    def save(document_id: int, content: str):
+        started = time.perf_counter()
+        client.post(f"/save/{document_id}", json={"content": content})
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    def editor(document_id: int):
+        base = client.get(f"/document/{document_id}").json()["content"]
+        typed = ""
+        with ThreadPoolExecutor(max_workers=16) as saves:
+            for keystroke in range(args.keystrokes):
+                if keystroke % args.idle_every:
+                    typed += chr(ord("a") + keystroke % 26)
+                saves.submit(save, document_id, f"{base}<p>{typed}</p>")
+                time.sleep(args.keystroke_ms / 1000)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=editor, args=(i + 1,)) for i in range(args.editors)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", count_writes)
+
+    latencies.sort()
+    return {
+        **coalescer.stats(),
+        "version_writes": version_writes,
+        "seconds": elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--editors", type=int, default=3, choices=[1, 2, 3], help="Concurrent editors, one per seed document")
+    parser.add_argument("--keystrokes", type=int, default=100, help="Keystrokes (and saves) per editor")
+    parser.add_argument("--keystroke-ms", type=float, default=30, help="Delay between keystrokes")
+    parser.add_argument("--idle-every", type=int, default=5, help="Every Nth save re-sends unchanged content")
+    parser.add_argument("--windows", type=float, nargs="+", default=[100, 250], help="Coalescing windows in ms")
+    args = parser.parse_args()
+
+    print(f"🏁 {args.editors} editors x {args.keystrokes} keystrokes every {args.keystroke_ms:g} ms\n")
+    with TestClient(main_module.app) as client:
+        for window_ms in [0, *args.windows]:
+            stats = run(client, window_ms, args)
+            print(
+                f"window {window_ms:>6g} ms  saves {stats['saves']:>5}  writes {stats['writes']:>5}  "
+                f"coalesced {stats['coalesced']:>5}  unchanged {stats['unchanged']:>5}  "
+                f"version UPDATEs {stats['version_writes']:>5}  "
+                f"p50 {stats['p50_ms']:>7.2f} ms  p95 {stats['p95_ms']:>7.2f} ms  ({stats['seconds']:.1f} s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Batch document API benchmark for a whole workspace.
+
+Runs the app in-process against a throwaway file-backed database filled up to
+--documents documents, and compares loading every document and creating a version of
+every document:
+
+- one request per document (GET /document/{id}, POST /api/documents/{id}/versions)
+- one batch request (GET /api/documents/batch, POST /api/documents/batch/versions)
+
+Reads are measured cold (document and content caches cleared) and warm. --rtt-ms adds
+a simulated network round trip to every request, which the in-process client doesn't
+have.
+
+Usage:
+    python benchmarks/bench_batch_documents.py --documents 100 --rounds 5 --rtt-ms 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+server_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(server_dir))
+
+tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmpdir) / 'batch.db'}"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import app.__main__ as main_module  # noqa: E402
+from app.internal import version_store  # noqa: E402
+from app.internal.blob_store import content_cache  # noqa: E402
+from app.internal.data import DOCUMENT_1  # noqa: E402
+from app.internal.db import SessionLocal  # noqa: E402
+from app.internal.document_cache import document_cache  # noqa: E402
+from app.models import Document, DocumentVersion  # noqa: E402
+
+
+def seed(documents: int):
+    """Fill the workspace up to the given number of documents"""
+    with SessionLocal() as db:
+        existing = db.scalar(select(func.count(Document.id)))
+        for i in range(existing, documents):
+            document = Document(title=f"Benchmark Patent {i + 1}")
+            db.add(document)
+            db.flush()
+            version = version_store.add_version(
+                db, DocumentVersion(document_id=document.id, version_number=1),
+                DOCUMENT_1.replace("</h1>", f" {i + 1}</h1>", 1)
+            )
+            document.current_version_id = version.id
+        db.commit()
+
+
+class Client:
+    """TestClient that adds a simulated round trip and counts requests and queries"""
+
+    def __init__(self, client: TestClient, rtt_ms: float):
+        self.client = client
+        self.rtt = rtt_ms / 1000
+        self.requests = 0
+        self.queries = 0
+
+    def request(self, method: str, url: str, **kwargs):
+        time.sleep(self.rtt)
+        response = self.client.request(method, url, **kwargs)
+        assert response.status_code == 200, response.text
+        self.requests += 1
+        self.queries += int(response.headers["X-Query-Count"])
+        return response
+
+
+def load_one_by_one(client: Client):
+    ids = [d["id"] for d in client.request("GET", "/api/documents").json()]
+    return [client.request("GET", f"/document/{i}").json() for i in ids]
+
+
+def load_batch(client: Client):
+    ids = [d["id"] for d in client.request("GET", "/api/documents").json()]
+    return client.request("GET", "/api/documents/batch", params={"ids": ids}).json()["documents"]
+
+
+def create_one_by_one(client: Client):
+    ids = [d["id"] for d in client.request("GET", "/api/documents").json()]
+    for i in ids:
+        client.request("POST", f"/api/documents/{i}/versions", json={})
+
+
+def create_batch(client: Client):
+    ids = [d["id"] for d in client.request("GET", "/api/documents").json()]
+    client.request("POST", "/api/documents/batch/versions", json={"versions": [{"document_id": i} for i in ids]})
+
+
+def measure(client: TestClient, scenario, args, cold: bool = False) -> dict:
+    timings, counted = [], None
+    for _ in range(args.rounds):
+        if cold:
+            document_cache.clear()
+            content_cache.clear()
+        counted = Client(client, args.rtt_ms)
+        started = time.perf_counter()
+        scenario(counted)
+        timings.append(time.perf_counter() - started)
+    return {
+        "ms": statistics.median(timings) * 1000,
+        "requests": counted.requests,
+        "queries": counted.queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100, help="Documents in the workspace (at most 200 per batch)")
+    parser.add_argument("--rounds", type=int, default=5, help="Repetitions per scenario, the median is reported")
+    parser.add_argument("--rtt-ms", type=float, default=0, help="Simulated network round trip per request")
+    args = parser.parse_args()
+
+    print(f"🏁 {args.documents} documents, {args.rounds} rounds, {args.rtt_ms:g} ms round trip\n")
+    with TestClient(main_module.app) as client:
+        seed(args.documents)
+        scenarios = [
+            ("load, per document (cold)", load_one_by_one, True),
+            ("load, batch (cold)", load_batch, True),
+            ("load, per document (warm)", load_one_by_one, False),
+            ("load, batch (warm)", load_batch, False),
+            ("create versions, per document", create_one_by_one, False),
+            ("create versions, batch", create_batch, False),
+        ]
+        for name, scenario, cold in scenarios:
+            result = measure(client, scenario, args, cold=cold)
+            print(
+                f"{name:<32} {result['ms']:>9.1f} ms  "
+                f"requests {result['requests']:>4}  queries {result['queries']:>5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
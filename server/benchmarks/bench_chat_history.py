@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Chat history loading benchmark.
+
+Seeds a file-backed WAL database with --messages chat messages on each of several
+document versions and measures, with and without the composite
+(document_id, version_number, created_at, id) index:
+
+- the first page of a version's history
+- walking the whole history page by page with the (created_at, id) keyset cursor,
+  versus the same pages fetched with OFFSET
+- streaming the whole history in keyset batches (what the NDJSON endpoint does)
+- cleanup_old_messages keeping the newest 100 messages
+
+Usage:
+    python benchmarks/bench_chat_history.py --messages 20000 --versions 5 --page-size 100
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+server_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(server_dir))
+
+from sqlalchemy import and_, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+from app.internal.chat_manager import ChatHistoryManager  # noqa: E402
+from app.internal.db import Base, create_async_db_engine, create_db_engine  # noqa: E402
+from app.models import ChatHistory, ChatMessage, Document  # noqa: E402
+
+INDEX_NAME = "ix_chat_history_document_version_created"
+
+
+def seed(database_url: str, messages: int, versions: int):
+    """Interleave messages of all versions, like concurrent conversations would"""
+    engine = create_db_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    started_at = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(Document.__table__.insert().values(id=1, title="Chat Benchmark"))
+        rows = [
+            {
+                "document_id": 1,
+                "version_number": f"v{i % versions + 1}.0",
+                "message_type": "user" if i % 2 == 0 else "assistant",
+                "content": f"Message {i} " + "lorem ipsum " * 20,
+                "chat_metadata": None,
+                "created_at": started_at + timedelta(milliseconds=i),
+            }
+            for i in range(messages * versions)
+        ]
+        conn.execute(ChatHistory.__table__.insert(), rows)
+    engine.dispose()
+
+
+def set_index(database_url: str, enabled: bool):
+    engine = create_db_engine(database_url)
+    with engine.begin() as conn:
+        if enabled:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+                "ON chat_history (document_id, version_number, created_at, id)"
+            ))
+        else:
+            conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def offset_page(session, page_size: int, offset: int):
+    """The same page as load_chat_history, located with OFFSET instead of the cursor"""
+    records = (await session.scalars(
+        select(ChatHistory)
+        .where(and_(ChatHistory.document_id == 1, ChatHistory.version_number == "v1.0"))
+        .order_by(ChatHistory.created_at, ChatHistory.id)
+        .offset(offset)
+        .limit(page_size)
+        .options(selectinload(ChatHistory.cards))
+    )).all()
+    return [ChatMessage.from_db_record(record) for record in records]
+
+
+async def measure(database_url: str, page_size: int) -> dict:
+    engine = create_async_db_engine(database_url)
+    factory = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+    results = {}
+    try:
+        async with factory() as session:
+            manager = ChatHistoryManager(session)
+
+            _, results["first_page_ms"] = await timed(manager.load_chat_history(1, "v1.0", limit=page_size))
+
+            keyset_pages, after = [], None
+            while True:
+                page, elapsed = await timed(manager.load_chat_history(1, "v1.0", limit=page_size, after=after))
+                if not page:
+                    break
+                keyset_pages.append(elapsed)
+                after = (page[-1].timestamp, int(page[-1].id))
+                session.expunge_all()
+            results["pages"] = len(keyset_pages)
+            results["keyset_walk_ms"] = sum(keyset_pages)
+            results["keyset_last_page_ms"] = keyset_pages[-1]
+
+            offset_pages = []
+            for number in range(len(keyset_pages)):
+                _, elapsed = await timed(offset_page(session, page_size, number * page_size))
+                offset_pages.append(elapsed)
+                session.expunge_all()
+            results["offset_walk_ms"] = sum(offset_pages)
+            results["offset_last_page_ms"] = offset_pages[-1]
+
+            started = time.perf_counter()
+            streamed = 0
+            async for _ in manager.iter_chat_history(1, "v1.0"):
+                streamed += 1
+            results["stream_ms"] = (time.perf_counter() - started) * 1000
+            results["streamed"] = streamed
+
+            _, results["cleanup_ms"] = await timed(manager.cleanup_old_messages(1, "v2.0", keep_count=100))
+    finally:
+        await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="Messages per document version")
+    parser.add_argument("--versions", type=int, default=5, help="Document versions with a history")
+    parser.add_argument("--page-size", type=int, default=100, help="Messages per page")
+    args = parser.parse_args()
+
+    print(f"🏁 {args.messages} messages x {args.versions} versions, pages of {args.page_size}\n")
+    for indexed in (False, True):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database_url = f"sqlite:///{Path(tmpdir) / 'chat_bench.db'}"
+            seed(database_url, args.messages, args.versions)
+            set_index(database_url, indexed)
+            stats = asyncio.run(measure(database_url, args.page_size))
+
+        label = "composite index" if indexed else "no index"
+        print(f"{label}")
+        print(f"  first page            {stats['first_page_ms']:>9.2f} ms")
+        print(f"  keyset walk           {stats['keyset_walk_ms']:>9.2f} ms  "
+              f"({stats['pages']} pages, last page {stats['keyset_last_page_ms']:.2f} ms)")
+        print(f"  offset walk           {stats['offset_walk_ms']:>9.2f} ms  "
+              f"(last page {stats['offset_last_page_ms']:.2f} ms)")
+        print(f"  stream whole history  {stats['stream_ms']:>9.2f} ms  "
+              f"({stats['streamed'] / stats['stream_ms'] * 1000:,.0f} msg/s)")
+        print(f"  cleanup keep 100      {stats['cleanup_ms']:>9.2f} ms\n")
+
+
+if __name__ == "__main__":
+    main()
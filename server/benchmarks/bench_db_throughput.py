@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Database throughput benchmark for the document endpoints.
+
+Starts the backend with uvicorn against a throwaway database and measures
+read/write throughput of `POST /save/{id}` and `GET /api/documents` under
+concurrent clients. Runs once with the in-memory database (single worker,
+StaticPool) and once with a file-backed WAL database so the two can be compared.
+
+Usage:
+    python benchmarks/bench_db_throughput.py --clients 16 --requests 200 --workers 2
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+server_dir = Path(__file__).parent.parent
+
+
+def find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, workers: int) -> tuple[subprocess.Popen, str]:
+    """Start uvicorn in a subprocess and wait until it answers"""
+    port = find_free_port()
+    env = {**os.environ, "DATABASE_URL": database_url}
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.__main__:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=server_dir,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/documents", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("Server did not start within 60 seconds")
+
+
+def run_load(base_url: str, clients: int, requests_per_client: int, write: bool) -> dict:
+    """Run one load phase and return throughput and latency figures"""
+    content = "<h1>Benchmark</h1>" + "<p>Claim text for throughput testing.</p>" * 200
+
+    def client_loop(client_index: int) -> tuple[list[float], int]:
+        latencies = []
+        errors = 0
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            for i in range(requests_per_client):
+                started = time.perf_counter()
+                try:
+                    if write:
+                        document_id = (client_index + i) % 3 + 1
+                        response = client.post(f"/save/{document_id}", json={"content": f"{content}<p>{i}</p>"})
+                    else:
+                        response = client.get("/api/documents")
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    # The shared in-memory connection breaks under concurrent writers
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client_loop, range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    completed = len(latencies)
+    latencies = latencies or [0.0]
+    return {
+        "requests": completed,
+        "errors": sum(errors for _, errors in results),
+        "rps": completed / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def benchmark(label: str, database_url: str, workers: int, args) -> None:
+    process, base_url = start_server(database_url, workers)
+    try:
+        for phase, write in (("GET /api/documents", False), ("POST /save/{id}", True)):
+            stats = run_load(base_url, args.clients, args.requests, write)
+            print(
+                f"{label:<28} {phase:<20} {stats['requests']:>6} req  "
+                f"{stats['rps']:>8.1f} req/s  p50 {stats['p50_ms']:>7.2f} ms  p95 {stats['p95_ms']:>7.2f} ms  "
+                f"errors {stats['errors']}"
+            )
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client per phase")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers for the file-backed run")
+    args = parser.parse_args()
+
+    print(f"🏁 {args.clients} clients x {args.requests} requests per phase\n")
+    benchmark("in-memory (1 worker)", "sqlite:///:memory:", 1, args)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = Path(tmpdir) / "bench.db"
+        benchmark(f"file WAL ({args.workers} workers)", f"sqlite:///{db_path}", args.workers, args)
+
+
+if __name__ == "__main__":
+    main()
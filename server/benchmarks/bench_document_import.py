@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Bulk document import benchmark.
+
+Generates --documents patent-sized HTML documents as an NDJSON archive and imports them
+into throwaway file-backed databases, reporting documents per second for:
+
+- the seeder's path: BeautifulSoup title, add_version() and a commit per document
+  (run on the first --baseline documents only, it is slow)
+- app.internal.document_import in this process (--workers 0)
+- app.internal.document_import with a process pool of --workers
+
+Usage:
+    python benchmarks/bench_document_import.py --documents 10000 --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+server_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(server_dir))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.internal import version_store  # noqa: E402
+from app.internal.data import DOCUMENT_1  # noqa: E402
+from app.internal.db import Base, create_db_engine  # noqa: E402
+from app.internal.document_import import import_documents, iter_ndjson  # noqa: E402
+from app.internal.migrations import run_migrations  # noqa: E402
+from app.models import Document, DocumentVersion  # noqa: E402
+
+
+def write_archive(path: Path, documents: int):
+    """NDJSON archive of distinct documents, about the size of the seed patents"""
+    with open(path, "w") as archive:
+        for i in range(documents):
+            content = DOCUMENT_1.replace("</h1>", f" {i + 1}</h1>", 1) + f"<p>Reference number {i}.</p>"
+            archive.write(json.dumps({"content": content}) + "\n")
+
+
+def open_database(tmpdir: str, name: str):
+    engine = create_db_engine(f"sqlite:///{Path(tmpdir) / name}")
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    return engine, sessionmaker(bind=engine, autoflush=False)
+
+
+def seeder_path(archive: Path, tmpdir: str, limit: int) -> float:
+    """Documents per second the way the startup seeder writes them"""
+    engine, Session = open_database(tmpdir, "seeder.db")
+    started = time.perf_counter()
+    with Session() as db, open(archive, "rb") as lines:
+        for count, item in enumerate(iter_ndjson(lines), 1):
+            if count > limit:
+                break
+            soup = BeautifulSoup(item.content, "html.parser")
+            heading = soup.find("title") or soup.find("h1")
+            document = Document(title=heading.string.strip() if heading and heading.string else "Untitled Document")
+            db.add(document)
+            db.flush()
+            version = DocumentVersion(document_id=document.id, version_number=1)
+            version_store.add_version(db, version, item.content)
+            document.current_version_id = version.id
+            db.commit()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return min(limit, count) / elapsed
+
+
+def bulk_import(archive: Path, tmpdir: str, workers: int, batch_size: int):
+    engine, Session = open_database(tmpdir, f"import-{workers}.db")
+    with Session() as db, open(archive, "rb") as lines:
+        report = import_documents(db, iter_ndjson(lines), batch_size=batch_size, workers=workers)
+        stored = db.scalar(select(func.count(Document.id)))
+    engine.dispose()
+    assert stored == report.documents and not report.skipped, report.errors
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10000, help="Documents in the archive")
+    parser.add_argument("--baseline", type=int, default=500, help="Documents written the seeder's way")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for the pooled run")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents per transaction")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    archive = Path(tmpdir) / "archive.ndjson"
+    write_archive(archive, args.documents)
+    size_mb = archive.stat().st_size / 1024 / 1024
+    print(f"🏁 {args.documents} documents, {size_mb:.0f} MiB of NDJSON, batches of {args.batch_size}\n")
+
+    rate = seeder_path(archive, tmpdir, args.baseline)
+    print(f"{'seeder path (first ' + str(args.baseline) + ')':<28} {rate:>8.0f} docs/s")
+    for workers in (0, args.workers):
+        report = bulk_import(archive, tmpdir, workers, args.batch_size)
+        print(
+            f"{f'bulk import, {workers} workers':<28} {report.docs_per_second:>8.0f} docs/s  "
+            f"{report.documents} documents in {report.seconds:.1f} s, {report.batches} batches"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Startup seeding benchmark.
+
+Measures how long seeding a fresh database takes as the seed corpus grows, for:
+
+- the previous seeder: BeautifulSoup title, add_version() per document, one commit
+- the precomputed snapshot (app/internal/seed_snapshot.py): load the file and bulk-insert
+
+Corpora of --sizes documents are made by repeating the seed patents with numbered
+titles; their snapshots are built up front, as they would be at build time. The full
+application startup (lifespan: tables, migrations, seeding) is also timed against a
+fresh file-backed database with the real seed snapshot.
+
+Usage:
+    python benchmarks/bench_startup.py --sizes 3 100 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+server_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(server_dir))
+
+tmpdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmpdir) / 'startup.db'}"
+
+from bs4 import BeautifulSoup  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import app.__main__ as main_module  # noqa: E402
+from app.internal import seed_snapshot, version_store  # noqa: E402
+from app.internal.db import Base, create_db_engine, engine  # noqa: E402
+from app.internal.migrations import run_migrations  # noqa: E402
+from app.models import Document, DocumentVersion  # noqa: E402
+
+
+def make_corpus(size: int):
+    seeds = seed_snapshot.seed_contents()
+    return [
+        seeds[i % len(seeds)].replace("</title>", f" {i + 1}</title>", 1) if i >= len(seeds) else seeds[i]
+        for i in range(size)
+    ]
+
+
+def open_database(name: str):
+    database = create_db_engine(f"sqlite:///{Path(tmpdir) / name}")
+    Base.metadata.create_all(bind=database)
+    run_migrations(database)
+    return database, sessionmaker(bind=database, autoflush=False)
+
+
+def previous_seeder(corpus, name: str) -> float:
+    database, Session = open_database(name)
+    started = time.perf_counter()
+    with Session() as db:
+        for i, content in enumerate(corpus, 1):
+            soup = BeautifulSoup(content, "html.parser")
+            heading = soup.find("title") or soup.find("h1")
+            document = Document(id=i, title=heading.string.strip() if heading and heading.string else "Untitled Document")
+            db.add(document)
+            db.flush()
+            version = DocumentVersion(document_id=document.id, version_number=1)
+            version_store.add_version(db, version, content)
+            document.current_version_id = version.id
+        db.commit()
+    elapsed = time.perf_counter() - started
+    database.dispose()
+    return elapsed
+
+
+def snapshot_seeder(snapshot_path: Path, name: str) -> float:
+    database, Session = open_database(name)
+    started = time.perf_counter()
+    with Session() as db:
+        seed_snapshot.seed_database(db, snapshot_path)
+    elapsed = time.perf_counter() - started
+    database.dispose()
+    return elapsed
+
+
+async def application_startup() -> float:
+    started = time.perf_counter()
+    async with main_module.lifespan(main_module.app):
+        elapsed = time.perf_counter() - started
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 100, 1000], help="Seed corpus sizes")
+    parser.add_argument("--rounds", type=int, default=3, help="Repetitions per size, the median is reported")
+    args = parser.parse_args()
+
+    print(f"🏁 seeding a fresh database, {args.rounds} rounds\n")
+    for size in args.sizes:
+        corpus = make_corpus(size)
+        snapshot_path = Path(tmpdir) / f"snapshot-{size}.json"
+        snapshot_path.write_text(json.dumps(seed_snapshot.build_snapshot(corpus)))
+
+        previous = statistics.median(previous_seeder(corpus, f"previous-{size}-{r}.db") for r in range(args.rounds))
+        snapshot = statistics.median(snapshot_seeder(snapshot_path, f"snapshot-{size}-{r}.db") for r in range(args.rounds))
+        print(
+            f"{size:>6} documents   previous seeder {previous * 1000:>9.1f} ms   "
+            f"snapshot {snapshot * 1000:>8.1f} ms   ({previous / snapshot:.0f}x)"
+        )
+
+    elapsed = asyncio.run(application_startup())
+    engine.dispose()
+    print(f"\napplication startup on a fresh database (tables, migrations, seed snapshot): {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
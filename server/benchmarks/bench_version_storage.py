@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Version storage benchmark.
+
+Builds a long version history for each seeded DOCUMENT_* fixture and reports how
+many bytes the content-addressed blob store keeps versus full copies, plus cold
+(no cache) and warm reconstruction latency. A share of the versions are verbatim
+copies (create_version without edits, saves without changes), the rest carry a
+small edit. Also compares the zlib and zstd codecs on each fixture.
+
+Usage:
+    python benchmarks/bench_version_storage.py --versions 300 --copy-ratio 0.3
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+server_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(server_dir))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import app.internal.data as data_module  # noqa: E402
+from app.internal import blob_store, version_store  # noqa: E402
+from app.internal.db import Base, create_db_engine  # noqa: E402
+from app.models import Document, DocumentVersion  # noqa: E402
+
+
+def edit(content: str, rng: random.Random, step: int) -> str:
+    """Insert or replace a phrase inside a random paragraph"""
+    position = content.find("</p>", rng.randrange(len(content)))
+    if position == -1:
+        position = content.rfind("</p>")
+    if rng.random() < 0.5:
+        return content[:position] + f" (amended in revision {step})" + content[position:]
+    start = max(content.rfind(">", 0, position) + 1, position - 40)
+    return content[:start] + f"replacement text {step} " + content[start:]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, int(len(values) * fraction) - 1)]
+
+
+def compare_codecs(fixtures):
+    codecs = ["zlib"] + (["zstd"] if blob_store.zstandard is not None else [])
+    print(f"{'fixture':<12} {'raw':>9} " + " ".join(f"{codec:>18}" for codec in codecs))
+    for name in fixtures:
+        payload = getattr(data_module, name).encode("utf-8")
+        cells = []
+        for codec in codecs:
+            _, data = blob_store.compress(payload, codec)
+            started = time.perf_counter()
+            for _ in range(100):
+                blob_store.decompress(codec, data)
+            decompress_us = (time.perf_counter() - started) * 1e6 / 100
+            cells.append(f"{len(data):>7} B {decompress_us:>6.1f} us")
+        print(f"{name:<12} {len(payload):>7} B " + " ".join(f"{cell:>18}" for cell in cells))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", type=int, default=300, help="Versions per document")
+    parser.add_argument("--copy-ratio", type=float, default=0.3, help="Share of versions that are verbatim copies")
+    args = parser.parse_args()
+
+    engine = create_db_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    fixtures = sorted(name for name in dir(data_module) if name.startswith("DOCUMENT_"))
+    print(f"🏁 {len(fixtures)} documents x {args.versions} versions, {args.copy_ratio:.0%} verbatim copies "
+          f"(codec {blob_store.BLOB_CODEC}, keyframe every {version_store.KEYFRAME_INTERVAL})\n")
+    compare_codecs(fixtures)
+
+    for name in fixtures:
+        rng = random.Random(name)
+        content = getattr(data_module, name)
+        full_bytes = 0
+
+        with Session() as db:
+            document = Document(title=name)
+            db.add(document)
+            db.flush()
+
+            started = time.perf_counter()
+            for number in range(1, args.versions + 1):
+                if number > 1 and rng.random() >= args.copy_ratio:
+                    content = edit(content, rng, number)
+                full_bytes += len(content.encode("utf-8"))
+                version_store.add_version(
+                    db, DocumentVersion(document_id=document.id, version_number=number), content
+                )
+            db.commit()
+            write_ms = (time.perf_counter() - started) * 1000 / args.versions
+
+            stats = version_store.storage_stats(db, document.id)
+            versions = db.scalars(select(DocumentVersion).where(DocumentVersion.document_id == document.id)).all()
+
+            cold = []
+            for version in versions:
+                blob_store.content_cache.clear()
+                started = time.perf_counter()
+                version_store.get_version_content(db, version)
+                cold.append((time.perf_counter() - started) * 1000)
+
+            warm = []
+            for version in versions:
+                started = time.perf_counter()
+                version_store.get_version_content(db, version)
+                warm.append((time.perf_counter() - started) * 1000)
+
+        print(f"📄 {name}")
+        print(f"   full copies   {full_bytes / 1024:>10.1f} KiB")
+        print(f"   stored        {stats['stored_bytes'] / 1024:>10.1f} KiB  "
+              f"({stats['blobs']} blobs for {stats['versions']} versions: {stats['keyframes']} full, "
+              f"{stats['deltas']} deltas, {full_bytes / max(stats['stored_bytes'], 1):.1f}x smaller)")
+        print(f"   write         {write_ms:>10.2f} ms/version")
+        print(f"   read (cold)   p50 {statistics.median(cold):.2f} ms  p95 {percentile(cold, 0.95):.2f} ms  "
+              f"max {max(cold):.2f} ms")
+        print(f"   read (cached) p50 {statistics.median(warm):.3f} ms  p95 {percentile(warm, 0.95):.3f} ms\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,14 @@
 Pytest configuration and fixtures for the Document Intelligence test suite.
 """
 
+import gc
 import pytest
+import pytest_asyncio
 import os
 import tempfile
 from pathlib import Path
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import StaticPool, create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
@@ -15,10 +18,15 @@ import sys
 server_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(server_dir))
 
-from app.internal.db import Base
+from app.internal.db import Base, create_async_db_engine, create_db_engine, get_db
 from app.models import Document, DocumentVersion, ChatHistory
 from app.__main__ import app
 
+# Move everything imported so far (the app and its AI dependencies) out of the garbage
+# collector's reach - otherwise every full collection rescans it, and the pauses trip
+# the latency assertions of whichever test they land in
+gc.freeze()
+
 
 @pytest.fixture(scope="session")
 def test_db_engine():
@@ -27,7 +35,9 @@ def test_db_engine():
         "sqlite:///:memory:", 
         echo=False,
         # Enable foreign key constraints in SQLite
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        # One shared connection, so requests served on TestClient threads see the same data
+        poolclass=StaticPool
     )
     
     # Enable foreign key constraints for SQLite
@@ -61,9 +71,11 @@ def db_session(test_db_engine):
             conn.execute(text("PRAGMA foreign_keys = OFF"))
             
             # Delete in dependency order (child tables first)
+            conn.execute(text("DELETE FROM suggestion_card"))
             conn.execute(text("DELETE FROM chat_history"))
             conn.execute(text("DELETE FROM document_version")) 
             conn.execute(text("DELETE FROM document"))
+            conn.execute(text("DELETE FROM content_blob"))
             
             # Re-enable foreign key constraints
             conn.execute(text("PRAGMA foreign_keys = ON"))
@@ -76,12 +88,49 @@ def db_session(test_db_engine):
                 pass
 
 
+@pytest_asyncio.fixture
+async def async_session_factory(tmp_path):
+    """File-backed WAL database with one seeded document, opened through the async engine."""
+    url = f"sqlite:///{tmp_path / 'chat.db'}"
+    sync_engine = create_db_engine(url)
+    Base.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        conn.execute(Document.__table__.insert().values(id=1, title="Chat Doc"))
+    sync_engine.dispose()
+
+    async_engine = create_async_db_engine(url)
+    factory = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    try:
+        yield factory
+    finally:
+        await async_engine.dispose()
+
+
 @pytest.fixture
 def client():
     """Create a test client for FastAPI application."""
     return TestClient(app)
 
 
+@pytest.fixture
+def api_client(test_db_engine, db_session):
+    """Test client whose endpoints use the test database instead of the app database."""
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_db_engine)
+
+    def override_get_db():
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
 @pytest.fixture
 def sample_document(db_session):
     """Create a sample document with version for testing."""
@@ -292,7 +292,7 @@ class TestWebSocketAIIntegration:
         mock_websocket = AsyncMock()
         
         # Test sending processing stage
-        await send_processing_stage(mock_websocket, "intent_detection", "system", 0)
+        await send_processing_stage(mock_websocket, "intent_detection", "system")
         
         # Verify WebSocket send was called
         mock_websocket.send_text.assert_called_once()
@@ -315,7 +315,7 @@ class TestWebSocketAIIntegration:
         mock_websocket = AsyncMock()
         
         # Test with non-existent stage
-        await send_processing_stage(mock_websocket, "invalid_stage", "system", 0)
+        await send_processing_stage(mock_websocket, "invalid_stage", "system")
         
         # Should not send anything for invalid stage
         mock_websocket.send_text.assert_not_called()
@@ -330,6 +330,483 @@ class TestWebSocketAIIntegration:
         mock_websocket.send_text.side_effect = Exception("Connection lost")
         
         # Should not raise exception
-        await send_processing_stage(mock_websocket, "intent_detection", "system", 0)
+        await send_processing_stage(mock_websocket, "intent_detection", "system")
         
-        # Exception should be caught and logged, not propagated
\ No newline at end of file
+        # Exception should be caught and logged, not propagated
+
+
+class TestWorkflowProgress:
+    """Test stage messages driven by workflow node events."""
+    
+    @pytest.mark.asyncio
+    async def test_node_events_and_final_state(self):
+        """run_with_node_events reports each node's start and end and returns the final state."""
+        import operator
+        from typing import Annotated
+        from typing_extensions import TypedDict
+        from langgraph.graph import StateGraph, END
+        from app.agents.graph_builder import run_with_node_events
+        
+        class State(TypedDict):
+            intent: str
+            messages: Annotated[list, operator.add]
+        
+        async def detect(state):
+            return {"intent": "casual_chat"}
+        
+        async def respond(state):
+            return {"messages": ["hi"]}
+        
+        graph = StateGraph(State)
+        graph.add_node("intent_detector", detect)
+        graph.add_node("casual_responder", respond)
+        graph.set_entry_point("intent_detector")
+        graph.add_conditional_edges(
+            "intent_detector", lambda state: "chat", {"chat": "casual_responder"}
+        )
+        graph.add_edge("casual_responder", END)
+        workflow = graph.compile()
+        
+        events = []
+        
+        async def record(node, phase, update):
+            events.append((node, phase, update))
+            if node == "casual_responder":
+                raise RuntimeError("a failing listener does not stop the workflow")
+        
+        result = await run_with_node_events(workflow, {"intent": "", "messages": []}, record)
+        
+        assert result == {"intent": "casual_chat", "messages": ["hi"]}
+        assert events == [
+            ("intent_detector", "start", {}),
+            ("intent_detector", "end", {"intent": "casual_chat"}),
+            ("casual_responder", "start", {}),
+            ("casual_responder", "end", {"messages": ["hi"]}),
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_stage_messages_follow_nodes(self):
+        """Stages start and complete with the nodes they cover, with measured durations."""
+        from app.endpoints import StageProgress
+        
+        mock_websocket = AsyncMock()
+        mock_websocket.client_state.name = "CONNECTED"
+        progress = StageProgress(mock_websocket)
+        
+        await progress("intent_detector", "start", {})
+        await progress("intent_detector", "end", {"intent": "document_analysis"})
+        await progress("document_loader", "start", {})
+        await progress("document_loader", "end", {})
+        await progress("agent_recruiter", "start", {})
+        await progress("agent_recruiter", "end", {})
+        
+        sent = [json.loads(call.args[0]) for call in mock_websocket.send_text.call_args_list]
+        assert [(m["type"], m.get("stage"), m.get("status")) for m in sent] == [
+            ("processing_stage", "intent_detection", "started"),
+            ("stage_list", None, None),
+            ("processing_stage", "intent_detection", "completed"),
+            ("processing_stage", "agent_selection", "started"),
+            ("processing_stage", "agent_selection", "completed"),
+        ]
+        assert sent[0]["intent_type"] is None and sent[0]["progress"] == 0
+        percentages = [stage["progress"] for stage in sent[1]["stages"]]
+        assert percentages == [12, 25, 38, 50, 62, 75, 88, 100]
+        assert "nodes" not in sent[1]["stages"][0]
+        assert sent[2]["progress"] == 12 and sent[2]["duration_ms"] >= 0
+        assert sent[4]["progress"] == 25
+        assert set(progress.durations) == {"intent_detection", "agent_selection"}
+    
+    @pytest.mark.asyncio
+    async def test_reply_deltas_stream_while_the_workflow_runs(self):
+        """Casual chat text reaches delta_callback piece by piece, the final message is complete."""
+        from types import SimpleNamespace
+        from langgraph.graph import StateGraph, END
+        from app.agents.graph_builder import (
+            ChatWorkflowState, handle_casual_chat_node, run_with_node_events
+        )
+        
+        async def stream():
+            for text in ["Hel", "lo", "", " there"]:
+                delta = SimpleNamespace(content=text)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=lambda **request: stream())
+        
+        graph = StateGraph(ChatWorkflowState)
+        graph.add_node("casual_responder", handle_casual_chat_node)
+        graph.set_entry_point("casual_responder")
+        graph.add_edge("casual_responder", END)
+        
+        deltas = []
+        
+        async def record(node, delta):
+            deltas.append((node, delta))
+        
+        result = await run_with_node_events(
+            graph.compile(),
+            {
+                "user_input": "hi",
+                "openai_client": mock_client,
+                "stream_deltas": True,
+                "messages": [],
+            },
+            delta_callback=record
+        )
+        
+        assert deltas == [
+            ("casual_responder", "Hel"), ("casual_responder", "lo"), ("casual_responder", " there")
+        ]
+        assert result["messages"][0]["content"] == "Hello there"
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+    
+    @pytest.mark.asyncio
+    async def test_assistant_delta_frames(self):
+        """AssistantDeltas sends each piece as a numbered assistant_delta frame."""
+        from app.endpoints import AssistantDeltas
+        
+        mock_websocket = AsyncMock()
+        deltas = AssistantDeltas(mock_websocket)
+        
+        await deltas("mermaid_generator", "flowchart")
+        await deltas("mermaid_generator", " TD")
+        
+        sent = [json.loads(call.args[0]) for call in mock_websocket.send_text.call_args_list]
+        assert [(m["type"], m["node"], m["delta"], m["index"]) for m in sent] == [
+            ("assistant_delta", "mermaid_generator", "flowchart", 0),
+            ("assistant_delta", "mermaid_generator", " TD", 1),
+        ]
+        assert deltas.first_delta_ms is not None
+    
+    @pytest.mark.asyncio
+    async def test_suggestion_cards_stream_per_mapped_chunk(self, monkeypatch):
+        """Cards reach cards_callback chunk by chunk, the final message reuses them."""
+        from types import SimpleNamespace
+        from langgraph.graph import StateGraph, END
+        from app.agents import mapping_agent
+        from app.agents.graph_builder import (
+            ChatWorkflowState, format_final_response_node, run_with_node_events
+        )
+        
+        original = [
+            {"chunk_id": "o1", "text": "A sensor.", "position": 0},
+            {"chunk_id": "o2", "text": "A controller.", "position": 1},
+        ]
+        suggested = [
+            {"chunk_id": "s1", "text": "A temperature sensor.", "position": 0},
+            {"chunk_id": "s2", "text": "A feedback controller.", "position": 1},
+        ]
+        monkeypatch.setattr(
+            mapping_agent, "create_chunks_from_text",
+            lambda text: [SimpleNamespace(to_dict=lambda chunk=chunk: chunk) for chunk in suggested]
+        )
+        mapping = {
+            "o1": {"suggested_chunks": ["s1"], "severity": "high", "confidence": 0.9,
+                   "change_type": "technical", "description": "Name the sensor"},
+            "o2": {"suggested_chunks": ["s2"], "severity": "low", "confidence": 0.7,
+                   "change_type": "technical", "description": "Name the controller"},
+        }
+        response = json.dumps(mapping)
+        
+        async def stream():
+            for i in range(0, len(response), 16):
+                delta = SimpleNamespace(content=response[i:i + 16])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=lambda **request: stream())
+        
+        graph = StateGraph(ChatWorkflowState)
+        graph.add_node("mapping_agent", mapping_agent.mapping_analysis_node)
+        graph.add_node("response_formatter", format_final_response_node)
+        graph.set_entry_point("mapping_agent")
+        graph.add_edge("mapping_agent", "response_formatter")
+        graph.add_edge("response_formatter", END)
+        
+        batches = []
+        
+        async def record(node, cards):
+            batches.append((node, cards))
+        
+        result = await run_with_node_events(
+            graph.compile(),
+            {"openai_client": mock_client, "original_chunks": original, "stream_cards": True,
+             "final_improved_document": "A temperature sensor.\n\nA feedback controller.",
+             "agents_used": [], "messages": []},
+            cards_callback=record
+        )
+        
+        assert [
+            (node, [card["chunk_mapping"]["original_chunk_id"] for card in cards])
+            for node, cards in batches
+        ] == [("mapping_agent", ["o1"]), ("mapping_agent", ["o2"])]
+        assert batches[0][1][0]["severity"] == "high"
+        final_cards = next(
+            m["cards"] for m in result["messages"] if m["type"] == "suggestion_cards"
+        )
+        assert [card["id"] for card in final_cards] == [cards[0]["id"] for _, cards in batches]
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+    
+    @pytest.mark.asyncio
+    async def test_suggestion_card_frames_and_summary(self):
+        """SuggestionCardStream sends numbered batches and a summary of the final cards."""
+        from app.endpoints import SuggestionCardStream
+        
+        mock_websocket = AsyncMock()
+        card_stream = SuggestionCardStream(mock_websocket)
+        
+        await card_stream("mapping_agent", [{"id": "a", "severity": "high"}])
+        await card_stream(
+            "mapping_agent", [{"id": "b", "severity": "low"}, {"id": "c", "severity": "low"}]
+        )
+        await card_stream.finish([
+            {"type": "text", "content": "intro"},
+            {"type": "suggestion_cards", "cards": [
+                {"id": "a", "severity": "high"},
+                {"id": "b", "severity": "low"},
+                {"id": "c", "severity": "low"},
+            ]},
+        ])
+        
+        sent = [json.loads(call.args[0]) for call in mock_websocket.send_text.call_args_list]
+        assert [(m["type"], m.get("batch")) for m in sent] == [
+            ("suggestion_cards_batch", 0),
+            ("suggestion_cards_batch", 1),
+            ("suggestion_cards_summary", None),
+        ]
+        summary = sent[2]
+        assert summary["total_count"] == 3 and summary["streamed_count"] == 3
+        assert summary["batches"] == 2
+        assert summary["severity_counts"] == {"high": 1, "medium": 0, "low": 2}
+        assert summary["first_card_ms"] >= 0
+
+
+class TestChatTurnScheduler:
+    """Test per-connection chat turns: superseding, queueing and cancelling."""
+    
+    @staticmethod
+    def _sent(websocket):
+        return [json.loads(call.args[0]) for call in websocket.send_text.call_args_list]
+    
+    @pytest.fixture
+    def turns(self, monkeypatch):
+        """Replaces run_chat_turn with a turn that runs until released, recording what happens."""
+        import asyncio
+        from app import endpoints
+        
+        log = []
+        release = asyncio.Event()
+        
+        async def fake_turn(websocket, data, stage_progress=None):
+            log.append(("start", data["message"]))
+            # An LLM node in flight when the turn is cancelled
+            stage_progress.running_nodes.add("llm")
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                log.append(("aborted", data["message"]))
+                raise
+            log.append(("done", data["message"]))
+        
+        monkeypatch.setattr(endpoints, "run_chat_turn", fake_turn)
+        return log, release
+    
+    @pytest.mark.asyncio
+    async def test_new_message_supersedes_the_documents_turn(self, turns):
+        import asyncio
+        from app.endpoints import ChatTurnScheduler
+        
+        log, release = turns
+        websocket = AsyncMock()
+        scheduler = ChatTurnScheduler(websocket, policy="supersede")
+        
+        scheduler.submit(1, {"message": "old"})
+        other = scheduler.submit(2, {"message": "other document"})
+        await asyncio.sleep(0)
+        new = scheduler.submit(1, {"message": "new"})
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(new, other)
+        
+        assert log == [
+            ("start", "old"), ("start", "other document"), ("aborted", "old"),
+            ("start", "new"), ("done", "other document"), ("done", "new"),
+        ]
+        assert [(m["type"], m["document_id"], m["reason"]) for m in self._sent(websocket)] == [
+            ("cancelled", 1, "superseded")
+        ]
+        assert scheduler.tasks == {}
+    
+    @pytest.mark.asyncio
+    async def test_queue_policy_waits_for_the_running_turn(self, turns):
+        import asyncio
+        from app.endpoints import ChatTurnScheduler
+        
+        log, release = turns
+        scheduler = ChatTurnScheduler(AsyncMock(), policy="queue")
+        
+        first = scheduler.submit(1, {"message": "first"})
+        second = scheduler.submit(1, {"message": "second"})
+        await asyncio.sleep(0.01)
+        assert log == [("start", "first")]
+        release.set()
+        await asyncio.gather(first, second)
+        
+        assert log == [
+            ("start", "first"), ("done", "first"), ("start", "second"), ("done", "second")
+        ]
+    
+    @pytest.mark.asyncio
+    async def test_cancel_and_close(self, turns):
+        import asyncio
+        from app.endpoints import ChatTurnScheduler
+        
+        log, _ = turns
+        websocket = AsyncMock()
+        scheduler = ChatTurnScheduler(websocket)
+        
+        scheduler.submit(1, {"message": "one"})
+        scheduler.submit(2, {"message": "two"})
+        await asyncio.sleep(0)
+        
+        assert scheduler.cancel(1) == [1]
+        assert scheduler.cancel(3) == []
+        await asyncio.sleep(0.01)
+        await scheduler.close()
+        
+        assert sorted(log) == [
+            ("aborted", "one"), ("aborted", "two"), ("start", "one"), ("start", "two")
+        ]
+        # Turns cut off by the disconnect have nobody to tell
+        sent = [(m["document_id"], m["reason"]) for m in self._sent(websocket)]
+        assert sent == [(1, "cancelled")]
+        assert scheduler.tasks == {}
+    
+    @pytest.mark.asyncio
+    async def test_cancelling_a_workflow_aborts_the_running_node(self):
+        """Cancellation reaches the awaited call inside a node (an LLM request in real nodes)."""
+        import asyncio
+        from typing_extensions import TypedDict
+        from langgraph.graph import StateGraph, END
+        from app.agents.graph_builder import run_with_node_events
+        
+        class State(TypedDict):
+            answer: str
+        
+        started = asyncio.Event()
+        aborted = []
+        
+        async def slow_llm_node(state):
+            started.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                aborted.append(True)
+                raise
+            return {"answer": "late"}
+        
+        graph = StateGraph(State)
+        graph.add_node("llm", slow_llm_node)
+        graph.set_entry_point("llm")
+        graph.add_edge("llm", END)
+        
+        async def on_node(node, phase, update):
+            pass
+        
+        task = asyncio.create_task(run_with_node_events(graph.compile(), {"answer": ""}, on_node))
+        await asyncio.wait_for(started.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        
+        assert aborted == [True]
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_turns_are_counted(self, turns):
+        import asyncio
+        from app.endpoints import ChatTurnScheduler
+        from app.internal.cancellation import cancellation_stats
+        
+        before = cancellation_stats.stats()
+        scheduler = ChatTurnScheduler(AsyncMock(), policy="supersede")
+        
+        scheduler.submit(1, {"message": "old"})
+        await asyncio.sleep(0)
+        scheduler.submit(1, {"message": "new"})
+        await asyncio.sleep(0.01)
+        await scheduler.close()
+        
+        after = cancellation_stats.stats()
+        delta = {key: after[key] - before[key] for key in after}
+        assert delta["chat_turns_cancelled"] == 2
+        assert delta["chat_turns_superseded"] == 1
+        assert delta["chat_turns_disconnected"] == 1
+        assert delta["workflow_nodes_aborted"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_client_frames_cancel_work_when_the_client_leaves(self):
+        """A disconnect noticed while reviewing cancels the review instead of finishing it."""
+        import asyncio
+        from app.endpoints import ClientFrames
+        
+        frames_in = [{"type": "websocket.receive", "text": "<p>doc</p>"}]
+        
+        async def receive():
+            if frames_in:
+                return frames_in.pop(0)
+            await asyncio.sleep(0.01)
+            return {"type": "websocket.disconnect"}
+        
+        websocket = AsyncMock()
+        websocket.receive.side_effect = receive
+        frames = ClientFrames(websocket)
+        aborted = []
+        
+        async def review():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                aborted.append(True)
+                raise
+        
+        assert await frames.receive_text() == "<p>doc</p>"
+        assert await asyncio.wait_for(frames.run(review()), 5) is False
+        assert aborted == [True]
+        assert await frames.receive_text() is None
+        await frames.close()
+    
+    @pytest.mark.asyncio
+    async def test_client_frames_run_completes_and_raises(self):
+        import asyncio
+        from app.endpoints import ClientFrames
+        
+        async def receive():
+            await asyncio.sleep(60)
+        
+        websocket = AsyncMock()
+        websocket.receive.side_effect = receive
+        frames = ClientFrames(websocket)
+        
+        async def review():
+            return "done"
+        
+        async def failing_review():
+            raise ValueError("model error")
+        
+        assert await frames.run(review()) is True
+        with pytest.raises(ValueError):
+            await frames.run(failing_review())
+        await frames.close()
+    
+    def test_ping_and_cancel_frames(self, api_client):
+        """The chat socket answers ping and cancel frames without running a workflow."""
+        with api_client.websocket_connect("/ws/chat") as websocket:
+            assert websocket.receive_json()["type"] == "connection_success"
+            
+            websocket.send_json({"type": "ping"})
+            assert websocket.receive_json()["type"] == "pong"
+            
+            websocket.send_json({"type": "cancel", "document_id": 7})
+            reply = websocket.receive_json()
+            assert reply["type"] == "cancelled"
+            assert (reply["document_id"], reply["reason"]) == (7, "idle")
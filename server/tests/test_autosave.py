@@ -0,0 +1,164 @@
+"""
+Tests for autosave write coalescing, unchanged-content skipping and If-Match preconditions.
+"""
+
+import threading
+import time
+
+import pytest
+
+import app.__main__ as main_module
+from app.internal.autosave import SaveCoalescer
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+
+@pytest.fixture
+def coalescer(monkeypatch):
+    coalescer = SaveCoalescer(window_ms=100)
+    monkeypatch.setattr(main_module, "save_coalescer", coalescer)
+    return coalescer
+
+
+@pytest.fixture
+def document(db_session):
+    document = Document(title="Autosave Doc")
+    db_session.add(document)
+    db_session.flush()
+    version = add_version(
+        db_session, DocumentVersion(document_id=document.id, version_number=1), "<p>start</p>"
+    )
+    document.current_version_id = version.id
+    db_session.commit()
+    return document
+
+
+class TestSaveCoalescer:
+    """Test merging of concurrent saves."""
+
+    def test_isolated_save_is_written_immediately(self):
+        coalescer = SaveCoalescer(window_ms=10_000)
+        started = time.perf_counter()
+
+        assert coalescer.save(1, "a", lambda content: (content, True)) == "a"
+        assert coalescer.save(2, "b", lambda content: (content, True)) == "b"
+        assert time.perf_counter() - started < 1
+
+    def test_saves_during_a_write_are_merged_into_one(self):
+        coalescer = SaveCoalescer(window_ms=50)
+        release = threading.Event()
+        written = []
+
+        def write(content):
+            if not written:
+                release.wait(5)
+            written.append(content)
+            return content, True
+
+        results = {}
+
+        def save(content):
+            results[content] = coalescer.save(1, content, write)
+
+        first = threading.Thread(target=save, args=("v0",))
+        first.start()
+        time.sleep(0.05)
+        burst = [threading.Thread(target=save, args=(f"v{i}",)) for i in range(1, 6)]
+        for thread in burst:
+            thread.start()
+            time.sleep(0.01)
+        release.set()
+        for thread in [first, *burst]:
+            thread.join(5)
+
+        assert written == ["v0", "v5"]
+        assert results == {"v0": "v0", **{f"v{i}": "v5" for i in range(1, 6)}}
+        assert coalescer.stats() == {"saves": 6, "coalesced": 4, "writes": 2, "unchanged": 0}
+
+    def test_failed_write_fails_every_merged_save(self):
+        coalescer = SaveCoalescer(window_ms=200)
+        coalescer.save(1, "first", lambda content: (content, True))
+        errors = []
+
+        def save():
+            try:
+                coalescer.save(
+                    1, "next", lambda content: (_ for _ in ()).throw(RuntimeError("disk full"))
+                )
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=save) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert errors == ["disk full"] * 3
+        # The document can still be saved afterwards
+        assert coalescer.save(1, "later", lambda content: (content, True)) == "later"
+
+
+class TestSaveEndpoint:
+    """Test /save/{id} on top of the coalescer."""
+
+    def test_unchanged_content_is_not_written(self, api_client, db_session, document, coalescer):
+        updated_at = document.updated_at
+
+        response = api_client.post(f"/save/{document.id}", json={"content": "<p>start</p>"})
+
+        assert response.status_code == 200
+        db_session.refresh(document)
+        assert document.updated_at == updated_at
+        assert coalescer.stats()["unchanged"] == 1
+        assert int(response.headers["X-Query-Count"]) == 1
+
+    def test_if_match_rejects_stale_saves(self, api_client, document, coalescer):
+        etag = api_client.get(f"/document/{document.id}").headers["ETag"]
+
+        saved = api_client.post(
+            f"/save/{document.id}", json={"content": "<p>one</p>"}, headers={"If-Match": etag}
+        )
+        assert saved.status_code == 200
+        assert saved.headers["ETag"] == saved.json()["etag"] != etag
+
+        stale = api_client.post(
+            f"/save/{document.id}", json={"content": "<p>two</p>"}, headers={"If-Match": etag}
+        )
+        assert stale.status_code == 412
+        assert int(stale.headers["X-Query-Count"]) == 1
+        assert api_client.get(f"/document/{document.id}").json()["content"] == "<p>one</p>"
+        assert coalescer.stats()["saves"] == 1
+
+        time.sleep(0.1)
+        current = api_client.post(
+            f"/save/{document.id}",
+            json={"content": "<p>two</p>"},
+            headers={"If-Match": f'"x", {saved.headers["ETag"]}'},
+        )
+        assert current.status_code == 200
+
+    def test_if_match_star_and_missing_document(self, api_client, document, coalescer):
+        assert api_client.post(
+            f"/save/{document.id}", json={"content": "<p>any</p>"}, headers={"If-Match": "*"}
+        ).status_code == 200
+        assert api_client.post(
+            "/save/9999", json={"content": "x"}, headers={"If-Match": "*"}
+        ).status_code == 404
+
+    def test_typing_burst_is_written_once_per_window(self, api_client, document, coalescer):
+        def type_and_save(i):
+            api_client.post(f"/save/{document.id}", json={"content": f"<p>start {i}</p>"})
+
+        threads = [threading.Thread(target=type_and_save, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join(10)
+
+        stats = coalescer.stats()
+        assert stats["saves"] == 10
+        assert stats["writes"] <= 3
+        assert stats["writes"] + stats["coalesced"] + stats["unchanged"] == 10
+        assert api_client.get(f"/document/{document.id}").json()["content"].startswith("<p>start ")
@@ -0,0 +1,133 @@
+"""
+Tests for the batch document read and batch version creation endpoints.
+"""
+
+import pytest
+from sqlalchemy import func, select
+
+from app.internal.blob_store import content_cache
+from app.internal.document_cache import document_cache
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+
+def _create_documents(db_session, count, versions=1):
+    documents = []
+    for i in range(count):
+        document = Document(title=f"Batch Doc {i}")
+        db_session.add(document)
+        db_session.flush()
+        for number in range(1, versions + 1):
+            version = add_version(
+                db_session, DocumentVersion(document_id=document.id, version_number=number),
+                f"<p>doc {i} v{number} " + "claim text " * 50 + "</p>"
+            )
+        document.current_version_id = version.id
+        documents.append(document)
+    db_session.commit()
+    document_cache.clear()
+    return documents
+
+
+@pytest.fixture
+def documents(db_session):
+    return _create_documents(db_session, 4)
+
+
+def _version_count(db_session):
+    return db_session.scalar(select(func.count(DocumentVersion.id)))
+
+
+class TestBatchRead:
+    """Test GET /api/documents/batch."""
+
+    def test_documents_in_requested_order(self, api_client, documents):
+        ids = [documents[2].id, documents[0].id, 9999, documents[2].id]
+
+        response = api_client.get("/api/documents/batch", params={"ids": ids})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert [d["id"] for d in body["documents"]] == [documents[2].id, documents[0].id]
+        assert body["documents"][0]["content"].startswith("<p>doc 2 v1 ")
+        assert body["documents"][0]["content_hash"]
+        assert body["missing"] == [9999]
+
+    def test_query_count_does_not_grow_with_documents(self, api_client, db_session):
+        many = _create_documents(db_session, 12)
+
+        counts = []
+        for batch in (many[:2], many):
+            content_cache.clear()
+            response = api_client.get("/api/documents/batch", params={"ids": [d.id for d in batch]})
+            assert len(response.json()["documents"]) == len(batch)
+            counts.append(int(response.headers["X-Query-Count"]))
+
+        # Documents and versions in one query, uncached contents in one more
+        assert counts[0] == counts[1] == 2
+
+    def test_older_current_versions_are_rebuilt(self, api_client, db_session):
+        document = _create_documents(db_session, 1, versions=3)[0]
+        document.current_version_id = db_session.scalar(
+            select(DocumentVersion.id).where(
+                DocumentVersion.document_id == document.id, DocumentVersion.version_number == 1
+            )
+        )
+        db_session.commit()
+        content_cache.clear()
+
+        body = api_client.get("/api/documents/batch", params={"ids": [document.id]}).json()
+
+        assert body["documents"][0]["version_number"] == 1
+        single = api_client.get(f"/document/{document.id}").json()
+        assert body["documents"][0]["content"] == single["content"]
+
+    def test_id_limits(self, api_client):
+        assert api_client.get("/api/documents/batch").status_code == 422
+        too_many = api_client.get("/api/documents/batch", params={"ids": list(range(1, 202))})
+        assert too_many.status_code == 422
+
+
+class TestBatchCreateVersions:
+    """Test POST /api/documents/batch/versions."""
+
+    def test_creates_and_points_at_new_versions(self, api_client, documents):
+        api_client.get(f"/document/{documents[0].id}")  # Warm the document cache
+
+        response = api_client.post("/api/documents/batch/versions", json={"versions": [
+            {"document_id": documents[0].id, "content": "<p>rewritten</p>"},
+            {"document_id": documents[1].id},
+        ]})
+
+        assert response.status_code == 200
+        created = response.json()["versions"]
+        assert [(v["document_id"], v["version_number"]) for v in created] == [
+            (documents[0].id, 2), (documents[1].id, 2)
+        ]
+        rewritten = api_client.get(f"/document/{documents[0].id}").json()
+        assert rewritten["content"] == "<p>rewritten</p>"
+        # No content copies the current version
+        copy = api_client.get(f"/document/{documents[1].id}").json()
+        assert copy["version_number"] == 2 and copy["content"].startswith("<p>doc 1 v1 ")
+
+    def test_all_or_nothing(self, api_client, db_session, documents):
+        before = _version_count(db_session)
+
+        response = api_client.post("/api/documents/batch/versions", json={"versions": [
+            {"document_id": documents[0].id, "content": "<p>new</p>"},
+            {"document_id": 9999, "content": "<p>new</p>"},
+        ]})
+
+        assert response.status_code == 404
+        assert "9999" in response.json()["detail"]
+        assert _version_count(db_session) == before
+
+    def test_rejects_duplicates_and_empty_batches(self, api_client, documents):
+        duplicate = {"document_id": documents[0].id, "content": "<p>x</p>"}
+
+        assert api_client.post(
+            "/api/documents/batch/versions", json={"versions": [duplicate, duplicate]}
+        ).status_code == 422
+        assert api_client.post(
+            "/api/documents/batch/versions", json={"versions": []}
+        ).status_code == 422
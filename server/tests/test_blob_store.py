@@ -0,0 +1,181 @@
+"""
+Tests for the content-addressed blob store and its migration.
+"""
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import Session
+
+from app.internal import blob_store
+from app.internal.blob_store import compress, content_cache, decompress, hash_content
+from app.internal.db import Base
+from app.internal.migrations import run_migrations
+from app.internal.version_store import add_version, get_version_content, update_version_content
+from app.models import ContentBlob, Document, DocumentVersion
+
+
+CONTENT = "<h1>Patent</h1>" + "<p>A fastening system comprising a clip and a rail.</p>" * 40
+
+
+@pytest.fixture(autouse=True)
+def clear_content_cache():
+    content_cache.clear()
+    yield
+    content_cache.clear()
+
+
+def blob_count(db_session) -> int:
+    return db_session.scalar(select(func.count(ContentBlob.hash)))
+
+
+class TestCompression:
+    """Test blob codecs."""
+
+    @pytest.mark.parametrize("codec", ["zlib", "zstd"])
+    def test_round_trip(self, codec):
+        """Compressed blobs decompress to the original bytes."""
+        if codec == "zstd" and blob_store.zstandard is None:
+            pytest.skip("zstandard not installed")
+        payload = CONTENT.encode("utf-8")
+        used_codec, data = compress(payload, codec)
+        assert used_codec == codec
+        assert len(data) < len(payload) / 5
+        assert decompress(codec, data) == payload
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            decompress("lz4", b"")
+
+
+class TestContentAddressing:
+    """Test deduplication and blob lifecycle."""
+
+    def test_identical_versions_share_one_blob(self, db_session):
+        """Copying a version or saving without edits stores no new content."""
+        document = Document(title="Dedup")
+        db_session.add(document)
+        db_session.flush()
+        for number in (1, 2, 3):
+            version = DocumentVersion(document_id=document.id, version_number=number)
+            add_version(db_session, version, CONTENT)
+        db_session.commit()
+
+        versions = db_session.scalars(select(DocumentVersion)).all()
+        assert {v.content_hash for v in versions} == {hash_content(CONTENT)}
+        assert all(v.content == "" for v in versions)
+        assert blob_count(db_session) == 1
+
+        update_version_content(db_session, versions[0], CONTENT)
+        db_session.commit()
+        assert blob_count(db_session) == 1
+
+    def test_shared_blob_survives_edit_of_one_version(self, db_session):
+        """A blob is only released once no version references it."""
+        document = Document(title="Shared")
+        db_session.add(document)
+        db_session.flush()
+        first = add_version(
+            db_session, DocumentVersion(document_id=document.id, version_number=1), CONTENT
+        )
+        second = add_version(
+            db_session, DocumentVersion(document_id=document.id, version_number=2), CONTENT
+        )
+        db_session.commit()
+
+        update_version_content(db_session, second, CONTENT + "<p>Edited</p>")
+        db_session.commit()
+        assert blob_count(db_session) == 2
+
+        update_version_content(db_session, first, CONTENT + "<p>Other edit</p>")
+        db_session.commit()
+        assert db_session.get(ContentBlob, hash_content(CONTENT)) is None
+        assert blob_count(db_session) == 2
+
+        content_cache.clear()
+        assert get_version_content(db_session, first) == CONTENT + "<p>Other edit</p>"
+        assert get_version_content(db_session, second) == CONTENT + "<p>Edited</p>"
+
+    def test_concurrent_insert_of_same_content(self, db_session, monkeypatch):
+        """Content stored by another worker after the existence check is not an error."""
+        stored_hash = blob_store.put_content(db_session, CONTENT)
+        db_session.commit()
+        db_session.expunge_all()
+
+        # The other worker's row is invisible to this session's check
+        monkeypatch.setattr(db_session, "get", lambda *args, **kwargs: None)
+        assert blob_store.put_content(db_session, CONTENT) == stored_hash
+        db_session.commit()
+        monkeypatch.undo()
+
+        assert blob_count(db_session) == 1
+
+    def test_legacy_inline_row_is_readable(self, db_session):
+        """Rows without a content hash are served from the inline column."""
+        document = Document(title="Legacy")
+        db_session.add(document)
+        db_session.flush()
+        version = DocumentVersion(
+            document_id=document.id, version_number=1, content="<p>Inline</p>"
+        )
+        db_session.add(version)
+        db_session.commit()
+
+        assert get_version_content(db_session, version) == "<p>Inline</p>"
+
+
+class TestBlobMigration:
+    """Test moving existing version rows into the blob store."""
+
+    @pytest.fixture
+    def legacy_engine(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE document (id INTEGER PRIMARY KEY, "
+                              "title VARCHAR NOT NULL, current_version_id INTEGER, "
+                              "created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"))
+            conn.execute(text("CREATE TABLE document_version (id INTEGER PRIMARY KEY, "
+                              "document_id INTEGER NOT NULL, version_number INTEGER NOT NULL, "
+                              "content VARCHAR NOT NULL, is_active BOOLEAN NOT NULL, "
+                              "created_at DATETIME NOT NULL)"))
+            conn.execute(text(
+                "INSERT INTO document VALUES (1, 'Legacy', 3, '2024-01-01', '2024-01-01')"
+            ))
+        yield engine
+        engine.dispose()
+
+    def insert_version(self, conn, version_id, number, content, **extra):
+        columns = {"id": version_id, "document_id": 1, "version_number": number, "content": content,
+                   "is_active": number == 3, "created_at": "2024-01-01", **extra}
+        placeholders = ", ".join(":" + c for c in columns)
+        conn.execute(
+            text(f"INSERT INTO document_version ({', '.join(columns)}) VALUES ({placeholders})"),
+            columns
+        )
+
+    def migrate_and_read(self, engine):
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+        content_cache.clear()
+        with Session(engine) as db:
+            versions = db.scalars(
+                select(DocumentVersion).order_by(DocumentVersion.version_number)
+            ).all()
+            assert all(v.content == "" and v.content_hash for v in versions)
+            contents = [get_version_content(db, v) for v in versions]
+            return contents, db.scalar(select(func.count(ContentBlob.hash)))
+
+    def test_inline_rows(self, legacy_engine):
+        """Full-content rows move into blobs, identical rows are stored once."""
+        with legacy_engine.begin() as conn:
+            self.insert_version(conn, 1, 1, CONTENT)
+            self.insert_version(conn, 2, 2, CONTENT)
+            self.insert_version(conn, 3, 3, CONTENT + "<p>Claim 2</p>")
+
+        contents, blobs = self.migrate_and_read(legacy_engine)
+
+        assert contents == [CONTENT, CONTENT, CONTENT + "<p>Claim 2</p>"]
+        assert blobs == 2
+
+        # Running again is a no-op
+        run_migrations(legacy_engine)
+        assert self.migrate_and_read(legacy_engine) == (contents, blobs)
@@ -0,0 +1,315 @@
+"""
+Tests for the async chat history manager.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, select, text
+from fastapi.testclient import TestClient
+
+from app.__main__ import app
+from app.internal.chat_manager import ChatHistoryManager, decode_history_cursor
+from app.internal.db import Base, create_db_engine
+from app.internal.migrations import move_suggestion_cards_to_table
+from app.models import ChatHistory, Document, SuggestionCard
+
+
+class TestAsyncChatHistoryManager:
+    """Test chat persistence through AsyncSession."""
+
+    @pytest.mark.asyncio
+    async def test_save_and_load_round_trip(self, async_session_factory):
+        """Messages saved through the manager are loaded back in order."""
+        async with async_session_factory() as session:
+            manager = ChatHistoryManager(session)
+            user_msg = await manager.save_user_message(1, "v1.0", "Analyze this")
+            assistant_msg = await manager.save_assistant_message(1, "v1.0", "Done", ["technical"])
+
+            assert user_msg.id is not None
+            assert assistant_msg.id > user_msg.id
+
+        async with async_session_factory() as session:
+            messages = await ChatHistoryManager(session).load_chat_history(1, "v1.0")
+
+        assert [m.type for m in messages] == ["user", "assistant"]
+        assert messages[1].agents_used == ["technical"]
+
+    @pytest.mark.asyncio
+    async def test_card_action_and_clear(self, async_session_factory):
+        """Card actions and history clearing work on the async session."""
+        cards = [{"id": "card_1"}, {"id": "card_2"}]
+        async with async_session_factory() as session:
+            manager = ChatHistoryManager(session)
+            message = await manager.save_suggestion_cards(1, "v1.0", cards, ["legal"])
+
+            assert await manager.mark_suggestion_card_action(message.id, "card_1", "accepted")
+            active = await manager.get_active_suggestion_cards(1, "v1.0")
+            assert [card["id"] for card in active] == ["card_2"]
+
+            assert await manager.clear_chat_history(1, "v1.0")
+            remaining = await session.scalars(select(ChatHistory))
+            assert remaining.all() == []
+
+    @pytest.mark.asyncio
+    async def test_card_action_is_single_row_update(self, async_session_factory):
+        """Accepting a card updates one suggestion_card row and never rewrites chat_metadata."""
+        cards = [{"id": f"card_{i}", "description": "x" * 500} for i in range(20)]
+        async with async_session_factory() as session:
+            manager = ChatHistoryManager(session)
+            message = await manager.save_suggestion_cards(1, "v1.0", cards, ["legal"])
+
+            statements = []
+            sync_engine = session.bind.sync_engine
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            event.listen(sync_engine, "before_cursor_execute", record)
+            try:
+                assert await manager.mark_suggestion_card_action(message.id, "card_3", "dismissed")
+                active = await manager.get_active_suggestion_cards(1, "v1.0")
+            finally:
+                event.remove(sync_engine, "before_cursor_execute", record)
+
+            assert len(active) == 19 and "card_3" not in [card["id"] for card in active]
+            writes = [
+                s for s in statements
+                if s.lstrip().upper().startswith(("UPDATE", "INSERT", "DELETE"))
+            ]
+            assert len(writes) == 1 and "suggestion_card" in writes[0]
+            assert not [s for s in statements if "chat_metadata" in s]
+
+            assert not await manager.mark_suggestion_card_action(message.id, "missing", "accepted")
+
+        async with async_session_factory() as session:
+            messages = await ChatHistoryManager(session).load_chat_history(1, "v1.0")
+        assert messages[0].metadata["card_actions"] == {"card_3": "dismissed"}
+        # All cards are returned, card_actions tells the client which ones were acted on
+        assert len(messages[0].suggestion_cards) == 20
+
+    @pytest.mark.asyncio
+    async def test_cards_without_id_are_never_active(self, async_session_factory):
+        """Cards without an id are kept and returned, but not listed as active."""
+        cards = [{"id": "card_1"}, {"type": "Grammar"}, {"id": "", "type": "Style"}]
+        async with async_session_factory() as session:
+            manager = ChatHistoryManager(session)
+            message = await manager.save_suggestion_cards(1, "v1.0", cards, ["legal"])
+
+            active = await manager.get_active_suggestion_cards(1, "v1.0")
+            assert [card["id"] for card in active] == ["card_1"]
+            assert message.get_active_suggestion_cards() == [{"id": "card_1"}]
+
+            await manager.mark_suggestion_card_action(message.id, "card_1", "accepted")
+            assert await manager.remove_suggestion_card_message(message.id)
+
+    @pytest.mark.asyncio
+    async def test_message_removed_after_last_card(self, async_session_factory):
+        async with async_session_factory() as session:
+            manager = ChatHistoryManager(session)
+            message = await manager.save_suggestion_cards(
+                1, "v1.0", [{"id": "a"}, {"id": "b"}], ["legal"]
+            )
+
+            await manager.mark_suggestion_card_action(message.id, "a", "accepted")
+            assert not await manager.remove_suggestion_card_message(message.id)
+            await manager.mark_suggestion_card_action(message.id, "b", "dismissed")
+            assert await manager.remove_suggestion_card_message(message.id)
+
+            assert (await session.scalars(select(SuggestionCard))).all() == []
+
+    @pytest.mark.asyncio
+    async def test_writes_do_not_block_other_connections(self, async_session_factory):
+        """While one connection writes, the event loop and other readers stay responsive."""
+        stop = asyncio.Event()
+        heartbeat_lags = []
+        read_latencies = []
+
+        async def writer():
+            async with async_session_factory() as session:
+                manager = ChatHistoryManager(session)
+                for i in range(200):
+                    content = f"Message {i} " + "x" * 2000
+                    await manager.save_assistant_message(1, "v1.0", content, ["system"])
+            stop.set()
+
+        async def heartbeat():
+            while not stop.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.005)
+                heartbeat_lags.append(time.perf_counter() - started - 0.005)
+
+        async def reader():
+            async with async_session_factory() as session:
+                manager = ChatHistoryManager(session)
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    await manager.load_chat_history(1, "v1.0", limit=20)
+                    read_latencies.append(time.perf_counter() - started)
+
+        await asyncio.wait_for(asyncio.gather(writer(), heartbeat(), reader()), timeout=60)
+
+        assert heartbeat_lags and read_latencies
+        # No single event-loop stall while the writer commits
+        assert max(heartbeat_lags) < 0.1
+        assert sorted(read_latencies)[int(len(read_latencies) * 0.95) - 1] < 0.1
+
+
+@pytest_asyncio.fixture
+async def long_history(async_session_factory):
+    """250 messages on v1.0 sharing 5 timestamps, so paging has to break ties by id."""
+    async with async_session_factory() as session:
+        session.add_all([
+            ChatHistory(
+                document_id=1, version_number="v1.0", message_type="user",
+                content=f"Message {i}", created_at=datetime(2024, 1, 1, 12, i // 50)
+            )
+            for i in range(250)
+        ] + [
+            ChatHistory(
+                document_id=1, version_number="v2.0", message_type="user", content="Other version"
+            )
+        ])
+        session.add(
+            ChatHistory.create_suggestion_cards_message(1, "v1.0", [{"id": "card_1"}], ["legal"])
+        )
+        await session.commit()
+    return async_session_factory
+
+
+class TestChatHistoryPaging:
+    """Test keyset-paginated and streamed history loading."""
+
+    @pytest.mark.asyncio
+    async def test_keyset_pages_cover_history_once(self, long_history):
+        contents, after = [], None
+        async with long_history() as session:
+            manager = ChatHistoryManager(session)
+            while True:
+                page = await manager.load_chat_history(1, "v1.0", limit=40, after=after)
+                if not page:
+                    break
+                contents += [m.content for m in page]
+                after = (page[-1].timestamp, int(page[-1].id))
+
+        assert contents[:250] == [f"Message {i}" for i in range(250)]
+        assert len(contents) == 251
+
+    @pytest.mark.asyncio
+    async def test_history_query_uses_composite_index(self, long_history):
+        async with long_history() as session:
+            plan = (await session.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM chat_history WHERE document_id = 1 "
+                "AND version_number = 'v1.0' AND (created_at, id) > ('2024-01-01', 10) "
+                "ORDER BY created_at, id LIMIT 40"
+            ))).all()
+
+        details = " ".join(row[-1] for row in plan)
+        assert "ix_chat_history_document_version_created" in details
+        assert "TEMP B-TREE" not in details
+
+    @pytest.mark.asyncio
+    async def test_cleanup_keeps_newest_messages(self, long_history):
+        async with long_history() as session:
+            manager = ChatHistoryManager(session)
+            assert await manager.cleanup_old_messages(1, "v1.0", keep_count=30) == 221
+            remaining = await manager.load_chat_history(1, "v1.0", limit=100)
+            assert [m.content for m in remaining[:-1]] == [f"Message {i}" for i in range(221, 250)]
+            assert remaining[-1].type == "suggestion_cards"
+            assert await manager.cleanup_old_messages(1, "v1.0", keep_count=30) == 0
+
+            assert await manager.cleanup_old_messages(1, "v1.0", keep_count=0) == 30
+            assert (await session.scalars(select(SuggestionCard))).all() == []
+            assert len(await manager.load_chat_history(1, "v2.0")) == 1
+
+    def test_history_endpoint_pages_and_streams(self, long_history):
+        client = TestClient(app)
+        with patch("app.endpoints.AsyncSessionLocal", long_history):
+            ids, cursor = [], None
+            while True:
+                url = "/api/chat/history/1/v1.0?limit=100" + (f"&cursor={cursor}" if cursor else "")
+                body = client.get(url).json()
+                ids += [m["id"] for m in body["messages"]]
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    break
+
+            response = client.get("/api/chat/history/1/v1.0/stream")
+            bad_cursor = client.get("/api/chat/history/1/v1.0?cursor=not-a-cursor")
+
+        assert len(ids) == len(set(ids)) == 251
+        assert response.headers["content-type"] == "application/x-ndjson"
+        streamed = [json.loads(line) for line in response.text.splitlines()]
+        assert [m["id"] for m in streamed] == ids
+        assert streamed[-1]["suggestion_cards"] == [{"id": "card_1"}]
+        assert bad_cursor.status_code == 400
+
+    def test_stream_ends_with_error_line_on_failure(self, long_history):
+        """A database error after streaming started is reported in a final NDJSON line."""
+        original_query = ChatHistoryManager._history_query
+        original_iter = ChatHistoryManager.iter_chat_history
+
+        def failing_after_first_page(self, document_id, version_number, after, limit):
+            if after is not None:
+                raise RuntimeError("database went away")
+            return original_query(self, document_id, version_number, after, limit)
+
+        def small_batches(self, document_id, version_number, batch_size=500):
+            return original_iter(self, document_id, version_number, batch_size=100)
+
+        client = TestClient(app)
+        with patch("app.endpoints.AsyncSessionLocal", long_history), \
+                patch.object(ChatHistoryManager, "_history_query", failing_after_first_page), \
+                patch.object(ChatHistoryManager, "iter_chat_history", small_batches):
+            response = client.get("/api/chat/history/1/v1.0/stream")
+
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert response.status_code == 200
+        assert len(lines) == 101
+        assert lines[-1] == {"error": "database went away"}
+
+    def test_malformed_cursor(self):
+        with pytest.raises(ValueError):
+            decode_history_cursor("bm9wZQ==")
+
+
+class TestSuggestionCardMigration:
+    """Test moving JSON cards out of chat_metadata."""
+
+    def test_moves_cards_and_actions(self, tmp_path):
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy_chat.db'}")
+        Base.metadata.create_all(bind=engine)
+        legacy_metadata = {
+            "suggestion_cards": [
+                {"id": "card_1", "type": "Grammar"}, {"id": "card_2", "type": "Structure"}
+            ],
+            "agents_used": ["technical"],
+            "card_actions": {"card_1": "accepted"},
+        }
+        with engine.begin() as conn:
+            conn.execute(Document.__table__.insert().values(id=1, title="Legacy Chat"))
+            conn.execute(ChatHistory.__table__.insert().values(
+                id=1, document_id=1, version_number="v1.0", message_type="suggestion_cards",
+                content="AI Analysis Results", chat_metadata=json.dumps(legacy_metadata)
+            ))
+
+        for _ in range(2):
+            with engine.begin() as conn:
+                move_suggestion_cards_to_table(conn)
+
+        with engine.connect() as conn:
+            cards = conn.execute(text(
+                "SELECT card_id, position, status FROM suggestion_card ORDER BY position"
+            )).all()
+            metadata = conn.execute(text("SELECT chat_metadata FROM chat_history")).scalar()
+
+        assert [tuple(card) for card in cards] == [
+            ("card_1", 0, "accepted"), ("card_2", 1, "active")
+        ]
+        assert json.loads(metadata) == {"agents_used": ["technical"]}
+        engine.dispose()
@@ -0,0 +1,173 @@
+"""
+Tests for the chat history retention and compaction job.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, func, select
+
+from app.internal.chat_retention import ChatCompactor
+from app.internal.db import Base, create_async_db_engine, create_db_engine
+from app.models import ChatHistory, Document, SuggestionCard
+
+
+@pytest_asyncio.fixture
+async def chat_engine(tmp_path):
+    """File-backed database with 30 messages on v1.0 and 5 on v2.0, the oldest 10 days old."""
+    url = f"sqlite:///{tmp_path / 'retention.db'}"
+    sync_engine = create_db_engine(url)
+    Base.metadata.create_all(bind=sync_engine)
+    started_at = datetime.utcnow() - timedelta(days=10)
+    with sync_engine.begin() as conn:
+        conn.execute(Document.__table__.insert().values(id=1, title="Retention Doc"))
+        conn.execute(ChatHistory.__table__.insert(), [
+            {
+                "id": i + 1,
+                "document_id": 1,
+                "version_number": "v1.0" if i < 30 else "v2.0",
+                "message_type": "suggestion_cards" if i % 3 == 0 else "user",
+                "content": "lorem ipsum " * 200,
+                "created_at": started_at + timedelta(hours=i),
+            }
+            for i in range(35)
+        ])
+        conn.execute(SuggestionCard.__table__.insert(), [
+            {
+                "message_id": i + 1, "document_id": 1, "version_number": "v1.0",
+                "card_id": "c1", "payload": {},
+            }
+            for i in range(0, 30, 3)
+        ])
+    sync_engine.dispose()
+
+    engine = create_async_db_engine(url)
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+
+
+async def _ids(engine, model, column):
+    async with engine.connect() as conn:
+        return list((await conn.scalars(select(column).order_by(column))).all())
+
+
+class TestRetention:
+    """Test the retention rules."""
+
+    @pytest.mark.asyncio
+    async def test_keeps_newest_messages_per_version(self, chat_engine):
+        report = await ChatCompactor(chat_engine, keep_per_version=10, max_age_days=0).compact()
+
+        assert report.overflow_messages == 20 and report.expired_messages == 0
+        assert report.cards == 7  # Cards of messages 1, 4, ... 19
+        assert report.complete
+        assert await _ids(chat_engine, ChatHistory, ChatHistory.id) == list(range(21, 36))
+        assert await _ids(chat_engine, SuggestionCard, SuggestionCard.message_id) == [22, 25, 28]
+
+    @pytest.mark.asyncio
+    async def test_deletes_expired_messages_everywhere(self, chat_engine):
+        # Messages are an hour apart starting 10 days ago, so all are older than 5 days
+        report = await ChatCompactor(chat_engine, keep_per_version=0, max_age_days=5).compact()
+
+        assert report.expired_messages == 35
+        assert await _ids(chat_engine, ChatHistory, ChatHistory.id) == []
+
+        # Nothing left to do on the next run
+        compactor = ChatCompactor(chat_engine, keep_per_version=0, max_age_days=5)
+        assert (await compactor.compact()).messages == 0
+
+    @pytest.mark.asyncio
+    async def test_age_cutoff_keeps_recent_messages(self, chat_engine):
+        compactor = ChatCompactor(chat_engine, keep_per_version=0, max_age_days=10 - 29.5 / 24)
+        report = await compactor.compact()
+
+        assert report.expired_messages == 30
+        assert await _ids(chat_engine, ChatHistory, ChatHistory.id) == list(range(31, 36))
+
+
+class TestCompaction:
+    """Test slicing, set-based statements and vacuum."""
+
+    @pytest.mark.asyncio
+    async def test_deletes_with_set_based_statements_in_slices(self, chat_engine):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if statement.startswith("DELETE"):
+                statements.append(statement)
+
+        event.listen(chat_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            report = await ChatCompactor(
+                chat_engine, keep_per_version=5, max_age_days=0, batch_size=10
+            ).compact()
+        finally:
+            event.remove(chat_engine.sync_engine, "before_cursor_execute", record)
+
+        assert report.overflow_messages == 25
+        assert report.slices == 3
+        # Two statements per slice, each deleting by a subquery
+        assert len(statements) == 6
+        assert all("IN (SELECT" in statement for statement in statements)
+
+    @pytest.mark.asyncio
+    async def test_budget_spreads_work_over_runs(self, chat_engine):
+        compactor = ChatCompactor(
+            chat_engine, keep_per_version=5, max_age_days=0, batch_size=10, budget_ms=0
+        )
+
+        reports = [await compactor.compact() for _ in range(4)]
+
+        assert [r.overflow_messages for r in reports] == [10, 10, 5, 0]
+        assert [r.complete for r in reports] == [False, False, True, True]
+        assert compactor.stats()["messages_deleted"] == 25
+        async with chat_engine.connect() as conn:
+            assert await conn.scalar(select(func.count(ChatHistory.id))) == 10
+
+    @pytest.mark.asyncio
+    async def test_vacuum_returns_free_pages(self, chat_engine):
+        report = await ChatCompactor(chat_engine, keep_per_version=1, max_age_days=0).compact()
+
+        # New databases are created with auto_vacuum=INCREMENTAL
+        assert report.vacuum == "incremental"
+        assert report.pages_freed > 0
+        async with chat_engine.connect() as conn:
+            assert (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar() == 0
+
+    @pytest.mark.asyncio
+    async def test_full_vacuum_without_incremental_vacuum(self, chat_engine):
+        async with chat_engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.exec_driver_sql("PRAGMA auto_vacuum=NONE")
+            await conn.exec_driver_sql("VACUUM")
+
+        report = await ChatCompactor(chat_engine, keep_per_version=1, max_age_days=0).compact()
+
+        assert report.vacuum == "full"
+        assert report.pages_freed > 0
+        async with chat_engine.connect() as conn:
+            # The full VACUUM also switched the database to incremental vacuum
+            assert (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar() == 2
+
+    @pytest.mark.asyncio
+    async def test_no_vacuum_in_memory(self):
+        engine = create_async_db_engine("sqlite:///:memory:")
+        try:
+            assert await ChatCompactor(engine)._vacuum() == (None, 0)
+        finally:
+            await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_scheduled_runs(self, chat_engine):
+        compactor = ChatCompactor(chat_engine, keep_per_version=10, max_age_days=0, interval=0.01)
+
+        compactor.start()
+        await asyncio.sleep(0.3)
+        await compactor.stop()
+
+        assert compactor.stats()["runs"] >= 1
+        assert compactor.stats()["messages_deleted"] == 20
@@ -0,0 +1,143 @@
+"""
+Tests for the write-behind chat persistence queue.
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app.internal.chat_writer import ChatWriteQueue
+from app.models import ChatHistory, SuggestionCard
+
+
+async def stored_contents(session_factory):
+    async with session_factory() as session:
+        return list(await session.scalars(select(ChatHistory.content).order_by(ChatHistory.id)))
+
+
+class TestChatWriteQueue:
+    """Test batching, returned IDs and durability on close."""
+
+    @pytest.mark.asyncio
+    async def test_burst_is_one_transaction(self, async_session_factory):
+        """Messages queued together are written in one batch, IDs come back in order."""
+        writer = ChatWriteQueue(async_session_factory, flush_interval=0.05)
+        for i in range(20):
+            writer.enqueue(ChatHistory.create_user_message(1, "v1.0", f"User {i}"))
+        ids = await writer.save_all([
+            ChatHistory.create_assistant_message(1, "v1.0", f"Assistant {i}", ["system"])
+            for i in range(5)
+        ])
+        await writer.close()
+
+        assert ids == sorted(ids) and len(set(ids)) == 5
+        assert writer.stats() == {
+            "queued": 25, "written": 25, "failed": 0, "batches": 1, "pending": 0
+        }
+        assert await stored_contents(async_session_factory) == (
+            [f"User {i}" for i in range(20)] + [f"Assistant {i}" for i in range(5)]
+        )
+
+    @pytest.mark.asyncio
+    async def test_save_does_not_wait_for_flush_window(self, async_session_factory):
+        """A caller waiting for an ID wakes the writer instead of waiting out the window."""
+        writer = ChatWriteQueue(async_session_factory, flush_interval=5)
+        writer.enqueue(ChatHistory.create_user_message(1, "v1.0", "Question"))
+
+        started = time.perf_counter()
+        message_id = await writer.save(
+            ChatHistory.create_assistant_message(1, "v1.0", "Answer", [])
+        )
+        elapsed = time.perf_counter() - started
+        await writer.close()
+
+        assert elapsed < 1
+        async with async_session_factory() as session:
+            assert (await session.get(ChatHistory, message_id)).content == "Answer"
+
+    @pytest.mark.asyncio
+    async def test_close_writes_queued_messages(self, async_session_factory):
+        """Fire-and-forget messages still queued at shutdown are written by close()."""
+        writer = ChatWriteQueue(async_session_factory, flush_interval=60)
+        for i in range(3):
+            writer.enqueue(ChatHistory.create_user_message(1, "v1.0", f"Pending {i}"))
+        await asyncio.sleep(0)
+
+        await writer.close()
+
+        stored = await stored_contents(async_session_factory)
+        assert stored == ["Pending 0", "Pending 1", "Pending 2"]
+        assert writer.stats()["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_bad_message_does_not_drop_batch(self, async_session_factory):
+        """A row that fails to insert only fails its own caller."""
+        writer = ChatWriteQueue(async_session_factory, flush_interval=0.05)
+        good = writer.save(ChatHistory.create_user_message(1, "v1.0", "Good"))
+        bad = writer.save(
+            ChatHistory(document_id=1, version_number="v1.0", message_type="user", content=None)
+        )
+
+        results = await asyncio.gather(good, bad, return_exceptions=True)
+        await writer.close()
+
+        assert isinstance(results[0], int)
+        assert isinstance(results[1], Exception)
+        assert writer.stats()["failed"] == 1
+        assert await stored_contents(async_session_factory) == ["Good"]
+
+    @pytest.mark.asyncio
+    async def test_commit_failure_is_retried_with_fresh_rows(self, async_session_factory):
+        """IDs are only returned for committed rows, a failed commit is retried."""
+        failures = []
+
+        def flaky_factory():
+            session = async_session_factory()
+            if not failures:
+                failures.append(1)
+
+                async def failing_commit():
+                    await session.flush()
+                    await session.rollback()
+                    raise RuntimeError("disk I/O error")
+
+                session.commit = failing_commit
+            return session
+
+        writer = ChatWriteQueue(flaky_factory, flush_interval=0.05)
+        ids = await writer.save_all([
+            ChatHistory.create_assistant_message(1, "v1.0", f"Reply {i}", []) for i in range(3)
+        ])
+        cards_id = await writer.save(
+            ChatHistory.create_suggestion_cards_message(1, "v1.0", [{"id": "a"}], [])
+        )
+        await writer.close()
+
+        assert writer.stats()["written"] == 4 and writer.stats()["failed"] == 0
+        async with async_session_factory() as session:
+            for message_id, content in zip(ids, ["Reply 0", "Reply 1", "Reply 2"]):
+                assert (await session.get(ChatHistory, message_id)).content == content
+            cards = await session.scalars(
+                select(SuggestionCard).where(SuggestionCard.message_id == cards_id)
+            )
+            assert [card.card_id for card in cards] == ["a"]
+
+    def test_messages_from_closed_loop_are_written(self, async_session_factory):
+        """Messages still queued when their event loop closed are written on the next one."""
+        writer = ChatWriteQueue(async_session_factory, flush_interval=60)
+
+        async def queue_only():
+            writer.enqueue(ChatHistory.create_user_message(1, "v1.0", "Left behind"))
+
+        async def write_and_close():
+            await writer.save(ChatHistory.create_user_message(1, "v1.0", "Next loop"))
+            await writer.close()
+            return await stored_contents(async_session_factory)
+
+        first_loop = asyncio.new_event_loop()
+        first_loop.run_until_complete(queue_only())
+        first_loop.close()
+
+        assert asyncio.run(write_and_close()) == ["Left behind", "Next loop"]
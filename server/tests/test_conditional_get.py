@@ -0,0 +1,137 @@
+"""
+Tests for conditional GETs (ETag / Last-Modified / 304) on document and version reads.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.internal.document_cache import document_cache
+from app.internal.document_repository import http_date, is_not_modified
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+# Selecting the content column or blob data
+CONTENT_READS = re.compile(r"(?<!CAST\()document_version\.content\b(?!_)|content_blob\.data")
+
+URLS = ["/document/{id}", "/api/documents/{id}", "/api/documents/{id}/versions"]
+
+
+@pytest.fixture
+def document(db_session):
+    """Document with 3 versions, pointing at version 3."""
+    document = Document(title="Conditional Doc")
+    db_session.add(document)
+    db_session.flush()
+    versions = [
+        add_version(
+            db_session,
+            DocumentVersion(document_id=document.id, version_number=n),
+            f"<p>v{n}</p>",
+        )
+        for n in range(1, 4)
+    ]
+    document.current_version_id = versions[2].id
+    document.updated_at = datetime(2024, 5, 1, 12, 0, 0, 500000)
+    db_session.commit()
+    document_cache.clear()
+    return document
+
+
+@pytest.fixture
+def statement_log(test_db_engine):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(test_db_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(test_db_engine, "before_cursor_execute", record)
+
+
+class TestIsNotModified:
+    """Test the precondition evaluation."""
+
+    def test_if_none_match(self):
+        assert is_not_modified('"a"', None, '"a"', None)
+        assert is_not_modified('"x", W/"a"', None, '"a"', None)
+        assert is_not_modified("*", None, '"a"', None)
+        assert not is_not_modified('"x"', None, '"a"', None)
+        assert not is_not_modified("*", None, None, None)
+
+    def test_if_modified_since(self):
+        modified = datetime(2024, 5, 1, 12, 0, 0, 500000)
+
+        assert is_not_modified(None, "Wed, 01 May 2024 12:00:00 GMT", None, modified)
+        assert is_not_modified(None, "Wed, 01 May 2024 13:00:00 GMT", None, modified)
+        assert not is_not_modified(None, "Wed, 01 May 2024 11:59:59 GMT", None, modified)
+        assert not is_not_modified(None, "yesterday", None, modified)
+
+    def test_if_none_match_takes_precedence(self):
+        modified = datetime(2024, 5, 1, 12, 0, 0)
+        assert not is_not_modified('"x"', http_date(modified), '"a"', modified)
+
+
+class TestConditionalEndpoints:
+    """Test 304 answers and when they stop being given."""
+
+    @pytest.mark.parametrize("url", URLS)
+    def test_validators_and_304(self, api_client, document, statement_log, url):
+        url = url.format(id=document.id)
+        first = api_client.get(url)
+        assert first.status_code == 200
+        assert first.headers["Last-Modified"] == "Wed, 01 May 2024 12:00:00 GMT"
+        assert first.headers["Cache-Control"] == "no-cache"
+        etag = first.headers["ETag"]
+
+        statement_log.clear()
+        revalidated = api_client.get(url, headers={"If-None-Match": etag})
+
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["ETag"] == etag
+        assert int(revalidated.headers["X-Query-Count"]) == 1
+        assert not [s for s in statement_log if CONTENT_READS.search(s)]
+
+        by_date = api_client.get(url, headers={"If-Modified-Since": first.headers["Last-Modified"]})
+        assert by_date.status_code == 304
+
+    @pytest.mark.parametrize("url", URLS)
+    def test_writes_invalidate(self, api_client, document, url):
+        url = url.format(id=document.id)
+        etag = api_client.get(url).headers["ETag"]
+
+        api_client.post(f"/save/{document.id}", json={"content": "<p>edited</p>"})
+        response = api_client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_deleting_an_old_version_changes_the_history(self, api_client, document):
+        url = f"/api/documents/{document.id}/versions?metadata_only=true"
+        first = api_client.get(url)
+
+        assert api_client.delete(f"/api/documents/{document.id}/versions/1").status_code == 200
+        by_tag = api_client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+        by_date = api_client.get(url, headers={"If-Modified-Since": first.headers["Last-Modified"]})
+
+        assert by_tag.status_code == 200 and len(by_tag.json()) == 2
+        assert by_date.status_code == 200
+
+    def test_switching_versions_changes_the_document_view(self, api_client, document):
+        url = f"/api/documents/{document.id}"
+        etag = api_client.get(url).headers["ETag"]
+
+        api_client.post(f"/api/documents/{document.id}/switch-version", json={"version_number": 1})
+
+        assert api_client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+    def test_stale_date_gets_the_body(self, api_client, document):
+        stale = http_date(datetime(2024, 5, 1, 12, 0, 0) - timedelta(seconds=1))
+        response = api_client.get(f"/document/{document.id}", headers={"If-Modified-Since": stale})
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "<p>v3</p>"
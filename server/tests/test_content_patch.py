@@ -0,0 +1,127 @@
+"""
+Tests for splice-based content patches (PATCH /api/documents/{id}/content).
+"""
+
+import json
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.internal.blob_store import hash_content
+from app.internal.version_store import (
+    ContentConflictError, add_version, apply_splices, update_version_content
+)
+from app.models import Document, DocumentVersion
+
+CONTENT = "<h1>Patent</h1>" + "<p>A claim about a widget.</p>" * 5000
+
+
+@pytest.fixture
+def document(db_session):
+    document = Document(title="Patch Doc")
+    db_session.add(document)
+    db_session.flush()
+    version = add_version(
+        db_session, DocumentVersion(document_id=document.id, version_number=1), CONTENT
+    )
+    document.current_version_id = version.id
+    db_session.commit()
+    return document
+
+
+def _patch(api_client, document_id, base_hash, splices):
+    return api_client.patch(
+        f"/api/documents/{document_id}/content", json={"base_hash": base_hash, "splices": splices}
+    )
+
+
+def _content(api_client, document_id):
+    return api_client.get(f"/document/{document_id}").json()["content"]
+
+
+class TestApplySplices:
+    """Test the splice primitive."""
+
+    def test_splices_apply_in_order(self):
+        assert apply_splices("abcdef", [(1, 2, "XY"), (0, 0, ">"), (7, 0, "<")]) == ">aXYdef<"
+
+    def test_out_of_range_splice_raises(self):
+        with pytest.raises(ValueError):
+            apply_splices("abc", [(2, 2, "")])
+
+
+class TestPatchEndpoint:
+    """Test patching the current version."""
+
+    def test_one_character_edit(self, api_client, document):
+        loaded = api_client.get(f"/document/{document.id}").json()
+        splices = [{"start": 21, "delete": 0, "insert": "!"}]
+
+        response = _patch(api_client, document.id, loaded["content_hash"], splices)
+
+        expected = CONTENT[:21] + "!" + CONTENT[21:]
+        assert response.status_code == 200
+        assert response.json()["content_hash"] == hash_content(expected)
+        assert response.headers["ETag"].endswith(f'{hash_content(expected)}"')
+        request_body = json.dumps({"base_hash": loaded["content_hash"], "splices": splices})
+        assert len(request_body) < 200 < len(CONTENT)
+        assert _content(api_client, document.id) == expected
+
+    def test_chained_patches_use_returned_hash(self, api_client, document):
+        base = hash_content(CONTENT)
+        first = _patch(api_client, document.id, base, [{"start": 0, "delete": 15}]).json()
+        second = _patch(
+            api_client, document.id, first["content_hash"], [{"start": 0, "insert": "<h2>New</h2>"}]
+        )
+
+        assert second.status_code == 200
+        assert _content(api_client, document.id) == "<h2>New</h2>" + CONTENT[15:]
+
+    def test_stale_base_is_a_conflict(self, api_client, document):
+        base = hash_content(CONTENT)
+        api_client.post(f"/save/{document.id}", json={"content": "<p>Saved elsewhere</p>"})
+
+        response = _patch(api_client, document.id, base, [{"start": 0, "insert": "x"}])
+
+        assert response.status_code == 409
+        assert _content(api_client, document.id) == "<p>Saved elsewhere</p>"
+
+    def test_invalid_splices(self, api_client, document):
+        base = hash_content(CONTENT)
+
+        past_end = [{"start": len(CONTENT), "delete": 1}]
+        assert _patch(api_client, document.id, base, past_end).status_code == 422
+        assert _patch(api_client, document.id, base, [{"start": -1}]).status_code == 422
+        assert _patch(api_client, document.id, base, []).status_code == 422
+        assert _patch(api_client, 9999, base, [{"start": 0, "insert": "x"}]).status_code == 404
+
+    def test_no_op_patch_writes_nothing(self, api_client, db_session, document):
+        updated_at = document.updated_at
+
+        same_character = [{"start": 4, "delete": 1, "insert": "P"}]
+        response = _patch(api_client, document.id, hash_content(CONTENT), same_character)
+
+        assert response.status_code == 200
+        assert response.json()["content_hash"] == hash_content(CONTENT)
+        db_session.refresh(document)
+        assert document.updated_at == updated_at
+
+
+class TestConcurrentSaves:
+    """Test the compare-and-swap on the version's content hash."""
+
+    def test_save_over_changed_content_conflicts(self, db_session, test_db_engine, document):
+        version = db_session.get(DocumentVersion, document.current_version_id)
+        assert version.content_hash == hash_content(CONTENT)
+
+        # Another request saves the same version in the meantime
+        with Session(bind=test_db_engine) as other:
+            update_version_content(other, other.get(DocumentVersion, version.id), "<p>theirs</p>")
+            other.commit()
+
+        with pytest.raises(ContentConflictError):
+            update_version_content(db_session, version, "<p>mine</p>")
+        db_session.rollback()
+
+        db_session.refresh(version)
+        assert version.content_hash == hash_content("<p>theirs</p>")
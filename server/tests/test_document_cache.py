@@ -0,0 +1,149 @@
+"""
+Tests for the read-through cache behind GET /document/{id}.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.internal.document_cache import DocumentCache, document_cache
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+from app.schemas import DocumentWithCurrentVersion
+
+
+@pytest.fixture(autouse=True)
+def clear_document_cache():
+    document_cache.clear()
+    yield
+    document_cache.clear()
+
+
+@pytest.fixture
+def cached_document(db_session):
+    """Document with two versions, pointing at version 2."""
+    document = Document(title="Cached Doc")
+    db_session.add(document)
+    db_session.flush()
+    add_version(
+        db_session, DocumentVersion(document_id=document.id, version_number=1), "<p>one</p>"
+    )
+    second = add_version(
+        db_session, DocumentVersion(document_id=document.id, version_number=2), "<p>two</p>"
+    )
+    document.current_version_id = second.id
+    db_session.commit()
+    return document
+
+
+def _response(document_id: int, content: str) -> DocumentWithCurrentVersion:
+    return DocumentWithCurrentVersion(
+        id=document_id, title="Doc", content=content, version_number=1,
+        last_modified=datetime(2024, 1, 1)
+    )
+
+
+class TestDocumentCache:
+    """Test the LRU itself."""
+
+    def test_entry_needs_same_pointer_and_write_time(self):
+        cache = DocumentCache()
+        written = datetime(2024, 1, 1)
+        cache.put(1, 10, written, _response(1, "a"))
+
+        assert cache.get(1, 10, written).content == "a"
+        assert cache.get(1, 11, written) is None
+        assert cache.get(1, 10, written + timedelta(seconds=1)) is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_keeps_one_entry_per_document(self):
+        cache = DocumentCache()
+        for version_id in range(5):
+            cache.put(1, version_id, None, _response(1, "x" * 100))
+
+        assert cache.stats()["entries"] == 1
+        assert cache.stats()["bytes"] == 100
+        assert cache.get(1, 4, None) is not None
+
+    def test_evicts_least_recently_used_by_count_and_bytes(self):
+        cache = DocumentCache(max_entries=2, max_bytes=250)
+        cache.put(1, 1, None, _response(1, "a" * 100))
+        cache.put(2, 1, None, _response(2, "b" * 100))
+        cache.get(1, 1, None)
+        cache.put(3, 1, None, _response(3, "c" * 100))
+
+        assert cache.get(2, 1, None) is None
+        assert cache.get(1, 1, None) is not None
+
+        cache.put(4, 1, None, _response(4, "d" * 200))
+        assert len(cache) == 1
+        assert cache.stats()["bytes"] == 200
+
+        cache.put(5, 1, None, _response(5, "e" * 300))
+        assert cache.get(5, 1, None) is None
+
+    def test_invalidate_counts_dropped_documents(self):
+        cache = DocumentCache()
+        cache.put(1, 1, None, _response(1, "a"))
+
+        cache.invalidate(1)
+        cache.invalidate(2)
+
+        assert cache.get(1, 1, None) is None
+        assert cache.invalidations == 1
+        assert cache.stats()["bytes"] == 0
+
+
+class TestDocumentEndpointCache:
+    """Test that writes through the API invalidate the cached editor response."""
+
+    def test_second_load_is_a_hit(self, api_client, cached_document):
+        first = api_client.get(f"/document/{cached_document.id}").json()
+        second = api_client.get(f"/document/{cached_document.id}").json()
+
+        assert first == second
+        assert second["content"] == "<p>two</p>"
+        assert (document_cache.hits, document_cache.misses) == (1, 1)
+
+    def test_save_invalidates(self, api_client, cached_document):
+        api_client.get(f"/document/{cached_document.id}")
+
+        api_client.post(f"/save/{cached_document.id}", json={"content": "<p>edited</p>"})
+
+        assert document_cache.invalidations == 1
+        response = api_client.get(f"/document/{cached_document.id}")
+        assert response.json()["content"] == "<p>edited</p>"
+
+    def test_version_changes_invalidate(self, api_client, cached_document):
+        url = f"/document/{cached_document.id}"
+        api_client.get(url)
+
+        api_client.post(
+            f"/api/documents/{cached_document.id}/switch-version", json={"version_number": 1}
+        )
+        assert api_client.get(url).json()["version_number"] == 1
+
+        api_client.post(
+            f"/api/documents/{cached_document.id}/versions", json={"content": "<p>three</p>"}
+        )
+        assert api_client.get(url).json()["content"] == "<p>three</p>"
+
+        api_client.delete(f"/api/documents/{cached_document.id}/versions/3")
+        assert api_client.get(url).json()["version_number"] == 2
+        assert document_cache.invalidations == 3
+
+    def test_write_by_another_worker_is_not_served_stale(
+        self, api_client, cached_document, db_session
+    ):
+        url = f"/document/{cached_document.id}"
+        api_client.get(url)
+
+        # Another process renames the document - this worker's cache is never told
+        db_session.execute(
+            update(Document).where(Document.id == cached_document.id).values(title="Renamed")
+        )
+        db_session.commit()
+
+        assert api_client.get(url).json()["title"] == "Renamed"
+        assert document_cache.hits == 0
@@ -0,0 +1,164 @@
+"""
+Tests for bulk document import: title scanning, NDJSON parsing and batched writes.
+"""
+
+import json
+
+from sqlalchemy import func, select
+
+from app.internal import document_import
+from app.internal.blob_store import get_content, hash_content
+from app.internal.document_import import (
+    DocumentImporter, ImportItem, NdjsonDecoder, import_documents, iter_html_files, iter_ndjson,
+    scan_title
+)
+from app.internal.version_store import add_version
+from app.models import ContentBlob, Document, DocumentVersion
+
+
+def _ndjson(*records) -> bytes:
+    return b"".join(json.dumps(record).encode() + b"\n" for record in records)
+
+
+class TestScanTitle:
+    """Test the regex title scanner."""
+
+    def test_title_before_h1(self):
+        html = "<html><head><title> Patent  A </title></head><h1>Heading</h1>"
+        assert scan_title(html) == "Patent A"
+        assert scan_title("<h1>Heading</h1><p>text</p>") == "Heading"
+
+    def test_inner_tags_and_entities(self):
+        html = '<H1 class="x">Sensor <em>&amp;</em>\n Controller</H1>'
+        assert scan_title(html) == "Sensor & Controller"
+
+    def test_default(self):
+        assert scan_title("<p>No heading</p>") == "Untitled Document"
+        assert scan_title("<title></title><p>x</p>") == "Untitled Document"
+
+
+class TestNdjsonDecoder:
+    """Test incremental NDJSON parsing."""
+
+    def test_lines_split_across_chunks(self):
+        body = _ndjson({"content": "<h1>One</h1>"}, {"content": "<p>2</p>", "title": "Two"})
+        decoder = NdjsonDecoder()
+
+        items = []
+        for i in range(0, len(body), 7):
+            items.extend(decoder.feed(body[i:i + 7]))
+        items.extend(decoder.close())
+
+        assert [(i.content, i.title) for i in items] == [
+            ("<h1>One</h1>", None), ("<p>2</p>", "Two")
+        ]
+
+    def test_invalid_and_oversized_lines(self, monkeypatch):
+        monkeypatch.setattr(document_import, "IMPORT_MAX_DOCUMENT_BYTES", 40)
+        decoder = NdjsonDecoder()
+
+        items = decoder.feed(b'not json\n\n{"title": "x"}\n{"content": "' + b"a" * 100 + b'"}\n')
+        items += decoder.feed(b'{"content": "<p>ok</p>"}')
+        items += decoder.close()
+
+        assert [i.source for i in items] == ["request:1", "request:3", "request:4", "request:5"]
+        assert [i.error is not None for i in items] == [True, True, True, False]
+
+
+class TestDocumentImporter:
+    """Test batched writes."""
+
+    def test_documents_versions_and_search(self, db_session):
+        records = [{"content": f"<h1>Patent {i}</h1><p>widget{i} claim</p>"} for i in range(5)]
+        records.append({"content": records[0]["content"], "title": "Copy"})
+
+        items = iter_ndjson(_ndjson(*records).splitlines())
+        report = import_documents(db_session, items, batch_size=2)
+
+        assert report.documents == 6 and report.batches == 3 and report.skipped == 0
+        assert report.docs_per_second > 0
+        documents = db_session.scalars(select(Document).order_by(Document.id)).all()
+        assert [d.id for d in documents] == report.document_ids
+        assert [d.title for d in documents] == [f"Patent {i}" for i in range(5)] + ["Copy"]
+        version = db_session.get(DocumentVersion, documents[3].current_version_id)
+        assert version.version_number == 1
+        assert get_content(db_session, version.content_hash) == records[3]["content"]
+        # Identical content is stored once
+        assert db_session.scalar(select(func.count()).select_from(ContentBlob)) == 5
+
+    def test_html_files_prepared_in_a_pool(self, db_session, tmp_path, monkeypatch):
+        monkeypatch.setattr(document_import, "IMPORT_MIN_PARALLEL", 1)
+        for i in range(4):
+            (tmp_path / f"doc{i}.html").write_text(f"<title>File {i}</title><p>body</p>")
+        (tmp_path / "notes.txt").write_text("skipped")
+
+        items = list(iter_html_files([tmp_path, tmp_path / "missing.html"]))
+        with DocumentImporter(db_session, batch_size=10, workers=2) as importer:
+            report = importer.run(items)
+
+        assert report.documents == 4
+        assert report.errors == [f"{tmp_path / 'missing.html'}: No such file or directory"]
+        titles = db_session.scalars(select(Document.title).order_by(Document.id)).all()
+        assert titles == [f"File {i}" for i in range(4)]
+
+    def test_existing_delta_blob_is_materialized(self, db_session):
+        document = Document(title="Existing")
+        db_session.add(document)
+        db_session.flush()
+        shared = "<p>" + "shared claim text " * 40 + "</p>"
+        for number, content in enumerate([shared, shared + "<p>more</p>"], 1):
+            version = DocumentVersion(document_id=document.id, version_number=number)
+            add_version(db_session, version, content)
+        db_session.commit()
+        assert db_session.get(ContentBlob, hash_content(shared)).base_hash is not None
+
+        import_documents(db_session, [ImportItem("shared", shared)])
+
+        blob = db_session.get(ContentBlob, hash_content(shared))
+        db_session.refresh(blob)
+        assert blob.base_hash is None
+        assert get_content(db_session, blob.hash) == shared
+
+
+class TestImportEndpoint:
+    """Test POST /api/documents/import."""
+
+    def test_streams_and_reports(self, api_client, monkeypatch):
+        monkeypatch.setattr(document_import, "IMPORT_BATCH_SIZE", 2)
+        records = [{"content": f"<h1>Doc {i}</h1><p>text</p>"} for i in range(3)]
+        body = _ndjson(*records) + b"{broken\n"
+
+        response = api_client.post(
+            "/api/documents/import", content=body, headers={"Content-Type": "application/x-ndjson"}
+        )
+
+        assert response.status_code == 200
+        report = response.json()
+        assert report["documents"] == 3 and report["skipped"] == 1 and report["batches"] == 2
+        assert report["errors"][0].startswith("request:4: Invalid JSON")
+        loaded = api_client.get(f"/document/{report['document_ids'][2]}").json()
+        assert loaded["title"] == "Doc 2" and loaded["content"] == "<h1>Doc 2</h1><p>text</p>"
+
+    def test_uses_the_shared_spawn_pool(self, api_client, monkeypatch):
+        """Requests share one spawn pool, which outlives them until shutdown()."""
+        import app.__main__ as main
+
+        pool = document_import.ImportPool(workers=2)
+        monkeypatch.setattr(main, "import_pool", pool)
+        monkeypatch.setattr(document_import, "IMPORT_MIN_PARALLEL", 1)
+        body = _ndjson(*[{"content": f"<h1>Pooled {i}</h1>"} for i in range(4)])
+
+        try:
+            for _ in range(2):
+                response = api_client.post("/api/documents/import", content=body)
+                assert response.status_code == 200 and response.json()["documents"] == 4
+            executor = pool.get()
+            assert executor._mp_context.get_start_method() == "spawn"
+            # Still usable: the requests didn't shut it down
+            assert executor.submit(document_import.scan_title, "<h1>Open</h1>").result() == "Open"
+        finally:
+            pool.shutdown()
+        assert pool._pool is None
+
+    def test_empty_body(self, api_client):
+        assert api_client.post("/api/documents/import", content=b"\n").status_code == 422
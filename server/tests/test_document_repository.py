@@ -0,0 +1,152 @@
+"""
+Tests for the single-query document repository and per-request query counting.
+"""
+
+import pytest
+from sqlalchemy import event
+
+from app.internal import document_repository
+from app.internal.db import count_queries
+from app.internal.document_cache import document_cache
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+
+@pytest.fixture
+def document(db_session):
+    """Document with 5 versions, pointing at version 3."""
+    document = Document(title="Repository Doc")
+    db_session.add(document)
+    db_session.flush()
+    versions = [
+        add_version(
+            db_session,
+            DocumentVersion(document_id=document.id, version_number=n),
+            f"<p>v{n}</p>",
+        )
+        for n in range(1, 6)
+    ]
+    document.current_version_id = versions[2].id
+    db_session.commit()
+    document_cache.clear()
+    return document
+
+
+def _query_count(response) -> int:
+    assert response.status_code < 300, response.text
+    return int(response.headers["X-Query-Count"])
+
+
+class TestRepository:
+    """Test the joined lookups."""
+
+    def test_current_version_in_one_query(self, db_session, document):
+        document_id = document.id
+        with count_queries() as queries:
+            loaded, version = document_repository.get_document_with_current_version(
+                db_session, document_id
+            )
+
+        assert queries.count == 1
+        assert loaded.id == document_id
+        assert version.version_number == 3
+
+    def test_falls_back_to_latest_version(self, db_session, document):
+        document.current_version_id = None
+        db_session.commit()
+
+        _, version = document_repository.get_document_with_current_version(db_session, document.id)
+        assert version.version_number == 5
+
+        document.current_version_id = 9999  # Pointer at a version that no longer exists
+        db_session.commit()
+        _, version = document_repository.get_document_with_current_version(db_session, document.id)
+        assert version.version_number == 5
+
+    def test_missing_document_and_version(self, db_session, document):
+        missing = document_repository.get_document_with_current_version(db_session, 9999)
+        assert missing == (None, None)
+        loaded, version = document_repository.get_document_with_version(db_session, document.id, 42)
+        assert loaded.id == document.id and version is None
+
+    def test_deletion_facts_in_one_query(self, db_session, document):
+        document_id = document.id
+        with count_queries() as queries:
+            deletion = document_repository.get_version_for_deletion(db_session, document_id, 5)
+
+        assert queries.count == 1
+        assert deletion.target.version_number == 5
+        assert deletion.version_count == 5
+        assert db_session.get(DocumentVersion, deletion.alternative_id).version_number == 4
+
+    def test_new_version_facts(self, db_session, document):
+        _, current, max_version = document_repository.get_document_for_new_version(
+            db_session, document.id
+        )
+
+        assert current.version_number == 3
+        assert max_version == 5
+
+
+class TestEndpointQueryCounts:
+    """Query counts per request stay flat, whatever the number of versions."""
+
+    def test_editor_load(self, api_client, document):
+        miss = _query_count(api_client.get(f"/document/{document.id}"))
+        hit = _query_count(api_client.get(f"/document/{document.id}"))
+
+        assert miss <= 3  # Pointer probe, joined lookup, content blob
+        assert hit == 1
+
+    def test_save(self, api_client, document, test_db_engine):
+        url = f"/save/{document.id}"
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(test_db_engine, "before_cursor_execute", record)
+        try:
+            response = api_client.post(url, json={"content": "<p>saved</p>"})
+        finally:
+            event.remove(test_db_engine, "before_cursor_execute", record)
+
+        assert response.json()["version_number"] == 3
+        # One joined lookup, and the document and version updates sent together in one flush
+        assert sum(s.startswith("SELECT document.id") for s in statements) == 1
+        updates = [i for i, s in enumerate(statements) if s.startswith("UPDATE")]
+        assert len(updates) == 2 and updates[1] == updates[0] + 1
+        # The rest is the blob store and search index: blob insert, index update, release
+        assert _query_count(response) == len(statements) <= 11
+
+    def test_switch_and_get_version(self, api_client, document):
+        switch = api_client.post(
+            f"/api/documents/{document.id}/switch-version", json={"version_number": 2}
+        )
+        get = api_client.get(f"/api/documents/{document.id}/versions/2")
+
+        assert switch.json()["content"] == "<p>v2</p>"
+        assert _query_count(switch) <= 4
+        assert _query_count(get) <= 2
+
+    def test_delete_current_version(self, api_client, document):
+        response = api_client.delete(f"/api/documents/{document.id}/versions/3")
+
+        assert _query_count(response) <= 8
+        assert api_client.get(f"/document/{document.id}").json()["version_number"] == 5
+
+    def test_document_with_versions_does_not_grow_with_history(
+        self, api_client, db_session, document
+    ):
+        url = f"/api/documents/{document.id}?metadata_only=true"
+        before = _query_count(api_client.get(url))
+
+        for n in range(6, 16):
+            add_version(
+                db_session,
+                DocumentVersion(document_id=document.id, version_number=n),
+                f"<p>v{n}</p>",
+            )
+        db_session.commit()
+
+        assert _query_count(api_client.get(url)) == before
@@ -172,10 +172,10 @@ class TestAIAnalysisWorkflow:
             mock_ai_service.review_document_with_functions = mock_review_stream
             
             # Test WebSocket endpoint
-            with patch('app.endpoints.SessionLocal') as mock_session_local:
+            with patch('app.endpoints.AsyncSessionLocal') as mock_session_local:
                 mock_session = MagicMock()
-                mock_session_local.return_value.__enter__.return_value = mock_session
-                mock_session_local.return_value.__exit__.return_value = None
+                mock_session_local.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+                mock_session_local.return_value.__aexit__ = AsyncMock(return_value=None)
                 
                 with patch('app.endpoints.get_chat_manager') as mock_get_chat_manager:
                     mock_chat_manager = MagicMock()
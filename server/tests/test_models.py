@@ -190,10 +190,12 @@ class TestChatHistory:
         db_session.commit()
         
         assert message.message_type == "suggestion_cards"
-        metadata = json.loads(message.chat_metadata)
+        assert json.loads(message.chat_metadata) == {"agents_used": ["technical"]}
+        assert [card.payload for card in message.cards] == cards
+        metadata = message.to_dict()["metadata"]
         assert metadata["suggestion_cards"] == cards
         assert metadata["agents_used"] == ["technical"]
-        assert "card_actions" in metadata
+        assert metadata["card_actions"] == {}
     
     def test_mark_card_action(self, db_session, sample_document):
         """Test marking suggestion card actions."""
@@ -210,7 +212,9 @@ class TestChatHistory:
         message.mark_card_action("card_1", "accepted")
         db_session.commit()
         
-        metadata = json.loads(message.chat_metadata)
+        assert message.cards[0].status == "accepted"
+        assert message.cards[0].acted_at is not None
+        metadata = message.to_dict()["metadata"]
         assert metadata["card_actions"]["card_1"] == "accepted"
     
     def test_get_active_suggestion_cards(self, db_session, sample_document):
@@ -0,0 +1,205 @@
+"""
+Tests for the FTS5 full-text index over versions and chat history, and /api/search.
+"""
+
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.internal import search_index
+from app.internal.db import Base
+from app.internal.migrations import run_migrations
+from app.internal.version_store import add_version, delete_version, update_version_content
+from app.models import ChatHistory, Document, DocumentVersion
+
+
+@pytest.fixture
+def searchable_document(db_session):
+    """Document with two versions and a short chat on version 1."""
+    document = Document(title="Widget Patent")
+    db_session.add(document)
+    db_session.flush()
+    first = add_version(
+        db_session,
+        DocumentVersion(document_id=document.id, version_number=1),
+        "<h1>Widget</h1><p>1. A fastening device comprising a <b>sprocket</b> &amp; a pin.</p>"
+    )
+    second = add_version(
+        db_session,
+        DocumentVersion(document_id=document.id, version_number=2),
+        "<h1>Widget</h1><p>1. A fastening device comprising a ratchet.</p>"
+    )
+    document.current_version_id = second.id
+    db_session.add_all([
+        ChatHistory.create_user_message(document.id, "v1.0", "Is the sprocket claim anticipated?"),
+        ChatHistory.create_assistant_message(document.id, "v1.0", "Claim 1 reads on prior <art>."),
+    ])
+    db_session.commit()
+    return document, first, second
+
+
+def _search(db_session, query, **kwargs):
+    results, _ = search_index.search(db_session, query, **kwargs)
+    return results
+
+
+class TestIndexing:
+    """Test that the index follows version and chat writes."""
+
+    def test_versions_are_indexed_as_plain_text(self, db_session, searchable_document):
+        _, first, _ = searchable_document
+
+        body = db_session.scalar(
+            text("SELECT body FROM version_search WHERE rowid = :id"), {"id": first.id}
+        )
+        assert "<" not in body
+        assert "sprocket & a pin" in body
+
+    def test_save_reindexes_version(self, db_session, searchable_document):
+        _, _, second = searchable_document
+
+        update_version_content(db_session, second, "<p>A fastening device comprising a cam.</p>")
+        db_session.commit()
+
+        assert [r["version_id"] for r in _search(db_session, "cam", kind="versions")] == [second.id]
+        assert _search(db_session, "ratchet") == []
+
+    def test_deleted_version_leaves_index(self, db_session, searchable_document):
+        _, first, _ = searchable_document
+
+        delete_version(db_session, first)
+        db_session.commit()
+
+        indexed = db_session.scalar(
+            text("SELECT count(*) FROM version_search WHERE rowid = :id"), {"id": first.id}
+        )
+        assert indexed == 0
+        assert _search(db_session, "sprocket", kind="versions") == []
+
+    def test_chat_messages_are_indexed_by_triggers(self, db_session, searchable_document):
+        document, _, _ = searchable_document
+
+        db_session.execute(text("DELETE FROM chat_history WHERE message_type = 'user'"))
+        db_session.commit()
+
+        results = _search(db_session, "claim", kind="chat")
+        assert [r["message_type"] for r in results] == ["assistant"]
+        assert results[0]["document_id"] == document.id
+
+    def test_migration_backfills_existing_data(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE document (id INTEGER PRIMARY KEY, "
+                              "title VARCHAR NOT NULL, current_version_id INTEGER, "
+                              "created_at DATETIME, updated_at DATETIME)"))
+            conn.execute(text("CREATE TABLE document_version (id INTEGER PRIMARY KEY, "
+                              "document_id INTEGER, version_number INTEGER, content TEXT, "
+                              "is_active BOOLEAN, created_at DATETIME)"))
+            conn.execute(text("CREATE TABLE chat_history (id INTEGER PRIMARY KEY, "
+                              "document_id INTEGER, version_number VARCHAR, "
+                              "message_type VARCHAR, content VARCHAR, "
+                              "chat_metadata VARCHAR, created_at DATETIME)"))
+            conn.execute(text("INSERT INTO document VALUES "
+                              "(1, 'Legacy', 1, '2024-01-01', '2024-01-01')"))
+            conn.execute(text("INSERT INTO document_version VALUES "
+                              "(1, 1, 1, '<p>legacy gearbox</p>', 1, '2024-01-01')"))
+            conn.execute(text("INSERT INTO chat_history VALUES "
+                              "(1, 1, 'v1.0', 'user', 'gearbox question', NULL, '2024-01-01')"))
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
+
+        with Session(bind=engine) as db:
+            kinds = sorted(r["kind"] for r in _search(db, "gearbox"))
+        engine.dispose()
+        assert kinds == ["chat", "version"]
+
+
+class TestSearch:
+    """Test ranking, filtering, snippets and query parsing."""
+
+    def test_snippets_are_escaped_and_highlighted(self, db_session, searchable_document):
+        results = _search(db_session, "prior", kind="chat")
+
+        assert results[0]["snippet"] == "Claim 1 reads on <mark>prior</mark> &lt;art&gt;."
+
+    def test_stemming_and_prefix(self, db_session, searchable_document):
+        assert {r["kind"] for r in _search(db_session, "claims")} == {"chat"}
+        assert {r["version_id"] for r in _search(db_session, "sprock*", kind="versions")} == {
+            searchable_document[1].id
+        }
+
+    def test_operators_in_input_are_plain_words(self, db_session, searchable_document):
+        assert search_index.build_match_query('body: NOT "fastening device" wid*') == (
+            '"body" "NOT" "fastening device" "wid"*'
+        )
+        assert _search(db_session, 'AND OR ( "') == []
+        assert len(_search(db_session, '"fastening device"', kind="versions")) == 2
+
+    def test_document_filter(self, db_session, searchable_document):
+        other = Document(title="Other")
+        db_session.add(other)
+        db_session.flush()
+        version = DocumentVersion(document_id=other.id, version_number=1)
+        add_version(db_session, version, "<p>ratchet</p>")
+        db_session.commit()
+
+        assert len(_search(db_session, "ratchet")) == 2
+        filtered = _search(db_session, "ratchet", document_id=other.id)
+        assert [r["document_id"] for r in filtered] == [other.id]
+
+    def test_latency_across_thousands_of_versions(self, db_session):
+        document = Document(title="Large")
+        db_session.add(document)
+        db_session.flush()
+        db_session.execute(
+            text("INSERT INTO document_version "
+                 "(id, document_id, version_number, content, is_active, created_at) "
+                 "VALUES (:id, :document_id, :number, '', 0, '2024-01-01')"),
+            [{"id": 10_000 + i, "document_id": document.id, "number": i} for i in range(3000)]
+        )
+        db_session.execute(
+            text("INSERT INTO version_search(rowid, body) VALUES (:id, :body)"),
+            [
+                {"id": 10_000 + i, "body": f"claim {i} comprising a lever and filler text " * 50}
+                for i in range(3000)
+            ]
+        )
+        db_session.commit()
+
+        started = time.perf_counter()
+        results, has_more = search_index.search(db_session, "lever 1234", kind="versions")
+        elapsed = time.perf_counter() - started
+
+        assert [r["version_number"] for r in results] == ["1234"]
+        assert not has_more
+        assert elapsed < 0.1
+
+
+class TestSearchEndpoint:
+    """Test GET /api/search."""
+
+    def test_paginates_best_match_first(self, api_client, searchable_document):
+        first_page = api_client.get("/api/search", params={"q": "fastening", "limit": 1}).json()
+        second_page = api_client.get(
+            "/api/search", params={"q": "fastening", "limit": 1, "offset": 1}
+        ).json()
+
+        assert first_page["has_more"] is True
+        assert second_page["has_more"] is False
+        numbers = {page["results"][0]["version_number"] for page in (first_page, second_page)}
+        assert numbers == {"1", "2"}
+        assert first_page["results"][0]["document_title"] == "Widget Patent"
+
+    def test_validates_parameters(self, api_client, searchable_document):
+        assert api_client.get("/api/search").status_code == 422
+        response = api_client.get("/api/search", params={"q": "claim", "kind": "blobs"})
+        assert response.status_code == 422
+        assert api_client.get("/api/search", params={"q": "claim", "limit": 0}).status_code == 422
+
+    def test_query_without_words_returns_nothing(self, api_client, searchable_document):
+        response = api_client.get("/api/search", params={"q": "***"})
+
+        assert response.status_code == 200
+        assert response.json()["results"] == []
@@ -0,0 +1,94 @@
+"""
+Tests for seeding from the precomputed seed snapshot.
+"""
+
+import json
+
+from sqlalchemy import event, select
+
+from app.internal import seed_snapshot
+from app.internal.blob_store import get_content
+from app.internal.search_index import search
+from app.models import Document, DocumentVersion
+
+
+def _seeded(db_session):
+    documents = db_session.scalars(select(Document).order_by(Document.id)).all()
+    return [
+        (
+            d.id,
+            d.title,
+            get_content(
+                db_session, db_session.get(DocumentVersion, d.current_version_id).content_hash
+            ),
+        )
+        for d in documents
+    ]
+
+
+class TestSeedSnapshot:
+    """Test the committed snapshot and loading it."""
+
+    def test_committed_snapshot_is_up_to_date(self):
+        snapshot = seed_snapshot.load_snapshot()
+
+        assert snapshot is not None
+        digest = seed_snapshot.source_digest(seed_snapshot.seed_contents())
+        assert snapshot["source_digest"] == digest, (
+            "app/internal/data.py changed, run: python -m app.internal.seed_snapshot"
+        )
+
+    def test_seeds_documents_in_order(self, db_session):
+        contents = seed_snapshot.seed_contents()
+
+        assert seed_snapshot.seed_database(db_session) == len(contents)
+
+        seeded = _seeded(db_session)
+        assert [(i, content) for i, _, content in seeded] == list(enumerate(contents, 1))
+        assert seeded[0][1] == "METHOD AND SYSTEM FOR IDENTIFYING FINGERPRINT"
+        assert search(db_session, "fingerprint", kind="versions")[0]
+
+    def test_missing_snapshot_falls_back_to_the_corpus(self, db_session, tmp_path):
+        seed_snapshot.seed_database(db_session, tmp_path / "missing.json")
+
+        assert [content for _, _, content in _seeded(db_session)] == seed_snapshot.seed_contents()
+
+    def test_stale_snapshot_falls_back_to_the_corpus(self, db_session, tmp_path):
+        stale = seed_snapshot.build_snapshot(["<h1>Old seed</h1><p>removed since</p>"])
+        path = tmp_path / "stale.json"
+        path.write_text(json.dumps(stale), encoding="utf-8")
+
+        assert seed_snapshot.seed_database(db_session, path) == len(seed_snapshot.seed_contents())
+
+        assert [content for _, _, content in _seeded(db_session)] == seed_snapshot.seed_contents()
+
+    def test_only_id_returning_inserts_run_per_document(
+        self, db_session, test_db_engine, tmp_path, monkeypatch
+    ):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            # SQLite runs INSERT ... RETURNING once per row, everything else is one execution
+            if not statement.startswith(("INSERT INTO document ", "INSERT INTO document_version ")):
+                statements.append(statement)
+
+        counts = []
+        event.listen(test_db_engine, "before_cursor_execute", record)
+        try:
+            for size in (3, 30):
+                corpus = [f"<h1>Patent {i}</h1><p>claim {i}</p>" for i in range(size)]
+                path = tmp_path / f"snapshot-{size}.json"
+                path.write_text(json.dumps(seed_snapshot.build_snapshot(corpus)))
+                # The snapshot is only used while it matches the seed corpus
+                monkeypatch.setattr(seed_snapshot, "seed_contents", lambda: corpus)
+                statements.clear()
+                seed_snapshot.seed_database(db_session, path)
+                counts.append(len(statements))
+                db_session.execute(Document.__table__.update().values(current_version_id=None))
+                db_session.execute(DocumentVersion.__table__.delete())
+                db_session.execute(Document.__table__.delete())
+                db_session.commit()
+        finally:
+            event.remove(test_db_engine, "before_cursor_execute", record)
+
+        assert counts[0] == counts[1]
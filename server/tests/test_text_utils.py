@@ -7,7 +7,8 @@ import json
 from app.internal.text_utils import (
     html_to_plain_text, 
     validate_text_for_ai, 
-    StreamingJSONParser
+    StreamingJSONParser,
+    StreamingObjectMembers
 )
 
 
@@ -308,6 +309,62 @@ class TestStreamingJSONParser:
         assert result1["issues"][0]["type"] != result2["issues"][0]["type"]
 
 
+class TestStreamingObjectMembers:
+    """Test member-by-member parsing of a streamed JSON object."""
+    
+    def test_members_complete_as_they_arrive(self):
+        """Each member is returned once its value is complete, prefix text is skipped."""
+        text = (
+            'Mapping:\n```json\n'
+            '{"chunk_1": {"severity": "high", "note": "a } b"}, "chunk_2": [1, 2],\n "n": 12}\n```'
+        )
+        members = StreamingObjectMembers()
+        
+        completed = []
+        for i in range(0, len(text), 5):
+            completed.append(members.add_chunk(text[i:i + 5]))
+        
+        flat = [member for batch in completed for member in batch]
+        assert flat == [
+            ("chunk_1", {"severity": "high", "note": "a } b"}), ("chunk_2", [1, 2]), ("n", 12)
+        ]
+        # chunk_1 was available before the object was complete
+        assert next(i for i, batch in enumerate(completed) if batch) < len(completed) - 3
+        assert members.done
+    
+    def test_invalid_member_stops_parsing(self):
+        """Nothing after a malformed member is returned."""
+        members = StreamingObjectMembers()
+        
+        assert members.add_chunk('{"a": {"x": 1}, "b": nope, "c": {}}') == [("a", {"x": 1})]
+        assert members.add_chunk('') == []
+    
+    def test_comma_before_colon_is_invalid(self):
+        """Only whitespace may separate a key from its colon."""
+        members = StreamingObjectMembers()
+        
+        assert members.add_chunk('{"a",: 1, "b": 2}') == []
+        assert members.done
+    
+    def test_incomplete_member_is_not_decoded_per_chunk(self):
+        """A long member is decoded again only after a closing bracket arrives."""
+        members = StreamingObjectMembers()
+        decodes = []
+        
+        class CountingDecoder(json.JSONDecoder):
+            def raw_decode(self, s, idx=0):
+                decodes.append(idx)
+                return super().raw_decode(s, idx)
+        
+        members._decoder = CountingDecoder()
+        members.add_chunk('{"chunk_1": {"text": "')
+        for _ in range(500):
+            assert members.add_chunk('word ') == []
+        
+        assert members.add_chunk('"}}') == [("chunk_1", {"text": "word " * 500})]
+        assert len(decodes) <= 4
+
+
 class TestTextUtilityIntegration:
     """Test integration between text utility functions."""
     
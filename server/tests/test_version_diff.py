@@ -0,0 +1,116 @@
+"""
+Tests for the word-level version diff and its cache.
+"""
+
+import pytest
+
+from app.internal import version_diff
+from app.internal.version_diff import DiffHunk, diff_cache, word_diff
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+CLAIMS = "".join(
+    f"<p>Claim {n}. A device comprising a sensor and a controller.</p>" for n in range(1, 200)
+)
+
+
+def apply_hunks(old: str, hunks) -> str:
+    """Rebuild the new text from the old one - hunks are in order and don't overlap"""
+    parts, position = [], 0
+    for hunk in hunks:
+        parts.append(old[position:hunk.from_start])
+        parts.append(hunk.to_text)
+        position = hunk.from_start + len(hunk.from_text)
+    parts.append(old[position:])
+    return "".join(parts)
+
+
+@pytest.fixture
+def document(db_session):
+    """Versions 1 and 2 differ by one word, version 3 is a copy of version 1."""
+    document = Document(title="Diff Doc")
+    db_session.add(document)
+    db_session.flush()
+    for number, content in enumerate(
+        [CLAIMS, CLAIMS.replace("Claim 100. A device", "Claim 100. An apparatus"), CLAIMS], 1
+    ):
+        add_version(
+            db_session, DocumentVersion(document_id=document.id, version_number=number), content
+        )
+    db_session.commit()
+    diff_cache.clear()
+    return document
+
+
+class TestWordDiff:
+    """Test hunks produced from plain text."""
+
+    def test_replaced_word(self):
+        old, new = "The sensor measures heat.", "The probe measures heat."
+
+        assert word_diff(old, new) == [DiffHunk(4, "sensor", 4, "probe")]
+
+    def test_hunks_rebuild_the_new_text(self):
+        old = "A device comprising a sensor, a controller and a housing."
+        new = "A system comprising two sensors, a controller, and a sealed housing!"
+
+        hunks = word_diff(old, new)
+
+        assert apply_hunks(old, hunks) == new
+        for hunk in hunks:
+            assert new[hunk.to_start:hunk.to_start + len(hunk.to_text)] == hunk.to_text
+
+    def test_changes_separated_by_whitespace_are_one_hunk(self):
+        hunks = word_diff("one two three four", "one 2 3 four")
+        assert hunks == [DiffHunk(4, "two three", 4, "2 3")]
+
+    def test_identical_and_empty_texts(self):
+        assert word_diff("same text", "same text") == []
+        assert word_diff("", "new") == [DiffHunk(0, "", 0, "new")]
+        assert word_diff("old", "") == [DiffHunk(0, "old", 0, "")]
+
+    def test_long_rewrites_are_one_replacement(self, monkeypatch):
+        monkeypatch.setattr(version_diff, "DIFF_MAX_TOKENS", 10)
+        old = " ".join(f"a{i}" for i in range(50))
+        new = " ".join(f"b{i}" for i in range(50))
+
+        assert word_diff(old, new) == [DiffHunk(0, old, 0, new)]
+
+
+class TestDiffEndpoint:
+    """Test /api/documents/{id}/diff."""
+
+    def test_returns_only_the_change(self, api_client, document):
+        response = api_client.get(f"/api/documents/{document.id}/diff", params={"from": 1, "to": 2})
+
+        assert response.status_code == 200
+        body = response.json()
+        changes = [(h["from_text"], h["to_text"]) for h in body["hunks"]]
+        assert changes == [("A device", "An apparatus")]
+        assert body["from_hash"] != body["to_hash"]
+        assert len(response.content) < 500 < len(CLAIMS)
+
+    def test_repeated_comparisons_are_cached(self, api_client, document):
+        url = f"/api/documents/{document.id}/diff"
+        first = api_client.get(url, params={"from": 1, "to": 2})
+        # Version 3 has version 1's content, so this is the same pair of hashes
+        second = api_client.get(url, params={"from": 3, "to": 2})
+
+        assert second.json()["hunks"] == first.json()["hunks"]
+        assert diff_cache.stats()["hits"] == 1 and diff_cache.stats()["misses"] == 1
+        assert int(second.headers["X-Query-Count"]) == 1
+
+    def test_identical_versions(self, api_client, document):
+        response = api_client.get(f"/api/documents/{document.id}/diff", params={"from": 1, "to": 3})
+
+        assert response.json()["hunks"] == []
+        assert int(response.headers["X-Query-Count"]) == 1
+
+    def test_missing_document_or_version(self, api_client, document):
+        url = f"/api/documents/{document.id}/diff"
+        no_document = api_client.get("/api/documents/9999/diff", params={"from": 1, "to": 2})
+        assert no_document.status_code == 404
+        missing = api_client.get(url, params={"from": 1, "to": 9})
+        assert missing.status_code == 404
+        assert missing.json()["detail"] == "Version 9 not found"
+        assert api_client.get(url, params={"from": 1}).status_code == 422
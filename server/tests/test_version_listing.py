@@ -0,0 +1,127 @@
+"""
+Tests for metadata-only, keyset-paginated version listing.
+"""
+
+import re
+
+import pytest
+from sqlalchemy import event
+
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+
+# Selecting the content column or blob data - length(CAST(content)) for legacy rows is fine
+CONTENT_READS = re.compile(r"(?<!CAST\()document_version\.content\b(?!_)|content_blob\.data")
+
+
+@pytest.fixture
+def versioned_document(db_session):
+    """Document with 7 versions of growing size, pointing at version 4."""
+    document = Document(title="Listing Doc")
+    db_session.add(document)
+    db_session.flush()
+    versions = {}
+    for number in range(1, 8):
+        versions[number] = add_version(
+            db_session,
+            DocumentVersion(document_id=document.id, version_number=number),
+            "<p>Claim</p>" * number
+        )
+    document.current_version_id = versions[4].id
+    db_session.commit()
+    return document
+
+
+@pytest.fixture
+def statement_log(test_db_engine):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_db_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(test_db_engine, "before_cursor_execute", record)
+
+
+class TestMetadataListing:
+    """Test listing versions without content."""
+
+    def test_metadata_only_never_reads_content(self, api_client, versioned_document, statement_log):
+        response = api_client.get(
+            f"/api/documents/{versioned_document.id}/versions?metadata_only=true"
+        )
+
+        assert response.status_code == 200
+        versions = response.json()
+        assert [v["version_number"] for v in versions] == [7, 6, 5, 4, 3, 2, 1]
+        assert all("content" not in v for v in versions)
+        assert versions[0]["size"] == len("<p>Claim</p>" * 7)
+        assert len(versions[0]["content_hash"]) == 64
+        assert [v["version_number"] for v in versions if v["is_active"]] == [4]
+        assert not [s for s in statement_log if CONTENT_READS.search(s)]
+
+    def test_full_listing_has_no_per_version_queries(
+        self, api_client, versioned_document, statement_log
+    ):
+        """Listing with content never loads the deferred content column row by row."""
+        response = api_client.get(f"/api/documents/{versioned_document.id}/versions")
+
+        assert response.status_code == 200
+        assert len(response.json()) == 7
+        # One query selecting version rows (the document lookup only aggregates them for
+        # the ETag); contents come from the (warm) blob cache
+        version_queries = [s for s in statement_log if s.startswith("SELECT document_version")]
+        assert len(version_queries) == 1
+        assert not [s for s in statement_log if re.search(r"document_version\.content\b(?!_)", s)]
+
+    def test_keyset_pagination(self, api_client, versioned_document):
+        """Following the before cursor walks every version exactly once."""
+        numbers, before = [], None
+        while True:
+            url = f"/api/documents/{versioned_document.id}/versions?metadata_only=true&limit=3"
+            page = api_client.get(url + (f"&before={before}" if before else "")).json()
+            if not page:
+                break
+            numbers += [v["version_number"] for v in page]
+            before = page[-1]["version_number"]
+
+        assert numbers == [7, 6, 5, 4, 3, 2, 1]
+
+    def test_full_listing_pages_keep_content(self, api_client, versioned_document):
+        response = api_client.get(
+            f"/api/documents/{versioned_document.id}/versions?limit=2&before=3"
+        )
+
+        assert [(v["version_number"], v["content"]) for v in response.json()] == [
+            (2, "<p>Claim</p>" * 2), (1, "<p>Claim</p>")
+        ]
+
+    def test_invalid_limit(self, api_client, versioned_document):
+        response = api_client.get(f"/api/documents/{versioned_document.id}/versions?limit=0")
+        assert response.status_code == 422
+
+    def test_document_with_metadata_versions(self, api_client, versioned_document):
+        response = api_client.get(f"/api/documents/{versioned_document.id}?metadata_only=true")
+
+        assert response.status_code == 200
+        body = response.json()
+        assert all("content" not in v and "size" in v for v in body["versions"])
+        assert body["current_version"]["content"] == "<p>Claim</p>" * 4
+
+
+class TestVersionContentEndpoint:
+    """Test fetching a single version's content."""
+
+    def test_get_version(self, api_client, versioned_document):
+        response = api_client.get(f"/api/documents/{versioned_document.id}/versions/2")
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "<p>Claim</p>" * 2
+        assert response.json()["is_active"] is False
+
+    def test_get_missing_version(self, api_client, versioned_document):
+        response = api_client.get(f"/api/documents/{versioned_document.id}/versions/99")
+        assert response.status_code == 404
+        assert api_client.get("/api/documents/999/versions/1").status_code == 404
@@ -0,0 +1,260 @@
+"""
+Tests for delta-compressed version storage.
+"""
+
+import random
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app.internal import blob_store, version_store
+from app.internal.blob_store import apply_delta, compute_delta, content_cache as version_cache
+from app.internal.version_store import (
+    KEYFRAME_INTERVAL, add_version, delete_version, get_version_content, hash_content,
+    storage_stats, update_version_content,
+)
+from app.models import ContentBlob, Document, DocumentVersion
+
+
+BASE_CONTENT = "<h1>Patent</h1>" + "".join(
+    f"<p>Claim {i}. A device comprising a housing and a sensor coupled to the housing.</p>"
+    for i in range(1, 60)
+)
+
+
+def edited(content: str, seed: int) -> str:
+    """Apply a small deterministic edit, like a user changing a few words"""
+    rng = random.Random(seed)
+    position = rng.randrange(len(content))
+    position = content.find("</p>", position)
+    if position == -1:
+        position = len(content)
+    return content[:position] + f" revised wording {seed}" + content[position:]
+
+
+@pytest.fixture(autouse=True)
+def clear_version_cache():
+    version_cache.clear()
+    yield
+    version_cache.clear()
+
+
+def create_document_with_versions(db_session, count: int):
+    document = Document(title="Delta Doc")
+    db_session.add(document)
+    db_session.flush()
+
+    contents = []
+    content = BASE_CONTENT
+    for number in range(1, count + 1):
+        if number > 1:
+            content = edited(content, number)
+        version = DocumentVersion(document_id=document.id, version_number=number, is_active=False)
+        add_version(db_session, version, content)
+        contents.append(content)
+    db_session.commit()
+    return document, contents
+
+
+def versions_by_number(db_session, document_id):
+    return {
+        v.version_number: v
+        for v in db_session.scalars(
+            select(DocumentVersion).where(DocumentVersion.document_id == document_id)
+        )
+    }
+
+
+class TestDeltaEncoding:
+    """Test the delta codec."""
+
+    @pytest.mark.parametrize("base,target", [
+        ("", ""),
+        ("", "<p>new</p>"),
+        ("<p>old</p>", ""),
+        ("<p>Hello world</p>", "<p>Hello brave new world</p>"),
+        (BASE_CONTENT, edited(BASE_CONTENT, 7)),
+        ("<p>ünïcödé 特许</p>", "<p>ünïcödé 专利 特许</p>"),
+    ])
+    def test_round_trip(self, base, target):
+        """apply_delta(base, compute_delta(base, target)) == target"""
+        assert apply_delta(base, compute_delta(base, target)) == target
+
+    def test_small_edit_gives_small_delta(self):
+        """A one-phrase edit of a large document encodes to a few dozen bytes."""
+        delta = compute_delta(BASE_CONTENT, edited(BASE_CONTENT, 3))
+        assert len(delta) < 100 < len(BASE_CONTENT)
+
+    def test_large_repetitive_document_is_bounded(self):
+        """Diffing a large, repetitive document stays fast and still round-trips."""
+        base = BASE_CONTENT * 40
+        target = edited(edited(base, 1), 2).replace("sensor", "detector", 50)
+
+        started = time.perf_counter()
+        delta = compute_delta(base, target)
+        elapsed = time.perf_counter() - started
+
+        assert apply_delta(base, delta) == target
+        assert elapsed < 2
+
+
+class TestVersionStore:
+    """Test reverse-delta storage of document versions."""
+
+    def test_reverse_deltas_with_keyframes(self, db_session):
+        """Newest version and every KEYFRAME_INTERVAL-th version are stored in full."""
+        count = KEYFRAME_INTERVAL * 2 + 3
+        document, contents = create_document_with_versions(db_session, count)
+        versions = versions_by_number(db_session, document.id)
+
+        for number, version in versions.items():
+            expected_keyframe = number == count or number % KEYFRAME_INTERVAL == 0
+            assert version_store.is_keyframe(db_session, version) is expected_keyframe
+            assert version.content_hash == hash_content(contents[number - 1])
+
+        version_cache.clear()
+        for number, version in versions.items():
+            assert get_version_content(db_session, version) == contents[number - 1]
+
+        stats = storage_stats(db_session, document.id)
+        assert stats["versions"] == count
+        assert stats["logical_bytes"] == sum(len(c) for c in contents)
+        assert stats["stored_bytes"] < stats["logical_bytes"] / 3
+
+    def test_reconstruction_uses_cache(self, db_session):
+        """Reading the same old version twice only applies deltas once."""
+        document, contents = create_document_with_versions(db_session, 5)
+        oldest = versions_by_number(db_session, document.id)[1]
+
+        version_cache.clear()
+        assert get_version_content(db_session, oldest) == contents[0]
+        hits_before = version_cache.hits
+        assert get_version_content(db_session, oldest) == contents[0]
+        assert version_cache.hits == hits_before + 1
+
+    def test_update_base_version_keeps_dependents(self, db_session):
+        """Saving a version that others depend on re-encodes its dependents."""
+        document, contents = create_document_with_versions(db_session, 4)
+        versions = versions_by_number(db_session, document.id)
+
+        new_content = BASE_CONTENT.replace("housing", "casing")
+        update_version_content(db_session, versions[3], new_content)
+        db_session.commit()
+
+        version_cache.clear()
+        assert get_version_content(db_session, versions[3]) == new_content
+        assert get_version_content(db_session, versions[2]) == contents[1]
+        assert get_version_content(db_session, versions[1]) == contents[0]
+        assert get_version_content(db_session, versions[4]) == contents[3]
+
+    def test_autosave_never_diffs(self, db_session, monkeypatch):
+        """Saving the newest version stores it in full and keeps the blob older versions use."""
+        document, contents = create_document_with_versions(db_session, 4)
+        versions = versions_by_number(db_session, document.id)
+        old_hash = versions[4].content_hash
+
+        def no_diff(base, target):
+            raise AssertionError("autosave computed a delta")
+
+        monkeypatch.setattr(blob_store, "compute_delta", no_diff)
+        saved = edited(contents[3], 99)
+        update_version_content(db_session, versions[4], saved)
+        db_session.commit()
+        monkeypatch.undo()
+
+        assert db_session.get(ContentBlob, old_hash) is not None
+        version_cache.clear()
+        for number in (1, 2, 3):
+            assert get_version_content(db_session, versions[number]) == contents[number - 1]
+        assert get_version_content(db_session, versions[4]) == saved
+
+    def test_create_version_compacts_autosaves(self, db_session):
+        """The next version re-encodes saved versions as deltas and drops the pre-save blob."""
+        document, contents = create_document_with_versions(db_session, 3)
+        versions = versions_by_number(db_session, document.id)
+        old_hash = versions[3].content_hash
+        saved = edited(contents[2], 42)
+        update_version_content(db_session, versions[3], saved)
+        add_version(
+            db_session,
+            DocumentVersion(document_id=document.id, version_number=4, is_active=False),
+            edited(saved, 43),
+        )
+        db_session.commit()
+
+        assert db_session.get(ContentBlob, old_hash) is None
+        for number in (1, 2, 3):
+            assert not version_store.is_keyframe(db_session, versions[number])
+        version_cache.clear()
+        for number, expected in ((1, contents[0]), (2, contents[1]), (3, saved)):
+            assert get_version_content(db_session, versions[number]) == expected
+
+    def test_delete_rebases_dependents(self, db_session):
+        """Deleting a version in the middle of a delta chain keeps older versions readable."""
+        document, contents = create_document_with_versions(db_session, 5)
+        versions = versions_by_number(db_session, document.id)
+
+        deleted_hash = versions[3].content_hash
+        delete_version(db_session, versions[3])
+        db_session.commit()
+
+        assert db_session.get(ContentBlob, deleted_hash) is None
+
+        version_cache.clear()
+        for number in (1, 2, 4, 5):
+            assert get_version_content(db_session, versions[number]) == contents[number - 1]
+
+    def test_revert_to_older_content_keeps_chain_acyclic(self, db_session):
+        """A new version reusing a delta-encoded blob makes that blob a keyframe again."""
+        document, contents = create_document_with_versions(db_session, 3)
+        add_version(
+            db_session,
+            DocumentVersion(document_id=document.id, version_number=4, is_active=False),
+            contents[1],
+        )
+        db_session.commit()
+
+        versions = versions_by_number(db_session, document.id)
+        assert versions[4].content_hash == versions[2].content_hash
+        assert version_store.is_keyframe(db_session, versions[4])
+
+        version_cache.clear()
+        expected_contents = ((1, contents[0]), (2, contents[1]), (3, contents[2]), (4, contents[1]))
+        for number, expected in expected_contents:
+            assert get_version_content(db_session, versions[number]) == expected
+
+
+class TestVersionEndpointsWithDeltas:
+    """API responses still carry full content for delta-encoded versions."""
+
+    def test_versions_list_returns_full_content(self, api_client, db_session):
+        document, contents = create_document_with_versions(db_session, 3)
+        document.current_version_id = versions_by_number(db_session, document.id)[3].id
+        db_session.commit()
+        version_cache.clear()
+
+        response = api_client.get(f"/api/documents/{document.id}/versions")
+
+        assert response.status_code == 200
+        by_number = {v["version_number"]: v["content"] for v in response.json()}
+        assert by_number == {1: contents[0], 2: contents[1], 3: contents[2]}
+
+    def test_switch_and_save_old_version(self, api_client, db_session):
+        document, contents = create_document_with_versions(db_session, 3)
+        document.current_version_id = versions_by_number(db_session, document.id)[3].id
+        db_session.commit()
+
+        response = api_client.post(
+            f"/api/documents/{document.id}/switch-version", json={"version_number": 2}
+        )
+        assert response.status_code == 200
+        assert response.json()["content"] == contents[1]
+
+        saved = "<h1>Patent</h1><p>Rewritten</p>"
+        assert api_client.post(f"/save/{document.id}", json={"content": saved}).status_code == 200
+
+        version_cache.clear()
+        response = api_client.get(f"/api/documents/{document.id}")
+        by_number = {v["version_number"]: v["content"] for v in response.json()["versions"]}
+        assert by_number == {1: contents[0], 2: saved, 3: contents[2]}
@@ -0,0 +1,136 @@
+"""
+Tests for pointer-based version switching (Document.current_version_id).
+"""
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from app.internal.migrations import add_version_number_unique_index
+from app.internal.version_store import add_version
+from app.models import Document, DocumentVersion
+
+
+@pytest.fixture
+def versioned_document(db_session):
+    """Document with 20 versions, pointing at the newest one."""
+    document = Document(title="Switch Doc")
+    db_session.add(document)
+    db_session.flush()
+    for number in range(1, 21):
+        version = add_version(
+            db_session,
+            DocumentVersion(document_id=document.id, version_number=number),
+            f"<p>Content of version {number}</p>"
+        )
+    document.current_version_id = version.id
+    db_session.commit()
+    return document
+
+
+@pytest.fixture
+def statement_log(test_db_engine):
+    """Collect SQL statements executed on the test engine."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_db_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(test_db_engine, "before_cursor_execute", record)
+
+
+def active_numbers(versions):
+    return [v["version_number"] for v in versions if v["is_active"]]
+
+
+def switch_to(api_client, document, version_number):
+    api_client.post(
+        f"/api/documents/{document.id}/switch-version", json={"version_number": version_number}
+    )
+
+
+class TestVersionSwitching:
+    """Test that the document pointer is the single source of truth."""
+
+    def test_switch_writes_one_row(self, api_client, versioned_document, statement_log):
+        """Switching updates the document row only, regardless of version count."""
+        response = api_client.post(
+            f"/api/documents/{versioned_document.id}/switch-version", json={"version_number": 3}
+        )
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "<p>Content of version 3</p>"
+        updates = [s for s in statement_log if s.lstrip().upper().startswith("UPDATE")]
+        assert len(updates) == 1
+        assert "document_version" not in updates[0]
+
+    def test_is_active_derived_from_pointer(self, api_client, versioned_document):
+        """Version listings flag exactly the version the document points at."""
+        switch_to(api_client, versioned_document, 7)
+
+        versions = api_client.get(f"/api/documents/{versioned_document.id}/versions").json()
+        assert active_numbers(versions) == [7]
+
+        document = api_client.get(f"/api/documents/{versioned_document.id}").json()
+        assert document["current_version"]["version_number"] == 7
+        assert document["current_version"]["is_active"] is True
+
+    def test_create_version_copies_current_version(self, api_client, versioned_document):
+        """A new version without content copies the version the document points at."""
+        switch_to(api_client, versioned_document, 5)
+
+        response = api_client.post(f"/api/documents/{versioned_document.id}/versions", json={})
+
+        assert response.status_code == 200
+        assert response.json()["version_number"] == 21
+        assert response.json()["content"] == "<p>Content of version 5</p>"
+        assert response.json()["is_active"] is True
+        versions = api_client.get(f"/api/documents/{versioned_document.id}/versions").json()
+        assert active_numbers(versions) == [21]
+
+    def test_delete_current_version_moves_pointer(self, api_client, versioned_document):
+        """Deleting the current version points the document at the latest remaining one."""
+        switch_to(api_client, versioned_document, 20)
+
+        response = api_client.delete(f"/api/documents/{versioned_document.id}/versions/20")
+
+        assert response.status_code == 200
+        document = api_client.get(f"/document/{versioned_document.id}").json()
+        assert document["version_number"] == 19
+
+
+class TestVersionNumberIndex:
+    """Test the unique (document_id, version_number) index."""
+
+    def test_duplicate_version_number_rejected(self, db_session, versioned_document):
+        db_session.add(
+            DocumentVersion(document_id=versioned_document.id, version_number=3, content="")
+        )
+        with pytest.raises(IntegrityError):
+            db_session.flush()
+        db_session.rollback()
+
+    def test_migration_renumbers_duplicates(self, tmp_path):
+        """Existing duplicates are renumbered before the index is created."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'dupes.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE document_version (id INTEGER PRIMARY KEY, "
+                              "document_id INTEGER NOT NULL, version_number INTEGER NOT NULL)"))
+            conn.execute(text(
+                "INSERT INTO document_version VALUES (1, 1, 1), (2, 1, 2), (3, 1, 2), (4, 2, 1)"
+            ))
+
+        with engine.begin() as conn:
+            add_version_number_unique_index(conn)
+            rows = conn.execute(
+                text("SELECT id, version_number FROM document_version ORDER BY id")
+            ).all()
+            indexes = {
+                index["name"]: index for index in inspect(conn).get_indexes("document_version")
+            }
+
+        assert [tuple(row) for row in rows] == [(1, 1), (2, 2), (3, 3), (4, 1)]
+        assert indexes["ux_document_version_document_number"]["unique"]
+        engine.dispose()